@@ -1,4 +1,5 @@
 from langgraph.graph import StateGraph, END, START
+from app.core.telemetry import traced
 from .state import GenesisState
 from .nodes import (
     router_node,
@@ -12,41 +13,44 @@ from .nodes import (
 )
 
 
-def build_genesis_graph():
+# Sequential chain
+# Router -> Skeleton -> Protagonist -> First Chapter -> World -> Outline -> Finalizer
+GENESIS_CHAIN = ["router", "skeleton_agent", "protagonist_agent", "first_chapter_agent", "world_agent", "outline_agent", "finalizer"]
+
+
+def build_genesis_graph(checkpointer=None):
     """
     Build the Genesis Wizard LangGraph workflow.
     Uses a sequential structure to ensure dependencies are met (e.g. Outline depends on World).
     Each node internally checks if it should run based on target_agents.
+    With a checkpointer the state is saved after every node, per thread_id.
     """
     
     workflow = StateGraph(GenesisState)
     
-    # Add all nodes
-    workflow.add_node("router", router_node)
-    workflow.add_node("skeleton_agent", skeleton_agent_node)
-    workflow.add_node("concept_agent", concept_agent_node) # Kept for legacy compatibility if needed
-    workflow.add_node("protagonist_agent", protagonist_agent_node)
-    workflow.add_node("world_agent", world_agent_node)
-    workflow.add_node("outline_agent", outline_agent_node)
-    workflow.add_node("first_chapter_agent", first_chapter_agent_node)
-    workflow.add_node("finalizer", finalizer_node)
+    # Add all nodes (each one timed as a "graph_node" stage)
+    def add_node(name, node):
+        workflow.add_node(name, traced("graph_node", name)(node))
+
+    add_node("router", router_node)
+    add_node("skeleton_agent", skeleton_agent_node)
+    add_node("concept_agent", concept_agent_node) # Kept for legacy compatibility if needed
+    add_node("protagonist_agent", protagonist_agent_node)
+    add_node("world_agent", world_agent_node)
+    add_node("outline_agent", outline_agent_node)
+    add_node("first_chapter_agent", first_chapter_agent_node)
+    add_node("finalizer", finalizer_node)
     
     # Set entry point
     workflow.add_edge(START, "router")
     
-    # Sequential chain
-    # Router -> Skeleton -> Protagonist -> First Chapter -> World -> Outline -> Finalizer
-    workflow.add_edge("router", "skeleton_agent")
-    workflow.add_edge("skeleton_agent", "protagonist_agent")
-    workflow.add_edge("protagonist_agent", "first_chapter_agent")
-    workflow.add_edge("first_chapter_agent", "world_agent")
-    workflow.add_edge("world_agent", "outline_agent")
-    workflow.add_edge("outline_agent", "finalizer")
+    for source, target in zip(GENESIS_CHAIN, GENESIS_CHAIN[1:]):
+        workflow.add_edge(source, target)
     
     # Finalizer goes to END
     workflow.add_edge("finalizer", END)
     
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
 
 
 # Global graph instance
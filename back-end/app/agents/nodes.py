@@ -1,99 +1,188 @@
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
-import json
-import os
+from typing import Dict, Any, List, Optional, Literal, Type, TypeVar
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+import functools
+import time
 from app.services.llm_service import llm_service
+from app.services.structured_output import generate_structured, StructuredOutputError
+from app.services.genesis_cache_service import genesis_cache_service, fingerprint, input_slice, GENESIS_NODE_CACHE
 from .state import GenesisState
+from .projection import project_blueprint, input_fields
 
+GENESIS_TEMPERATURE = 0.7
+ROLE_ALIASES = {"主角": "protagonist", "反派": "antagonist", "配角": "supporting"}
 
-from app.core.config import settings
+class RouterDecision(BaseModel):
+    target_tabs: List[str] = Field(default_factory=list)
+    response: str = ""
 
-def get_llm():
-    """Get configured LLM instance"""
-    return ChatOpenAI(
-        model="deepseek-chat", # Default to deepseek-chat as per llm_service
-        base_url=settings.LLM_BASE_URL,
-        api_key=settings.OPENAI_API_KEY,
-        temperature=0.7,
-    )
+class Skeleton(BaseModel):
+    story_formula: str = ""
+    volume1_goal: str = ""
+    golden_finger_rules: List[Any] = Field(default_factory=list)
+    core_hook: str = ""
+    emotional_tone: str = ""
+
+class Concept(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    title: str = ""
+    genre: str = ""
+    theme: str = ""
+    response: str = ""
+
+class CharacterProfile(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: Optional[str] = None
+    name: str = Field(..., min_length=1)
+    role: Literal["protagonist", "antagonist", "supporting"] = "supporting"
+
+    @field_validator("role", mode="before")
+    @classmethod
+    def _role(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            value = value.strip()
+            return ROLE_ALIASES.get(value, value.lower())
+        return value
+
+class Characters(BaseModel):
+    characters: List[CharacterProfile] = Field(default_factory=list)
+    response: str = ""
+
+class World(BaseModel):
+    # Sections vary with the prompt (macro, conflict, power_system, factions, ...); all are kept
+    model_config = ConfigDict(extra="allow")
+
+class OutlineChapter(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: Optional[str] = None
+    title: str = Field(..., min_length=1)
+    summary: str = ""
+
+class OutlineVolume(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: Optional[str] = None
+    title: str = Field(..., min_length=1)
+    summary: str = ""
+    chapters: List[OutlineChapter] = Field(default_factory=list)
+
+class GenesisOutline(BaseModel):
+    outline: List[OutlineVolume]
+    foreshadowing: List[Any] = Field(default_factory=list)
+    hidden_plot: Any = None
+    response: str = ""
+
+class FirstChapter(BaseModel):
+    title: str = ""
+    content: str = Field(..., min_length=1)
+    response: str = ""
+
+T = TypeVar("T", bound=BaseModel)
+
+async def run_agent(system_prompt: str, user_prompt: str, schema: Type[T], name: str, stats: Optional[Dict[str, Any]] = None) -> Optional[T]:
+    """
+    One structured LLM call for a node; None if no valid result could be obtained.
+    The call's duration is added to `stats` (the node's projection stats) if given.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    started = time.monotonic()
+    try:
+        return await generate_structured(messages, schema, name, kind="genesis", temperature=GENESIS_TEMPERATURE)
+    except StructuredOutputError as e:
+        print(f"⚠️  Genesis {name} output unusable: {e}")
+        return None
+    finally:
+        if stats is not None:
+            stats["elapsed_seconds"] = round(time.monotonic() - started, 3)
+
+def memoized(name: str, tab: str, always: bool = False):
+    """
+    Reuse the draft's cached output of a node while the blueprint fields it reads
+    (projection.input_fields) are unchanged.
+
+    A node the router targeted must also see the same user input again, otherwise the new
+    instruction is applied. Nodes that run without being targeted (`always`) only need an
+    unchanged slice. A node's own output fields are left out of its slice: the client merges
+    them into the blueprint, so they would look changed on every turn. For the same reason an
+    untargeted hit returns no outputs: the section the client holds is already the agent's
+    answer, possibly edited by hand since, and replaying the cached one would undo the edit.
+    """
+    inputs = input_fields(name)
+
+    def decorate(node):
+        @functools.wraps(node)
+        async def run(state: GenesisState) -> Dict[str, Any]:
+            targeted = tab in state.get("target_agents", [])
+            if not (targeted or always):
+                return await node(state)
+
+            slice_fingerprint = fingerprint(input_slice(state["current_data"], inputs))
+            intent = fingerprint(state["user_input"])
+            cached = state.get("node_cache", {}).get(name)
+            if cached and cached["fingerprint"] == slice_fingerprint and (not targeted or cached["intent"] == intent):
+                GENESIS_NODE_CACHE.inc(node=name, result="hit")
+                return {"agent_outputs": cached["outputs"] if targeted else {}, "cache_hits": [name]}
+
+            GENESIS_NODE_CACHE.inc(node=name, result="miss")
+            update = await node(state)
+            outputs = update.get("agent_outputs", {})
+            # Failed runs come back empty and are retried next turn
+            if state.get("draft_id") and any(outputs.values()):
+                try:
+                    await genesis_cache_service.store(state["draft_id"], name, slice_fingerprint, intent, outputs)
+                except Exception as e:
+                    print(f"⚠️  Genesis cache write for {name} failed: {e}")
+            return update
+        return run
+    return decorate
 
 
 async def router_node(state: GenesisState) -> Dict[str, Any]:
     """Router agent that analyzes input and determines which specialist agents to activate"""
+    blueprint, stats = project_blueprint(state["current_data"], "router")
     system_prompt = llm_service.load_prompt("genesis/unified.txt")
     
     user_prompt = f"""当前任务:分析用户输入并智能分配
-已知蓝图:{json.dumps(state['current_data'], ensure_ascii=False)}
+已知蓝图:{blueprint}
 用户输入:"{state['user_input']}"
 
 请判断用户输入涉及哪些模块（skeleton / characters / world / outline），返回 target_tabs 数组。"""
     
-    llm = get_llm()
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt)
-    ]
-    
-    response = await llm.ainvoke(messages)
-    
-    # Extract JSON from response
-    try:
-        json_match = response.content
-        if '{' in json_match:
-            json_str = json_match[json_match.find('{'):json_match.rfind('}')+1]
-            data = json.loads(json_str)
-        else:
-            data = {"target_tabs": [], "response": response.content}
-    except:
-        data = {"target_tabs": [], "response": response.content}
-    
-    target_agents = data.get("target_tabs", [])
+    decision = await run_agent(system_prompt, user_prompt, RouterDecision, "genesis_router", stats) or RouterDecision()
     
     return {
-        "target_agents": target_agents,
-        "final_response": data.get("response", "")
+        "target_agents": decision.target_tabs,
+        "final_response": decision.response,
+        "projection": {"router": stats}
     }
 
 
+@memoized("skeleton_agent", "skeleton")
 async def skeleton_agent_node(state: GenesisState) -> Dict[str, Any]:
     """Skeleton specialist agent"""
     if "skeleton" not in state.get("target_agents", []):
         return {"agent_outputs": {}}
         
+    blueprint, stats = project_blueprint(state["current_data"], "skeleton_agent")
     system_prompt = llm_service.load_prompt("genesis/skeleton.txt")
     
     user_prompt = f"""当前任务:构建骨架小纲
-已知蓝图:{json.dumps(state['current_data'], ensure_ascii=False)}
+已知蓝图:{blueprint}
 用户输入:"{state['user_input']}"
 
 请生成 JSON 格式的骨架小纲。"""
     
-    llm = get_llm()
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt)
-    ]
-    
-    response = await llm.ainvoke(messages)
-    
-    try:
-        json_str = response.content[response.content.find('{'):response.content.rfind('}')+1]
-        data = json.loads(json_str)
-    except:
-        data = {}
+    skeleton = await run_agent(system_prompt, user_prompt, Skeleton, "genesis_skeleton", stats) or Skeleton()
     
-    return {
-        "agent_outputs": {
-            "story_formula": data.get("story_formula", ""),
-            "volume1_goal": data.get("volume1_goal", ""),
-            "golden_finger_rules": data.get("golden_finger_rules", []),
-            "core_hook": data.get("core_hook", ""),
-            "emotional_tone": data.get("emotional_tone", "")
-        }
-    }
+    return {"agent_outputs": skeleton.model_dump(), "projection": {"skeleton_agent": stats}}
 
 
+@memoized("concept_agent", "concept")
 async def concept_agent_node(state: GenesisState) -> Dict[str, Any]:
     """Concept specialist agent"""
     if "concept" not in state.get("target_agents", []):
@@ -110,31 +199,21 @@ async def concept_agent_node(state: GenesisState) -> Dict[str, Any]:
 3. "theme": 提炼核心主题或冲突。
 4. "response": 以架构师的口吻点评这个点子,并引导用户进入下一步(主角设定)。"""
     
-    llm = get_llm()
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt)
-    ]
-    
-    response = await llm.ainvoke(messages)
-    
-    try:
-        json_str = response.content[response.content.find('{'):response.content.rfind('}')+1]
-        data = json.loads(json_str)
-    except:
-        data = {}
+    concept = await run_agent(system_prompt, user_prompt, Concept, "genesis_concept")
     
-    return {"agent_outputs": {"concept": data}}
+    return {"agent_outputs": {"concept": concept.model_dump() if concept else {}}}
 
 
+@memoized("protagonist_agent", "characters", always=True)
 async def protagonist_agent_node(state: GenesisState) -> Dict[str, Any]:
     """Protagonist/Characters specialist agent - always tries to extract from user_input"""
     # Always try to extract characters if user mentions them
         
+    blueprint, stats = project_blueprint(state["current_data"], "protagonist_agent")
     system_prompt = llm_service.load_prompt("genesis/protagonist.txt")
     
     user_prompt = f"""当前任务:塑造角色
-已知蓝图:{json.dumps(state['current_data'], ensure_ascii=False)}
+已知蓝图:{blueprint}
 用户输入:"{state['user_input']}"
 
 请完善角色设定,生成 JSON:
@@ -143,61 +222,44 @@ async def protagonist_agent_node(state: GenesisState) -> Dict[str, Any]:
 
 注意: role 必须是 "protagonist"(主角)、"antagonist"(反派) 或 "supporting"(配角) 之一。"""
     
-    llm = get_llm()
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt)
-    ]
-    
-    response = await llm.ainvoke(messages)
-    
-    try:
-        json_str = response.content[response.content.find('{'):response.content.rfind('}')+1]
-        data = json.loads(json_str)
-    except:
-        data = {}
+    cast = await run_agent(system_prompt, user_prompt, Characters, "genesis_characters", stats)
     
-    return {"agent_outputs": {"characters": data.get("characters", [])}}
+    return {
+        "agent_outputs": {"characters": [c.model_dump(exclude_none=True) for c in cast.characters] if cast else []},
+        "projection": {"protagonist_agent": stats}
+    }
 
 
+@memoized("world_agent", "world", always=True)
 async def world_agent_node(state: GenesisState) -> Dict[str, Any]:
     """World-building specialist agent - always tries to extract from user_input"""
     # Always try to extract world info if user mentions it
         
+    blueprint, stats = project_blueprint(state["current_data"], "world_agent")
     system_prompt = llm_service.load_prompt("genesis/world.txt")
     
     user_prompt = f"""当前任务:构建世界观
-已知蓝图:{json.dumps(state['current_data'], ensure_ascii=False)}
+已知蓝图:{blueprint}
 用户输入:"{state['user_input']}"
 
 请生成完整的结构化世界观 JSON，包含macro、conflict、power_system、factions、economy、rules等所有字段。"""
     
-    llm = get_llm()
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt)
-    ]
-    
-    response = await llm.ainvoke(messages)
-    
-    try:
-        json_str = response.content[response.content.find('{'):response.content.rfind('}')+1]
-        data = json.loads(json_str)
-    except:
-        data = {}
+    world = await run_agent(system_prompt, user_prompt, World, "genesis_world", stats)
     
-    return {"agent_outputs": {"world": data}}
+    return {"agent_outputs": {"world": world.model_dump() if world else {}}, "projection": {"world_agent": stats}}
 
 
+@memoized("outline_agent", "outline")
 async def outline_agent_node(state: GenesisState) -> Dict[str, Any]:
     """Outline specialist agent"""
     if "outline" not in state.get("target_agents", []):
         return {"agent_outputs": {}}
         
+    blueprint, stats = project_blueprint(state["current_data"], "outline_agent")
     system_prompt = llm_service.load_prompt("genesis/outline.txt")
     
     user_prompt = f"""当前任务:生成故事大纲
-已知蓝图:{json.dumps(state['current_data'], ensure_ascii=False)}
+已知蓝图:{blueprint}
 用户输入:"{state['user_input']}"
 
 请生成一个符合"卷-章"结构的故事大纲,返回 JSON:
@@ -213,32 +275,25 @@ async def outline_agent_node(state: GenesisState) -> Dict[str, Any]:
 
 建议生成3-5卷,每卷3-8章。注重前30章的爽点密集度和情绪波浪设计。"""
     
-    llm = get_llm()
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt)
-    ]
-    
-    response = await llm.ainvoke(messages)
-    
-    try:
-        json_str = response.content[response.content.find('{'):response.content.rfind('}')+1]
-        data = json.loads(json_str)
-    except:
-        data = {}
+    outline = await run_agent(system_prompt, user_prompt, GenesisOutline, "genesis_outline", stats)
     
-    return {"agent_outputs": {"outline": data.get("outline", [])}}
+    return {
+        "agent_outputs": {"outline": [v.model_dump(exclude_none=True) for v in outline.outline] if outline else []},
+        "projection": {"outline_agent": stats}
+    }
 
 
+@memoized("first_chapter_agent", "first_chapter")
 async def first_chapter_agent_node(state: GenesisState) -> Dict[str, Any]:
     """First chapter specialist agent"""
     if "first_chapter" not in state.get("target_agents", []):
         return {"agent_outputs": {}}
         
+    blueprint, stats = project_blueprint(state["current_data"], "first_chapter_agent")
     system_prompt = llm_service.load_prompt("genesis/first_chapter.txt")
     
     user_prompt = f"""当前任务:撰写第一章
-已知蓝图:{json.dumps(state['current_data'], ensure_ascii=False)}
+已知蓝图:{blueprint}
 用户输入:"{state['user_input']}"
 
 请撰写第一章正文，返回 JSON:
@@ -248,25 +303,14 @@ async def first_chapter_agent_node(state: GenesisState) -> Dict[str, Any]:
 
 请务必遵循"黄金三章"法则，开篇即高潮，留下强悬念。"""
     
-    llm = get_llm()
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt)
-    ]
-    
-    response = await llm.ainvoke(messages)
-    
-    try:
-        json_str = response.content[response.content.find('{'):response.content.rfind('}')+1]
-        data = json.loads(json_str)
-    except:
-        data = {}
+    chapter = await run_agent(system_prompt, user_prompt, FirstChapter, "genesis_first_chapter", stats)
     
     return {
         "agent_outputs": {
-            "first_chapter_title": data.get("title", ""),
-            "first_chapter_content": data.get("content", "")
-        }
+            "first_chapter_title": chapter.title if chapter else "",
+            "first_chapter_content": chapter.content if chapter else ""
+        },
+        "projection": {"first_chapter_agent": stats}
     }
 
 
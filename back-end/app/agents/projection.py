@@ -0,0 +1,267 @@
+"""
+Per-agent views of the Genesis blueprint.
+
+Nodes used to embed the whole `current_data` in every prompt, so a detailed world and a
+long outline were paid for by agents that never read them. Each agent now declares the
+sections it reads and the detail it prefers; sections are then rendered more compactly
+(outline -> volume summaries -> titles, world -> digest -> headline), largest first,
+until the view fits the agent's token budget (GENESIS_PROMPT_BUDGETS).
+"""
+import json
+import math
+from typing import Any, Callable, Dict, List, Tuple
+from app.core.config import settings
+from app.core.telemetry import metrics
+
+BLUEPRINT_TOKENS = metrics.counter(
+    "novel_genesis_blueprint_tokens_total",
+    "Estimated blueprint tokens per Genesis agent prompt: as sent (projected) and for the whole blueprint (full)",
+    ["agent", "type"]
+)
+
+# Blueprint keys behind each section
+SECTION_FIELDS = {
+    "concept": ("title", "genre", "theme"),
+    "skeleton": ("story_formula", "volume1_goal", "golden_finger_rules", "core_hook", "emotional_tone"),
+    "characters": ("characters",),
+    "world": ("world",),
+    "outline": ("outline",),
+    "first_chapter": ("first_chapter_title", "first_chapter_content"),
+}
+
+# Preferred detail per section; sections not listed are not shown to the agent.
+# The section an agent writes itself is listed last.
+AGENT_VIEWS = {
+    "router": {"concept": "full", "skeleton": "brief", "characters": "names", "world": "headline", "outline": "titles", "first_chapter": "title"},
+    "skeleton_agent": {"concept": "full", "skeleton": "full"},
+    "protagonist_agent": {"concept": "full", "skeleton": "full", "characters": "full"},
+    "world_agent": {"concept": "full", "skeleton": "full", "characters": "brief", "world": "full"},
+    "outline_agent": {"concept": "full", "skeleton": "full", "characters": "brief", "world": "digest", "outline": "full"},
+    "first_chapter_agent": {"concept": "full", "skeleton": "full", "characters": "full", "world": "digest", "outline": "volumes", "first_chapter": "full"},
+}
+AGENT_OUTPUTS = {
+    "skeleton_agent": "skeleton",
+    "protagonist_agent": "characters",
+    "world_agent": "world",
+    "outline_agent": "outline",
+    "first_chapter_agent": "first_chapter",
+}
+
+def estimate_tokens(text: str) -> int:
+    """Rough DeepSeek token count: about 0.6 per CJK character, 0.3 per other character."""
+    cjk = sum(1 for ch in text if "\u3000" <= ch <= "\u9fff" or "\uff00" <= ch <= "\uffef")
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+def _clip(value: Any, limit: int) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + "…"
+    return value
+
+def _label(item: Any, limit: int = 40) -> Any:
+    """A list item reduced to its name or title."""
+    if isinstance(item, dict):
+        for key in ("name", "title", "id"):
+            if item.get(key):
+                return _clip(item[key], limit)
+        return _clip(_dump(item), limit)
+    return _clip(item, limit)
+
+# --- Section renderings, most detailed first ----------------------------------------
+
+def _concept_full(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: data[key] for key in SECTION_FIELDS["concept"] if data.get(key)}
+
+def _skeleton_full(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: data[key] for key in SECTION_FIELDS["skeleton"] if data.get(key)}
+
+def _skeleton_brief(data: Dict[str, Any]) -> Dict[str, Any]:
+    brief = {key: _clip(value, 150) for key, value in _skeleton_full(data).items()}
+    if isinstance(brief.get("golden_finger_rules"), list):
+        brief["golden_finger_rules"] = [_clip(rule, 60) for rule in brief["golden_finger_rules"][:3]]
+    return brief
+
+def _characters_full(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"characters": data["characters"]} if data.get("characters") else {}
+
+def _characters_brief(data: Dict[str, Any]) -> Dict[str, Any]:
+    characters = [c for c in data.get("characters") or [] if isinstance(c, dict)]
+    if not characters:
+        return {}
+    return {"characters": [
+        {key: _clip(c[key], 60) for key in ("name", "role", "goal", "personality") if c.get(key)}
+        for c in characters
+    ]}
+
+def _characters_names(data: Dict[str, Any]) -> Dict[str, Any]:
+    characters = [c for c in data.get("characters") or [] if isinstance(c, dict)]
+    if not characters:
+        return {}
+    return {"characters": [f"{c.get('name', '')}({c.get('role', '')})" for c in characters]}
+
+def _world_full(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"world": data["world"]} if data.get("world") else {}
+
+def _world_digest(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Every world section kept, with short values: texts clipped, lists reduced to a few names."""
+    world = data.get("world")
+    if not isinstance(world, dict):
+        return _world_full(data)
+    digest: Dict[str, Any] = {}
+    for section, content in world.items():
+        if isinstance(content, dict):
+            compact = {}
+            for key, value in content.items():
+                if isinstance(value, list):
+                    value = [_label(item) for item in value[:5]]
+                elif isinstance(value, dict):
+                    value = _clip(_dump(value), 80)
+                else:
+                    value = _clip(value, 80)
+                if value not in (None, "", []):
+                    compact[key] = value
+            if compact:
+                digest[section] = compact
+        elif isinstance(content, list):
+            if content:
+                digest[section] = [_label(item) for item in content[:8]]
+        elif content:
+            digest[section] = _clip(content, 80)
+    return {"world": digest} if digest else {}
+
+def _world_headline(data: Dict[str, Any]) -> Dict[str, Any]:
+    world = data.get("world")
+    if not isinstance(world, dict):
+        return {}
+    headline: Dict[str, Any] = {}
+    macro = world.get("macro") if isinstance(world.get("macro"), dict) else {}
+    conflict = world.get("conflict") if isinstance(world.get("conflict"), dict) else {}
+    if macro.get("era"):
+        headline["era"] = _clip(macro["era"], 60)
+    if conflict.get("main_contradiction"):
+        headline["main_contradiction"] = _clip(conflict["main_contradiction"], 60)
+    filled = [section for section, content in world.items() if content not in (None, "", [], {})]
+    if filled:
+        headline["sections"] = filled
+    return {"world": headline} if headline else {}
+
+def _volumes(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [v for v in data.get("outline") or [] if isinstance(v, dict)]
+
+def _outline_full(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"outline": data["outline"]} if data.get("outline") else {}
+
+def _outline_volumes(data: Dict[str, Any]) -> Dict[str, Any]:
+    volumes = _volumes(data)
+    if not volumes:
+        return {}
+    return {"outline": [
+        {
+            "title": v.get("title", ""),
+            "summary": _clip(v.get("summary", ""), 200),
+            "chapters": [_label(c) for c in v.get("chapters") or []]
+        }
+        for v in volumes
+    ]}
+
+def _outline_titles(data: Dict[str, Any]) -> Dict[str, Any]:
+    volumes = _volumes(data)
+    if not volumes:
+        return {}
+    return {"outline": [
+        {"title": v.get("title", ""), "summary": _clip(v.get("summary", ""), 60), "chapter_count": len(v.get("chapters") or [])}
+        for v in volumes
+    ]}
+
+def _first_chapter_full(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: data[key] for key in SECTION_FIELDS["first_chapter"] if data.get(key)}
+
+def _first_chapter_excerpt(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: _clip(value, 600) for key, value in _first_chapter_full(data).items()}
+
+def _first_chapter_title(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"first_chapter_title": data["first_chapter_title"]} if data.get("first_chapter_title") else {}
+
+Renderer = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+LEVELS: Dict[str, List[Tuple[str, Renderer]]] = {
+    "concept": [("full", _concept_full)],
+    "skeleton": [("full", _skeleton_full), ("brief", _skeleton_brief)],
+    "characters": [("full", _characters_full), ("brief", _characters_brief), ("names", _characters_names)],
+    "world": [("full", _world_full), ("digest", _world_digest), ("headline", _world_headline)],
+    "outline": [("full", _outline_full), ("volumes", _outline_volumes), ("titles", _outline_titles)],
+    "first_chapter": [("full", _first_chapter_full), ("excerpt", _first_chapter_excerpt), ("title", _first_chapter_title)],
+}
+
+def input_fields(agent: str) -> Tuple[str, ...]:
+    """Blueprint keys an agent's output depends on: its view, minus the section it writes."""
+    own = AGENT_OUTPUTS.get(agent)
+    return tuple(
+        field
+        for section in AGENT_VIEWS.get(agent, {}) if section != own
+        for field in SECTION_FIELDS[section]
+    )
+
+def project_blueprint(current_data: Dict[str, Any], agent: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    (blueprint JSON for the prompt, stats). Starting from the agent's preferred detail,
+    the section costing the most tokens is stepped down one level at a time until the
+    view fits the budget or nothing can be shortened further. The section the agent
+    writes is never shortened: its answer replaces that section, so anything clipped
+    from the prompt would be lost; the view is reported over_budget instead.
+    """
+    view = AGENT_VIEWS[agent]
+    own = AGENT_OUTPUTS.get(agent)
+    budget = settings.GENESIS_PROMPT_BUDGETS.get(agent)
+    levels = {section: [name for name, _ in LEVELS[section]].index(level) for section, level in view.items()}
+
+    def render(section: str) -> Dict[str, Any]:
+        return LEVELS[section][levels[section]][1](current_data)
+
+    rendered = {section: render(section) for section in view}
+    sizes = {section: estimate_tokens(_dump(part)) for section, part in rendered.items()}
+    while budget is not None and sum(sizes.values()) > budget:
+        shorter = [s for s in view if s != own and levels[s] + 1 < len(LEVELS[s]) and sizes[s] > 0]
+        if not shorter:
+            break
+        section = max(shorter, key=lambda s: sizes[s])
+        levels[section] += 1
+        rendered[section] = render(section)
+        sizes[section] = estimate_tokens(_dump(rendered[section]))
+
+    projection: Dict[str, Any] = {}
+    for section in view:
+        projection.update(rendered[section])
+    text = _dump(projection)
+    full_tokens = estimate_tokens(_dump(current_data))
+    projected_tokens = estimate_tokens(text)
+    BLUEPRINT_TOKENS.inc(full_tokens, agent=agent, type="full")
+    BLUEPRINT_TOKENS.inc(projected_tokens, agent=agent, type="projected")
+    return text, {
+        "full_tokens": full_tokens,
+        "projected_tokens": projected_tokens,
+        "saved_tokens": max(0, full_tokens - projected_tokens),
+        "budget": budget,
+        "over_budget": budget is not None and projected_tokens > budget,
+        "levels": {section: LEVELS[section][levels[section]][0] for section in view if rendered[section]}
+    }
+
+def savings_report(stats_by_agent: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Per-run totals for the agents that called the LLM. Latency saved is an estimate:
+    tokens not sent divided by the provider's prefill rate (GENESIS_PREFILL_TOKENS_PER_SECOND).
+    """
+    full = sum(s["full_tokens"] for s in stats_by_agent.values())
+    projected = sum(s["projected_tokens"] for s in stats_by_agent.values())
+    saved = sum(s["saved_tokens"] for s in stats_by_agent.values())
+    return {
+        "agents": stats_by_agent,
+        "full_tokens": full,
+        "projected_tokens": projected,
+        "saved_tokens": saved,
+        "saved_ratio": round(saved / full, 3) if full else 0.0,
+        "agent_seconds": round(sum(s.get("elapsed_seconds", 0.0) for s in stats_by_agent.values()), 3),
+        "estimated_latency_saved_seconds": round(saved / settings.GENESIS_PREFILL_TOKENS_PER_SECOND, 2)
+    }
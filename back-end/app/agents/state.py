@@ -10,6 +10,14 @@ class GenesisState(TypedDict):
     target_agents: list
     agent_outputs: Annotated[Dict[str, Any], merge_dicts]
     final_response: str
+
+    # Memoization (see nodes.memoized)
+    draft_id: str
+    node_cache: Dict[str, Any]  # node -> {fingerprint, intent, outputs}, loaded before the run
+    cache_hits: Annotated[list, operator.add]  # Nodes that reused their cached output
+
+    # Prompt projection stats per agent that called the LLM (see projection.project_blueprint)
+    projection: Annotated[Dict[str, Any], merge_dicts]
     
     # Skeleton fields
     story_formula: str
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Novel Writing Assistant"
@@ -22,6 +22,83 @@ class Settings(BaseSettings):
     # External Services
     TAVILY_API_KEY: Optional[str] = None
 
+    # Streaming Generations
+    GENERATION_TTL_SECONDS: int = 3600 # Abandoned generations are purged after this
+    GENERATION_FLUSH_CHARS: int = 400
+    GENERATION_FLUSH_INTERVAL_SECONDS: float = 2.0
+    GENERATION_GC_INTERVAL_SECONDS: int = 300
+    GENERATION_DETACH_GRACE_SECONDS: float = 30.0 # Upstream is cancelled if no client reattaches in time
+    DRAFT_MAX_PER_REQUEST: int = 4
+    DRAFT_MAX_CONCURRENT: int = 8 # Draft LLM streams running at once on this worker; the rest wait for a slot
+
+    # Retrieval
+    CONTEXT_TYPE_QUOTAS: Dict[str, int] = {"character": 5, "event": 3, "location": 2, "faction": 2, "world_setting": 2}
+    CONTEXT_MAX_QUERIES: int = 8
+    CONTEXT_GRAPH_EXPAND_LIMIT: int = 5 # Entities added next to retrieval hits via relationship edges (0 disables)
+
+    # Project Metadata
+    META_PATCH_MAX_OPS: int = 100
+
+    # Structured LLM Output
+    STRUCTURED_OUTPUT_JSON_MODE: bool = True # Request response_format=json_object; disable for providers without it
+    STRUCTURED_OUTPUT_REPAIR_ROUNDS: int = 1 # Field-level re-asks before invalid list items are dropped
+
+    # Genesis Wizard
+    GENESIS_CACHE_TTL_SECONDS: int = 7 * 24 * 3600 # Cached agent outputs of a draft are dropped after this idle time
+    GENESIS_CHECKPOINT_ENABLED: bool = True # Checkpoint /genesis/unified runs in Postgres so they can be resumed
+    GENESIS_CHECKPOINT_POOL_SIZE: int = 4
+    GENESIS_RUN_TTL_SECONDS: int = 24 * 3600 # Checkpoints of a run are dropped after this idle time
+    GENESIS_RUN_LEASE_SECONDS: int = 600 # A run "running" this long without finishing a node is taken as crashed and may be resumed
+    GENESIS_GC_INTERVAL_SECONDS: int = 3600 # Purging expired draft caches and run checkpoints; 0 disables
+    GENESIS_PROMPT_BUDGETS: Dict[str, int] = { # Blueprint tokens per agent prompt; larger sections are summarized to fit
+        "router": 800,
+        "skeleton_agent": 1000,
+        "protagonist_agent": 2500,
+        "world_agent": 3000,
+        "outline_agent": 3500,
+        "first_chapter_agent": 3500
+    }
+    GENESIS_PREFILL_TOKENS_PER_SECOND: float = 2000 # Provider prompt processing rate, for the latency saved estimate
+
+    # Chapter Analysis on Save
+    ANALYSIS_DEBOUNCE_SECONDS: float = 3.0 # Saves within this window are analyzed once, on the latest content
+    ANALYSIS_SUPERSEDE_POLL_SECONDS: float = 2.0 # How often a running analysis checks for a newer save
+    ANALYSIS_WAIT_TIMEOUT_SECONDS: float = 300.0 # PUT /chapters/{id} stops waiting for the report after this
+
+    # Entity History Compaction
+    COMPACTION_INTERVAL_SECONDS: int = 21600 # 0 disables the background job
+    COMPACTION_COLD_HORIZON_CHAPTERS: int = 50 # Superseded versions older than this move to the archive
+    COMPACTION_EMBEDDING_MODE: str = "quantize" # quantize (halfvec) or drop, for archived embeddings
+    COMPACTION_BATCH_SIZE: int = 500
+
+    # Payload Queries
+    PAYLOAD_QUERY_MAX_FILTERS: int = 10
+    PAYLOAD_INDEX_TUNE_INTERVAL_SECONDS: int = 3600 # 0 disables automatic expression index tuning
+    PAYLOAD_INDEX_MIN_QUERIES: float = 50 # Decayed equality-filter count a path needs to get an index
+    PAYLOAD_INDEX_MAX: int = 8 # Managed expression indexes on entity_versions
+
+    # World Snapshots
+    SNAPSHOT_CACHE_SIZE: int = 256 # Cached (project, chapter, types, epoch) snapshots per worker
+    SNAPSHOT_CACHE_MAX_ENTITIES: int = 5000 # Larger snapshots are streamed but not cached
+
+    # Project Export/Import
+    TRANSFER_BATCH_ROWS: int = 500 # Rows per archive frame and per cursor fetch
+    TRANSFER_FRAME_BYTES: int = 4 * 1024 * 1024
+    TRANSFER_RETENTION_SECONDS: int = 3600 # Finished transfer progress is kept this long
+
+    # Manuscript Ingestion
+    INGEST_CONCURRENCY: int = 6 # Chapters analyzed in parallel; results are still applied in order
+    INGEST_FALLBACK_CHAPTER_CHARS: int = 4000 # Chunk size when a manuscript has no chapter headings
+
+    # Chat Sessions
+    CHAT_RECENT_MESSAGES: int = 8 # Sent verbatim; older turns are represented by the rolling summary
+    CHAT_SUMMARY_BATCH: int = 6 # Summarize once this many messages are waiting beyond the recent window
+    CHAT_SUMMARY_MAX_CHARS: int = 800
+
+    # Observability
+    OTLP_ENDPOINT: Optional[str] = None # e.g. http://localhost:4318/v1/traces; requires opentelemetry-sdk
+    OTEL_SERVICE_NAME: str = "novel-assist-backend"
+
     class Config:
         env_file = ".env"
         case_sensitive = True
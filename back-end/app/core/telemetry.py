@@ -0,0 +1,312 @@
+"""
+Lightweight instrumentation shared by routers, services and agents.
+
+Stage timings are kept as Prometheus-style histograms and rendered at /metrics.
+When OTLP_ENDPOINT is configured and the OpenTelemetry SDK is installed, every
+span is additionally exported over OTLP. Trace context is carried in a contextvar
+and can be handed to subprocesses (e.g. the MCP server) as a W3C traceparent.
+"""
+import contextvars
+import functools
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {} # bucket counts..., +Inf, sum
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', str(bound)))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        if name not in self._metrics:
+            self._metrics[name] = cls(name, *args, **kwargs)
+        return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """Register a callable that renders already-formatted exposition lines at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f"# collector failed: {_escape(str(e))}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+STAGE_DURATION = metrics.histogram(
+    "novel_stage_duration_seconds",
+    "Duration of instrumented pipeline stages",
+    ["stage", "name", "status"]
+)
+
+# --- Trace context -------------------------------------------------------------
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+_span_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("span_id", default=None)
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Parse a W3C traceparent header into (trace_id, parent_span_id)."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+def set_trace_context(traceparent: Optional[str]) -> str:
+    """Adopt an incoming traceparent, or start a new trace. Returns the trace id."""
+    parsed = parse_traceparent(traceparent)
+    trace_id, span_id = parsed if parsed else (secrets.token_hex(16), secrets.token_hex(8))
+    _trace_id.set(trace_id)
+    _span_id.set(span_id)
+    if parsed and _otel_tracer is not None:
+        from opentelemetry import context as otel_context, trace as otel_trace
+        remote = otel_trace.SpanContext(
+            trace_id=int(trace_id, 16),
+            span_id=int(span_id, 16),
+            is_remote=True,
+            trace_flags=otel_trace.TraceFlags(otel_trace.TraceFlags.SAMPLED)
+        )
+        otel_context.attach(otel_trace.set_span_in_context(otel_trace.NonRecordingSpan(remote)))
+    return trace_id
+
+def current_traceparent() -> str:
+    """W3C traceparent for the current span, for propagation to subprocesses and upstream calls."""
+    if _otel_tracer is not None:
+        from opentelemetry import trace as otel_trace
+        ctx = otel_trace.get_current_span().get_span_context()
+        if ctx.is_valid:
+            return f"00-{ctx.trace_id:032x}-{ctx.span_id:016x}-{ctx.trace_flags:02x}"
+    trace_id = _trace_id.get() or set_trace_context(None)
+    return f"00-{trace_id}-{_span_id.get()}-01"
+
+# --- Optional OTLP export ------------------------------------------------------
+
+_otel_tracer = None
+
+def _init_otlp():
+    global _otel_tracer
+    if not settings.OTLP_ENDPOINT:
+        return
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        print("⚠️  OTLP_ENDPOINT is set but opentelemetry-sdk / opentelemetry-exporter-otlp are not installed")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": settings.OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.OTLP_ENDPOINT)))
+    otel_trace.set_tracer_provider(provider)
+    _otel_tracer = otel_trace.get_tracer("novel-assist")
+
+_init_otlp()
+
+# --- Spans ---------------------------------------------------------------------
+
+class Span:
+    """
+    Handle yielded by `span()` so callers can attach attributes discovered mid-flight.
+    `name` and `status` may be overridden before the span closes (e.g. once the route is known).
+    """
+    def __init__(self, name: str, otel_span=None):
+        self.name = name
+        self.status: Optional[str] = None
+        self.attributes: Dict[str, object] = {}
+        self._otel_span = otel_span
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, value)
+
+@contextmanager
+def span(stage: str, name: str, **attributes) -> Iterator[Span]:
+    """
+    Time a pipeline stage. Usable from sync and async code:
+
+        with span("rag", "retrieve_context", chapter=12):
+            ...
+    """
+    if _trace_id.get() is None:
+        set_trace_context(None)
+    token = _span_id.set(secrets.token_hex(8))
+    otel_cm = _otel_tracer.start_as_current_span(f"{stage}.{name}", attributes=attributes) if _otel_tracer else None
+    handle = Span(name, otel_cm.__enter__() if otel_cm else None)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield handle
+    except BaseException as e:
+        status = "cancelled" if type(e).__name__ in ("CancelledError", "GeneratorExit") else "error"
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage=stage, name=handle.name, status=handle.status or status)
+        if otel_cm:
+            if handle.name != name:
+                handle._otel_span.update_name(f"{stage}.{handle.name}")
+            otel_cm.__exit__(None, None, None)
+        try:
+            _span_id.reset(token)
+        except ValueError:
+            # Async generators may be finalized from a different context
+            pass
+
+def traced(stage: str, name: Optional[str] = None):
+    """Decorator form of `span()` for async functions."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(stage, span_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def traceparent_env() -> Dict[str, str]:
+    """Environment variables that carry the current trace into a child process."""
+    env = {"TRACEPARENT": current_traceparent()}
+    if settings.OTLP_ENDPOINT:
+        env["OTEL_EXPORTER_OTLP_ENDPOINT"] = settings.OTLP_ENDPOINT
+    return env
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every request by route template.
+    Unlike BaseHTTPMiddleware it does not interfere with streaming bodies or
+    disconnect detection, and the timing covers the full streamed response.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(b"traceparent")
+        set_trace_context(incoming.decode("latin-1") if incoming else None)
+        status_code = {"value": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code["value"] = message["status"]
+            await send(message)
+
+        with span("http", "unmatched") as handle:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                handle.name = f"{scope['method']} {getattr(route, 'path', 'unmatched')}"
+                handle.status = str(status_code["value"])
@@ -1,6 +1,10 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
+from app.core.telemetry import metrics
+from typing import Dict, Any
+import time
 
 engine = create_async_engine(settings.DATABASE_URL, echo=True)
 
@@ -18,3 +22,91 @@ async def get_db():
             yield session
         finally:
             await session.close()
+
+class PoolMonitor:
+    """
+    Tracks pool occupancy and how long each connection stays checked out.
+    Long holds point at sessions kept open across non-database work (e.g. LLM streaming).
+    """
+    HOLD_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.hold_seconds_total = 0.0
+        self.hold_seconds_max = 0.0
+        self.hold_buckets = [0] * (len(self.HOLD_BUCKETS) + 1) # Last bucket is +Inf
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.monotonic()
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is None:
+            return
+        held = time.monotonic() - checked_out_at
+        self.checked_out -= 1
+        self.hold_seconds_total += held
+        self.hold_seconds_max = max(self.hold_seconds_max, held)
+        for i, bound in enumerate(self.HOLD_BUCKETS):
+            if held <= bound:
+                self.hold_buckets[i] += 1
+                break
+        else:
+            self.hold_buckets[-1] += 1
+
+    def reset_peak(self):
+        """Restart peak tracking from the current occupancy (used between benchmark scenarios)."""
+        self.peak_checked_out = self.checked_out
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = engine.sync_engine.pool
+        return {
+            "pool_size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": self.checked_out,
+            "peak_checked_out": self.peak_checked_out,
+            "checkouts": self.checkouts,
+            "hold_seconds_avg": self.hold_seconds_total / self.checkouts if self.checkouts else 0.0,
+            "hold_seconds_max": self.hold_seconds_max,
+            "hold_seconds_buckets": {
+                **{f"le_{bound}": count for bound, count in zip(self.HOLD_BUCKETS, self.hold_buckets)},
+                "le_inf": self.hold_buckets[-1]
+            }
+        }
+
+    def prometheus_lines(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP novel_db_pool_checked_out Connections currently checked out of the pool",
+            "# TYPE novel_db_pool_checked_out gauge",
+            f"novel_db_pool_checked_out {snapshot['checked_out']}",
+            "# HELP novel_db_pool_checked_out_peak Highest number of simultaneously checked out connections",
+            "# TYPE novel_db_pool_checked_out_peak gauge",
+            f"novel_db_pool_checked_out_peak {snapshot['peak_checked_out']}",
+            "# HELP novel_db_connection_hold_seconds How long connections stay checked out",
+            "# TYPE novel_db_connection_hold_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(self.HOLD_BUCKETS, self.hold_buckets):
+            cumulative += count
+            lines.append(f'novel_db_connection_hold_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'novel_db_connection_hold_seconds_bucket{{le="+Inf"}} {cumulative + self.hold_buckets[-1]}')
+        lines.append(f"novel_db_connection_hold_seconds_count {self.checkouts - self.checked_out}")
+        lines.append(f"novel_db_connection_hold_seconds_sum {self.hold_seconds_total}")
+        return lines
+
+pool_monitor = PoolMonitor()
+metrics.register_collector(pool_monitor.prometheus_lines)
+event.listen(engine.sync_engine, "checkout", pool_monitor.on_checkout)
+event.listen(engine.sync_engine, "checkin", pool_monitor.on_checkin)
+
+DB_STATEMENTS = metrics.counter("novel_db_statements_total", "SQL statements sent to the database")
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    DB_STATEMENTS.inc()
+
+event.listen(engine.sync_engine, "before_cursor_execute", _count_statement)
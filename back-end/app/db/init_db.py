@@ -1,6 +1,6 @@
 import asyncio
 from app.db.database import engine, Base
-from app.db.models import Project, Chapter, EntityVersion
+from app.db.models import Project, Chapter, EntityVersion, EntityVersionArchive, EntityEdge, EntityEdgeArchive, StoryEvent, PayloadQueryStat, GenesisNodeCache, GenesisRun, Generation, IngestionJob, ChatSession, ChatMessage
 from sqlalchemy import text
 
 async def init_models():
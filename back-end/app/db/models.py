@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime, func
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import Column, Integer, SmallInteger, String, Boolean, ForeignKey, Text, DateTime, Float, LargeBinary, Index, func
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.orm import relationship, Mapped, mapped_column
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import Vector, HALFVEC
 from .database import Base
 import uuid
 
@@ -12,22 +12,28 @@ class Project(Base):
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     meta_info = Column(JSONB, default={})
+    meta_revision = Column(Integer, nullable=False, default=0, server_default="0") # Bumped on every meta_info write
+    entity_epoch = Column(Integer, nullable=False, default=0, server_default="0") # Bumped on every entity version write
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    chapters = relationship("Chapter", back_populates="project", cascade="all, delete-orphan")
-    entity_versions = relationship("EntityVersion", back_populates="project", cascade="all, delete-orphan")
+    # Rows are removed by ON DELETE CASCADE; passive_deletes keeps the ORM from loading them first
+    chapters = relationship("Chapter", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
+    entity_versions = relationship("EntityVersion", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
 
 class Chapter(Base):
     __tablename__ = "chapters"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"), nullable=False)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
     chapter_number = Column(Integer, nullable=False)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=True)
     summary = Column(Text, nullable=True)
     detailed_outline = Column(Text, nullable=True) # Added for chapter-level outline
+    content_revision = Column(Integer, nullable=False, default=0, server_default="0") # Bumped on every content write
+    analyzed_revision = Column(Integer, nullable=True) # Revision the current summary/entities/events came from
+    analysis_report = Column(JSONB, nullable=True) # Outcome of the last analysis run
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -37,7 +43,7 @@ class EntityVersion(Base):
     __tablename__ = "entity_versions"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"), nullable=False)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
     entity_type = Column(String, nullable=False) # character, location, item, etc.
     entity_id = Column(String, nullable=False) # Logical ID, e.g., "char_elin"
     version = Column(Integer, nullable=False)
@@ -55,5 +61,234 @@ class EntityVersion(Base):
 
     project = relationship("Project", back_populates="entity_versions")
 
+    __table_args__ = (
+        # Serves "state at chapter N" (DISTINCT ON entity, newest version first) without touching the heap for filtering
+        Index(
+            "ix_entity_versions_temporal",
+            "project_id", "entity_type", "entity_id", version.desc(),
+            postgresql_include=["valid_from_chapter", "valid_to_chapter"]
+        ),
+        # Containment (@>) and JSON path (@?, @@) filters on payload fields
+        Index("ix_entity_versions_payload", "payload_json", postgresql_using="gin", postgresql_ops={"payload_json": "jsonb_path_ops"}),
+    )
+
     def __repr__(self):
         return f"<EntityVersion(entity_id={self.entity_id}, version={self.version}, valid={self.valid_from_chapter}-{self.valid_to_chapter})>"
+
+class EntityVersionArchive(Base):
+    """
+    Cold storage for entity versions removed from entity_versions by compaction.
+    Payloads are zlib-compressed JSON; embeddings are half precision (halfvec, 2 bytes per
+    dimension), so cold rows are ranked in SQL like live ones. Rows with reason='cold' are
+    still served by time-travel reads for deep-history chapters.
+    """
+    __tablename__ = "entity_versions_archive"
+
+    id = Column(UUID(as_uuid=True), primary_key=True) # Same id as the original version
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    entity_type = Column(String, nullable=False)
+    entity_id = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    valid_from_chapter = Column(Integer, nullable=False)
+    valid_to_chapter = Column(Integer, nullable=True)
+    reason = Column(String, nullable=False) # invisible, merged, cold
+    payload_zlib = Column(LargeBinary, nullable=False)
+    embedding_half = mapped_column(HALFVEC(1536), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=True) # Of the original version
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_entity_versions_archive_temporal", "project_id", "reason", "valid_from_chapter", "valid_to_chapter"),
+    )
+
+class EntityEdge(Base):
+    """
+    A typed relationship between two entities, derived from the payload of `source_version_id`
+    (character relationships, event participants/witnesses, location_id/faction_id).
+    An edge is visible at chapter N exactly when its source version is, and is deleted with it;
+    when compaction moves the version to cold storage, its edges move to entity_edges_archive.
+    """
+    __tablename__ = "entity_edges"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    source_version_id = Column(UUID(as_uuid=True), ForeignKey("entity_versions.id", ondelete="CASCADE"), nullable=False, index=True)
+    src_type = Column(String, nullable=False)
+    src_id = Column(String, nullable=False)
+    dst_type = Column(String, nullable=False)
+    dst_id = Column(String, nullable=False)
+    relation = Column(String, nullable=False) # relationship, participant, witness, located_at, member_of
+    label = Column(Text, nullable=True) # e.g. "师父" for relationships
+
+    __table_args__ = (
+        # One lookup per hop in each direction
+        Index("ix_entity_edges_src", "project_id", "src_type", "src_id"),
+        Index("ix_entity_edges_dst", "project_id", "dst_type", "dst_id"),
+    )
+
+class EntityEdgeArchive(Base):
+    """Edges of versions archived as cold, still followed by graph reads for deep-history chapters."""
+    __tablename__ = "entity_edges_archive"
+
+    id = Column(UUID(as_uuid=True), primary_key=True) # Same id as the original edge
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    source_version_id = Column(UUID(as_uuid=True), ForeignKey("entity_versions_archive.id", ondelete="CASCADE"), nullable=False, index=True)
+    src_type = Column(String, nullable=False)
+    src_id = Column(String, nullable=False)
+    dst_type = Column(String, nullable=False)
+    dst_id = Column(String, nullable=False)
+    relation = Column(String, nullable=False)
+    label = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_entity_edges_archive_src", "project_id", "src_type", "src_id"),
+        Index("ix_entity_edges_archive_dst", "project_id", "dst_type", "dst_id"),
+    )
+
+class StoryEvent(Base):
+    """
+    Timeline of story events with typed, indexed columns. Written alongside the event's
+    EntityVersion (which keeps serving retrieval and world snapshots), so timeline queries
+    never have to parse payload_json.
+    """
+    __tablename__ = "story_events"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    event_id = Column(String, nullable=False) # Same logical id as the event entity, e.g. "evt_1a2b3c4d"
+    chapter = Column(Integer, nullable=False) # occurred_at_chapter
+    title = Column(String, nullable=True)
+    description = Column(Text, nullable=True)
+    participants = Column(ARRAY(String), nullable=False, default=list)
+    witnesses = Column(ARRAY(String), nullable=False, default=list)
+    location_id = Column(String, nullable=True)
+    significance = Column(SmallInteger, nullable=True) # 3 high, 2 medium, 1 low
+    tags = Column(ARRAY(String), nullable=False, default=list)
+    payload_json = Column(JSONB, nullable=False)
+    embedding = mapped_column(Vector(1536))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_story_events_project_event", "project_id", "event_id", unique=True),
+        Index("ix_story_events_chapter_significance", "project_id", "chapter", "significance"),
+        Index("ix_story_events_location", "project_id", "location_id"),
+        Index("ix_story_events_participants", "participants", postgresql_using="gin"),
+        Index("ix_story_events_witnesses", "witnesses", postgresql_using="gin"),
+    )
+
+class PayloadQueryStat(Base):
+    """
+    How often each payload path is filtered on by equality. PayloadQueryService builds
+    expression indexes (ix_evp_*) for the most used paths; counts decay on every tuning run.
+    """
+    __tablename__ = "payload_query_stats"
+
+    path = Column(String, primary_key=True) # Dotted payload path, e.g. "location_id" or "stats.realm"
+    query_count = Column(Float, nullable=False, default=0)
+    last_queried_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GenesisNodeCache(Base):
+    """
+    Last output of each Genesis agent for a wizard draft, with the fingerprints of the
+    blueprint slice (`fingerprint`) and user input (`intent`) it was generated from.
+    Agents whose slice is unchanged reuse it instead of calling the LLM again.
+    """
+    __tablename__ = "genesis_node_cache"
+
+    draft_id = Column(String, primary_key=True) # Client-chosen id of the wizard draft
+    node = Column(String, primary_key=True) # Graph node, e.g. world_agent
+    fingerprint = Column(String, nullable=False)
+    intent = Column(String, nullable=False)
+    outputs_json = Column(JSONB, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
+class GenesisRun(Base):
+    """
+    A /genesis/unified run. Its graph state is checkpointed by LangGraph under thread_id = id,
+    so an interrupted run resumes after the last completed node; this row tracks expiry.
+    """
+    __tablename__ = "genesis_runs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    draft_id = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="running") # running, completed, failed, interrupted
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
+class Generation(Base):
+    __tablename__ = "generations"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=True, index=True) # Chat generations may have no project
+    kind = Column(String, nullable=False) # chapter, chat
+    status = Column(String, nullable=False, default="running") # running, completed, failed, cancelled
+    content = Column(Text, nullable=False, default="") # Appended incrementally while streaming
+    context_json = Column(JSONB, nullable=True) # Context summary sent ahead of the text
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<Generation(id={self.id}, kind={self.kind}, status={self.status})>"
+
+class IngestionJob(Base):
+    """
+    Bulk manuscript ingestion. Chapters are created up front; analysis results are applied
+    strictly in chapter order and `applied_through` records progress, so a job interrupted
+    by a crash or restart resumes from the first chapter not yet applied.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="running") # running, completed, failed
+    source_name = Column(String, nullable=True)
+    run_analysis = Column(Boolean, nullable=False, default=True)
+    first_chapter = Column(Integer, nullable=False)
+    last_chapter = Column(Integer, nullable=False)
+    applied_through = Column(Integer, nullable=False) # Last chapter number whose analysis is applied
+    stats = Column(JSONB, nullable=False, default={})
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<IngestionJob(id={self.id}, status={self.status}, applied={self.applied_through}/{self.last_chapter})>"
+
+class ChatSession(Base):
+    """
+    Server-side copilot conversation. Messages up to `summarized_through` are folded into
+    `summary`; `context_cache` holds the project context block built for `context_key`.
+    """
+    __tablename__ = "chat_sessions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=True, index=True)
+    title = Column(String, nullable=True)
+    current_chapter = Column(Integer, nullable=False, default=1)
+    message_count = Column(Integer, nullable=False, default=0) # Also the last allocated message seq
+    summary = Column(Text, nullable=True)
+    summarized_through = Column(Integer, nullable=False, default=0)
+    context_cache = Column(Text, nullable=True)
+    context_key = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", passive_deletes=True, order_by="ChatMessage.seq")
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    session_id = Column(UUID(as_uuid=True), ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String, nullable=False) # user, assistant
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    session = relationship("ChatSession", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_chat_messages_session_seq", "session_id", "seq", unique=True),
+    )
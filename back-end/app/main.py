@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.telemetry import MetricsMiddleware
 from app.routers import inspiration, entities, chat, genesis
 
 app = FastAPI(
@@ -15,15 +16,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Generation-Id", "X-Transfer-Id", "ETag"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(inspiration.router, prefix=f"{settings.API_V1_STR}", tags=["inspiration"])
 app.include_router(entities.router, prefix=f"{settings.API_V1_STR}", tags=["entities"])
 app.include_router(chat.router, prefix=f"{settings.API_V1_STR}/chat", tags=["chat"])
 app.include_router(genesis.router, prefix=f"{settings.API_V1_STR}/genesis", tags=["genesis"])
-from app.routers import projects, chapters
+from app.routers import projects, chapters, generations, system, ingestion
 app.include_router(projects.router, prefix=f"{settings.API_V1_STR}", tags=["projects"])
 app.include_router(chapters.router, prefix=f"{settings.API_V1_STR}", tags=["chapters"])
+app.include_router(generations.router, prefix=f"{settings.API_V1_STR}", tags=["generations"])
+app.include_router(ingestion.router, prefix=f"{settings.API_V1_STR}", tags=["ingestion"])
+app.include_router(system.router, prefix=f"{settings.API_V1_STR}", tags=["system"])
+app.include_router(system.metrics_router, tags=["system"])
+
+@app.on_event("startup")
+async def start_background_jobs():
+    from app.services.generation_service import generation_service
+    from app.services.compaction_service import compaction_service
+    from app.services.ingestion_service import ingestion_service
+    from app.services.payload_query_service import payload_query_service
+    from app.services.genesis_cache_service import genesis_cache_service
+    from app.services.genesis_checkpoint_service import genesis_checkpoint_service
+    generation_service.start_gc()
+    compaction_service.start_background()
+    payload_query_service.start_background()
+    genesis_cache_service.start_background()
+    genesis_checkpoint_service.start_background()
+    await ingestion_service.resume_pending()
 
 @app.get("/")
 async def root():
@@ -1,13 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.db.database import get_db
+from app.db.database import get_db, AsyncSessionLocal
 from app.db.models import Chapter
-from pydantic import BaseModel
-from typing import Optional, Any
+from pydantic import BaseModel, Field
+from typing import Optional, Any, List, Literal
 import uuid
-import json
 
 router = APIRouter()
 
@@ -40,8 +39,21 @@ async def get_chapter(chapter_id: uuid.UUID, db: AsyncSession = Depends(get_db))
     return chapter
 
 @router.put("/chapters/{chapter_id}")
-async def update_chapter(chapter_id: uuid.UUID, update_data: ChapterUpdate, db: AsyncSession = Depends(get_db)):
+async def update_chapter(
+    chapter_id: uuid.UUID,
+    update_data: ChapterUpdate,
+    wait_analysis: bool = True,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Save a chapter. Content is committed right away; analysis (summary, entities, events,
+    outline sync) runs debounced and single-flight per chapter, always on the latest content.
+    With wait_analysis (the default) the response carries the report of this save's analysis,
+    or marks it superseded when a newer save took over. Autosave should pass wait_analysis=false.
+    """
     import time
+    from app.core.config import settings
+    from app.services.chapter_analysis_service import chapter_analysis_service
     start_time = time.time()
     execution_steps = []
     
@@ -61,201 +73,47 @@ async def update_chapter(chapter_id: uuid.UUID, update_data: ChapterUpdate, db:
         chapter.title = update_data.title
     if update_data.content is not None:
         chapter.content = update_data.content
+        # Atomic in SQL, so concurrent saves on any worker get distinct revisions
+        chapter.content_revision = Chapter.content_revision + 1
     if update_data.summary is not None:
         chapter.summary = update_data.summary
     if update_data.detailed_outline is not None:
         chapter.detailed_outline = update_data.detailed_outline
-    
-    
-    # Step 1: Content Save (mark as queued, will commit at the end)
+
+    await db.commit()
+    await db.refresh(chapter)
+    # The refresh opened a transaction; end it so the pooled connection is not held
+    # idle in transaction while the analysis (LLM calls) is awaited below
+    await db.commit()
     execution_steps.append({
         "step": "content_save",
         "status": "success",
         "message": "章节内容已保存"
     })
-    
-    # Perform Analysis & RAG Update if needed
+
     if should_analyze:
-        try:
-            from app.services.analysis_service import analysis_service
-            from app.services.rag_service import rag_service
-            
-            print(f"🔍 Analyzing chapter {chapter.chapter_number}...")
-            
-            # Step 2: Summary & Entity Extraction
-            try:
-                summary, entity_updates = await analysis_service.analyze_chapter_content(chapter.content)
-                
-                entities_updated = 0
-                if summary:
-                    chapter.summary = summary
-                    print(f"✅ Summary updated.")
-                
-                if entity_updates:
-                    print(f"🔄 Updating {len(entity_updates)} entities...")
-                    for entity in entity_updates:
-                        await rag_service.upsert_entity_version(
-                            db,
-                            project_id=chapter.project_id,
-                            entity_type=entity.get('entity_type', 'unknown'),
-                            entity_id=entity.get('entity_id', 'unknown'),
-                            payload=entity.get('payload', {}),
-                            current_chapter=chapter.chapter_number
-                        )
-                        entities_updated += 1
-                
+        revision = chapter.content_revision
+        task = chapter_analysis_service.schedule(chapter.id, revision)
+        if wait_analysis:
+            report = await chapter_analysis_service.wait(task, revision, settings.ANALYSIS_WAIT_TIMEOUT_SECONDS)
+            if report["status"] in ("completed", "failed"):
+                execution_steps.extend(report["steps"])
+            else:
                 execution_steps.append({
                     "step": "analysis",
-                    "status": "success",
-                    "message": "自动分析完成",
-                    "details": {
-                        "summary_generated": bool(summary),
-                        "entities_updated": entities_updated
-                    }
-                })
-            except Exception as e:
-                print(f"❌ Analysis failed: {e}")
-                execution_steps.append({
-                    "step": "analysis",
-                    "status": "failed",
-                    "message": f"分析失败: {str(e)}"
-                })
-            
-            # Step 3: Event Extraction & Knowledge Propagation
-            try:
-                print(f"📅 Extracting events...")
-                events = await analysis_service.extract_events(chapter.content, chapter.chapter_number)
-                
-                events_extracted = 0
-                characters_notified = 0
-                
-                if events:
-                    print(f"Found {len(events)} events.")
-                    events_extracted = len(events)
-                    
-                    # Hard Reset: Delete old events for this chapter to ensure consistency
-                    # We need a method in rag_service or just do it here.
-                    # Let's add delete_events_for_chapter in rag_service later, for now do it manually or via rag_service
-                    # Actually, let's implement a helper in rag_service for this.
-                    await rag_service.delete_events_for_chapter(db, chapter.project_id, chapter.chapter_number)
-                    
-                    for event_data in events:
-                        # Create Event Entity
-                        event_id = f"evt_{uuid.uuid4().hex[:8]}"
-                        await rag_service.upsert_entity_version(
-                            db,
-                            project_id=chapter.project_id,
-                            entity_type="event",
-                            entity_id=event_id,
-                            payload=event_data,
-                            current_chapter=chapter.chapter_number
-                        )
-                        
-                        # Propagate Knowledge to Witnesses
-                        witnesses = event_data.get('witnesses', [])
-                        for char_id in witnesses:
-                            # Get current version of character
-                            # We need to be careful not to create infinite loops or excessive versions
-                            # For MVP, we fetch the character, update known_events, and upsert
-                            
-                            # Find character (we need a way to get by ID)
-                            # rag_service.retrieve_context is for similarity search.
-                            # We need get_entity_by_id.
-                            # Let's add get_latest_entity_version to rag_service.
-                            char_entity = await rag_service.get_latest_entity_version(
-                                db, chapter.project_id, "character", char_id
-                            )
-                            
-                            if char_entity:
-                                current_payload = char_entity.payload_json.copy()
-                                known_events = current_payload.get('known_events', [])
-                                if event_id not in known_events:
-                                    known_events.append(event_id)
-                                    current_payload['known_events'] = known_events
-                                    
-                                    await rag_service.upsert_entity_version(
-                                        db,
-                                        project_id=chapter.project_id,
-                                        entity_type="character",
-                                        entity_id=char_id,
-                                        payload=current_payload,
-                                        current_chapter=chapter.chapter_number
-                                    )
-                                    characters_notified += 1
-                                    print(f"  -> Updated knowledge for {char_id}")
-
-                execution_steps.append({
-                    "step": "events",
-                    "status": "success",
-                    "message": "事件提取完成",
-                    "details": {
-                        "events_extracted": events_extracted,
-                        "characters_notified": characters_notified
-                    }
-                })
-            except Exception as e:
-                print(f"❌ Event extraction failed: {e}")
-                execution_steps.append({
-                    "step": "events",
-                    "status": "failed",
-                    "message": f"事件提取失败: {str(e)}"
+                    "status": report["status"],
+                    "message": "已有更新的保存，分析将基于最新内容进行" if report["status"] == "superseded" else "分析仍在进行中"
                 })
-
-            print(f"✅ Analysis complete.")
-            
-            # Step 4: Outline Synchronization
-            print(f"📋 Checking outline synchronization...")
-            outline_sync_result = None
-            try:
-                from app.services.outline_service import outline_service
-                
-                outline_sync_result = await outline_service.sync_outline_after_chapter_save(
-                    db,
-                    chapter.project_id,
-                    chapter.chapter_number,
-                    chapter.content
-                )
-                
-                if outline_sync_result and outline_sync_result.get('sync_performed'):
-                    print(f"  ✅ Outline synced: {outline_sync_result.get('subsequent_updated', 0)} subsequent chapters updated")
-                    execution_steps.append({
-                        "step": "outline_sync",
-                        "status": "success",
-                        "message": "大纲同步完成",
-                        "details": {
-                            "deviation_level": outline_sync_result.get('deviation_level', 'none'),
-                            "subsequent_updated": outline_sync_result.get('subsequent_updated', 0),
-                            "analysis": outline_sync_result.get('analysis', '')
-                        }
-                    })
-                else:
-                    print(f"  ℹ️  No outline sync needed")
-                    execution_steps.append({
-                        "step": "outline_sync",
-                        "status": "success",
-                        "message": "无需同步大纲"
-                    })
-                    
-            except Exception as e:
-                print(f"  ⚠️  Outline sync failed: {e}")
-                import traceback
-                traceback.print_exc()
-                execution_steps.append({
-                    "step": "outline_sync",
-                    "status": "failed",
-                    "message": f"大纲同步失败: {str(e)}"
-                })
-                
-        except Exception as e:
-            print(f"❌ Analysis failed: {e}")
-            import traceback
-            traceback.print_exc()
-            pass
-
-
-    # Final commit after all modifications
-    await db.commit()
-    await db.refresh(chapter)
+            # Re-read the analyzed row (summary) in a short session of its own
+            async with AsyncSessionLocal() as read_db:
+                chapter = await read_db.get(Chapter, chapter.id) or chapter
+        else:
+            execution_steps.append({
+                "step": "analysis",
+                "status": "queued",
+                "message": "分析已排队，将基于最新内容进行",
+                "details": {"revision": revision}
+            })
     
     # Calculate total duration
     total_duration_ms = int((time.time() - start_time) * 1000)
@@ -269,6 +127,8 @@ async def update_chapter(chapter_id: uuid.UUID, update_data: ChapterUpdate, db:
         "content": chapter.content,
         "summary": chapter.summary,
         "detailed_outline": chapter.detailed_outline,
+        "content_revision": chapter.content_revision,
+        "analyzed_revision": chapter.analyzed_revision,
 
         "created_at": chapter.created_at,
         "updated_at": chapter.updated_at,
@@ -280,92 +140,183 @@ async def update_chapter(chapter_id: uuid.UUID, update_data: ChapterUpdate, db:
     
     return chapter_dict
 
+@router.get("/chapters/{chapter_id}/analysis")
+async def get_chapter_analysis(chapter_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """Whether the chapter's derived data (summary, entities, events) is up to date with its content."""
+    from app.services.chapter_analysis_service import chapter_analysis_service
+    result = await db.execute(
+        select(Chapter.content_revision, Chapter.analyzed_revision, Chapter.analysis_report).where(Chapter.id == chapter_id)
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    return {
+        "chapter_id": str(chapter_id),
+        "content_revision": row.content_revision,
+        "analyzed_revision": row.analyzed_revision,
+        "up_to_date": row.analyzed_revision == row.content_revision,
+        "running_here": chapter_analysis_service.is_running(chapter_id),
+        "report": row.analysis_report
+    }
+
+class DraftVariant(BaseModel):
+    temperature: Optional[float] = Field(None, ge=0, le=2)
+    instructions: Optional[str] = None # Appended to the shared instructions for this draft only
+
 class GenerateChapterRequest(BaseModel):
     project_id: uuid.UUID
     instructions: str
     previous_chapter_id: Optional[uuid.UUID] = None
+    stream_format: Literal["text", "ndjson", "sse"] = "text" # ndjson/sse carry generation offsets
+    n: int = Field(1, ge=1) # Number of alternative drafts; more than one is always streamed as NDJSON
+    variants: Optional[List[DraftVariant]] = None # Per-draft overrides; its length sets n when given
 
 @router.post("/chapters/generate")
-async def generate_chapter(request: GenerateChapterRequest, db: AsyncSession = Depends(get_db)):
-    """Generate content for the next chapter based on instructions, with rich context."""
+async def generate_chapter(request: GenerateChapterRequest, http_request: Request):
+    """
+    Generate content for the next chapter based on instructions, with rich context.
+    With n > 1 (or variants) the context is assembled once and N drafts run concurrently,
+    multiplexed over one NDJSON stream; losing drafts can be stopped early
+    with POST /generations/{id}/cancel.
+    """
+    from app.core.config import settings
     from app.services.llm_service import llm_service
     from app.services.rag_service import rag_service
-    from app.db.models import Project
-    
-    # 1. Fetch project info
-    result = await db.execute(select(Project).where(Project.id == request.project_id))
-    project = result.scalars().first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-        
-    # 2. Determine current chapter number (for context validity)
-    # If we have previous chapter, next is prev + 1. If not, assume 1.
+    from app.services.embedding_service import embedding_service
+    from app.services.generation_service import generation_service, STREAM_MEDIA_TYPES
+    from app.services.stream_guard import guard_stream
+    from app.services.snapshot_service import snapshot_service
+    from app.services.graph_service import graph_service
+    from app.services.prompt_builder import canonical_json, chapter_layout, record_prefix
+    from app.db.database import AsyncSessionLocal
+    from app.db.models import Project, EntityVersion
+
+    variants = request.variants or [DraftVariant() for _ in range(request.n)]
+    if not variants or len(variants) > settings.DRAFT_MAX_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {settings.DRAFT_MAX_PER_REQUEST} drafts per request")
+
+    # Embed the instructions before touching the database so the embedding
+    # request does not run while a pooled connection is checked out
+    query_embedding = None
+    try:
+        query_embedding = await embedding_service.get_embedding(request.instructions)
+    except Exception as e:
+        print(f"Instruction embedding failed: {e}")
+
+    # Context is fetched in a short-lived session that is closed before streaming
+    # starts, so no connection is held for the 30-90s of token streaming
     next_chapter_num = 1
     prev_chapter = None
+    relevant_entities = []
+    async with AsyncSessionLocal() as db:
+        # 1. Fetch project info
+        result = await db.execute(select(Project).where(Project.id == request.project_id))
+        project = result.scalars().first()
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        # 2. Determine current chapter number (for context validity)
+        # If we have previous chapter, next is prev + 1. If not, assume 1.
+        if request.previous_chapter_id:
+            prev_result = await db.execute(select(Chapter).where(Chapter.id == request.previous_chapter_id))
+            prev_chapter = prev_result.scalars().first()
+            if prev_chapter:
+                next_chapter_num = prev_chapter.chapter_number + 1
+
+        # 3. RAG Retrieval (Characters & World & Events)
+        # Retrieve entities valid for the NEXT chapter, with a quota per type so
+        # events cannot crowd out characters (or the other way round)
+        if query_embedding is not None:
+            try:
+                grouped = await rag_service.retrieve_batch(
+                    db,
+                    request.project_id,
+                    [request.instructions],
+                    next_chapter_num,
+                    settings.CONTEXT_TYPE_QUOTAS,
+                    query_embeddings=[query_embedding]
+                )
+                relevant_entities = [hit["version"] for hits in grouped.values() for hit in hits]
+                # Pull in whoever is directly connected to the retrieved characters and events
+                # (relationships, participants, locations) with one graph query
+                if settings.CONTEXT_GRAPH_EXPAND_LIMIT and relevant_entities:
+                    seeds = [(e.entity_type, e.entity_id) for e in relevant_entities if e.entity_type in ("character", "event")]
+                    present = {(e.entity_type, e.entity_id) for e in relevant_entities}
+                    try:
+                        # A savepoint, so a failure here keeps the hits already loaded
+                        async with db.begin_nested():
+                            expanded = await graph_service.expand(
+                                db, request.project_id, seeds, next_chapter_num,
+                                max_hops=1, limit=settings.CONTEXT_GRAPH_EXPAND_LIMIT + len(present)
+                            )
+                        relevant_entities += [
+                            version for _, version in expanded if (version.entity_type, version.entity_id) not in present
+                        ][:settings.CONTEXT_GRAPH_EXPAND_LIMIT]
+                    except Exception as e:
+                        print(f"Graph expansion failed: {e}")
+            except Exception as e:
+                print(f"RAG retrieval failed: {e}")
+                await db.rollback()
+
+        # Without a query embedding (or if retrieval failed), fall back to the world
+        # state at this chapter so the draft still knows who and where everyone is
+        if not relevant_entities:
+            try:
+                snapshot = await snapshot_service.get_snapshot(db, request.project_id, next_chapter_num)
+                relevant_entities = [
+                    EntityVersion(entity_type=e["entity_type"], entity_id=e["entity_id"], payload_json=e["payload"])
+                    for e in (snapshot or {}).get("entities", []) if e["entity_type"] != "event"
+                ][:10]
+            except Exception as e:
+                print(f"World snapshot fallback failed: {e}")
+
     prev_content_tail = ""
     prev_summary = "无"
+    if prev_chapter:
+        # Use summary + tail
+        prev_summary = prev_chapter.summary or "暂无概要"
+        if prev_chapter.content:
+            prev_content_tail = prev_chapter.content[-500:]
 
-    if request.previous_chapter_id:
-        prev_result = await db.execute(select(Chapter).where(Chapter.id == request.previous_chapter_id))
-        prev_chapter = prev_result.scalars().first()
-        if prev_chapter:
-            next_chapter_num = prev_chapter.chapter_number + 1
-            # Use summary + tail
-            prev_summary = prev_chapter.summary or "暂无概要"
-            if prev_chapter.content:
-                prev_content_tail = prev_chapter.content[-500:]
-            
-    # 3. RAG Retrieval (Characters & World & Events)
-    # Retrieve entities valid for the NEXT chapter
     rag_context = ""
-    try:
-        # Retrieve general context based on instructions
-        relevant_entities = await rag_service.retrieve_context(
-            db, 
-            request.project_id, 
-            query=request.instructions, 
-            current_chapter=next_chapter_num,
-            limit=10 
-        )
-        
-        if relevant_entities:
-            rag_context = "【相关角色与世界观】\n"
-            
-            # Separate events and other entities
-            events = []
-            others = []
-            
-            for entity in relevant_entities:
-                if entity.entity_type == 'event':
-                    events.append(entity)
-                else:
-                    others.append(entity)
-            
-            for entity in others:
-                payload_str = json.dumps(entity.payload_json, ensure_ascii=False)
-                rag_context += f"- [{entity.entity_type}] {entity.entity_id}: {payload_str}\n"
-
-            # Process Events (Known vs Unknown)
-            # For now, we don't strictly enforce POV filtering in the prompt construction 
-            # because we haven't determined the POV character dynamically yet.
-            # But we can list them as "Recent Events"
-            if events:
-                rag_context += "\n【相关历史事件】\n"
-                for event in events:
-                    payload = event.payload_json
-                    rag_context += f"- [Event] {payload.get('title')}: {payload.get('description')} (发生于第{payload.get('occurred_at_chapter')}章)\n"
-                    
-    except Exception as e:
-        print(f"RAG retrieval failed: {e}")
+    events = []
+    others = []
+    if relevant_entities:
+        rag_context = "【相关角色与世界观】\n"
+
+        # Separate events and other entities
+        for entity in relevant_entities:
+            if entity.entity_type == 'event':
+                events.append(entity)
+            else:
+                others.append(entity)
+
+        # Sorted and canonically rendered, so the same hits always produce the same text
+        others.sort(key=lambda e: (e.entity_type, e.entity_id))
+        for entity in others:
+            payload_str = canonical_json(entity.payload_json)
+            rag_context += f"- [{entity.entity_type}] {entity.entity_id}: {payload_str}\n"
+
+        # Process Events (Known vs Unknown)
+        # For now, we don't strictly enforce POV filtering in the prompt construction 
+        # because we haven't determined the POV character dynamically yet.
+        # But we can list them as "Recent Events"
+        if events:
+            rag_context += "\n【相关历史事件】\n"
+            events.sort(key=lambda e: (e.payload_json.get('occurred_at_chapter') or 0, e.entity_id))
+            for event in events:
+                payload = event.payload_json
+                rag_context += f"- [Event] {payload.get('title')}: {payload.get('description')} (发生于第{payload.get('occurred_at_chapter')}章)\n"
 
     # 4. Smart Outline Extraction
     outline_context = ""
     meta = project.meta_info or {}
     full_outline = meta.get('outline', [])
+    flat_chapters = []
+    start_idx = end_idx = 0
     
     if full_outline:
         # Flatten outline to find current position
-        flat_chapters = []
         for v_idx, vol in enumerate(full_outline):
             vol_title = vol.get('title', f'第{v_idx+1}卷')
             for c_idx, ch in enumerate(vol.get('chapters', [])):
@@ -398,98 +349,79 @@ async def generate_chapter(request: GenerateChapterRequest, db: AsyncSession = D
             marker = " (当前)" if i == target_idx else ""
             outline_context += f"- {item['ch_title']}: {item['summary']}{marker}\n"
 
-    # 5. Construct Prompt with Smart Priority Handling
+    # 5. Construct Prompt: stable prefix first so the provider's context cache can serve it
     has_user_instructions = request.instructions and len(request.instructions.strip()) > 0
+    layout = chapter_layout(meta, outline_context, prev_summary, prev_content_tail, rag_context, request.instructions)
+    prefix_fingerprint = record_prefix("chapter", layout.prefix())
+
+    def draft_messages(variant: DraftVariant):
+        # Variant instructions go last so all drafts share everything before them
+        tail = layout.tail()
+        if variant.instructions and variant.instructions.strip():
+            tail += f"\n\n【本稿侧重】\n{variant.instructions.strip()}"
+        return [
+            {"role": "system", "content": layout.prefix()},
+            {"role": "user", "content": tail + "\n\n请开始创作："}
+        ]
     
-    if has_user_instructions:
-        # User provided specific instructions - prioritize them
-        instruction_context = f"""【用户创作指令】
-{request.instructions}
-
-【优先级规则】
-- 用户创作指令 > 大纲建议
-- 如果用户指令与大纲有微小冲突（如改变场景细节、增加配角对话），请自然融合两者
-- 如果有重大冲突（如改变关键剧情走向），以用户指令为准，但请设法为后续章节留下回旋余地，保持故事整体连贯性"""
-    else:
-        # No user instructions - follow outline strictly
-        instruction_context = """【创作模式】
-严格按照大纲继续创作。无特殊指示，请根据大纲中本章的计划内容进行创作。"""
-    
-    system_prompt = """你是一位专业的小说创作者。请根据用户提供的项目背景、大纲脉络、相关设定以及上一章概要，创作下一章的内容。
-
-要求：
-1. **剧情承接**：紧密衔接上一章的结尾和概要。
-2. **设定一致**：严格遵守提供的角色和世界观设定。
-3. **指令遵循**：遵循创作指令和优先级规则（见下方）。
-4. **格式规范**：输出内容必须包含章节标题和正文。
-
-格式：
-# 章节标题
-正文内容..."""
-
-    user_prompt = f"""【项目背景】
-类型: {meta.get('genre', '未定')}
-主题: {meta.get('theme', '')}
-
-{outline_context}
-
-{rag_context}
-
-【上一章概要】
-{prev_summary}
-
-【上一章结尾】
-{prev_content_tail}
-
-{instruction_context}
-
-请开始创作："""
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt}
-    ]
-    
-    # 6. Generate Content (Streaming)
     # 6. Generate Content (Streaming)
-    async def generate_stream():
-        import json
-        
-        # Send context summary first
-        # We need to safely access variables from the outer scope
-        rag_chars = [e.entity_id for e in others] if 'others' in locals() else []
-        rag_events = [e.payload_json.get('title', 'Unknown Event') for e in events] if 'events' in locals() else []
-        
-        outline_chapters = []
-        if 'flat_chapters' in locals() and 'start_idx' in locals() and 'end_idx' in locals():
-            outline_chapters = [item['ch_title'] for item in flat_chapters[start_idx:end_idx]]
-            
-        context_summary = {
-            "type": "context_summary",
-            "data": {
-                "outline": {
-                    "summary": "完整大纲" if full_outline else "无大纲",
-                    "surrounding_chapters": outline_chapters
-                },
-                "rag": {
-                    "characters": rag_chars,
-                    "events": rag_events,
-                },
-                "prev_chapter": {
-                    "summary": prev_summary[:100] + "..." if prev_summary else "无"
-                },
-                "instructions": {
-                    "type": "用户指令" if has_user_instructions else "大纲模式",
-                    "content": request.instructions if has_user_instructions else "严格遵循大纲"
-                }
-            }
+    # The context summary is sent ahead of the text so the client can show what was used
+    outline_chapters = [item['ch_title'] for item in flat_chapters[start_idx:end_idx]]
+    context_summary = {
+        "outline": {
+            "summary": "完整大纲" if full_outline else "无大纲",
+            "surrounding_chapters": outline_chapters
+        },
+        "rag": {
+            "characters": [e.entity_id for e in others],
+            "events": [e.payload_json.get('title', 'Unknown Event') for e in events],
+        },
+        "prev_chapter": {
+            "summary": prev_summary[:100] + "..." if prev_summary else "无"
+        },
+        "instructions": {
+            "type": "用户指令" if has_user_instructions else "大纲模式",
+            "content": request.instructions if has_user_instructions else "严格遵循大纲"
+        },
+        "prompt_prefix": prefix_fingerprint
+    }
+
+    if len(variants) > 1:
+        # Each draft is its own resumable generation, queued behind the global draft cap
+        generations = []
+        for i, variant in enumerate(variants):
+            generations.append(await generation_service.start(
+                generation_service.gated(
+                    llm_service.generate_text(draft_messages(variant), stream=True, kind="chapter", temperature=variant.temperature)
+                ),
+                kind="chapter",
+                project_id=request.project_id,
+                context={**context_summary, "draft": {"index": i, **variant.model_dump()}}
+            ))
+        header = {
+            "context_summary": context_summary,
+            "variants": [v.model_dump() for v in variants]
         }
-        yield json.dumps(context_summary, ensure_ascii=False) + "\n"
+        return StreamingResponse(
+            guard_stream(http_request, generation_service.stream_many([g.id for g in generations], header=header), kind="chapter_drafts"),
+            media_type=STREAM_MEDIA_TYPES["ndjson"],
+            headers={"X-Generation-Id": ",".join(str(g.id) for g in generations)}
+        )
 
-        async for chunk in llm_service.generate_text(messages, stream=True):
-            yield chunk
+    # Run as a resumable generation: a dropped client can reconnect via /generations/{id}/stream
+    variant = variants[0]
+    generation = await generation_service.start(
+        llm_service.generate_text(draft_messages(variant), stream=True, kind="chapter", temperature=variant.temperature),
+        kind="chapter",
+        project_id=request.project_id,
+        context=context_summary
+    )
 
-    return StreamingResponse(generate_stream(), media_type="text/plain")
+    return StreamingResponse(
+        guard_stream(http_request, generation_service.stream(generation.id, fmt=request.stream_format), kind="chapter"),
+        media_type=STREAM_MEDIA_TYPES.get(request.stream_format, "text/plain"),
+        headers={"X-Generation-Id": str(generation.id)}
+    )
 
 class CreateChapterRequest(BaseModel):
     title: str
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.db.database import get_db
-from app.db.models import Project, Chapter
+from app.db.database import AsyncSessionLocal, get_db
+from app.db.models import Project, ChatSession, ChatMessage
 from app.services.llm_service import llm_service
+from app.services.embedding_service import embedding_service
+from app.services.generation_service import generation_service, STREAM_MEDIA_TYPES
+from app.services.stream_guard import guard_stream
+from app.services.chat_service import (
+    chat_session_service, build_outline_block, build_rag_block, recent_outline_chapters,
+    build_recent_outlines_block, rag_query_for, attach_context, session_to_dict, message_to_dict,
+    CHAT_PROMPT_CHARS
+)
 import uuid
 
 router = APIRouter()
@@ -15,136 +23,144 @@ class ChatGenerateRequest(BaseModel):
     messages: List[Dict[str, str]]
     context_data: str
     current_chapter: int
-    project_id: Optional[str] = None # Added project_id
+    project_id: Optional[uuid.UUID] = None # Malformed ids are rejected with 422 by validation
+    stream_format: Literal["text", "ndjson", "sse"] = "text" # ndjson/sse carry generation offsets
 
 @router.post("/generate")
-async def generate_chat(request: ChatGenerateRequest, db: AsyncSession = Depends(get_db)):
+async def generate_chat(request: ChatGenerateRequest, http_request: Request):
+    """
+    Stateless chat: the client sends the whole history every turn.
+    Prefer /chat/sessions for long conversations.
+    """
     # 1. Fetch Global Outline & Detailed Outlines if project_id is provided
     outline_context = ""
-    if request.project_id:
-        try:
-            # Fetch Project Global Outline
-            project_result = await db.execute(select(Project).where(Project.id == uuid.UUID(request.project_id)))
+    rag_context = ""
+    project_id = request.project_id
+    if project_id:
+        # Embed the RAG query up front so the embedding request does not run
+        # while the session holds a pooled connection
+        rag_query = ""
+        rag_query_embedding = None
+        if request.current_chapter != 1:
+            last_msg = request.messages[-1]['content'] if request.messages else ""
+            rag_query = rag_query_for(request.current_chapter, last_msg, request.context_data)
+            try:
+                rag_query_embedding = await embedding_service.get_embedding(rag_query)
+            except Exception as e:
+                print(f"RAG query embedding failed: {e}")
+
+        # Context is fetched in a short-lived session that is closed before streaming starts
+        async with AsyncSessionLocal() as db:
+            project_result = await db.execute(select(Project).where(Project.id == project_id))
             project = project_result.scalars().first()
-            
-            if project and project.meta_info:
-                # Always include Core Skeleton & Global Outline
-                story_formula = project.meta_info.get('story_formula', '')
-                global_outline = project.meta_info.get('outline', '暂无大纲')
-                
-                if story_formula:
-                    outline_context += f"【故事公式】\n{story_formula}\n\n"
-                
-                outline_context += f"【全书大纲】\n{global_outline}\n\n"
-
-                # Strategy: 
-                # Chapter 1: Dump full static world info (Legacy/Safe mode)
-                # Chapter > 1: Use RAG to retrieve relevant Characters & World info
-                
-                if request.current_chapter == 1:
-                    # --- Chapter 1: Full Static Context ---
-                    golden_finger_rules = project.meta_info.get('golden_finger_rules', [])
-                    world = project.meta_info.get('world', {})
-                    
-                    if golden_finger_rules:
-                        outline_context += "【金手指规则】\n" + "\n".join([f"{i+1}. {r}" for i, r in enumerate(golden_finger_rules)]) + "\n\n"
-                    
-                    if world:
-                        outline_context += "【世界观】\n"
-                        # Power System
-                        power = world.get('power_system', {})
-                        if power:
-                            outline_context += f"力量体系: {power.get('source', '')}\n"
-                            if power.get('levels'):
-                                outline_context += "境界: " + " → ".join([lv.get('name', '') for lv in power.get('levels', [])[:5]]) + "...\n"
-                        # Factions
-                        factions = world.get('factions', [])
-                        if factions:
-                            outline_context += "主要势力: " + ", ".join([f.get('name', '') for f in factions]) + "\n"
-                        # Rules
-                        rules = world.get('rules', {})
-                        if rules and rules.get('public_rules'):
-                            outline_context += "核心规则:\n" + "\n".join([f"  {i+1}. {r}" for i, r in enumerate(rules['public_rules'][:3])]) + "\n"
-                        outline_context += "\n"
-                        
-                    # Also dump characters for Chapter 1 if available (missing in original code)
-                    characters = project.meta_info.get('characters', [])
-                    if characters:
-                        outline_context += "【主要角色】\n"
-                        for char in characters[:5]: # Limit to top 5 to avoid overflow
-                            outline_context += f"- {char.get('name')}: {char.get('role', '')}, {char.get('personality', '')}\n"
-                        outline_context += "\n"
-
-                else:
-                    # --- Chapter > 1: RAG Retrieval ---
-                    from app.services.rag_service import rag_service
-                    
-                    # Construct Query from user messages and context
-                    last_msg = request.messages[-1]['content'] if request.messages else ""
-                    query = f"Chapter {request.current_chapter}. {last_msg}\nContext: {request.context_data[:300]}"
-                    
-                    try:
-                        rag_results = await rag_service.retrieve_context(
-                            db=db,
-                            project_id=uuid.UUID(request.project_id),
-                            query=query,
-                            current_chapter=request.current_chapter,
-                            limit=10 # Retrieve top 10 relevant entities
+            if not project:
+                raise HTTPException(status_code=404, detail="Project not found")
+            try:
+                if project.meta_info:
+                    outline_context += build_outline_block(project, request.current_chapter)
+                    if request.current_chapter != 1:
+                        rag_context = await build_rag_block(
+                            db, project_id, request.current_chapter, rag_query, rag_query_embedding
                         )
-                        
-                        if rag_results:
-                            outline_context += "【相关资料 (RAG检索)】\n"
-                            for node in rag_results:
-                                # Simplify payload for prompt
-                                payload_str = str(node.payload_json)
-                                if len(payload_str) > 300: payload_str = payload_str[:300] + "..."
-                                outline_context += f"- [{node.entity_type}] {node.entity_id}: {payload_str}\n"
-                            outline_context += "\n"
-                        else:
-                            outline_context += "【相关资料】\n(未检索到强相关资料，请基于大纲自由发挥)\n\n"
-                            
-                    except Exception as e:
-                        print(f"RAG Retrieval Error: {e}")
-                        outline_context += f"【系统提示】\n资料检索服务暂时不可用 ({str(e)})\n\n"
-
-            # Fetch Detailed Outlines (Current + Previous 2)
-            # Assuming chapters are ordered by chapter_number
-            chapters_result = await db.execute(
-                select(Chapter)
-                .where(Chapter.project_id == uuid.UUID(request.project_id))
-                .where(Chapter.chapter_number <= request.current_chapter)
-                .order_by(Chapter.chapter_number.desc())
-                .limit(3)
-            )
-            chapters = chapters_result.scalars().all()
-            
-            if chapters:
-                outline_context += "【近期章节细纲】\n"
-                # Reverse to show in chronological order
-                for chap in reversed(chapters):
-                    outline_context += f"第{chap.chapter_number}章细纲: {chap.detailed_outline or '暂无'}\n"
-                outline_context += "\n"
-                
-        except Exception as e:
-            print(f"Error fetching outline context: {e}")
-
-    # 2. Construct prompt with context
-    messages = request.messages.copy()
-    
-    full_context = f"{outline_context}Context Information:\n{request.context_data}\n\nUse this context to assist the user."
-    
-    system_context_msg = {
-        "role": "system",
-        "content": full_context
+
+                chapters = await recent_outline_chapters(db, project_id, request.current_chapter)
+                outline_context += build_recent_outlines_block(chapters)
+            except Exception as e:
+                print(f"Error fetching outline context: {e}")
+
+    # 2. Construct prompt: stable context first, per-turn retrieval and editor context last
+    messages = attach_context(request.messages, outline_context, rag_context, request.context_data)
+    CHAT_PROMPT_CHARS.observe(sum(len(m["content"]) for m in messages), mode="stateless")
+
+    # Run as a resumable generation: a dropped client can reconnect via /generations/{id}/stream
+    generation = await generation_service.start(
+        llm_service.generate_text(messages, stream=True, kind="chat"),
+        kind="chat",
+        project_id=project_id
+    )
+
+    return StreamingResponse(
+        guard_stream(http_request, generation_service.stream(generation.id, fmt=request.stream_format), kind="chat"),
+        media_type=STREAM_MEDIA_TYPES.get(request.stream_format, "text/event-stream"),
+        headers={"X-Generation-Id": str(generation.id)}
+    )
+
+# --- Server-side sessions ---------------------------------------------------------------
+
+class ChatSessionCreate(BaseModel):
+    project_id: Optional[uuid.UUID] = None
+    title: Optional[str] = None
+    current_chapter: int = 1
+
+class ChatTurnRequest(BaseModel):
+    content: str
+    context_data: str = "" # Editor context for this turn only; not stored
+    current_chapter: Optional[int] = None
+    stream_format: Literal["text", "ndjson", "sse"] = "text"
+
+@router.post("/sessions")
+async def create_chat_session(request: ChatSessionCreate, db: AsyncSession = Depends(get_db)):
+    if request.project_id and not await db.scalar(select(Project.id).where(Project.id == request.project_id)):
+        raise HTTPException(status_code=404, detail="Project not found")
+    session = ChatSession(project_id=request.project_id, title=request.title, current_chapter=request.current_chapter)
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+    return session_to_dict(session)
+
+@router.get("/sessions")
+async def list_chat_sessions(project_id: Optional[uuid.UUID] = None, db: AsyncSession = Depends(get_db)):
+    stmt = select(ChatSession).order_by(ChatSession.updated_at.desc())
+    if project_id:
+        stmt = stmt.where(ChatSession.project_id == project_id)
+    result = await db.execute(stmt)
+    return [session_to_dict(session) for session in result.scalars().all()]
+
+@router.get("/sessions/{session_id}")
+async def get_chat_session(session_id: uuid.UUID, limit: int = 50, before_seq: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """Session details with its latest `limit` messages (page back with `before_seq`)."""
+    session = await db.get(ChatSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    stmt = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    if before_seq is not None:
+        stmt = stmt.where(ChatMessage.seq < before_seq)
+    result = await db.execute(stmt.order_by(ChatMessage.seq.desc()).limit(limit))
+    return {
+        **session_to_dict(session),
+        "messages": [message_to_dict(message) for message in reversed(result.scalars().all())]
     }
-    
-    # Insert context at the beginning or after existing system prompt
-    if messages and messages[0]["role"] == "system":
-        messages[0]["content"] += f"\n\n{system_context_msg['content']}"
-    else:
-        messages.insert(0, system_context_msg)
+
+@router.delete("/sessions/{session_id}")
+async def delete_chat_session(session_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    session = await db.get(ChatSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    await db.delete(session)
+    await db.commit()
+    return {"message": "Chat session deleted successfully"}
+
+@router.post("/sessions/{session_id}/messages")
+async def send_chat_message(session_id: uuid.UUID, request: ChatTurnRequest, http_request: Request):
+    """
+    Send one user message. The server adds the cached project context, the rolling
+    summary and recent turns; the reply is stored when the generation completes.
+    """
+    turn = await chat_session_service.prepare_turn(
+        session_id, request.content, context_data=request.context_data, current_chapter=request.current_chapter
+    )
+    if turn is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    session, messages = turn
+
+    generation = await generation_service.start(
+        chat_session_service.record_reply(session_id, llm_service.generate_text(messages, stream=True, kind="chat")),
+        kind="chat",
+        project_id=session.project_id
+    )
 
     return StreamingResponse(
-        llm_service.generate_text(messages, stream=True),
-        media_type="text/event-stream"
+        guard_stream(http_request, generation_service.stream(generation.id, fmt=request.stream_format), kind="chat"),
+        media_type=STREAM_MEDIA_TYPES.get(request.stream_format, "text/event-stream"),
+        headers={"X-Generation-Id": str(generation.id)}
     )
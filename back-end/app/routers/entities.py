@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import get_db
 from app.services.rag_service import rag_service
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Literal
+import json
 import uuid
 
 router = APIRouter()
@@ -21,6 +23,12 @@ class ContextRetrieveRequest(BaseModel):
     current_chapter: int
     limit: int = 5
 
+class BatchRetrieveRequest(BaseModel):
+    project_id: uuid.UUID
+    queries: List[str] = Field(..., min_length=1)
+    current_chapter: int
+    quotas: Optional[Dict[str, int]] = None # entity_type -> max results, e.g. {"character": 5, "event": 3}
+
 @router.post("/entities/update")
 async def update_entity(
     request: EntityUpdateRequest,
@@ -66,6 +74,92 @@ async def retrieve_context(
         ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/context/retrieve/batch")
+async def retrieve_context_batch(
+    request: BatchRetrieveRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Several queries with per-type quotas in one call: the queries are embedded in one
+    request and answered by one SQL statement. Results are grouped by entity type and
+    deduplicated; `queries` lists the indexes of the queries that matched each entity.
+    """
+    from app.core.config import settings
+    from app.services.embedding_service import embedding_service
+
+    if len(request.queries) > settings.CONTEXT_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.CONTEXT_MAX_QUERIES} queries per request")
+    quotas = request.quotas if request.quotas is not None else settings.CONTEXT_TYPE_QUOTAS
+    try:
+        # Embedded before the session runs its first query, so no connection is held meanwhile
+        query_embeddings = await embedding_service.get_embeddings(request.queries)
+        grouped = await rag_service.retrieve_batch(
+            db,
+            request.project_id,
+            request.queries,
+            request.current_chapter,
+            quotas,
+            query_embeddings=query_embeddings
+        )
+        return {
+            "queries": request.queries,
+            "groups": {
+                entity_type: [
+                    {
+                        "entity_id": hit["version"].entity_id,
+                        "entity_type": hit["version"].entity_type,
+                        "version": hit["version"].version,
+                        "payload": hit["version"].payload_json,
+                        "valid_from": hit["version"].valid_from_chapter,
+                        "valid_to": hit["version"].valid_to_chapter,
+                        "distance": hit["distance"],
+                        "queries": hit["queries"]
+                    }
+                    for hit in hits
+                ]
+                for entity_type, hits in grouped.items()
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class PayloadFilterModel(BaseModel):
+    path: str # Dotted payload path, e.g. "location_id" or "stats.realm"
+    op: Literal["eq", "ne", "in", "contains", "exists", "lt", "lte", "gt", "gte"] = "eq"
+    value: Any = None
+
+class EntityQueryRequest(BaseModel):
+    entity_type: Optional[str] = None
+    chapter: Optional[int] = None # State at this chapter; current versions if omitted
+    filters: List[PayloadFilterModel] = Field(..., min_length=1)
+    limit: int = Field(100, ge=1, le=1000)
+
+@router.post("/projects/{project_id}/entities/query")
+async def query_entities(
+    project_id: uuid.UUID,
+    request: EntityQueryRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Entities whose payload matches every filter, e.g. characters whose location_id is
+    loc_ruins at chapter 40. Filtering happens in SQL on the payload indexes.
+    """
+    from app.services.payload_query_service import payload_query_service, InvalidPayloadQuery
+
+    try:
+        results = await payload_query_service.query(
+            db,
+            project_id,
+            [f.model_dump() for f in request.filters],
+            entity_type=request.entity_type,
+            chapter=request.chapter,
+            limit=request.limit
+        )
+    except InvalidPayloadQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"project_id": str(project_id), "chapter": request.chapter, "entities": results}
+
 class EntityDeleteRequest(BaseModel):
     project_id: uuid.UUID
     entity_type: str
@@ -86,3 +180,95 @@ async def delete_entity(
         return {"status": "success", "deleted_count": count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/projects/{project_id}/graph/neighbors")
+async def get_graph_neighbors(
+    project_id: uuid.UUID,
+    chapter: int,
+    seeds: List[str] = Query(..., description="entity_type:entity_id, e.g. character:char_linfan"),
+    hops: int = Query(1, ge=1, le=3),
+    relations: Optional[List[str]] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    """Entities connected to the seeds within `hops` edges, as the graph stood at `chapter`."""
+    from app.services.graph_service import graph_service
+
+    parsed = []
+    for seed in seeds:
+        entity_type, sep, entity_id = seed.partition(":")
+        if not sep or not entity_type or not entity_id:
+            raise HTTPException(status_code=400, detail=f"Invalid seed {seed!r}, expected entity_type:entity_id")
+        parsed.append((entity_type, entity_id))
+    neighbors = await graph_service.neighbors(db, project_id, parsed, chapter, hops, relations, limit)
+    return {"project_id": str(project_id), "chapter": chapter, "neighbors": neighbors}
+
+@router.get("/projects/{project_id}/timeline/events")
+async def get_timeline_events(
+    project_id: uuid.UUID,
+    entity: str = Query(..., description="Character or location id, e.g. char_linfan"),
+    role: Literal["any", "participant", "witness", "location"] = "any",
+    from_chapter: Optional[int] = None,
+    to_chapter: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Events involving an entity (as participant, witness or location) in chapter order."""
+    from app.services.timeline_service import timeline_service, event_to_dict
+
+    events = await timeline_service.involving(db, project_id, entity, from_chapter, to_chapter, role, limit)
+    return {"project_id": str(project_id), "entity": entity, "events": [event_to_dict(e) for e in events]}
+
+@router.get("/projects/{project_id}/timeline/significant")
+async def get_significant_events(
+    project_id: uuid.UUID,
+    before: int,
+    min_significance: Literal["low", "medium", "high"] = "high",
+    limit: int = Query(20, ge=1, le=200),
+    db: AsyncSession = Depends(get_db)
+):
+    """The most recent events of at least `min_significance` before chapter `before`, newest first."""
+    from app.services.timeline_service import timeline_service, event_to_dict
+
+    events = await timeline_service.significant_before(db, project_id, before, min_significance, limit)
+    return {"project_id": str(project_id), "before": before, "events": [event_to_dict(e) for e in events]}
+
+@router.get("/projects/{project_id}/world")
+async def get_world_snapshot(
+    project_id: uuid.UUID,
+    chapter: int,
+    types: Optional[List[str]] = Query(None),
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    State of every entity as of `chapter` (optionally filtered by type), one version per entity.
+    Use format=ndjson for large worlds: a header line, then one entity per line.
+    """
+    from app.services.snapshot_service import snapshot_service
+
+    if format == "json":
+        snapshot = await snapshot_service.get_snapshot(db, project_id, chapter, types)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        return snapshot
+
+    epoch = await snapshot_service.get_epoch(db, project_id)
+    if epoch is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    cached = snapshot_service.cached(project_id, chapter, types, epoch)
+
+    async def ndjson_stream():
+        from app.db.database import AsyncSessionLocal
+
+        yield json.dumps({"project_id": str(project_id), "chapter": chapter, "epoch": epoch}) + "\n"
+        if cached is not None:
+            for entity in cached:
+                yield json.dumps(entity, ensure_ascii=False) + "\n"
+            return
+        # The request-scoped session may be closed before the body is sent; stream from our own
+        async with AsyncSessionLocal() as stream_db:
+            async for entity in snapshot_service.iter_snapshot(stream_db, project_id, chapter, types):
+                yield json.dumps(entity, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional, Literal
+from app.services.generation_service import generation_service, STREAM_MEDIA_TYPES
+from app.services.stream_guard import guard_stream
+import uuid
+
+router = APIRouter()
+
+@router.get("/generations/{generation_id}")
+async def get_generation(generation_id: uuid.UUID):
+    status = await generation_service.get_status(generation_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+    return status
+
+@router.get("/generations/{generation_id}/stream")
+async def resume_generation(
+    generation_id: uuid.UUID,
+    http_request: Request,
+    offset: int = 0,
+    format: Literal["text", "ndjson", "sse"] = "text",
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Reconnect to a generation. Text already produced after `offset` is sent immediately,
+    then the live stream is tailed until the generation finishes.
+    SSE clients can rely on the Last-Event-ID header, which carries the offset.
+    """
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Offset must be non-negative")
+
+    status = await generation_service.get_status(generation_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+
+    return StreamingResponse(
+        guard_stream(http_request, generation_service.stream(generation_id, offset=offset, fmt=format), kind="resume"),
+        media_type=STREAM_MEDIA_TYPES.get(format, "text/plain"),
+        headers={"X-Generation-Id": str(generation_id)}
+    )
+
+@router.post("/generations/{generation_id}/cancel")
+async def cancel_generation(generation_id: uuid.UUID):
+    """Stop a running generation and its upstream LLM stream."""
+    if not generation_service.cancel(generation_id):
+        raise HTTPException(status_code=404, detail="No running generation with this id on this worker")
+    return {"status": "cancelled", "generation_id": str(generation_id)}
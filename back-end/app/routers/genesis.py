@@ -1,9 +1,13 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional
 from app.services.llm_service import llm_service
+from app.services.structured_output import generate_structured, StructuredOutputError
+from app.services.stream_guard import guard_stream, run_cancellable
 import json
+import uuid
+import anyio
 
 router = APIRouter()
 
@@ -27,13 +31,15 @@ class GenerateUnifiedRequest(BaseModel):
     user_input: str
     current_data: Dict[str, Any]
     inspiration_context: Optional[str] = ""
+    draft_id: Optional[str] = Field(None, max_length=128) # Agents reuse this draft's cached outputs; a new id is issued if omitted
+    resume_token: Optional[str] = None # From the {"type": "run"} line of an interrupted run
 
 class GenerateFirstChapterRequest(BaseModel):
     user_input: str
     current_data: Dict[str, Any]
 
 @router.post("/concept")
-async def generate_concept(request: GenerateConceptRequest):
+async def generate_concept(request: GenerateConceptRequest, http_request: Request):
     """Generate core concept (title, genre, theme) for a new project."""
     
     # Load system prompt from file
@@ -56,7 +62,7 @@ async def generate_concept(request: GenerateConceptRequest):
     ]
     
     return StreamingResponse(
-        llm_service.generate_text(messages, stream=True),
+        guard_stream(http_request, llm_service.generate_text(messages, stream=True), kind="genesis"),
         media_type="text/event-stream"
     )
 
@@ -65,7 +71,7 @@ class GenerateSkeletonRequest(BaseModel):
     inspiration_context: Optional[str] = ""
 
 @router.post("/skeleton")
-async def generate_skeleton(request: GenerateSkeletonRequest):
+async def generate_skeleton(request: GenerateSkeletonRequest, http_request: Request):
     """Generate project skeleton (formula, goal, rules)."""
     
     system_prompt = llm_service.load_prompt("genesis/skeleton.txt")
@@ -88,12 +94,12 @@ async def generate_skeleton(request: GenerateSkeletonRequest):
     ]
     
     return StreamingResponse(
-        llm_service.generate_text(messages, stream=True),
+        guard_stream(http_request, llm_service.generate_text(messages, stream=True), kind="genesis"),
         media_type="text/event-stream"
     )
 
 @router.post("/protagonist")
-async def generate_protagonist(request: GenerateProtagonistRequest):
+async def generate_protagonist(request: GenerateProtagonistRequest, http_request: Request):
     """Generate protagonist details based on established concept."""
     
     system_prompt = llm_service.load_prompt("genesis/protagonist.txt")
@@ -114,12 +120,12 @@ async def generate_protagonist(request: GenerateProtagonistRequest):
     ]
     
     return StreamingResponse(
-        llm_service.generate_text(messages, stream=True),
+        guard_stream(http_request, llm_service.generate_text(messages, stream=True), kind="genesis"),
         media_type="text/event-stream"
     )
 
 @router.post("/world")
-async def generate_world(request: GenerateWorldRequest):
+async def generate_world(request: GenerateWorldRequest, http_request: Request):
     """Generate world-building elements (power system, factions)."""
     
     system_prompt = llm_service.load_prompt("genesis/world.txt")
@@ -140,12 +146,12 @@ async def generate_world(request: GenerateWorldRequest):
     ]
     
     return StreamingResponse(
-        llm_service.generate_text(messages, stream=True),
+        guard_stream(http_request, llm_service.generate_text(messages, stream=True), kind="genesis"),
         media_type="text/event-stream"
     )
 
 @router.post("/outline")
-async def generate_outline(request: GenerateOutlineRequest):
+async def generate_outline(request: GenerateOutlineRequest, http_request: Request):
     """Generate full story outline with volume-chapter structure."""
     
     system_prompt = llm_service.load_prompt("genesis/outline.txt")
@@ -173,12 +179,12 @@ async def generate_outline(request: GenerateOutlineRequest):
     ]
     
     return StreamingResponse(
-        llm_service.generate_text(messages, stream=True),
+        guard_stream(http_request, llm_service.generate_text(messages, stream=True), kind="genesis"),
         media_type="text/event-stream"
     )
 
 @router.post("/first_chapter")
-async def generate_first_chapter(request: GenerateFirstChapterRequest):
+async def generate_first_chapter(request: GenerateFirstChapterRequest, http_request: Request):
     """Generate the first chapter based on all established project info."""
     
     system_prompt = llm_service.load_prompt("genesis/first_chapter.txt")
@@ -200,25 +206,23 @@ async def generate_first_chapter(request: GenerateFirstChapterRequest):
     ]
     
     return StreamingResponse(
-        llm_service.generate_text(messages, stream=True),
+        guard_stream(http_request, llm_service.generate_text(messages, stream=True), kind="genesis"),
         media_type="text/event-stream"
     )
 
 class SuggestTitleRequest(BaseModel):
     project_data: Dict[str, Any]
 
-def clean_json_string(text: str) -> str:
-    """Clean LLM response to ensure valid JSON."""
-    text = text.strip()
-    # Remove markdown code blocks if present
-    if text.startswith("```"):
-        text = text.split("\n", 1)[1] if "\n" in text else text
-        if text.endswith("```"):
-            text = text.rsplit("\n", 1)[0]
-    # Remove "json" language identifier if present
-    if text.startswith("json"):
-        text = text[4:].strip()
-    return text
+class TitleAnalysis(BaseModel):
+    core_elements: List[str] = Field(..., min_length=1)
+    selling_point_summary: str = ""
+    naming_direction: str = ""
+
+class SearchQueries(BaseModel):
+    queries: List[str] = Field(..., min_length=1)
+
+class TitleSuggestions(BaseModel):
+    suggestions: List[str] = Field(..., min_length=1)
 
 @router.post("/suggest_title")
 async def suggest_title(request: SuggestTitleRequest):
@@ -272,23 +276,18 @@ async def suggest_title(request: SuggestTitleRequest):
         {"role": "user", "content": analysis_user_prompt}
     ]
     
-    analysis_response = ""
-    async for chunk in llm_service.generate_text(analysis_messages, stream=False):
-        analysis_response += chunk
-        
     try:
-        cleaned_response = clean_json_string(analysis_response)
-        analysis_data = json.loads(cleaned_response)
-        core_elements = analysis_data.get("core_elements", [])
-        selling_point = analysis_data.get("selling_point_summary", "")
-        naming_direction = analysis_data.get("naming_direction", "")
+        analysis_data = await generate_structured(analysis_messages, TitleAnalysis, "title_analysis", kind="genesis")
+        core_elements = analysis_data.core_elements
+        selling_point = analysis_data.selling_point_summary
+        naming_direction = analysis_data.naming_direction
         
         print(f"Core Elements: {core_elements}")
         print(f"Selling Point: {selling_point}")
         print(f"Direction: {naming_direction}\n")
-    except Exception as e:
+    except StructuredOutputError as e:
         print(f"Analysis parsing failed: {e}")
-        print(f"Raw response: {analysis_response}")
+        print(f"Raw response: {e.raw}")
         core_elements = [genre, theme]
         selling_point = description
         naming_direction = "常规网文风格"
@@ -310,15 +309,10 @@ async def suggest_title(request: SuggestTitleRequest):
         {"role": "user", "content": query_gen_user_prompt}
     ]
     
-    query_response = ""
-    async for chunk in llm_service.generate_text(query_messages, stream=False):
-        query_response += chunk
-    
     try:
-        cleaned_query = clean_json_string(query_response)
-        query_data = json.loads(cleaned_query)
-        search_queries = query_data.get("queries", [])
-    except Exception as e:
+        query_data = await generate_structured(query_messages, SearchQueries, "title_search_queries", kind="genesis")
+        search_queries = query_data.queries
+    except StructuredOutputError as e:
         print(f"Query parsing failed: {e}")
         search_queries = [f"{genre} {core_elements[0]} 热门小说"]
 
@@ -376,94 +370,175 @@ async def suggest_title(request: SuggestTitleRequest):
         {"role": "user", "content": synthesis_user_prompt}
     ]
 
-    suggestions_text = ""
-    async for chunk in llm_service.generate_text(synthesis_messages, stream=False):
-        suggestions_text += chunk
-    
     try:
-        cleaned_suggestions = clean_json_string(suggestions_text)
-        suggestions_data = json.loads(cleaned_suggestions)
-        print(f"✅ Generated: {suggestions_data.get('suggestions', [])}")
-        return suggestions_data
-    except Exception as e:
+        suggestions_data = await generate_structured(synthesis_messages, TitleSuggestions, "title_suggestions", kind="genesis")
+        print(f"✅ Generated: {suggestions_data.suggestions}")
+        return suggestions_data.model_dump()
+    except StructuredOutputError as e:
         print(f"Synthesis parsing failed: {e}")
-        print(f"Raw text: {suggestions_text}")
+        print(f"Raw text: {e.raw}")
         return {"suggestions": ["数据解析失败，请重试"]}
 
+def _partial_data(current_outputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Agent outputs in the shape the wizard merges into its blueprint."""
+    partial_data = {}
+    # Skeleton fields
+    if "story_formula" in current_outputs:
+        partial_data["story_formula"] = current_outputs["story_formula"]
+    if "volume1_goal" in current_outputs:
+        partial_data["volume1_goal"] = current_outputs["volume1_goal"]
+    if "golden_finger_rules" in current_outputs:
+        partial_data["golden_finger_rules"] = current_outputs["golden_finger_rules"]
+    if "core_hook" in current_outputs:
+        partial_data["core_hook"] = current_outputs["core_hook"]
+    if "emotional_tone" in current_outputs:
+        partial_data["emotional_tone"] = current_outputs["emotional_tone"]
+
+    # Characters
+    if "characters" in current_outputs:
+        partial_data["characters"] = current_outputs["characters"]
+
+    # World
+    if "world" in current_outputs:
+        partial_data["world"] = current_outputs["world"]
+
+    # Outline
+    if "outline" in current_outputs:
+        partial_data["outline"] = current_outputs["outline"]
+
+    # First chapter (mapped to title/content for frontend compatibility)
+    if "first_chapter_title" in current_outputs or "first_chapter_content" in current_outputs:
+        partial_data["title"] = current_outputs.get("first_chapter_title", "")
+        partial_data["content"] = current_outputs.get("first_chapter_content", "")
+
+    # Concept (if router produced it)
+    if "concept" in current_outputs:
+        partial_data["concept"] = current_outputs["concept"]
+    return partial_data
+
 @router.post("/unified")
-async def generate_unified(request: GenerateUnifiedRequest):
-    """Unified AI entry using LangGraph multi-agent collaboration with event streaming."""
+async def generate_unified(request: GenerateUnifiedRequest, http_request: Request):
+    """
+    Unified AI entry using LangGraph multi-agent collaboration with event streaming.
+    Agents whose inputs are unchanged since the last turn of the same draft replay their
+    cached output instead of running; the first line carries the draft id to send back.
+
+    Each agent sees only its projection of the blueprint; the final result reports the
+    prompt tokens (and estimated latency) saved against sending the whole blueprint.
+
+    Runs are checkpointed after every node. The {"type": "run"} line carries the run's
+    resume token; sending it back as `resume_token` replays the completed nodes at once and
+    continues from the first one that did not finish (the rest of the request is ignored).
+    A run that another request is still running cannot be resumed (409).
+    """
     from app.agents import genesis_graph, GenesisState
-    
-    # Prepare initial state
-    initial_state: GenesisState = {
-        "user_input": f"{request.user_input}\n\n参考灵感:\n{request.inspiration_context}" if request.inspiration_context else request.user_input,
-        "current_data": request.current_data,
-        "target_agents": [],
-        "agent_outputs": {},
-        "final_response": ""
-    }
+    from app.services.genesis_cache_service import genesis_cache_service
+    from app.services.genesis_checkpoint_service import genesis_checkpoint_service
+    from app.agents.projection import savings_report
+
+    durable_graph = await genesis_checkpoint_service.get_graph()
+    snapshot = None
+    if request.resume_token:
+        if durable_graph is None:
+            raise HTTPException(status_code=503, detail="Run checkpointing is unavailable")
+        run = await genesis_checkpoint_service.get_run(request.resume_token)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired resume token")
+        run_id = str(run.id)
+        # Only one request may continue a run, or its pending node would run twice
+        if await genesis_checkpoint_service.claim_run(run_id) is None:
+            raise HTTPException(status_code=409, detail="Run is still running")
+        snapshot = await durable_graph.aget_state(genesis_checkpoint_service.config(run_id))
+        if not snapshot.values:
+            await genesis_checkpoint_service.set_status(run_id, run.status, run.error)
+            raise HTTPException(status_code=404, detail="Run has no checkpoint to resume from")
+        draft_id = snapshot.values.get("draft_id") or run.draft_id
+        graph_input = None # Continue from the checkpoint
+    else:
+        draft_id = request.draft_id or str(uuid.uuid4())
+        try:
+            node_cache = await genesis_cache_service.load(draft_id) if request.draft_id else {}
+        except Exception as e:
+            print(f"⚠️  Genesis cache unavailable, running every agent: {e}")
+            node_cache = {}
+
+        # Prepare initial state
+        initial_state: GenesisState = {
+            "user_input": f"{request.user_input}\n\n参考灵感:\n{request.inspiration_context}" if request.inspiration_context else request.user_input,
+            "current_data": request.current_data,
+            "target_agents": [],
+            "agent_outputs": {},
+            "final_response": "",
+            "draft_id": draft_id,
+            "node_cache": node_cache,
+            "cache_hits": [],
+            "projection": {}
+        }
+        graph_input = initial_state
+        run_id = await genesis_checkpoint_service.start_run(draft_id) if durable_graph is not None else None
+
+    graph = durable_graph if run_id else genesis_graph
+    config = genesis_checkpoint_service.config(run_id) if run_id else None
     
     async def event_generator():
         aggregated_outputs: Dict[str, Any] = {}
         final_response_text = ""
+        cached_agents: List[str] = []
+        projection_stats: Dict[str, Any] = {}
+        settled = False # Final status of the run written
         
+        yield json.dumps({"type": "draft", "draft_id": draft_id}) + "\n"
+        if run_id:
+            yield json.dumps({"type": "run", "run_id": run_id, "resume_token": run_id, "resumed": snapshot is not None}) + "\n"
         try:
-            # Stream events from the graph
-            async for event in genesis_graph.astream(initial_state):
-                for node_name, state_update in event.items():
-                    # Yield status update
-                    yield json.dumps({"type": "status", "agent": node_name, "status": "working"}, ensure_ascii=False) + "\n"
-
-                    # Track latest final response from finalizer
-                    if "final_response" in state_update:
-                        final_response_text = state_update["final_response"]
-                    
-                    # Yield intermediate results if available
-                    current_outputs = state_update.get("agent_outputs", {})
-                    if current_outputs:
-                        # Merge into aggregated outputs so we don't lose earlier modules
-                        aggregated_outputs = {**aggregated_outputs, **current_outputs}
-
-                        partial_data = {}
-                        # Skeleton fields
-                        if "story_formula" in current_outputs:
-                            partial_data["story_formula"] = current_outputs["story_formula"]
-                        if "volume1_goal" in current_outputs:
-                            partial_data["volume1_goal"] = current_outputs["volume1_goal"]
-                        if "golden_finger_rules" in current_outputs:
-                            partial_data["golden_finger_rules"] = current_outputs["golden_finger_rules"]
-                        if "core_hook" in current_outputs:
-                            partial_data["core_hook"] = current_outputs["core_hook"]
-                        if "emotional_tone" in current_outputs:
-                            partial_data["emotional_tone"] = current_outputs["emotional_tone"]
-
-                        # Characters
-                        if "characters" in current_outputs:
-                            partial_data["characters"] = current_outputs["characters"]
-
-                        # World
-                        if "world" in current_outputs:
-                            partial_data["world"] = current_outputs["world"]
-
-                        # Outline
-                        if "outline" in current_outputs:
-                            partial_data["outline"] = current_outputs["outline"]
-
-                        # First chapter (mapped to title/content for frontend compatibility)
-                        if "first_chapter_title" in current_outputs or "first_chapter_content" in current_outputs:
-                            partial_data["title"] = current_outputs.get("first_chapter_title", "")
-                            partial_data["content"] = current_outputs.get("first_chapter_content", "")
-
-                        # Concept (if router produced it)
-                        if "concept" in current_outputs:
-                            partial_data["concept"] = current_outputs["concept"]
+            if snapshot is not None:
+                # Replay what the interrupted run already produced
+                for node_name in genesis_checkpoint_service.completed_nodes(snapshot):
+                    yield json.dumps({"type": "status", "agent": node_name, "status": "replayed"}, ensure_ascii=False) + "\n"
+                aggregated_outputs = dict(snapshot.values.get("agent_outputs") or {})
+                final_response_text = snapshot.values.get("final_response", "")
+                cached_agents = list(snapshot.values.get("cache_hits") or [])
+                projection_stats = dict(snapshot.values.get("projection") or {})
+                partial_data = _partial_data(aggregated_outputs)
+                if partial_data:
+                    yield json.dumps({"type": "result", "data": partial_data}, ensure_ascii=False) + "\n"
+
+            # Stream events from the graph; the run lives in its own task so a
+            # disconnect cancels the in-flight node and its LLM call
+            if snapshot is None or snapshot.next:
+                async for event in run_cancellable(graph.astream(graph_input, config), kind="genesis_graph"):
+                    if run_id:
+                        await genesis_checkpoint_service.touch(run_id)
+                    for node_name, state_update in event.items():
+                        # Yield status update
+                        if node_name in state_update.get("cache_hits", []):
+                            cached_agents.append(node_name)
+                            yield json.dumps({"type": "status", "agent": node_name, "status": "cached"}, ensure_ascii=False) + "\n"
+                        else:
+                            yield json.dumps({"type": "status", "agent": node_name, "status": "working"}, ensure_ascii=False) + "\n"
+
+                        projection_stats.update(state_update.get("projection") or {})
+
+                        # Track latest final response from finalizer
+                        if "final_response" in state_update:
+                            final_response_text = state_update["final_response"]
                         
-                        if partial_data:
-                            yield json.dumps({"type": "result", "data": partial_data}, ensure_ascii=False) + "\n"
+                        # Yield intermediate results if available
+                        current_outputs = state_update.get("agent_outputs", {})
+                        if current_outputs:
+                            # Merge into aggregated outputs so we don't lose earlier modules
+                            aggregated_outputs = {**aggregated_outputs, **current_outputs}
+                            partial_data = _partial_data(current_outputs)
+                            if partial_data:
+                                yield json.dumps({"type": "result", "data": partial_data}, ensure_ascii=False) + "\n"
             
             # After all nodes complete, yield final result
-            response_data = {"response": final_response_text}
+            response_data = {
+                "response": final_response_text,
+                "draft_id": draft_id,
+                "cached_agents": cached_agents,
+                "prompt_savings": savings_report(projection_stats)
+            }
 
             # Attach all aggregated agent outputs
             for key, value in aggregated_outputs.items():
@@ -476,15 +551,43 @@ async def generate_unified(request: GenerateUnifiedRequest):
                 response_data["title"] = aggregated_outputs["first_chapter_title"]
                 response_data["content"] = aggregated_outputs.get("first_chapter_content", "")
 
+            if run_id:
+                await genesis_checkpoint_service.set_status(run_id, "completed")
+                settled = True
+
             # Yield final result
             yield json.dumps({"type": "result", "data": response_data}, ensure_ascii=False) + "\n"
             
         except Exception as e:
             import traceback
             print(f"Error in event_generator: {traceback.format_exc()}")
-            yield json.dumps({"type": "status", "message": f"系统错误: {str(e)}"}, ensure_ascii=False) + "\n"
+            error_event = {"type": "status", "message": f"系统错误: {str(e)}"}
+            if run_id:
+                error_event["resume_token"] = run_id
+                try:
+                    await genesis_checkpoint_service.set_status(run_id, "failed", str(e))
+                    settled = True
+                except Exception:
+                    pass
+            yield json.dumps(error_event, ensure_ascii=False) + "\n"
+        finally:
+            if run_id and not settled:
+                # The client went away mid-run: release the run so it can be resumed
+                with anyio.CancelScope(shield=True):
+                    try:
+                        await genesis_checkpoint_service.set_status(run_id, "interrupted")
+                    except Exception:
+                        pass
 
     return StreamingResponse(
-        event_generator(),
+        guard_stream(http_request, event_generator(), kind="genesis_unified"),
         media_type="application/x-ndjson"
     )
+
+@router.delete("/drafts/{draft_id}/cache")
+async def clear_draft_cache(draft_id: str):
+    """Forget a draft's cached agent outputs so the next unified turn runs every agent."""
+    from app.services.genesis_cache_service import genesis_cache_service
+
+    cleared = await genesis_cache_service.clear(draft_id)
+    return {"draft_id": draft_id, "cleared": cleared}
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.db.database import get_db
+from app.db.models import Project, IngestionJob
+from app.services.ingestion_service import ingestion_service, job_to_dict, decode_manuscript, ChapterConflict
+from typing import Optional
+import uuid
+
+router = APIRouter()
+
+@router.post("/projects/{project_id}/ingest")
+async def ingest_manuscript(
+    project_id: uuid.UUID,
+    http_request: Request,
+    source_name: Optional[str] = None,
+    start_chapter: Optional[int] = None,
+    analyze: bool = True,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Import a whole manuscript (plain text, UTF-8 or GBK, as the raw request body).
+    Chapters are split on headings such as "第十二章" and created immediately; analysis
+    runs in the background. Poll /ingestion-jobs/{job_id} for progress and throughput.
+    """
+    if start_chapter is not None and start_chapter < 1:
+        raise HTTPException(status_code=400, detail="start_chapter must be at least 1")
+    project = await db.scalar(select(Project.id).where(Project.id == project_id))
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    try:
+        text = decode_manuscript(await http_request.body())
+        job = await ingestion_service.create_job(
+            db, project_id, text, source_name=source_name, start_chapter=start_chapter, run_analysis=analyze
+        )
+    except ChapterConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if job.status == "running":
+        ingestion_service.start(job.id)
+    return job_to_dict(job)
+
+@router.get("/projects/{project_id}/ingestion-jobs")
+async def list_ingestion_jobs(project_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        select(IngestionJob).where(IngestionJob.project_id == project_id).order_by(IngestionJob.created_at.desc())
+    )
+    return [job_to_dict(job) for job in result.scalars().all()]
+
+@router.get("/ingestion-jobs/{job_id}")
+async def get_ingestion_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    job = await db.get(IngestionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job_to_dict(job)
+
+@router.post("/ingestion-jobs/{job_id}/resume")
+async def resume_ingestion_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """Continue a failed or interrupted job from the first chapter not yet applied."""
+    job = await db.get(IngestionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    if job.status == "completed":
+        return job_to_dict(job)
+
+    job.status = "running"
+    job.error = None
+    await db.commit()
+    await db.refresh(job)
+    ingestion_service.start(job.id)
+    return job_to_dict(job)
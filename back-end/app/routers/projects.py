@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Header, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import delete, func, cast
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import selectinload
 from app.db.database import get_db
 from app.db.models import Project, Chapter, EntityVersion
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Literal
 import uuid
 
 router = APIRouter()
@@ -50,11 +53,19 @@ class ProjectUpdate(BaseModel):
     description: Optional[str] = None
     meta_info: Optional[Dict[str, Any]] = None
 
+class MetaPatchOperation(BaseModel):
+    """One RFC 6902 JSON Patch operation on meta_info, e.g. {"op": "replace", "path": "/world/power_system/source", "value": "..."}."""
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str
+    value: Any = None
+    from_: Optional[str] = Field(None, alias="from")
+
 class ProjectResponse(BaseModel):
     id: uuid.UUID
     name: str
     description: Optional[str]
     meta_info: Dict[str, Any]
+    meta_revision: int = 0
     created_at: Any
     updated_at: Any
 
@@ -132,6 +143,73 @@ async def sync_project_rag(project_id: uuid.UUID, db: AsyncSession = Depends(get
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/projects/{project_id}/compact")
+async def compact_project_history(project_id: uuid.UUID, horizon: Optional[int] = None, vacuum: bool = False):
+    """
+    Compact entity version history: archive never-visible versions, merge identical
+    adjacent versions and move superseded versions older than `horizon` chapters to
+    cold storage. Time-travel reads return the same versions before and after.
+    """
+    from app.services.compaction_service import compaction_service
+    from app.db.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        if not await db.scalar(select(Project.id).where(Project.id == project_id)):
+            raise HTTPException(status_code=404, detail="Project not found")
+    return await compaction_service.compact([project_id], horizon=horizon, vacuum=vacuum)
+
+@router.get("/projects/{project_id}/export")
+async def export_project(project_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """
+    Stream the project as an archive: chapters, the full entity version history with
+    embeddings, and cold-archived versions. Poll /transfers/{X-Transfer-Id} for progress.
+    """
+    from app.services.transfer_service import transfer_service, ARCHIVE_MEDIA_TYPE
+
+    project = await db.scalar(select(Project.id).where(Project.id == project_id))
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    await db.close()
+
+    progress = transfer_service.start_export(project_id)
+    return StreamingResponse(
+        transfer_service.export_project(progress),
+        media_type=ARCHIVE_MEDIA_TYPE,
+        headers={
+            "X-Transfer-Id": str(progress.id),
+            "Content-Disposition": f'attachment; filename="project-{project_id}.novelarc"'
+        }
+    )
+
+@router.post("/projects/import")
+async def import_project(http_request: Request, name: Optional[str] = None, transfer_id: Optional[uuid.UUID] = None):
+    """
+    Create a project from an archive sent as the raw request body. Embeddings are kept,
+    so no re-sync or re-analysis is needed. Pass your own `transfer_id` to poll progress
+    while the upload runs.
+    """
+    from app.services.transfer_service import transfer_service
+
+    progress = transfer_service.start_import(transfer_id)
+    try:
+        return await transfer_service.import_project(progress, http_request.stream(), name=name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/transfers")
+async def list_transfers():
+    from app.services.transfer_service import transfer_service
+    return transfer_service.list_progress()
+
+@router.get("/transfers/{transfer_id}")
+async def get_transfer(transfer_id: uuid.UUID):
+    from app.services.transfer_service import transfer_service
+
+    progress = transfer_service.get_progress(transfer_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Transfer not found or expired")
+    return progress
+
 @router.get("/projects/{project_id}", response_model=ProjectDetailResponse)
 async def get_project(project_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
     result = await db.execute(
@@ -156,21 +234,59 @@ async def update_project(project_id: uuid.UUID, update_data: ProjectUpdate, db:
     if update_data.description:
         project.description = update_data.description
     if update_data.meta_info is not None:
-        # Merge or replace meta_info? For now, let's merge if it's a dict, or replace
-        current_meta = project.meta_info or {}
-        project.meta_info = {**current_meta, **update_data.meta_info}
+        # Shallow merge of top-level keys, done in SQL so it applies to the latest document.
+        # Prefer PATCH /projects/{id}/meta to change single fields.
+        project.meta_info = func.coalesce(Project.meta_info, cast({}, JSONB)).op("||")(cast(update_data.meta_info, JSONB))
+        project.meta_revision = Project.meta_revision + 1
     
     await db.commit()
     await db.refresh(project)
     return project
 
+@router.patch("/projects/{project_id}/meta")
+async def patch_project_meta(
+    project_id: uuid.UUID,
+    ops: List[MetaPatchOperation],
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Apply a JSON Patch to meta_info in a single UPDATE. Send If-Match with the meta_revision
+    the patch was based on to have it rejected (409) when someone else changed meta_info since.
+    Operations that cannot be applied (missing path, failed test) leave meta_info untouched (422).
+    """
+    from app.services.meta_patch_service import meta_patch_service, PatchConflict, PatchFailed
+
+    expected_revision = None
+    if if_match and if_match.strip() != "*":
+        tag = if_match.strip().removeprefix("W/").strip('"')
+        if not tag.isdigit():
+            raise HTTPException(status_code=400, detail="If-Match must be a meta_revision")
+        expected_revision = int(tag)
+
+    try:
+        revision = await meta_patch_service.apply(
+            db, project_id, [op.model_dump(by_alias=True, exclude_unset=True) for op in ops], expected_revision
+        )
+    except PatchConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except PatchFailed as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    await db.commit()
+
+    response.headers["ETag"] = f'"{revision}"'
+    return {"project_id": str(project_id), "meta_revision": revision, "applied": len(ops)}
+
 @router.delete("/projects/{project_id}")
 async def delete_project(project_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Project).where(Project.id == project_id))
-    project = result.scalars().first()
-    if not project:
+    # Chapters and entity versions go with it through ON DELETE CASCADE,
+    # so nothing is loaded into the session regardless of project size
+    result = await db.execute(delete(Project).where(Project.id == project_id).returning(Project.id))
+    if result.first() is None:
         raise HTTPException(status_code=404, detail="Project not found")
-    
-    await db.delete(project)
+
     await db.commit()
     return {"message": "Project deleted successfully"}
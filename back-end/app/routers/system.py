@@ -0,0 +1,53 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.telemetry import metrics
+from app.services.stream_guard import stream_stats
+from app.db.database import pool_monitor, AsyncSessionLocal
+
+router = APIRouter()
+
+# Mounted without the API prefix so Prometheus can scrape the conventional /metrics path
+metrics_router = APIRouter()
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of stage histograms, LLM token counters, pool and stream stats."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/system/streams")
+async def get_stream_stats():
+    """
+    Completed vs. cancelled streams per kind, with the tokens and seconds
+    saved by cancelling upstream work after a client disconnect.
+    """
+    return stream_stats.snapshot()
+
+@router.get("/system/pool")
+async def get_pool_stats():
+    """
+    Database pool occupancy and connection hold times.
+    Streaming endpoints should only show short holds here.
+    """
+    return pool_monitor.snapshot()
+
+@router.post("/system/pool/reset-peak")
+async def reset_pool_peak():
+    """Reset the peak checked-out gauge so load tests can measure it per scenario."""
+    pool_monitor.reset_peak()
+    return pool_monitor.snapshot()
+
+@router.get("/system/payload-indexes")
+async def get_payload_indexes():
+    """Managed payload expression indexes and the equality-filtered paths they are chosen from."""
+    from app.services.payload_query_service import payload_query_service
+
+    await payload_query_service.flush_stats()
+    async with AsyncSessionLocal() as db:
+        return await payload_query_service.list_indexes(db)
+
+@router.post("/system/payload-indexes/tune")
+async def tune_payload_indexes():
+    """Build indexes for the most queried payload paths now and drop those no longer used."""
+    from app.services.payload_query_service import payload_query_service
+
+    return await payload_query_service.tune_indexes()
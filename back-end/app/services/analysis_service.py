@@ -1,8 +1,55 @@
-import json
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Literal
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from app.services.llm_service import llm_service
+from app.services.structured_output import generate_structured, StructuredOutputError
+from app.core.telemetry import traced
+
+SIGNIFICANCE_ALIASES = {"高": "high", "中": "medium", "低": "low"}
+
+class EntityUpdate(BaseModel):
+    entity_type: str
+    entity_id: str = Field(..., min_length=1)
+    payload: Dict[str, Any] = Field(default_factory=dict)
+
+    @field_validator("entity_type", mode="before")
+    @classmethod
+    def _lower(cls, value: Any) -> Any:
+        return value.strip().lower() if isinstance(value, str) else value
+
+class EntityUpdates(BaseModel):
+    entities: List[EntityUpdate]
+
+class ExtractedEvent(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    title: str = Field(..., min_length=1)
+    description: str = ""
+    participants: List[str] = Field(default_factory=list)
+    witnesses: List[str] = Field(default_factory=list)
+    location_id: Optional[str] = None
+    significance: Literal["high", "medium", "low"] = "medium"
+    tags: List[str] = Field(default_factory=list)
+
+    @field_validator("participants", "witnesses", "tags", mode="before")
+    @classmethod
+    def _listify(cls, value: Any) -> Any:
+        if value is None:
+            return []
+        return [value] if isinstance(value, str) else value
+
+    @field_validator("significance", mode="before")
+    @classmethod
+    def _significance(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            value = value.strip().lower()
+            return SIGNIFICANCE_ALIASES.get(value, value)
+        return value
+
+class ExtractedEvents(BaseModel):
+    events: List[ExtractedEvent]
 
 class AnalysisService:
+    @traced("analysis")
     async def analyze_chapter_content(self, content: str, project_context: str = "") -> Tuple[str, List[Dict[str, Any]]]:
         """
         Analyze chapter content to generate a summary and extract entity updates.
@@ -47,13 +94,13 @@ class AnalysisService:
     async def _extract_entities(self, content: str, project_context: str) -> List[Dict[str, Any]]:
         system_prompt = """你是一个小说设定分析助手。请分析章节内容，提取出发生变化的实体（角色、地点、物品、势力等）信息。
 
-请返回 JSON 格式的列表，每个条目包含：
+请返回 JSON 对象 {"entities": [...]}，列表中每个条目包含：
 - entity_type: 实体类型 (character, location, item, faction, rule, other)
 - entity_id: 实体的唯一标识符 (例如: char_linfan, loc_city_a)。如果是新实体，请根据名称生成合理的 ID。
 - payload: 一个字典，包含该实体的最新属性、状态、位置或描述。只记录本章中提及或变化的属性。
 
 示例 JSON:
-[
+{"entities": [
   {
     "entity_type": "character",
     "entity_id": "char_linfan",
@@ -71,7 +118,7 @@ class AnalysisService:
       "status": "已开启"
     }
   }
-]
+]}
 """
         user_prompt = f"""请分析以下章节内容，提取实体变更信息：
 
@@ -82,33 +129,23 @@ class AnalysisService:
             {"role": "user", "content": user_prompt}
         ]
         
-        response_text = ""
         try:
-            async for chunk in llm_service.generate_text(messages, stream=False):
-                response_text += chunk
-            
-            # Clean JSON
-            response_text = response_text.strip()
-            if response_text.startswith("```"):
-                response_text = response_text.split("\n", 1)[1] if "\n" in response_text else response_text
-                if response_text.endswith("```"):
-                    response_text = response_text.rsplit("\n", 1)[0]
-            if response_text.startswith("json"):
-                response_text = response_text[4:].strip()
-                
-            return json.loads(response_text)
+            result = await generate_structured(messages, EntityUpdates, "entity_updates", kind="analysis")
+            return [entity.model_dump() for entity in result.entities]
         except Exception as e:
             print(f"Entity extraction failed: {e}")
-            print(f"Raw response: {response_text}")
+            if isinstance(e, StructuredOutputError):
+                print(f"Raw response: {e.raw}")
             return []
 
+    @traced("analysis")
     async def extract_events(self, content: str, chapter_num: int) -> List[Dict[str, Any]]:
         """
         Extract key events from chapter content.
         """
         system_prompt = """你是一个小说剧情分析专家。请分析章节内容，提取出发生的关键事件。
 
-请返回 JSON 格式的列表，每个条目包含：
+请返回 JSON 对象 {"events": [...]}，列表中每个条目包含：
 - title: 事件标题 (简短概括)
 - description: 事件详细描述 (发生了什么，结果如何)
 - participants: 参与该事件的角色 ID 列表 (例如: ["char_linfan", "char_xiaoyan"])
@@ -118,7 +155,7 @@ class AnalysisService:
 - tags: 标签列表 (例如: ["战斗", "发现", "对话"])
 
 示例 JSON:
-[
+{"events": [
   {
     "title": "发现上古剑谱",
     "description": "林凡在地下遗迹的密室中意外发现了失传已久的《青莲剑歌》残卷。",
@@ -128,7 +165,7 @@ class AnalysisService:
     "significance": "high",
     "tags": ["发现", "奇遇"]
   }
-]
+]}
 """
         user_prompt = f"""请分析以下第 {chapter_num} 章的内容，提取关键事件：
 
@@ -139,28 +176,17 @@ class AnalysisService:
             {"role": "user", "content": user_prompt}
         ]
         
-        response_text = ""
         try:
-            async for chunk in llm_service.generate_text(messages, stream=False):
-                response_text += chunk
-            
-            # Clean JSON
-            response_text = response_text.strip()
-            if response_text.startswith("```"):
-                response_text = response_text.split("\n", 1)[1] if "\n" in response_text else response_text
-                if response_text.endswith("```"):
-                    response_text = response_text.rsplit("\n", 1)[0]
-            if response_text.startswith("json"):
-                response_text = response_text[4:].strip()
-                
-            events = json.loads(response_text)
+            result = await generate_structured(messages, ExtractedEvents, "chapter_events", kind="analysis")
+            events = [event.model_dump() for event in result.events]
             # Add occurred_at_chapter to each event
             for event in events:
                 event['occurred_at_chapter'] = chapter_num
             return events
         except Exception as e:
             print(f"Event extraction failed: {e}")
-            print(f"Raw response: {response_text}")
+            if isinstance(e, StructuredOutputError):
+                print(f"Raw response: {e.raw}")
             return []
 
 analysis_service = AnalysisService()
@@ -0,0 +1,236 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select, update, func
+from app.core.config import settings
+from app.core.telemetry import metrics
+from app.db.database import AsyncSessionLocal, engine
+from app.db.models import Chapter
+
+ANALYSIS_RUNS = metrics.counter(
+    "novel_chapter_analysis_runs_total",
+    "Chapter analyses triggered by saves, by outcome",
+    ["result"]
+)
+
+class Superseded(Exception):
+    """A newer save of the chapter arrived; this run's results must not be applied."""
+
+class ChapterAnalysisService:
+    """
+    Analysis of saved chapters: debounced to the latest content and single-flight per chapter.
+
+    Every content write bumps chapters.content_revision and schedules a run for that revision.
+    - Debounce: a run sleeps ANALYSIS_DEBOUNCE_SECONDS first and gives up if the revision moved on.
+      A newer save on the same worker cancels the pending or running task right away.
+    - Single flight across workers: the run holds a session-level advisory lock on the chapter
+      (same pattern as compaction and ingestion). A run waiting for the lock gives up as soon as
+      its revision is superseded, and a running analysis polls the revision and cancels itself
+      when a save on another worker supersedes it.
+    - Results are applied only if the chapter row, locked FOR UPDATE, still has the analyzed
+      revision, so a stale analysis can never replace the events of newer content.
+    """
+    def __init__(self):
+        self._tasks: Dict[uuid.UUID, asyncio.Task] = {}
+
+    def schedule(self, chapter_id: uuid.UUID, revision: int) -> asyncio.Task:
+        """Analyze `revision` of the chapter in the background, superseding any run on this worker."""
+        previous = self._tasks.get(chapter_id)
+        if previous and not previous.done():
+            previous.cancel()
+        task = asyncio.create_task(self._run(chapter_id, revision))
+        self._tasks[chapter_id] = task
+
+        def forget(t: asyncio.Task):
+            if self._tasks.get(chapter_id) is t:
+                del self._tasks[chapter_id]
+        task.add_done_callback(forget)
+        return task
+
+    def is_running(self, chapter_id: uuid.UUID) -> bool:
+        task = self._tasks.get(chapter_id)
+        return bool(task and not task.done())
+
+    async def wait(self, task: asyncio.Task, revision: int, timeout: float) -> Dict[str, Any]:
+        """
+        Wait for a scheduled run without tying it to the caller: a disconnecting client
+        does not cancel the analysis, and a cancelled (superseded) run is reported as such.
+        """
+        await asyncio.wait({task}, timeout=timeout)
+        if not task.done():
+            return {"revision": revision, "status": "running", "steps": []}
+        if task.cancelled():
+            return {"revision": revision, "status": "superseded", "steps": []}
+        return task.result()
+
+    async def _current_revision(self, chapter_id: uuid.UUID) -> Optional[int]:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(Chapter.content_revision).where(Chapter.id == chapter_id))
+
+    async def _check(self, chapter_id: uuid.UUID, revision: int):
+        if await self._current_revision(chapter_id) != revision:
+            raise Superseded()
+
+    async def _run(self, chapter_id: uuid.UUID, revision: int) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(settings.ANALYSIS_DEBOUNCE_SECONDS)
+            await self._check(chapter_id, revision)
+
+            lock_key = func.hashtext(f"chapter_analysis:{chapter_id}")
+            async with engine.connect() as lock_conn:
+                lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+                while not await lock_conn.scalar(select(func.pg_try_advisory_lock(lock_key))):
+                    # An older revision is still being analyzed elsewhere; it stops once it notices ours
+                    await asyncio.sleep(settings.ANALYSIS_SUPERSEDE_POLL_SECONDS)
+                    await self._check(chapter_id, revision)
+                try:
+                    steps = await self._analyze_locked(chapter_id, revision)
+                finally:
+                    await lock_conn.execute(select(func.pg_advisory_unlock(lock_key)))
+        except asyncio.CancelledError:
+            ANALYSIS_RUNS.inc(result="superseded")
+            raise
+        except Superseded:
+            print(f"⏭️  Analysis of chapter {chapter_id} r{revision} superseded by a newer save")
+            ANALYSIS_RUNS.inc(result="superseded")
+            return {"revision": revision, "status": "superseded", "steps": []}
+        except Exception as e:
+            print(f"❌ Analysis of chapter {chapter_id} r{revision} failed: {e}")
+            ANALYSIS_RUNS.inc(result="failed")
+            return {
+                "revision": revision,
+                "status": "failed",
+                "steps": [{"step": "analysis", "status": "failed", "message": f"分析失败: {str(e)}"}]
+            }
+
+        report = {
+            "revision": revision,
+            "status": "completed",
+            "steps": steps,
+            "duration_ms": int((time.perf_counter() - started) * 1000)
+        }
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Chapter)
+                    .where(Chapter.id == chapter_id, Chapter.content_revision == revision)
+                    .values(analysis_report=report)
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"⚠️  Failed to store analysis report for chapter {chapter_id}: {e}")
+        ANALYSIS_RUNS.inc(result="completed")
+        return report
+
+    async def _watch_revision(self, chapter_id: uuid.UUID, revision: int):
+        """Returns once a newer save of the chapter exists, from any worker."""
+        while True:
+            await asyncio.sleep(settings.ANALYSIS_SUPERSEDE_POLL_SECONDS)
+            if await self._current_revision(chapter_id) != revision:
+                return
+
+    async def _analyze_locked(self, chapter_id: uuid.UUID, revision: int) -> List[Dict[str, Any]]:
+        from app.services.ingestion_service import extract_chapter
+        from app.services.rag_service import rag_service
+        from app.services.outline_service import outline_service
+
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(Chapter.project_id, Chapter.chapter_number, Chapter.content, Chapter.content_revision)
+                .where(Chapter.id == chapter_id)
+            )).first()
+        if not row or row.content_revision != revision:
+            raise Superseded()
+        project_id, number, content = row.project_id, row.chapter_number, row.content or ""
+
+        print(f"🔍 Analyzing chapter {number} (r{revision})...")
+        # The LLM calls are the expensive part: stop them as soon as a newer save shows up
+        extraction = asyncio.create_task(extract_chapter(content, number))
+        watcher = asyncio.create_task(self._watch_revision(chapter_id, revision))
+        try:
+            await asyncio.wait({extraction, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            if not extraction.done():
+                extraction.cancel()
+                # cancel() only requests it: let the task unwind before reading its state
+                await asyncio.gather(extraction, return_exceptions=True)
+        if extraction.cancelled():
+            raise Superseded()
+        prepared = extraction.result()
+
+        steps: List[Dict[str, Any]] = []
+        async with AsyncSessionLocal() as db:
+            current = await db.scalar(
+                select(Chapter.content_revision).where(Chapter.id == chapter_id).with_for_update()
+            )
+            if current != revision:
+                raise Superseded()
+            # One transaction: the row lock is held until every result is written, and
+            # analyzed_revision only becomes visible together with all of them
+            entities_updated = await rag_service.apply_entity_updates(
+                db, project_id, number, prepared["entity_updates"], prepared["entity_embeddings"], commit=False
+            )
+            events_extracted, characters_notified = await rag_service.apply_chapter_events(
+                db, project_id, number, prepared["events"], prepared["event_ids"], prepared["event_embeddings"], commit=False
+            )
+            values: Dict[str, Any] = {"analyzed_revision": revision}
+            if prepared["summary"]:
+                values["summary"] = prepared["summary"]
+            await db.execute(update(Chapter).where(Chapter.id == chapter_id).values(**values))
+            await db.commit()
+        steps.append({
+            "step": "analysis",
+            "status": "success",
+            "message": "自动分析完成",
+            "details": {
+                "summary_generated": bool(prepared["summary"]),
+                "entities_updated": entities_updated
+            }
+        })
+        steps.append({
+            "step": "events",
+            "status": "success",
+            "message": "事件提取完成",
+            "details": {
+                "events_extracted": events_extracted,
+                "characters_notified": characters_notified
+            }
+        })
+        print("✅ Analysis complete.")
+
+        # Outline synchronization
+        await self._check(chapter_id, revision)
+        try:
+            async with AsyncSessionLocal() as db:
+                outline_sync_result = await outline_service.sync_outline_after_chapter_save(db, project_id, number, content)
+            if outline_sync_result and outline_sync_result.get('sync_performed'):
+                print(f"  ✅ Outline synced: {outline_sync_result.get('subsequent_updated', 0)} subsequent chapters updated")
+                steps.append({
+                    "step": "outline_sync",
+                    "status": "success",
+                    "message": "大纲同步完成",
+                    "details": {
+                        "deviation_level": outline_sync_result.get('deviation_level', 'none'),
+                        "subsequent_updated": outline_sync_result.get('subsequent_updated', 0),
+                        "analysis": outline_sync_result.get('analysis', '')
+                    }
+                })
+            else:
+                steps.append({
+                    "step": "outline_sync",
+                    "status": "success",
+                    "message": "无需同步大纲"
+                })
+        except Exception as e:
+            print(f"  ⚠️  Outline sync failed: {e}")
+            steps.append({
+                "step": "outline_sync",
+                "status": "failed",
+                "message": f"大纲同步失败: {str(e)}"
+            })
+        return steps
+
+chapter_analysis_service = ChapterAnalysisService()
@@ -0,0 +1,359 @@
+import asyncio
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.telemetry import metrics, traced
+from app.db.database import AsyncSessionLocal
+from app.db.models import Project, Chapter, ChatSession, ChatMessage
+from app.services.prompt_builder import canonical_json, world_digest, record_prefix
+
+CHAT_PROMPT_CHARS = metrics.histogram(
+    "novel_chat_prompt_chars",
+    "Characters sent to the LLM per chat turn",
+    ["mode"],
+    buckets=(1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+)
+CHAT_CONTEXT_CACHE = metrics.counter("novel_chat_context_cache_total", "Chat session project context lookups", ["result"])
+
+# --- Project context ------------------------------------------------------------------
+
+def build_outline_block(project: Project, current_chapter: int) -> str:
+    """
+    Story formula and global outline, plus the static world digest for chapter 1.
+    Rendered deterministically: this block opens the cacheable prompt prefix.
+    """
+    outline_context = ""
+    if not project or not project.meta_info:
+        return outline_context
+
+    # Always include Core Skeleton & Global Outline
+    story_formula = project.meta_info.get('story_formula', '')
+    global_outline = project.meta_info.get('outline', '暂无大纲')
+    if not isinstance(global_outline, str):
+        global_outline = canonical_json(global_outline)
+
+    if story_formula:
+        outline_context += f"【故事公式】\n{story_formula}\n\n"
+
+    outline_context += f"【全书大纲】\n{global_outline}\n\n"
+
+    # Strategy:
+    # Chapter 1: Dump full static world info (Legacy/Safe mode)
+    # Chapter > 1: Use RAG to retrieve relevant Characters & World info (see build_rag_block)
+    if current_chapter == 1:
+        outline_context += world_digest(project.meta_info)
+    return outline_context
+
+async def build_rag_block(
+    db: AsyncSession,
+    project_id: uuid.UUID,
+    current_chapter: int,
+    query: str,
+    query_embedding: Optional[List[float]]
+) -> str:
+    """Entities relevant to the latest message. Only used after chapter 1."""
+    from app.services.rag_service import rag_service
+
+    try:
+        rag_results = await rag_service.retrieve_context(
+            db=db,
+            project_id=project_id,
+            query=query,
+            current_chapter=current_chapter,
+            limit=10, # Retrieve top 10 relevant entities
+            query_embedding=query_embedding
+        )
+    except Exception as e:
+        print(f"RAG Retrieval Error: {e}")
+        await db.rollback()
+        return f"【系统提示】\n资料检索服务暂时不可用 ({str(e)})\n\n"
+
+    if not rag_results:
+        return "【相关资料】\n(未检索到强相关资料，请基于大纲自由发挥)\n\n"
+    block = "【相关资料 (RAG检索)】\n"
+    for node in rag_results:
+        # Simplify payload for prompt
+        payload_str = str(node.payload_json)
+        if len(payload_str) > 300: payload_str = payload_str[:300] + "..."
+        block += f"- [{node.entity_type}] {node.entity_id}: {payload_str}\n"
+    return block + "\n"
+
+async def recent_outline_chapters(db: AsyncSession, project_id: uuid.UUID, current_chapter: int) -> List[Chapter]:
+    # Detailed Outlines (Current + Previous 2), in chronological order
+    result = await db.execute(
+        select(Chapter)
+        .where(Chapter.project_id == project_id)
+        .where(Chapter.chapter_number <= current_chapter)
+        .order_by(Chapter.chapter_number.desc())
+        .limit(3)
+    )
+    return list(reversed(result.scalars().all()))
+
+def build_recent_outlines_block(chapters: List[Chapter]) -> str:
+    if not chapters:
+        return ""
+    block = "【近期章节细纲】\n"
+    for chap in chapters:
+        block += f"第{chap.chapter_number}章细纲: {chap.detailed_outline or '暂无'}\n"
+    return block + "\n"
+
+def rag_query_for(current_chapter: int, last_message: str, context_data: str) -> str:
+    return f"Chapter {current_chapter}. {last_message}\nContext: {context_data[:300]}"
+
+def attach_context(
+    messages: List[Dict[str, str]],
+    stable_context: str,
+    volatile_context: str,
+    context_data: str
+) -> List[Dict[str, str]]:
+    """
+    Lay out a chat prompt for provider prefix caching. Stable context joins the system
+    message at the front (appended to an existing one); per-turn context (retrieval
+    hits, editor context) is put in front of the newest user message, so everything
+    before it is byte-identical to the previous turn's prompt.
+    """
+    messages = [dict(m) for m in messages]
+    if stable_context:
+        if messages and messages[0]["role"] == "system":
+            messages[0]["content"] += f"\n\n{stable_context}"
+        else:
+            messages.insert(0, {"role": "system", "content": stable_context})
+    turn_context = f"{volatile_context}Context Information:\n{context_data}\n\nUse this context to assist the user."
+    if messages and messages[-1]["role"] == "user":
+        messages[-1]["content"] = f"{turn_context}\n\n{messages[-1]['content']}"
+    else:
+        messages.append({"role": "user", "content": turn_context})
+    if messages[0]["role"] == "system":
+        record_prefix("chat", messages[0]["content"])
+    return messages
+
+def session_prompt(
+    project_context: str,
+    summary: Optional[str],
+    history: List[Dict[str, str]],
+    rag_block: str,
+    context_data: str
+) -> List[Dict[str, str]]:
+    """A session turn's prompt: project context and conversation summary up front, per-turn context last."""
+    # The summary changes only every few turns, so it stays in the cacheable system prefix
+    if summary:
+        project_context += f"【此前对话摘要】\n{summary}\n\n"
+    return attach_context(history, project_context, rag_block, context_data)
+
+# --- Sessions -------------------------------------------------------------------------
+
+def session_to_dict(session: ChatSession) -> Dict[str, Any]:
+    return {
+        "id": str(session.id),
+        "project_id": str(session.project_id) if session.project_id else None,
+        "title": session.title,
+        "current_chapter": session.current_chapter,
+        "summary": session.summary,
+        "summarized_through": session.summarized_through,
+        "message_count": session.message_count,
+        "created_at": session.created_at,
+        "updated_at": session.updated_at
+    }
+
+def message_to_dict(message: ChatMessage) -> Dict[str, Any]:
+    return {
+        "seq": message.seq,
+        "role": message.role,
+        "content": message.content,
+        "created_at": message.created_at
+    }
+
+class ChatSessionService:
+    """
+    Server-side chat sessions. Each turn uploads only the new message; the prompt is
+    the cached project context, a rolling summary of older turns and the most recent
+    turns verbatim, so prompt size stays flat however long the session runs.
+    """
+    def __init__(self):
+        self._summarizing: Dict[uuid.UUID, asyncio.Task] = {}
+
+    async def _context_key(self, db: AsyncSession, project_id: uuid.UUID, current_chapter: int) -> Optional[str]:
+        """Changes whenever anything the cached context block is built from changes."""
+        project = (await db.execute(
+            select(Project.updated_at, Project.created_at).where(Project.id == project_id)
+        )).first()
+        if project is None:
+            return None
+        chapters = (await db.execute(
+            select(Chapter.chapter_number, func.coalesce(Chapter.updated_at, Chapter.created_at))
+            .where(Chapter.project_id == project_id)
+            .where(Chapter.chapter_number <= current_chapter)
+            .order_by(Chapter.chapter_number.desc())
+            .limit(3)
+        )).all()
+        marks = ",".join(f"{number}@{changed_at}" for number, changed_at in chapters)
+        return f"{current_chapter}|{project.updated_at or project.created_at}|{marks}"
+
+    async def project_context(self, db: AsyncSession, session: ChatSession) -> str:
+        """The session's project context block, rebuilt only when the project changed."""
+        if not session.project_id:
+            return ""
+        key = await self._context_key(db, session.project_id, session.current_chapter)
+        if key is not None and key == session.context_key and session.context_cache is not None:
+            CHAT_CONTEXT_CACHE.inc(result="hit")
+            return session.context_cache
+
+        CHAT_CONTEXT_CACHE.inc(result="miss")
+        project = await db.get(Project, session.project_id)
+        chapters = await recent_outline_chapters(db, session.project_id, session.current_chapter)
+        block = build_outline_block(project, session.current_chapter) + build_recent_outlines_block(chapters)
+        session.context_cache = block
+        session.context_key = key
+        return block
+
+    async def add_message(
+        self,
+        db: AsyncSession,
+        session: ChatSession,
+        role: str,
+        content: str
+    ) -> ChatMessage:
+        # Row lock serializes seq allocation between concurrent turns of the same session
+        seq = await db.scalar(
+            update(ChatSession)
+            .where(ChatSession.id == session.id)
+            .values(message_count=ChatSession.message_count + 1, updated_at=func.now())
+            .returning(ChatSession.message_count)
+        )
+        message = ChatMessage(session_id=session.id, seq=seq, role=role, content=content)
+        db.add(message)
+        return message
+
+    async def unsummarized_messages(self, db: AsyncSession, session: ChatSession) -> List[ChatMessage]:
+        result = await db.execute(
+            select(ChatMessage)
+            .where(ChatMessage.session_id == session.id, ChatMessage.seq > session.summarized_through)
+            .order_by(ChatMessage.seq)
+        )
+        return list(result.scalars().all())
+
+    @traced("chat", "prepare_turn")
+    async def prepare_turn(
+        self,
+        session_id: uuid.UUID,
+        content: str,
+        context_data: str = "",
+        current_chapter: Optional[int] = None
+    ) -> Optional[Tuple[ChatSession, List[Dict[str, str]]]]:
+        """Store the user message and build the prompt for this turn."""
+        from app.services.embedding_service import embedding_service
+
+        async with AsyncSessionLocal() as db:
+            session = await db.get(ChatSession, session_id)
+            if not session:
+                return None
+            if current_chapter is not None and current_chapter != session.current_chapter:
+                session.current_chapter = current_chapter
+
+            await self.add_message(db, session, "user", content)
+            await db.commit()
+
+            outline_context = await self.project_context(db, session)
+            history = await self.unsummarized_messages(db, session)
+            await db.commit() # Persist a refreshed context cache
+            project_id = session.project_id
+            chapter = session.current_chapter
+
+        rag_block = ""
+        if project_id and chapter != 1:
+            # Embedding first, then a short session for the vector search
+            rag_query = rag_query_for(chapter, content, context_data)
+            rag_query_embedding = None
+            try:
+                rag_query_embedding = await embedding_service.get_embedding(rag_query)
+            except Exception as e:
+                print(f"RAG query embedding failed: {e}")
+            async with AsyncSessionLocal() as db:
+                rag_block = await build_rag_block(db, project_id, chapter, rag_query, rag_query_embedding)
+
+        messages = session_prompt(
+            outline_context,
+            session.summary,
+            [{"role": m.role, "content": m.content} for m in history],
+            rag_block,
+            context_data
+        )
+        CHAT_PROMPT_CHARS.observe(sum(len(m["content"]) for m in messages), mode="session")
+        return session, messages
+
+    async def record_reply(self, session_id: uuid.UUID, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Relay the LLM stream and store the reply once it completes, then fold old turns
+        into the rolling summary in the background.
+        """
+        parts: List[str] = []
+        async for chunk in source:
+            parts.append(chunk)
+            yield chunk
+
+        async with AsyncSessionLocal() as db:
+            session = await db.get(ChatSession, session_id)
+            if session:
+                await self.add_message(db, session, "assistant", "".join(parts))
+                await db.commit()
+        self.schedule_summary(session_id)
+
+    def schedule_summary(self, session_id: uuid.UUID):
+        task = self._summarizing.get(session_id)
+        if task and not task.done():
+            return
+        self._summarizing[session_id] = asyncio.create_task(self._summarize(session_id))
+
+    async def _summarize(self, session_id: uuid.UUID):
+        """
+        Fold everything but the last CHAT_RECENT_MESSAGES into the summary, once at least
+        CHAT_SUMMARY_BATCH messages are waiting. Runs off the request path.
+        """
+        from app.services.llm_service import llm_service
+
+        try:
+            async with AsyncSessionLocal() as db:
+                session = await db.get(ChatSession, session_id)
+                if not session:
+                    return
+                history = await self.unsummarized_messages(db, session)
+                old_summary, summarized_through = session.summary, session.summarized_through
+            if len(history) < settings.CHAT_RECENT_MESSAGES + settings.CHAT_SUMMARY_BATCH:
+                return
+
+            to_fold = history[:-settings.CHAT_RECENT_MESSAGES]
+            transcript = "\n".join(f"[{m.role}] {m.content}" for m in to_fold)
+            prompt = f"""请将以下小说创作对话整合进已有的对话摘要，生成一份新的摘要（不超过{settings.CHAT_SUMMARY_MAX_CHARS}字）。
+要求：
+1. 保留作者已确定的设定、剧情决定和写作要求。
+2. 保留尚未解决的问题和待办事项。
+3. 省略寒暄和已被否决的方案。
+
+已有摘要：
+{old_summary or '无'}
+
+新增对话：
+{transcript}
+"""
+            summary = ""
+            async for chunk in llm_service.generate_text([{"role": "user", "content": prompt}], stream=False):
+                summary += chunk
+            summary = summary.strip()
+            if not summary:
+                return
+
+            async with AsyncSessionLocal() as db:
+                # Only advance from the state we read, in case another worker got there first
+                await db.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == session_id, ChatSession.summarized_through == summarized_through)
+                    .values(summary=summary, summarized_through=to_fold[-1].seq, updated_at=ChatSession.updated_at)
+                )
+                await db.commit()
+            print(f"🧾 Chat session {session_id}: folded {len(to_fold)} messages into the summary")
+        except Exception as e:
+            print(f"⚠️  Chat summary failed for {session_id}: {e}")
+
+chat_session_service = ChatSessionService()
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+import uuid
+from sqlalchemy import select, update, delete, insert, func, cast, text, literal_column, Text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.telemetry import traced
+from app.db.database import AsyncSessionLocal, engine
+from app.db.models import Project, Chapter, EntityVersion, EntityVersionArchive, EntityEdge, EntityEdgeArchive
+
+# --- Archive encoding -----------------------------------------------------------
+
+def compress_payload(payload: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+def decompress_payload(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+def archived_to_version(row: EntityVersionArchive) -> EntityVersion:
+    """Transient EntityVersion for an archived row, so read paths can return it unchanged."""
+    return EntityVersion(
+        id=row.id,
+        project_id=row.project_id,
+        entity_type=row.entity_type,
+        entity_id=row.entity_id,
+        version=row.version,
+        valid_from_chapter=row.valid_from_chapter,
+        valid_to_chapter=row.valid_to_chapter,
+        is_current=False,
+        payload_json=decompress_payload(row.payload_zlib),
+        embedding=None,
+        created_at=row.created_at
+    )
+
+class CompactionService:
+    """
+    Compacts entity version history without changing what time-travel reads return:
+    1. Versions that are never visible (valid_to < valid_from, left by re-saves of the
+       same chapter) are archived.
+    2. Runs of adjacent versions with identical payloads are merged into the first one,
+       which takes over the run's validity range.
+    3. Superseded versions that ended before `latest chapter - horizon` move to the
+       archive with compressed payloads and halfvec (or dropped) embeddings, and their
+       graph edges to entity_edges_archive. RAGService and GraphService still serve
+       them for chapters in that range.
+    Current versions are never touched, so compaction can run next to normal writes.
+    """
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    async def table_sizes(self, db: AsyncSession) -> Dict[str, int]:
+        row = (await db.execute(text("""
+            SELECT pg_relation_size('entity_versions'),
+                   pg_indexes_size('entity_versions'),
+                   pg_total_relation_size('entity_versions'),
+                   pg_total_relation_size('entity_versions_archive')
+        """))).one()
+        return {
+            "entity_versions_heap_bytes": row[0],
+            "entity_versions_index_bytes": row[1],
+            "entity_versions_total_bytes": row[2],
+            "archive_total_bytes": row[3]
+        }
+
+    async def _plan(self, db: AsyncSession, project_id: uuid.UUID, cold_boundary: int) -> Dict[str, Any]:
+        """Decide what to compact from version metadata only; payloads and vectors are not loaded."""
+        result = await db.execute(
+            select(
+                EntityVersion.id,
+                EntityVersion.entity_type,
+                EntityVersion.entity_id,
+                EntityVersion.valid_from_chapter,
+                EntityVersion.valid_to_chapter,
+                EntityVersion.is_current,
+                func.md5(cast(EntityVersion.payload_json, Text))
+            ).where(
+                EntityVersion.project_id == project_id
+            ).order_by(EntityVersion.entity_type, EntityVersion.entity_id, EntityVersion.version)
+        )
+
+        invisible: List[uuid.UUID] = []
+        merges: Dict[uuid.UUID, Dict[str, Any]] = {} # anchor id -> {"valid_to", "merged": [ids]}
+        cold: List[uuid.UUID] = []
+
+        def close_group(group: List[Any]):
+            anchor = None
+            anchor_valid_to = None
+            survivors = []
+            for row in group:
+                id_, _, _, valid_from, valid_to, is_current, digest = row
+                if not is_current and valid_to is not None and valid_to < valid_from:
+                    invisible.append(id_)
+                    continue
+                if (
+                    anchor is not None and not is_current and valid_to is not None
+                    and digest == anchor[6] and valid_from == anchor_valid_to + 1
+                ):
+                    anchor_valid_to = valid_to
+                    merges.setdefault(anchor[0], {"valid_to": valid_to, "merged": []})
+                    merges[anchor[0]]["valid_to"] = valid_to
+                    merges[anchor[0]]["merged"].append(id_)
+                    continue
+                if anchor is not None:
+                    survivors.append((anchor, anchor_valid_to))
+                anchor, anchor_valid_to = (row, valid_to) if not is_current and valid_to is not None else (None, None)
+            if anchor is not None:
+                survivors.append((anchor, anchor_valid_to))
+            for row, effective_valid_to in survivors:
+                if effective_valid_to < cold_boundary:
+                    cold.append(row[0])
+
+        group: List[Any] = []
+        key = None
+        for row in result:
+            if (row[1], row[2]) != key:
+                close_group(group)
+                group, key = [], (row[1], row[2])
+            group.append(row)
+        close_group(group)
+        return {"invisible": invisible, "merges": merges, "cold": cold}
+
+    async def _archive(self, db: AsyncSession, ids: List[uuid.UUID], reason: str) -> Dict[str, int]:
+        """Copy a batch of versions into the archive and delete them, in the caller's transaction."""
+        result = await db.execute(
+            select(EntityVersion, func.pg_column_size(literal_column("entity_versions.*")))
+            .where(EntityVersion.id.in_(ids))
+        )
+        rows = []
+        stats = {"rows": 0, "bytes": 0, "embeddings_quantized": 0, "embeddings_dropped": 0}
+        for version, size in result.all():
+            quantized = None
+            if version.embedding is not None:
+                if reason == "cold" and settings.COMPACTION_EMBEDDING_MODE == "quantize":
+                    quantized = version.embedding # Stored as halfvec
+                    stats["embeddings_quantized"] += 1
+                else:
+                    stats["embeddings_dropped"] += 1
+            rows.append({
+                "id": version.id,
+                "project_id": version.project_id,
+                "entity_type": version.entity_type,
+                "entity_id": version.entity_id,
+                "version": version.version,
+                "valid_from_chapter": version.valid_from_chapter,
+                "valid_to_chapter": version.valid_to_chapter,
+                "reason": reason,
+                "payload_zlib": compress_payload(version.payload_json),
+                "embedding_half": quantized,
+                "created_at": version.created_at
+            })
+            stats["rows"] += 1
+            stats["bytes"] += size or 0
+        if rows:
+            await db.execute(insert(EntityVersionArchive), rows)
+            if reason == "cold":
+                # Cold versions stay visible to graph walks; other edges go with their version
+                columns = ["id", "project_id", "source_version_id", "src_type", "src_id", "dst_type", "dst_id", "relation", "label"]
+                await db.execute(
+                    insert(EntityEdgeArchive).from_select(
+                        columns,
+                        select(*(getattr(EntityEdge, c) for c in columns)).where(EntityEdge.source_version_id.in_(ids))
+                    )
+                )
+            await db.execute(delete(EntityVersion).where(EntityVersion.id.in_(ids)))
+        db.expunge_all()
+        return stats
+
+    @traced("compaction")
+    async def compact_project(self, project_id: uuid.UUID, horizon: Optional[int] = None) -> Dict[str, Any]:
+        from app.services.snapshot_service import bump_entity_epoch
+
+        horizon = settings.COMPACTION_COLD_HORIZON_CHAPTERS if horizon is None else horizon
+        batch_size = settings.COMPACTION_BATCH_SIZE
+        started = time.perf_counter()
+        lock_key = func.hashtext(f"compaction:{project_id}")
+
+        async with engine.connect() as lock_conn:
+            # Session-level advisory lock on a dedicated autocommit connection:
+            # one compaction per project across workers, without an idle open transaction
+            lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await lock_conn.scalar(select(func.pg_try_advisory_lock(lock_key))):
+                return {"project_id": str(project_id), "status": "skipped", "reason": "compaction already running"}
+            try:
+                async with AsyncSessionLocal() as db:
+                    latest_chapter = await db.scalar(
+                        select(func.max(Chapter.chapter_number)).where(Chapter.project_id == project_id)
+                    ) or 0
+                    cold_boundary = latest_chapter - horizon
+                    plan = await self._plan(db, project_id, cold_boundary)
+                    await db.rollback()
+
+                    totals = {"rows": 0, "bytes": 0, "embeddings_quantized": 0, "embeddings_dropped": 0}
+
+                    def add(stats: Dict[str, int]):
+                        for k, v in stats.items():
+                            totals[k] += v
+
+                    invisible = plan["invisible"]
+                    for i in range(0, len(invisible), batch_size):
+                        add(await self._archive(db, invisible[i:i + batch_size], "invisible"))
+                        await db.commit()
+
+                    # Extending the anchor and archiving the merged rows commit together,
+                    # so readers never see a gap in the validity range
+                    anchors = list(plan["merges"].items())
+                    merged_count = 0
+                    for i in range(0, len(anchors), batch_size):
+                        batch = anchors[i:i + batch_size]
+                        await db.execute(update(EntityVersion), [
+                            {"id": anchor_id, "valid_to_chapter": merge["valid_to"]} for anchor_id, merge in batch
+                        ])
+                        merged_ids = [id_ for _, merge in batch for id_ in merge["merged"]]
+                        add(await self._archive(db, merged_ids, "merged"))
+                        merged_count += len(merged_ids)
+                        # Snapshots report version numbers, which merging changes
+                        await bump_entity_epoch(db, project_id)
+                        await db.commit()
+
+                    cold = plan["cold"]
+                    for i in range(0, len(cold), batch_size):
+                        add(await self._archive(db, cold[i:i + batch_size], "cold"))
+                        await db.commit()
+            finally:
+                await lock_conn.execute(select(func.pg_advisory_unlock(lock_key)))
+
+        return {
+            "project_id": str(project_id),
+            "status": "completed",
+            "latest_chapter": latest_chapter,
+            "cold_boundary_chapter": cold_boundary,
+            "invisible_archived": len(invisible),
+            "versions_merged": merged_count,
+            "cold_archived": len(cold),
+            "embeddings_quantized": totals["embeddings_quantized"],
+            "embeddings_dropped": totals["embeddings_dropped"],
+            "rows_moved": totals["rows"],
+            "live_bytes_moved": totals["bytes"],
+            "duration_seconds": round(time.perf_counter() - started, 3)
+        }
+
+    async def vacuum(self):
+        """Make the space freed by compaction reusable and refresh planner statistics."""
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM (ANALYZE) entity_versions"))
+            await conn.execute(text("VACUUM (ANALYZE) entity_versions_archive"))
+
+    async def compact(self, project_ids: Optional[List[uuid.UUID]] = None, horizon: Optional[int] = None, vacuum: bool = False) -> Dict[str, Any]:
+        """Compact the given projects (default: all) and report size changes."""
+        async with AsyncSessionLocal() as db:
+            sizes_before = await self.table_sizes(db)
+            if project_ids is None:
+                project_ids = list((await db.execute(select(Project.id))).scalars().all())
+
+        projects = [await self.compact_project(project_id, horizon) for project_id in project_ids]
+        if vacuum:
+            await self.vacuum()
+
+        async with AsyncSessionLocal() as db:
+            sizes_after = await self.table_sizes(db)
+
+        report = {
+            "projects": projects,
+            "sizes_before": sizes_before,
+            "sizes_after": sizes_after,
+            "vacuumed": vacuum,
+            "reclaimed_bytes": {
+                key: sizes_before[key] - sizes_after[key] for key in sizes_before
+            }
+        }
+        self.last_report = report
+        return report
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.COMPACTION_INTERVAL_SECONDS)
+            try:
+                report = await self.compact(vacuum=True)
+                moved = sum(p.get("rows_moved", 0) for p in report["projects"])
+                if moved:
+                    print(f"🗜️  Compacted {moved} entity versions, live table {report['reclaimed_bytes']['entity_versions_total_bytes']} bytes smaller")
+            except Exception as e:
+                print(f"⚠️  Entity history compaction failed: {e}")
+
+    def start_background(self):
+        if settings.COMPACTION_INTERVAL_SECONDS <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+compaction_service = CompactionService()
@@ -1,5 +1,6 @@
 from openai import AsyncOpenAI
 from app.core.config import settings
+from app.core.telemetry import span
 from typing import List
 
 class EmbeddingService:
@@ -15,10 +16,24 @@ class EmbeddingService:
         Generate embedding for a given text string.
         """
         text = text.replace("\n", " ")
-        response = await self.client.embeddings.create(
-            input=[text],
-            model=self.model
-        )
+        with span("embedding", self.model):
+            response = await self.client.embeddings.create(
+                input=[text],
+                model=self.model
+            )
         return response.data[0].embedding
 
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts in one request. Results are in input order.
+        """
+        if not texts:
+            return []
+        with span("embedding", self.model, batch_size=len(texts)):
+            response = await self.client.embeddings.create(
+                input=[text.replace("\n", " ") for text in texts],
+                model=self.model
+            )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
 embedding_service = EmbeddingService()
@@ -0,0 +1,446 @@
+import asyncio
+import bisect
+import json
+import time
+import uuid
+from typing import AsyncGenerator, AsyncIterator, Dict, Any, List, Optional, Tuple
+from sqlalchemy import select, update, delete, func
+from app.core.config import settings
+from app.core.telemetry import metrics
+from app.db.database import AsyncSessionLocal
+from app.db.models import Generation
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+DRAFTS_WAITING = metrics.gauge(
+    "novel_generation_drafts_waiting",
+    "Draft generations queued for a free slot under DRAFT_MAX_CONCURRENT"
+)
+
+class LiveGeneration:
+    """
+    In-memory state of a generation produced by this worker.
+    Chunks are kept with their start offsets so a reconnecting client
+    can be served from any character offset without re-joining the whole text.
+    """
+    def __init__(self, generation_id: uuid.UUID, kind: str, context: Optional[Dict[str, Any]]):
+        self.id = generation_id
+        self.kind = kind
+        self.context = context
+        self.chunks: List[str] = []
+        self.starts: List[int] = []
+        self.length = 0
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.last_activity = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._cond = asyncio.Condition()
+
+    def attach(self):
+        self.subscribers += 1
+        if self._abandon_timer:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+    def detach(self):
+        """
+        Called when a client stream ends. Once the last client is gone the upstream
+        keeps running for a grace period so a reconnect can pick it up; after that
+        it is cancelled to stop paying for tokens nobody will read.
+        """
+        self.subscribers -= 1
+        if self.subscribers > 0 or self.status != "running":
+            return
+        self.arm_abandon_timer()
+
+    def arm_abandon_timer(self):
+        loop = asyncio.get_running_loop()
+        self._abandon_timer = loop.call_later(settings.GENERATION_DETACH_GRACE_SECONDS, self._abandon)
+
+    def _abandon(self):
+        self._abandon_timer = None
+        if self.subscribers == 0 and self.status == "running" and self.task:
+            print(f"✂️  Cancelling abandoned generation {self.id}")
+            self.task.cancel()
+
+    async def append(self, chunk: str):
+        async with self._cond:
+            self.starts.append(self.length)
+            self.chunks.append(chunk)
+            self.length += len(chunk)
+            self.last_activity = time.monotonic()
+            self._cond.notify_all()
+
+    async def finish(self, status: str, error: Optional[str] = None):
+        async with self._cond:
+            self.status = status
+            self.error = error
+            self.last_activity = time.monotonic()
+            self._cond.notify_all()
+
+    async def wait_for_change(self, offset: int):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.length > offset or self.status != "running")
+
+    def text_from(self, offset: int) -> str:
+        if offset >= self.length:
+            return ""
+        idx = bisect.bisect_right(self.starts, offset) - 1
+        head = self.chunks[idx][offset - self.starts[idx]:]
+        return head + "".join(self.chunks[idx + 1:])
+
+class GenerationService:
+    """
+    Runs LLM streams as resumable generations.
+
+    The upstream stream is consumed by a background task that is decoupled
+    from the HTTP response, so a dropped client does not lose the tokens.
+    Produced text is appended to the `generations` table in small batches;
+    a client reconnecting (possibly to another worker) gets the text from
+    its last offset immediately and then tails the live stream.
+    """
+    def __init__(self):
+        self._live: Dict[uuid.UUID, LiveGeneration] = {}
+        self._gc_task: Optional[asyncio.Task] = None
+        self._draft_slots = asyncio.Semaphore(settings.DRAFT_MAX_CONCURRENT)
+        self._drafts_waiting = 0
+
+    async def start(
+        self,
+        source: AsyncIterator[str],
+        kind: str,
+        project_id: Optional[uuid.UUID] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> LiveGeneration:
+        """
+        Register a new generation and start consuming `source` in the background.
+        """
+        generation_id = uuid.uuid4()
+        async with AsyncSessionLocal() as db:
+            db.add(Generation(
+                id=generation_id,
+                project_id=project_id,
+                kind=kind,
+                status="running",
+                content="",
+                context_json=context
+            ))
+            await db.commit()
+
+        live = LiveGeneration(generation_id, kind, context)
+        self._live[generation_id] = live
+        live.task = asyncio.create_task(self._produce(live, source))
+        # Covers clients that go away before they ever attach to the stream
+        live.arm_abandon_timer()
+        return live
+
+    async def gated(self, source: AsyncIterator[str]) -> AsyncGenerator[str, None]:
+        """
+        Hold a draft slot while `source` runs. The LLM request only starts once
+        a slot is free, so N drafts from many requests never exceed the cap;
+        cancelling a queued draft simply drops it from the queue.
+        """
+        self._drafts_waiting += 1
+        DRAFTS_WAITING.set(self._drafts_waiting)
+        try:
+            await self._draft_slots.acquire()
+        finally:
+            self._drafts_waiting -= 1
+            DRAFTS_WAITING.set(self._drafts_waiting)
+        try:
+            async for chunk in source:
+                yield chunk
+        finally:
+            self._draft_slots.release()
+
+    async def _produce(self, live: LiveGeneration, source: AsyncIterator[str]):
+        pending: List[str] = []
+        pending_chars = 0
+        last_flush = time.monotonic()
+        status, error = "completed", None
+        try:
+            async for chunk in source:
+                if not chunk:
+                    continue
+                await live.append(chunk)
+                pending.append(chunk)
+                pending_chars += len(chunk)
+                if (pending_chars >= settings.GENERATION_FLUSH_CHARS or
+                        time.monotonic() - last_flush >= settings.GENERATION_FLUSH_INTERVAL_SECONDS):
+                    await self._flush(live.id, "".join(pending))
+                    pending, pending_chars = [], 0
+                    last_flush = time.monotonic()
+        except asyncio.CancelledError:
+            status = "cancelled"
+        except Exception as e:
+            print(f"❌ Generation {live.id} failed: {e}")
+            status, error = "failed", str(e)
+        finally:
+            await self._flush(live.id, "".join(pending), status=status, error=error)
+            await live.finish(status, error)
+
+    async def _flush(
+        self,
+        generation_id: uuid.UUID,
+        delta: str,
+        status: Optional[str] = None,
+        error: Optional[str] = None
+    ):
+        """Append produced text to the persisted generation in a short-lived session."""
+        if not delta and status is None:
+            return
+        values: Dict[str, Any] = {"updated_at": func.now()}
+        if delta:
+            values["content"] = Generation.content + delta
+        if status is not None:
+            values["status"] = status
+            values["error"] = error
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Generation).where(Generation.id == generation_id).values(**values))
+                await db.commit()
+        except Exception as e:
+            # Persisting is best-effort; the live buffer still serves this worker's clients
+            print(f"⚠️  Failed to persist generation {generation_id}: {e}")
+
+    def cancel(self, generation_id: uuid.UUID) -> bool:
+        """Cancel a running generation owned by this worker."""
+        live = self._live.get(generation_id)
+        if not live or live.status != "running" or not live.task:
+            return False
+        live.task.cancel()
+        return True
+
+    async def get_status(self, generation_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        live = self._live.get(generation_id)
+        if live:
+            return {
+                "generation_id": str(live.id),
+                "kind": live.kind,
+                "status": live.status,
+                "length": live.length,
+                "error": live.error
+            }
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Generation.kind, Generation.status, func.length(Generation.content), Generation.error)
+                .where(Generation.id == generation_id)
+            )
+            row = result.first()
+        if not row:
+            return None
+        return {
+            "generation_id": str(generation_id),
+            "kind": row[0],
+            "status": row[1],
+            "length": row[2],
+            "error": row[3]
+        }
+
+    async def _events(
+        self,
+        generation_id: uuid.UUID,
+        offset: int
+    ) -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        Yield ("context", dict), ("delta", (offset, text)) and finally ("end", (status, offset, error)).
+        Served from the live buffer when this worker owns the generation, otherwise from the database.
+        """
+        live = self._live.get(generation_id)
+        if live:
+            live.attach()
+            try:
+                if live.context is not None:
+                    yield "context", live.context
+                while True:
+                    text = live.text_from(offset)
+                    if text:
+                        yield "delta", (offset, text)
+                        offset += len(text)
+                        continue
+                    if live.status != "running":
+                        yield "end", (live.status, offset, live.error)
+                        return
+                    await live.wait_for_change(offset)
+            finally:
+                live.detach()
+
+        context_sent = False
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(
+                        Generation.status,
+                        Generation.error,
+                        Generation.context_json,
+                        func.substr(Generation.content, offset + 1)
+                    ).where(Generation.id == generation_id)
+                )
+                row = result.first()
+            if not row:
+                yield "end", ("failed", offset, "Generation expired")
+                return
+            status, error, context, text = row
+            if not context_sent:
+                context_sent = True
+                if context is not None:
+                    yield "context", context
+            if text:
+                yield "delta", (offset, text)
+                offset += len(text)
+            if status in TERMINAL_STATUSES:
+                yield "end", (status, offset, error)
+                return
+            await asyncio.sleep(settings.GENERATION_FLUSH_INTERVAL_SECONDS)
+
+    async def stream(
+        self,
+        generation_id: uuid.UUID,
+        offset: int = 0,
+        fmt: str = "text"
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream a generation from `offset` (in characters of generated text).
+
+        Formats:
+            text:   legacy raw text; a context summary line is sent first when starting from 0
+            ndjson: {"type": "generation" | "context_summary" | "delta" | "done", ...} per line
+            sse:    server-sent events whose id is the offset after the chunk (usable as Last-Event-ID)
+        """
+        if fmt == "ndjson":
+            yield json.dumps({"type": "generation", "generation_id": str(generation_id), "offset": offset}, ensure_ascii=False) + "\n"
+        elif fmt == "sse":
+            yield f"event: generation\ndata: {json.dumps({'generation_id': str(generation_id), 'offset': offset})}\n\n"
+
+        events = self._events(generation_id, offset)
+        try:
+            async for kind, data in events:
+                if kind == "context" and offset > 0:
+                    continue
+                chunk = self._format(kind, data, fmt)
+                if chunk:
+                    yield chunk
+        finally:
+            # Close explicitly so the live generation sees the detach right away
+            await events.aclose()
+
+    async def stream_many(
+        self,
+        generation_ids: List[uuid.UUID],
+        header: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Multiplex several generations into one NDJSON stream.
+
+        The first line is {"type": "drafts", "drafts": [...], **header}. Every following
+        line is a delta or done event of a single generation, tagged with its `draft`
+        index and `generation_id`, so each draft can later be resumed on its own via
+        /generations/{id}/stream. A final {"type": "drafts_done"} line closes the stream.
+        """
+        drafts = [{"draft": i, "generation_id": str(gid)} for i, gid in enumerate(generation_ids)]
+        yield json.dumps({"type": "drafts", "drafts": drafts, **(header or {})}, ensure_ascii=False) + "\n"
+
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump(index: int, generation_id: uuid.UUID):
+            events = self._events(generation_id, 0)
+            try:
+                async for kind, data in events:
+                    await queue.put((index, kind, data))
+            except Exception as e:
+                await queue.put((index, "end", ("failed", None, str(e))))
+            finally:
+                await events.aclose()
+
+        pumps = [asyncio.create_task(pump(i, gid)) for i, gid in enumerate(generation_ids)]
+        statuses: Dict[int, str] = {}
+        try:
+            while len(statuses) < len(pumps):
+                index, kind, data = await queue.get()
+                tag = {"draft": index, "generation_id": drafts[index]["generation_id"]}
+                if kind == "delta":
+                    chunk_offset, text = data
+                    event = {"type": "delta", **tag, "offset": chunk_offset, "text": text}
+                elif kind == "end":
+                    status, end_offset, error = data
+                    statuses[index] = status
+                    event = {"type": "done", **tag, "status": status, "offset": end_offset, "error": error}
+                else:
+                    continue # Shared context is part of the header
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+            yield json.dumps({"type": "drafts_done", "statuses": [statuses[i] for i in range(len(pumps))]}) + "\n"
+        finally:
+            # Stops tailing only; each generation keeps its own abandon timer
+            for task in pumps:
+                task.cancel()
+            await asyncio.gather(*pumps, return_exceptions=True)
+
+    def _format(self, kind: str, data: Any, fmt: str) -> Optional[str]:
+        if kind == "context":
+            payload = json.dumps({"type": "context_summary", "data": data}, ensure_ascii=False)
+            if fmt == "sse":
+                return f"event: context_summary\ndata: {payload}\n\n"
+            return payload + "\n"
+        if kind == "delta":
+            chunk_offset, text = data
+            if fmt == "ndjson":
+                return json.dumps({"type": "delta", "offset": chunk_offset, "text": text}, ensure_ascii=False) + "\n"
+            if fmt == "sse":
+                payload = json.dumps({"offset": chunk_offset, "text": text}, ensure_ascii=False)
+                return f"id: {chunk_offset + len(text)}\nevent: delta\ndata: {payload}\n\n"
+            return text
+        status, end_offset, error = data
+        if fmt == "ndjson":
+            return json.dumps({"type": "done", "status": status, "offset": end_offset, "error": error}, ensure_ascii=False) + "\n"
+        if fmt == "sse":
+            payload = json.dumps({"status": status, "offset": end_offset, "error": error}, ensure_ascii=False)
+            return f"event: done\ndata: {payload}\n\n"
+        return None
+
+    async def collect_garbage(self) -> int:
+        """
+        Drop generations that have been idle longer than the TTL.
+        Running generations without any progress for that long are treated as abandoned.
+        """
+        ttl = settings.GENERATION_TTL_SECONDS
+        now = time.monotonic()
+        for generation_id, live in list(self._live.items()):
+            if now - live.last_activity < ttl:
+                continue
+            if live.status == "running" and live.task:
+                live.task.cancel()
+            else:
+                self._live.pop(generation_id, None)
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(Generation)
+                .where(Generation.updated_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, ttl))
+                .returning(Generation.id)
+            )
+            purged = len(result.all())
+            await db.commit()
+        return purged
+
+    async def _gc_loop(self):
+        while True:
+            await asyncio.sleep(settings.GENERATION_GC_INTERVAL_SECONDS)
+            try:
+                purged = await self.collect_garbage()
+                if purged:
+                    print(f"🧹 Purged {purged} expired generations")
+            except Exception as e:
+                print(f"⚠️  Generation GC failed: {e}")
+
+    def start_gc(self):
+        if self._gc_task is None or self._gc_task.done():
+            self._gc_task = asyncio.create_task(self._gc_loop())
+
+generation_service = GenerationService()
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Optional
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.core.config import settings
+from app.core.telemetry import metrics
+from app.db.database import AsyncSessionLocal
+from app.db.models import GenesisNodeCache
+
+GENESIS_NODE_CACHE = metrics.counter(
+    "novel_genesis_node_cache_total",
+    "Genesis agent runs by whether the cached output of the draft was reused (hit) or the agent ran (miss)",
+    ["node", "result"]
+)
+
+def fingerprint(value: Any) -> str:
+    """Stable digest of JSON-compatible data; key order does not matter."""
+    encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def input_slice(current_data: Dict[str, Any], keys: Iterable[str]) -> Dict[str, Any]:
+    """The part of the blueprint an agent reads; missing and empty fields look the same."""
+    return {key: current_data[key] for key in keys if current_data.get(key) not in (None, "", [], {})}
+
+class GenesisCacheService:
+    """
+    Per-draft memo of Genesis agent outputs, so a wizard turn only re-runs the agents
+    whose inputs changed. Entries are read once per run and written as each agent finishes.
+    """
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self, draft_id: str) -> Dict[str, Dict[str, Any]]:
+        """node -> {"fingerprint", "intent", "outputs"} for the draft's unexpired entries."""
+        ttl = settings.GENESIS_CACHE_TTL_SECONDS
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(GenesisNodeCache).where(
+                    GenesisNodeCache.draft_id == draft_id,
+                    GenesisNodeCache.updated_at >= func.now() - func.make_interval(0, 0, 0, 0, 0, 0, ttl)
+                )
+            )
+            return {
+                row.node: {"fingerprint": row.fingerprint, "intent": row.intent, "outputs": row.outputs_json}
+                for row in result.scalars().all()
+            }
+
+    async def store(self, draft_id: str, node: str, slice_fingerprint: str, intent: str, outputs: Dict[str, Any]):
+        stmt = pg_insert(GenesisNodeCache).values(
+            draft_id=draft_id, node=node, fingerprint=slice_fingerprint, intent=intent, outputs_json=outputs
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GenesisNodeCache.draft_id, GenesisNodeCache.node],
+            set_={
+                "fingerprint": stmt.excluded.fingerprint,
+                "intent": stmt.excluded.intent,
+                "outputs_json": stmt.excluded.outputs_json,
+                "updated_at": func.now()
+            }
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def clear(self, draft_id: str) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(GenesisNodeCache).where(GenesisNodeCache.draft_id == draft_id).returning(GenesisNodeCache.node)
+            )
+            count = len(result.all())
+            await db.commit()
+        return count
+
+    async def purge_expired(self) -> int:
+        ttl = settings.GENESIS_CACHE_TTL_SECONDS
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(GenesisNodeCache)
+                .where(GenesisNodeCache.updated_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, ttl))
+                .returning(GenesisNodeCache.node)
+            )
+            purged = len(result.all())
+            await db.commit()
+        return purged
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.GENESIS_GC_INTERVAL_SECONDS)
+            try:
+                purged = await self.purge_expired()
+                if purged:
+                    print(f"🧹 Purged {purged} expired Genesis cache entries")
+            except Exception as e:
+                print(f"⚠️  Genesis cache purge failed: {e}")
+
+    def start_background(self):
+        if settings.GENESIS_GC_INTERVAL_SECONDS <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+genesis_cache_service = GenesisCacheService()
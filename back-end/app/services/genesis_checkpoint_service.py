@@ -0,0 +1,165 @@
+import asyncio
+import time
+import uuid
+from typing import Any, List, Optional
+from sqlalchemy import select, update, delete, func, or_
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import GenesisRun
+
+RETRY_SETUP_SECONDS = 60.0
+
+def _psycopg_dsn() -> str:
+    return settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+
+class GenesisCheckpointService:
+    """
+    Durable /genesis/unified runs.
+
+    The graph is compiled with LangGraph's Postgres checkpointer (on its own psycopg pool,
+    since the saver does not speak asyncpg), using the run id as thread_id. State is saved
+    after every node, so a run that failed or lost its client continues after the last
+    completed node instead of paying for every agent again. If the checkpointer cannot be
+    set up, get_graph() returns None and runs are not resumable.
+    """
+    def __init__(self):
+        self._graph = None
+        self._saver = None
+        self._lock = asyncio.Lock()
+        self._retry_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def get_graph(self):
+        if not settings.GENESIS_CHECKPOINT_ENABLED:
+            return None
+        async with self._lock:
+            if self._graph is None and time.monotonic() >= self._retry_at:
+                try:
+                    from psycopg.rows import dict_row
+                    from psycopg_pool import AsyncConnectionPool
+                    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+                    from app.agents.graph import build_genesis_graph
+
+                    pool = AsyncConnectionPool(
+                        conninfo=_psycopg_dsn(),
+                        max_size=settings.GENESIS_CHECKPOINT_POOL_SIZE,
+                        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+                        open=False
+                    )
+                    await pool.open()
+                    saver = AsyncPostgresSaver(pool)
+                    await saver.setup()
+                    self._saver = saver
+                    self._graph = build_genesis_graph(checkpointer=saver)
+                except Exception as e:
+                    self._retry_at = time.monotonic() + RETRY_SETUP_SECONDS
+                    print(f"⚠️  Genesis checkpointer unavailable, runs will not be resumable: {e}")
+        return self._graph
+
+    @staticmethod
+    def config(run_id: str) -> dict:
+        return {"configurable": {"thread_id": run_id}}
+
+    @staticmethod
+    def completed_nodes(snapshot: Any) -> List[str]:
+        """Nodes of the chain that already ran, given a checkpointed state snapshot."""
+        from app.agents.graph import GENESIS_CHAIN
+
+        if not snapshot.next:
+            return list(GENESIS_CHAIN)
+        pending = snapshot.next[0]
+        return GENESIS_CHAIN[:GENESIS_CHAIN.index(pending)] if pending in GENESIS_CHAIN else []
+
+    async def start_run(self, draft_id: Optional[str]) -> str:
+        run_id = uuid.uuid4()
+        async with AsyncSessionLocal() as db:
+            db.add(GenesisRun(id=run_id, draft_id=draft_id, status="running"))
+            await db.commit()
+        return str(run_id)
+
+    async def get_run(self, run_id: str) -> Optional[GenesisRun]:
+        try:
+            parsed = uuid.UUID(run_id)
+        except ValueError:
+            return None
+        async with AsyncSessionLocal() as db:
+            return await db.get(GenesisRun, parsed)
+
+    async def claim_run(self, run_id: str) -> Optional[GenesisRun]:
+        """
+        Mark a run as running again for a resume. Returns None while another request runs it,
+        i.e. it is "running" and finished a node within GENESIS_RUN_LEASE_SECONDS; an older
+        "running" run was left by a crashed worker and is taken over. A single
+        UPDATE ... RETURNING, so two concurrent resumes cannot both claim the run.
+        """
+        lease = settings.GENESIS_RUN_LEASE_SECONDS
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(GenesisRun)
+                .where(
+                    GenesisRun.id == uuid.UUID(run_id),
+                    or_(
+                        GenesisRun.status != "running",
+                        GenesisRun.updated_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, lease)
+                    )
+                )
+                .values(status="running", error=None, updated_at=func.now())
+                .returning(GenesisRun)
+            )
+            run = result.scalar_one_or_none()
+            await db.commit()
+            return run
+
+    async def touch(self, run_id: str):
+        """Renew the lease of a running run after each node."""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenesisRun).where(GenesisRun.id == uuid.UUID(run_id), GenesisRun.status == "running").values(updated_at=func.now())
+            )
+            await db.commit()
+
+    async def set_status(self, run_id: str, status: str, error: Optional[str] = None):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenesisRun).where(GenesisRun.id == uuid.UUID(run_id)).values(status=status, error=error, updated_at=func.now())
+            )
+            await db.commit()
+
+    async def purge_expired(self) -> int:
+        """Drop runs idle longer than GENESIS_RUN_TTL_SECONDS together with their checkpoints."""
+        ttl = settings.GENESIS_RUN_TTL_SECONDS
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(GenesisRun.id).where(GenesisRun.updated_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, ttl))
+            )
+            expired = [row[0] for row in result.all()]
+        if not expired:
+            return 0
+        if self._saver is not None:
+            for run_id in expired:
+                await self._saver.adelete_thread(str(run_id))
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(GenesisRun).where(GenesisRun.id.in_(expired)))
+            await db.commit()
+        return len(expired)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.GENESIS_GC_INTERVAL_SECONDS)
+            try:
+                # Checkpoints can only be deleted through the saver
+                if await self.get_graph() is None:
+                    continue
+                purged = await self.purge_expired()
+                if purged:
+                    print(f"🧹 Purged {purged} expired Genesis runs")
+            except Exception as e:
+                print(f"⚠️  Genesis run purge failed: {e}")
+
+    def start_background(self):
+        if settings.GENESIS_GC_INTERVAL_SECONDS <= 0 or not settings.GENESIS_CHECKPOINT_ENABLED:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+genesis_checkpoint_service = GenesisCheckpointService()
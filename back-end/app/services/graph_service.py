@@ -0,0 +1,325 @@
+import re
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import select, delete, insert, text, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import EntityVersion, EntityVersionArchive, EntityEdge, EntityEdgeArchive
+from app.services.compaction_service import decompress_payload, archived_to_version
+
+# Payload keys of any entity that point at another entity, with the target's type
+REFERENCE_KEYS = {
+    "location_id": ("location", "located_at"),
+    "faction_id": ("faction", "member_of"),
+}
+# Event payload lists of character ids
+EVENT_ROLE_KEYS = {
+    "participants": "participant",
+    "witnesses": "witness",
+}
+RELATIONSHIP_TARGET_KEYS = ("target_id", "target", "character_id", "entity_id", "id", "name")
+RELATIONSHIP_LABEL_KEYS = ("relation", "relationship", "type", "description")
+CLAUSE_SPLIT = re.compile(r"[,，;；、。\n]")
+EdgeTuple = Tuple[str, str, str, Optional[str]] # (dst_type, dst_id, relation, label)
+
+def _target_type(target_id: str) -> str:
+    if target_id.startswith("loc_"):
+        return "location"
+    if target_id.startswith("faction_"):
+        return "faction"
+    return "character"
+
+def _relationship_edges(relationships: Any, name_index: Dict[str, str]) -> List[EdgeTuple]:
+    """
+    `relationships` comes in several shapes: a list of {"target": ..., "relation": ...},
+    a {target: relation} dict, or free text like "林凡的师父，萧炎的死敌" (genesis output).
+    Free text is resolved against known character names and ids, one clause at a time.
+    """
+    edges: List[EdgeTuple] = []
+    if isinstance(relationships, list):
+        for item in relationships:
+            if isinstance(item, dict):
+                target = next((item[k] for k in RELATIONSHIP_TARGET_KEYS if isinstance(item.get(k), str) and item.get(k)), None)
+                label = next((item[k] for k in RELATIONSHIP_LABEL_KEYS if isinstance(item.get(k), str) and item.get(k)), None)
+                if target:
+                    target = name_index.get(target, target)
+                    edges.append((_target_type(target), target, "relationship", label))
+            elif isinstance(item, str):
+                edges.extend(_relationship_edges(item, name_index))
+    elif isinstance(relationships, dict):
+        for target, label in relationships.items():
+            target = name_index.get(target, target)
+            edges.append((_target_type(target), target, "relationship", label if isinstance(label, str) else None))
+    elif isinstance(relationships, str):
+        for clause in CLAUSE_SPLIT.split(relationships):
+            clause = clause.strip()
+            if not clause:
+                continue
+            for name, target in name_index.items():
+                if name in clause:
+                    edges.append(("character", target, "relationship", clause))
+    return edges
+
+def extract_edges(entity_type: str, entity_id: str, payload: Dict[str, Any], name_index: Optional[Dict[str, str]] = None) -> List[EdgeTuple]:
+    """Typed edges encoded in an entity payload, deduplicated, without self-loops."""
+    if not isinstance(payload, dict):
+        return []
+    edges: List[EdgeTuple] = []
+    if entity_type == "event":
+        for key, relation in EVENT_ROLE_KEYS.items():
+            for target in payload.get(key) or []:
+                if isinstance(target, str) and target:
+                    edges.append(("character", target, relation, None))
+    for key, (target_type, relation) in REFERENCE_KEYS.items():
+        target = payload.get(key)
+        if isinstance(target, str) and target:
+            edges.append((target_type, target, relation, None))
+    if payload.get("relationships"):
+        edges.extend(_relationship_edges(payload["relationships"], name_index or {}))
+
+    unique: Dict[Tuple[str, str, str], EdgeTuple] = {}
+    for dst_type, dst_id, relation, label in edges:
+        if (dst_type, dst_id) == (entity_type, entity_id):
+            continue
+        unique.setdefault((dst_type, dst_id, relation), (dst_type, dst_id, relation, label))
+    return list(unique.values())
+
+def _needs_names(payload: Dict[str, Any]) -> bool:
+    relationships = payload.get("relationships") if isinstance(payload, dict) else None
+    if isinstance(relationships, str):
+        return True
+    if isinstance(relationships, list):
+        return any(isinstance(item, (str, dict)) for item in relationships)
+    return isinstance(relationships, dict)
+
+# One index lookup per hop and direction; edges count only while the version that
+# produced them is visible at the chapter, whether it is live or archived as cold.
+# visible_edges is inlined (NOT MATERIALIZED) so each hop's filters reach the indexes.
+# UNION (not ALL) keeps revisits bounded.
+NEIGHBORS_SQL = """
+WITH RECURSIVE visible_edges AS NOT MATERIALIZED (
+    SELECT e.src_type, e.src_id, e.dst_type, e.dst_id, e.relation, e.label
+    FROM entity_edges e
+    JOIN entity_versions v ON v.id = e.source_version_id
+    WHERE e.project_id = :project_id
+      AND v.valid_from_chapter <= :chapter
+      AND (v.valid_to_chapter IS NULL OR v.valid_to_chapter >= :chapter)
+    UNION ALL
+    SELECT e.src_type, e.src_id, e.dst_type, e.dst_id, e.relation, e.label
+    FROM entity_edges_archive e
+    JOIN entity_versions_archive v ON v.id = e.source_version_id
+    WHERE e.project_id = :project_id
+      AND v.reason = 'cold'
+      AND v.valid_from_chapter <= :chapter
+      AND v.valid_to_chapter >= :chapter
+),
+walk(entity_type, entity_id, hops, from_type, from_id, relation, label) AS (
+    SELECT s.entity_type, s.entity_id, 0, NULL::varchar, NULL::varchar, NULL::varchar, NULL::text
+    FROM unnest(CAST(:seed_types AS varchar[]), CAST(:seed_ids AS varchar[])) AS s(entity_type, entity_id)
+  UNION
+    SELECT n.entity_type, n.entity_id, w.hops + 1, w.entity_type, w.entity_id, n.relation, n.label
+    FROM walk w
+    CROSS JOIN LATERAL (
+        SELECT e.dst_type AS entity_type, e.dst_id AS entity_id, e.relation, e.label
+        FROM visible_edges e
+        WHERE e.src_type = w.entity_type AND e.src_id = w.entity_id
+        UNION ALL
+        SELECT e.src_type, e.src_id, e.relation, e.label
+        FROM visible_edges e
+        WHERE e.dst_type = w.entity_type AND e.dst_id = w.entity_id
+    ) n
+    WHERE w.hops < :max_hops
+      {relation_filter}
+)
+SELECT entity_type, entity_id, hops, from_type, from_id, relation, label FROM (
+    SELECT DISTINCT ON (entity_type, entity_id) *
+    FROM walk
+    ORDER BY entity_type, entity_id, hops, relation
+) nearest
+WHERE hops > 0
+ORDER BY hops, relation, entity_type, entity_id
+LIMIT :limit
+"""
+
+class GraphService:
+    """
+    Relationship graph between entities, kept in entity_edges.
+
+    Edges are derived from payloads (character relationships, event participants and
+    witnesses, location_id/faction_id references) whenever an entity version is written,
+    and belong to that version: they are visible exactly while the version is, and go
+    away with it (ON DELETE CASCADE) when it is deleted or merged away by compaction.
+    Versions compacted into cold storage take their edges along (entity_edges_archive),
+    so walks at deep-history chapters still find them.
+    """
+    async def _name_index(self, db: AsyncSession, project_id: uuid.UUID) -> Dict[str, str]:
+        """Current character names (and ids) -> character id, for resolving free-text relationships."""
+        result = await db.execute(
+            select(EntityVersion.entity_id, EntityVersion.payload_json["name"].astext).where(
+                EntityVersion.project_id == project_id,
+                EntityVersion.entity_type == "character",
+                EntityVersion.is_current == True
+            )
+        )
+        index: Dict[str, str] = {}
+        for entity_id, name in result.all():
+            index[entity_id] = entity_id
+            if name and len(name) >= 2: # Single characters match too much free text
+                index[name] = entity_id
+        return index
+
+    def _rows(self, version: Any, edges: Iterable[EdgeTuple]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": uuid.uuid4(),
+                "project_id": version.project_id,
+                "source_version_id": version.id,
+                "src_type": version.entity_type,
+                "src_id": version.entity_id,
+                "dst_type": dst_type,
+                "dst_id": dst_id,
+                "relation": relation,
+                "label": label
+            }
+            for dst_type, dst_id, relation, label in edges
+        ]
+
+    async def index_version(self, db: AsyncSession, version: EntityVersion) -> int:
+        """Add the edges of a newly written version (in the caller's transaction). Returns the edge count."""
+        name_index = None
+        if _needs_names(version.payload_json):
+            name_index = await self._name_index(db, version.project_id)
+        rows = self._rows(version, extract_edges(version.entity_type, version.entity_id, version.payload_json, name_index))
+        if rows:
+            await db.execute(insert(EntityEdge), rows)
+        return len(rows)
+
+    async def rebuild(self, db: AsyncSession, project_id: uuid.UUID) -> int:
+        """Recompute every edge of a project from its live and cold versions, e.g. after an import or for backfill."""
+        await db.execute(delete(EntityEdge).where(EntityEdge.project_id == project_id))
+        await db.execute(delete(EntityEdgeArchive).where(EntityEdgeArchive.project_id == project_id))
+        name_index = await self._name_index(db, project_id)
+        total = 0
+
+        async def write(table, batch: List[Dict[str, Any]]):
+            nonlocal total
+            if batch:
+                await db.execute(insert(table), batch)
+                total += len(batch)
+
+        stream = await db.stream(
+            select(EntityVersion.id, EntityVersion.project_id, EntityVersion.entity_type, EntityVersion.entity_id, EntityVersion.payload_json)
+            .where(EntityVersion.project_id == project_id)
+            .execution_options(yield_per=500)
+        )
+        batch: List[Dict[str, Any]] = []
+        async for row in stream:
+            batch.extend(self._rows(row, extract_edges(row.entity_type, row.entity_id, row.payload_json, name_index)))
+            if len(batch) >= 1000:
+                await write(EntityEdge, batch)
+                batch = []
+        await write(EntityEdge, batch)
+
+        stream = await db.stream(
+            select(
+                EntityVersionArchive.id, EntityVersionArchive.project_id, EntityVersionArchive.entity_type,
+                EntityVersionArchive.entity_id, EntityVersionArchive.payload_zlib
+            )
+            .where(EntityVersionArchive.project_id == project_id, EntityVersionArchive.reason == "cold")
+            .execution_options(yield_per=500)
+        )
+        batch = []
+        async for row in stream:
+            payload = decompress_payload(row.payload_zlib)
+            batch.extend(self._rows(row, extract_edges(row.entity_type, row.entity_id, payload, name_index)))
+            if len(batch) >= 1000:
+                await write(EntityEdgeArchive, batch)
+                batch = []
+        await write(EntityEdgeArchive, batch)
+        return total
+
+    async def neighbors(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        seeds: Sequence[Tuple[str, str]],
+        chapter: int,
+        max_hops: int = 1,
+        relations: Optional[Sequence[str]] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Entities within `max_hops` of the seed (entity_type, entity_id) pairs at `chapter`,
+        nearest first. Edges are followed in both directions; each result names the
+        entity and relation through which it was first reached.
+        """
+        if not seeds or max_hops < 1:
+            return []
+        params: Dict[str, Any] = {
+            "project_id": project_id,
+            "seed_types": [t for t, _ in seeds],
+            "seed_ids": [i for _, i in seeds],
+            "chapter": chapter,
+            "max_hops": max_hops,
+            "limit": limit
+        }
+        relation_filter = ""
+        if relations:
+            relation_filter = "AND n.relation = ANY(CAST(:relations AS varchar[]))"
+            params["relations"] = list(relations)
+        result = await db.execute(text(NEIGHBORS_SQL.format(relation_filter=relation_filter)), params)
+        return [
+            {
+                "entity_type": row.entity_type,
+                "entity_id": row.entity_id,
+                "hops": row.hops,
+                "via": {"entity_type": row.from_type, "entity_id": row.from_id},
+                "relation": row.relation,
+                "label": row.label
+            }
+            for row in result.all()
+        ]
+
+    async def expand(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        seeds: Sequence[Tuple[str, str]],
+        chapter: int,
+        max_hops: int = 1,
+        limit: int = 10,
+        relations: Optional[Sequence[str]] = None
+    ) -> List[Tuple[Dict[str, Any], EntityVersion]]:
+        """
+        Neighbors of the seeds together with their versions visible at `chapter` (live or
+        cold); neighbors without one are skipped.
+        """
+        found = await self.neighbors(db, project_id, seeds, chapter, max_hops, relations, limit)
+        if not found:
+            return []
+        keys = [(n["entity_type"], n["entity_id"]) for n in found]
+        result = await db.execute(
+            select(EntityVersion).where(
+                EntityVersion.project_id == project_id,
+                tuple_(EntityVersion.entity_type, EntityVersion.entity_id).in_(keys),
+                EntityVersion.valid_from_chapter <= chapter,
+                or_(EntityVersion.valid_to_chapter == None, EntityVersion.valid_to_chapter >= chapter)
+            )
+        )
+        versions = {(v.entity_type, v.entity_id): v for v in result.scalars().all()}
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            archived = await db.execute(
+                select(EntityVersionArchive).where(
+                    EntityVersionArchive.project_id == project_id,
+                    EntityVersionArchive.reason == "cold",
+                    tuple_(EntityVersionArchive.entity_type, EntityVersionArchive.entity_id).in_(missing),
+                    EntityVersionArchive.valid_from_chapter <= chapter,
+                    EntityVersionArchive.valid_to_chapter >= chapter
+                )
+            )
+            for row in archived.scalars().all():
+                versions[(row.entity_type, row.entity_id)] = archived_to_version(row)
+                db.expunge(row)
+        return [(n, versions[key]) for n, key in zip(found, keys) if key in versions]
+
+graph_service = GraphService()
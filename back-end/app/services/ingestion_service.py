@@ -0,0 +1,364 @@
+import asyncio
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.telemetry import metrics
+from app.db.database import AsyncSessionLocal, engine
+from app.db.models import Chapter, IngestionJob
+
+INGEST_STAGE_SECONDS = metrics.histogram(
+    "novel_ingest_stage_seconds",
+    "Per-chapter manuscript ingestion stage duration",
+    ["stage"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+INGEST_CHAPTERS = metrics.counter("novel_ingest_chapters_total", "Chapters applied by manuscript ingestion", ["result"])
+
+# "第十二章 风起" / "第12回" / "Chapter 12: ..." on a line of its own
+CHAPTER_HEADING = re.compile(
+    r"^[ \t　]*(?:第[0-9０-９零〇一二两三四五六七八九十百千万]+[章回节]|chapter\s+\d+)[^\n]{0,50}$",
+    re.IGNORECASE | re.MULTILINE
+)
+MIN_PREFACE_CHARS = 200 # Shorter text before the first heading is a title page, not a prologue
+MAX_ERRORS_KEPT = 10
+
+class ChapterConflict(ValueError):
+    pass
+
+def decode_manuscript(data: bytes) -> str:
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16")
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Most non-UTF-8 Chinese manuscripts are GBK/GB2312, both subsets of GB18030
+        return data.decode("gb18030")
+
+def split_manuscript(text: str) -> List[Tuple[str, str]]:
+    """
+    Split a manuscript into (title, content) chapters on chapter headings.
+    Headings without content (e.g. a table of contents) are dropped. A manuscript
+    without recognizable headings is cut at paragraph boundaries instead.
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    matches = list(CHAPTER_HEADING.finditer(text))
+    if not matches:
+        return _chunk_paragraphs(text)
+
+    chapters = []
+    preface = text[:matches[0].start()].strip()
+    if len(preface) >= MIN_PREFACE_CHARS:
+        chapters.append(("序章", preface))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        content = text[match.end():end].strip()
+        if content:
+            chapters.append((match.group(0).strip(), content))
+    return chapters
+
+def _chunk_paragraphs(text: str) -> List[Tuple[str, str]]:
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in (p.strip() for p in text.split("\n")):
+        if not paragraph:
+            continue
+        current.append(paragraph)
+        size += len(paragraph)
+        if size >= settings.INGEST_FALLBACK_CHAPTER_CHARS:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return [(f"第{i}章", chunk) for i, chunk in enumerate(chunks, start=1)]
+
+async def extract_chapter(content: str, number: int) -> Dict[str, Any]:
+    """
+    Summary, entity updates and events of one chapter plus their embeddings, ready for
+    RAGService.apply_entity_updates / apply_chapter_events. Holds no database connection.
+    """
+    from app.services.analysis_service import analysis_service
+    from app.services.embedding_service import embedding_service
+    from app.services.rag_service import entity_embedding_text
+
+    (summary, entity_updates), events = await asyncio.gather(
+        analysis_service.analyze_chapter_content(content),
+        analysis_service.extract_events(content, number)
+    )
+    event_ids = [f"evt_{uuid.uuid4().hex[:8]}" for _ in events]
+    texts = [
+        entity_embedding_text(e.get('entity_type', 'unknown'), e.get('entity_id', 'unknown'), e.get('payload', {}))
+        for e in entity_updates
+    ] + [entity_embedding_text("event", event_id, event) for event_id, event in zip(event_ids, events)]
+    embeddings = await embedding_service.get_embeddings(texts)
+    return {
+        "summary": summary,
+        "entity_updates": entity_updates,
+        "entity_embeddings": embeddings[:len(entity_updates)],
+        "events": events,
+        "event_ids": event_ids,
+        "event_embeddings": embeddings[len(entity_updates):]
+    }
+
+def job_to_dict(job: IngestionJob) -> Dict[str, Any]:
+    total = job.last_chapter - job.first_chapter + 1
+    return {
+        "job_id": str(job.id),
+        "project_id": str(job.project_id),
+        "status": job.status,
+        "source_name": job.source_name,
+        "run_analysis": job.run_analysis,
+        "first_chapter": job.first_chapter,
+        "last_chapter": job.last_chapter,
+        "applied_through": job.applied_through,
+        "progress": round((job.applied_through - job.first_chapter + 1) / total, 4) if total else 1.0,
+        "stats": job.stats or {},
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at
+    }
+
+class IngestionService:
+    """
+    Bulk manuscript ingestion: split, create all chapters at once, then analyze.
+
+    Extraction (LLM + embeddings, no database connection held) runs for up to
+    INGEST_CONCURRENCY chapters at a time, a bounded window ahead of the writer.
+    Results are applied one chapter at a time in chapter order, because each entity
+    version closes the validity range of the previous one.
+    """
+    def __init__(self):
+        self._tasks: Dict[uuid.UUID, asyncio.Task] = {}
+
+    async def create_job(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        text: str,
+        source_name: Optional[str] = None,
+        start_chapter: Optional[int] = None,
+        run_analysis: bool = True
+    ) -> IngestionJob:
+        chapters = split_manuscript(text)
+        if not chapters:
+            raise ValueError("No chapter text found in the manuscript")
+
+        has_content = func.length(func.coalesce(Chapter.content, "")) > 0
+        if start_chapter is None:
+            start_chapter = (await db.scalar(
+                select(func.max(Chapter.chapter_number)).where(Chapter.project_id == project_id, has_content)
+            ) or 0) + 1
+        last_chapter = start_chapter + len(chapters) - 1
+
+        in_range = (
+            Chapter.project_id == project_id,
+            Chapter.chapter_number >= start_chapter,
+            Chapter.chapter_number <= last_chapter
+        )
+        conflicts = await db.scalar(select(func.count()).select_from(Chapter).where(*in_range, has_content))
+        if conflicts:
+            raise ChapterConflict(f"{conflicts} chapters between {start_chapter} and {last_chapter} already have content")
+        # Chapters in the range without content (the chapter 1 every new project starts with,
+        # chapters planned from the outline) are filled in place: their detailed outline stays
+        existing = (await db.execute(
+            select(Chapter.id, Chapter.chapter_number, Chapter.content_revision).where(*in_range)
+        )).all()
+        if existing:
+            await db.execute(update(Chapter), [
+                {
+                    "id": row.id,
+                    "title": chapters[row.chapter_number - start_chapter][0],
+                    "content": chapters[row.chapter_number - start_chapter][1],
+                    "content_revision": row.content_revision + 1
+                }
+                for row in existing
+            ])
+        filled = {row.chapter_number for row in existing}
+        new_chapters = [
+            {
+                "id": uuid.uuid4(),
+                "project_id": project_id,
+                "chapter_number": start_chapter + i,
+                "title": title,
+                "content": content
+            }
+            for i, (title, content) in enumerate(chapters) if start_chapter + i not in filled
+        ]
+        if new_chapters:
+            await db.execute(insert(Chapter), new_chapters)
+        job = IngestionJob(
+            project_id=project_id,
+            status="running" if run_analysis else "completed",
+            source_name=source_name,
+            run_analysis=run_analysis,
+            first_chapter=start_chapter,
+            last_chapter=last_chapter,
+            applied_through=start_chapter - 1 if run_analysis else last_chapter,
+            stats={"chapters_total": len(chapters), "chars_total": sum(len(content) for _, content in chapters)}
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        return job
+
+    def start(self, job_id: uuid.UUID) -> bool:
+        task = self._tasks.get(job_id)
+        if task and not task.done():
+            return False
+        self._tasks[job_id] = asyncio.create_task(self.run(job_id))
+        return True
+
+    async def resume_pending(self):
+        """Restart jobs left running by a crash or restart. Called at startup."""
+        try:
+            async with AsyncSessionLocal() as db:
+                job_ids = (await db.execute(select(IngestionJob.id).where(IngestionJob.status == "running"))).scalars().all()
+        except Exception as e:
+            print(f"⚠️  Could not look up pending ingestion jobs: {e}")
+            return
+        for job_id in job_ids:
+            print(f"📚 Resuming manuscript ingestion {job_id}")
+            self.start(job_id)
+
+    async def run(self, job_id: uuid.UUID):
+        lock_key = func.hashtext(f"ingestion:{job_id}")
+        async with engine.connect() as lock_conn:
+            # Same pattern as compaction: one runner per job across workers
+            lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await lock_conn.scalar(select(func.pg_try_advisory_lock(lock_key))):
+                return
+            try:
+                await self._run_locked(job_id)
+            except asyncio.CancelledError:
+                raise # Shutdown: the job stays running and resumes on the next start
+            except Exception as e:
+                print(f"⚠️  Manuscript ingestion {job_id} failed: {e}")
+                async with AsyncSessionLocal() as db:
+                    await db.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(status="failed", error=str(e)))
+                    await db.commit()
+            finally:
+                await lock_conn.execute(select(func.pg_advisory_unlock(lock_key)))
+
+    async def _run_locked(self, job_id: uuid.UUID):
+        async with AsyncSessionLocal() as db:
+            job = await db.get(IngestionJob, job_id)
+            if not job or job.status != "running":
+                return
+            project_id = job.project_id
+            stats = dict(job.stats or {})
+            chapters = (await db.execute(
+                select(Chapter.chapter_number, Chapter.id).where(
+                    Chapter.project_id == project_id,
+                    Chapter.chapter_number > job.applied_through,
+                    Chapter.chapter_number <= job.last_chapter
+                ).order_by(Chapter.chapter_number)
+            )).all()
+
+        semaphore = asyncio.Semaphore(settings.INGEST_CONCURRENCY)
+        window = settings.INGEST_CONCURRENCY * 2 # Bounds how many extracted chapters wait in memory
+        upcoming = iter(chapters)
+        pending: Deque[Tuple[int, uuid.UUID, asyncio.Task]] = deque()
+        run_started = time.perf_counter()
+        elapsed_before = stats.get("elapsed_seconds", 0.0)
+
+        def schedule():
+            while len(pending) < window:
+                chapter = next(upcoming, None)
+                if chapter is None:
+                    return
+                number, chapter_id = chapter
+                pending.append((number, chapter_id, asyncio.create_task(self._extract(semaphore, chapter_id, number))))
+
+        try:
+            schedule()
+            while pending:
+                number, chapter_id, task = pending.popleft()
+                prepared = await task
+                schedule()
+                stats["elapsed_seconds"] = elapsed_before + (time.perf_counter() - run_started)
+                await self._apply(job_id, project_id, chapter_id, number, prepared, stats)
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(status="completed"))
+            await db.commit()
+        print(f"✅ Manuscript ingestion {job_id} complete: {stats.get('chapters_applied', 0)} chapters, "
+              f"{stats.get('chapters_per_minute', 0)} chapters/min")
+
+    async def _extract(self, semaphore: asyncio.Semaphore, chapter_id: uuid.UUID, number: int) -> Dict[str, Any]:
+        """LLM extraction and embeddings for one chapter. Never raises; failures are reported to the writer."""
+        async with semaphore:
+            started = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                content = await db.scalar(select(Chapter.content).where(Chapter.id == chapter_id)) or ""
+            try:
+                prepared = await extract_chapter(content, number)
+            except Exception as e:
+                prepared = {"error": str(e)}
+            prepared["chars"] = len(content)
+            prepared["extract_seconds"] = time.perf_counter() - started
+            INGEST_STAGE_SECONDS.observe(prepared["extract_seconds"], stage="extract")
+            return prepared
+
+    async def _apply(
+        self,
+        job_id: uuid.UUID,
+        project_id: uuid.UUID,
+        chapter_id: uuid.UUID,
+        number: int,
+        prepared: Dict[str, Any],
+        stats: Dict[str, Any]
+    ):
+        """
+        Write one chapter's results and advance `applied_through`. Re-applying a chapter after
+        a crash is safe: its events are replaced and entity updates become newer versions.
+        """
+        from app.services.rag_service import rag_service
+
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            if "error" in prepared:
+                stats["chapters_failed"] = stats.get("chapters_failed", 0) + 1
+                stats["errors"] = (stats.get("errors", []) + [{"chapter": number, "error": prepared["error"]}])[-MAX_ERRORS_KEPT:]
+                INGEST_CHAPTERS.inc(result="failed")
+            else:
+                values = {"analyzed_revision": Chapter.content_revision}
+                if prepared["summary"]:
+                    values["summary"] = prepared["summary"]
+                await db.execute(update(Chapter).where(Chapter.id == chapter_id).values(**values))
+                entities_updated = await rag_service.apply_entity_updates(
+                    db, project_id, number, prepared["entity_updates"], prepared["entity_embeddings"]
+                )
+                events_created, characters_notified = await rag_service.apply_chapter_events(
+                    db, project_id, number, prepared["events"], prepared["event_ids"], prepared["event_embeddings"]
+                )
+                stats["entities_updated"] = stats.get("entities_updated", 0) + entities_updated
+                stats["events_created"] = stats.get("events_created", 0) + events_created
+                stats["characters_notified"] = stats.get("characters_notified", 0) + characters_notified
+                INGEST_CHAPTERS.inc(result="applied")
+
+            apply_seconds = time.perf_counter() - started
+            INGEST_STAGE_SECONDS.observe(apply_seconds, stage="apply")
+            stats["chapters_applied"] = stats.get("chapters_applied", 0) + 1
+            stats["chars_applied"] = stats.get("chars_applied", 0) + prepared["chars"]
+            stats["extract_seconds_total"] = stats.get("extract_seconds_total", 0.0) + prepared["extract_seconds"]
+            stats["apply_seconds_total"] = stats.get("apply_seconds_total", 0.0) + apply_seconds
+            elapsed = stats["elapsed_seconds"] + apply_seconds
+            stats["chapters_per_minute"] = round(stats["chapters_applied"] / elapsed * 60, 2) if elapsed else None
+            stats["chars_per_second"] = round(stats["chars_applied"] / elapsed, 1) if elapsed else None
+            # Extraction time overlapped per second of wall clock: how much the pipeline parallelizes
+            stats["effective_concurrency"] = round(stats["extract_seconds_total"] / elapsed, 2) if elapsed else None
+
+            await db.execute(
+                update(IngestionJob).where(IngestionJob.id == job_id).values(applied_through=number, stats=dict(stats))
+            )
+            await db.commit()
+
+ingestion_service = IngestionService()
@@ -1,6 +1,7 @@
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from app.core.config import settings
+from app.core.telemetry import span, traceparent_env
 from typing import Dict, Any
 import os
 import sys
@@ -34,7 +35,8 @@ class InspirationService:
         server_params = StdioServerParameters(
             command=python_exe,
             args=[server_script],
-            env={**os.environ, "TAVILY_API_KEY": settings.TAVILY_API_KEY or ""}
+            # TRACEPARENT lets the MCP server attach its timings to this request's trace
+            env={**os.environ, "TAVILY_API_KEY": settings.TAVILY_API_KEY or "", **traceparent_env()}
         )
 
         retries = 2
@@ -45,7 +47,8 @@ class InspirationService:
                         await session.initialize()
                         
                         # Call the tool
-                        result = await session.call_tool("search_inspiration", arguments={"query": query})
+                        with span("mcp", "search_inspiration"):
+                            result = await session.call_tool("search_inspiration", arguments={"query": query})
                         
                         # The result from call_tool is a CallToolResult object
                         # We need to parse it back to the expected dictionary format
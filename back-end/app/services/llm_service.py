@@ -1,7 +1,44 @@
 from openai import AsyncOpenAI
 from app.core.config import settings
-from typing import List, Dict, Any, AsyncGenerator
+from app.core.telemetry import metrics, STAGE_DURATION
+from app.services.stream_guard import stream_stats
+from typing import List, Dict, Any, AsyncGenerator, Optional
 from pathlib import Path
+import asyncio
+import time
+
+LLM_TTFT = metrics.histogram(
+    "novel_llm_time_to_first_token_seconds",
+    "Time from request to the first streamed content token",
+    ["model"]
+)
+LLM_TOKENS_PER_SECOND = metrics.histogram(
+    "novel_llm_tokens_per_second",
+    "Completion tokens per second after the first token",
+    ["model"],
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320)
+)
+LLM_TOKENS = metrics.counter(
+    "novel_llm_tokens_total",
+    "Tokens reported by the provider (or estimated from stream deltas)",
+    ["model", "type"]
+)
+LLM_PROMPT_CACHE_TOKENS = metrics.counter(
+    "novel_llm_prompt_cache_tokens_total",
+    "Prompt tokens served from (hit) or not from (miss) the provider's context cache",
+    ["model", "kind", "result"]
+)
+
+def cached_prompt_tokens(usage) -> Optional[int]:
+    """
+    Cache hits from the provider's usage block: DeepSeek reports prompt_cache_hit_tokens,
+    OpenAI-compatible APIs prompt_tokens_details.cached_tokens. None if neither is present.
+    """
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        hit = getattr(details, "cached_tokens", None) if details is not None else None
+    return hit
 
 class LLMService:
     def __init__(self):
@@ -30,24 +67,72 @@ class LLMService:
     async def generate_text(
         self, 
         messages: List[Dict[str, str]], 
-        stream: bool = True
+        stream: bool = True,
+        kind: str = "default",
+        temperature: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None
     ) -> AsyncGenerator[str, None]:
         """
         Generate text using the LLM. Supports streaming.
+        If the consumer stops early (client disconnect, cancelled generation),
+        the upstream stream is closed so the provider stops producing tokens.
+        `kind` labels the prompt-cache telemetry (chapter, chat, ...).
+        `temperature` is left to the provider default unless given.
+        `response_format` is passed through, e.g. {"type": "json_object"} for JSON mode.
         """
+        started = time.monotonic()
         response = await self.client.chat.completions.create(
             model=self.model,
             messages=messages,
-            stream=stream
+            stream=stream,
+            **({"stream_options": {"include_usage": True}} if stream else {}),
+            **({"temperature": temperature} if temperature is not None else {}),
+            **({"response_format": response_format} if response_format is not None else {})
         )
 
         if stream:
-            async for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+            tokens = 0
+            usage = None
+            first_token_at = None
+            try:
+                async for chunk in response:
+                    if chunk.usage:
+                        usage = chunk.usage # Sent in a final chunk without choices
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                            LLM_TTFT.observe(first_token_at - started, model=self.model)
+                        tokens += 1 # One content delta is roughly one token
+                        yield chunk.choices[0].delta.content
+            except (GeneratorExit, asyncio.CancelledError):
+                stream_stats.record_cancelled("llm", tokens, time.monotonic() - started)
+                self._record_usage(usage, tokens, started, first_token_at, "cancelled", kind)
+                await response.close()
+                raise
+            except Exception:
+                self._record_usage(usage, tokens, started, first_token_at, "error", kind)
+                await response.close()
+                raise
+            stream_stats.record_completed("llm", tokens, time.monotonic() - started)
+            self._record_usage(usage, tokens, started, first_token_at, "ok", kind)
         else:
             # This part is for non-streaming, though the requirement emphasizes streaming.
             # For consistency with the return type, we could yield the single response.
+            self._record_usage(response.usage, 0, started, None, "ok", kind)
             yield response.choices[0].message.content
 
+    def _record_usage(self, usage, streamed_tokens: int, started: float, first_token_at, status: str, kind: str = "default"):
+        finished_at = time.monotonic()
+        STAGE_DURATION.observe(finished_at - started, stage="llm", name=self.model, status=status)
+        completion_tokens = usage.completion_tokens if usage else streamed_tokens
+        if usage:
+            LLM_TOKENS.inc(usage.prompt_tokens, model=self.model, type="prompt")
+            hit = cached_prompt_tokens(usage)
+            if hit is not None:
+                LLM_PROMPT_CACHE_TOKENS.inc(hit, model=self.model, kind=kind, result="hit")
+                LLM_PROMPT_CACHE_TOKENS.inc(max(0, usage.prompt_tokens - hit), model=self.model, kind=kind, result="miss")
+        LLM_TOKENS.inc(completion_tokens, model=self.model, type="completion")
+        if first_token_at is not None and finished_at > first_token_at and completion_tokens:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / (finished_at - first_token_at), model=self.model)
+
 llm_service = LLMService()
@@ -0,0 +1,156 @@
+import json
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+
+PATCH_OPS = ("add", "remove", "replace", "move", "copy", "test")
+
+class PatchConflict(ValueError):
+    """meta_revision no longer matches the revision the client based its patch on."""
+
+class PatchFailed(ValueError):
+    """An operation could not be applied (missing path, failed test, invalid pointer)."""
+
+def parse_pointer(pointer: str) -> List[str]:
+    """RFC 6901 JSON pointer to a Postgres text[] path: "/world/factions/0" -> ["world", "factions", "0"]."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise PatchFailed(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+class _PatchCompiler:
+    """
+    Compiles a JSON Patch into a chain of CTE steps over the document, one per operation.
+    Each step yields the new document and, if the operation's precondition does not hold
+    on the document as left by the previous steps, the index of the first failing operation.
+    """
+    def __init__(self):
+        self.params: Dict[str, Any] = {}
+
+    def _bind(self, name: str, value: Any, sql_type: str) -> str:
+        self.params[name] = value
+        return f"CAST(:{name} AS {sql_type})"
+
+    def _path(self, name: str, path: List[str]) -> str:
+        return self._bind(name, path, "text[]")
+
+    def _add(self, i: int, base: str, path: List[str], value: str) -> Tuple[str, str]:
+        if not path:
+            return value, "true"
+        parent = self._path(f"pp{i}", path[:-1])
+        last = path[-1]
+        if last == "-":
+            appended = f"(({base} #> {parent}) || jsonb_build_array({value}))"
+            new = appended if len(path) == 1 else f"jsonb_set({base}, {parent}, {appended})"
+            return new, f"jsonb_typeof({base} #> {parent}) = 'array'"
+        target = self._path(f"p{i}", path)
+        if last.isdigit():
+            new = (f"CASE WHEN jsonb_typeof({base} #> {parent}) = 'array' "
+                   f"THEN jsonb_insert({base}, {target}, {value}) ELSE jsonb_set({base}, {target}, {value}, true) END")
+            return new, f"jsonb_typeof({base} #> {parent}) IN ('object', 'array')"
+        return f"jsonb_set({base}, {target}, {value}, true)", f"jsonb_typeof({base} #> {parent}) = 'object'"
+
+    def step(self, i: int, op: Dict[str, Any]) -> Tuple[str, str]:
+        """SQL for (new document, precondition) of operation `i`, in terms of the previous document `d`."""
+        kind = op.get("op")
+        if kind not in PATCH_OPS:
+            raise PatchFailed(f"Operation {i}: unsupported op {kind!r}")
+        path = parse_pointer(op.get("path", ""))
+        if kind in ("add", "replace", "test"):
+            if "value" not in op:
+                raise PatchFailed(f"Operation {i}: '{kind}' requires a value")
+            value = self._bind(f"v{i}", json.dumps(op["value"], ensure_ascii=False), "jsonb")
+
+        if kind == "add":
+            return self._add(i, "d", path, value)
+        if kind == "test":
+            target = self._path(f"p{i}", path)
+            return "d", f"coalesce((d #> {target}) = {value}, false)"
+        if not path:
+            if kind == "replace":
+                return value, "true"
+            raise PatchFailed(f"Operation {i}: cannot {kind} the document root")
+        if kind in ("replace", "remove"):
+            target = self._path(f"p{i}", path)
+            if kind == "replace":
+                return f"jsonb_set(d, {target}, {value}, false)", f"(d #> {target}) IS NOT NULL"
+            return f"(d #- {target})", f"(d #> {target}) IS NOT NULL"
+
+        # move / copy
+        source = parse_pointer(op.get("from", ""))
+        if not source:
+            raise PatchFailed(f"Operation {i}: '{kind}' requires a non-root 'from'")
+        if kind == "move" and path[:len(source)] == source:
+            raise PatchFailed(f"Operation {i}: cannot move a value into itself")
+        origin = self._path(f"f{i}", source)
+        base = f"(d #- {origin})" if kind == "move" else "d"
+        new, ok = self._add(i, base, path, f"(d #> {origin})")
+        return new, f"(d #> {origin}) IS NOT NULL AND {ok}"
+
+    def compile(self, ops: List[Dict[str, Any]], expected_revision: Optional[int]) -> str:
+        revision_check = ""
+        if expected_revision is not None:
+            revision_check = f" AND meta_revision = {self._bind('expected_revision', expected_revision, 'integer')}"
+        ctes = [
+            "s0 AS (SELECT coalesce(meta_info, '{}'::jsonb) AS d, NULL::integer AS failed "
+            f"FROM projects WHERE id = :project_id{revision_check} FOR UPDATE)"
+        ]
+        for i, op in enumerate(ops):
+            new, ok = self.step(i, op)
+            # Once an operation failed the document is carried through unchanged
+            ctes.append(
+                f"s{i + 1} AS (SELECT CASE WHEN failed IS NULL AND ({ok}) THEN {new} ELSE d END AS d, "
+                f"coalesce(failed, CASE WHEN ({ok}) THEN NULL ELSE {i} END) AS failed FROM s{i})"
+            )
+        last = f"s{len(ops)}"
+        ctes.append(
+            f"upd AS (UPDATE projects SET meta_info = {last}.d, meta_revision = projects.meta_revision + 1, "
+            f"updated_at = now() FROM {last} WHERE projects.id = :project_id AND {last}.failed IS NULL "
+            "RETURNING projects.meta_revision)"
+        )
+        return "WITH " + ",\n".join(ctes) + f"\nSELECT {last}.failed, (SELECT meta_revision FROM upd) FROM {last}"
+
+class MetaPatchService:
+    """
+    Partial updates of Project.meta_info.
+
+    A JSON Patch (RFC 6902) is applied by a single UPDATE built from jsonb_set, jsonb_insert
+    and #-, so only the operations travel over the wire and the document never round-trips
+    through Python. The row is locked for the statement, which makes concurrent patches to
+    different paths compose instead of overwriting each other; `expected_revision` adds an
+    optimistic check against meta_revision for clients that edited a copy of the document.
+    """
+    async def apply(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        ops: List[Dict[str, Any]],
+        expected_revision: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Apply `ops` in the session's transaction (the caller commits) and return the new meta_revision.
+        Returns None if the project does not exist; raises PatchConflict or PatchFailed otherwise.
+        """
+        if not ops:
+            raise PatchFailed("Empty patch")
+        if len(ops) > settings.META_PATCH_MAX_OPS:
+            raise PatchFailed(f"At most {settings.META_PATCH_MAX_OPS} operations per patch")
+
+        compiler = _PatchCompiler()
+        statement = compiler.compile(ops, expected_revision)
+        row = (await db.execute(text(statement), {"project_id": project_id, **compiler.params})).first()
+        if row is None:
+            current = await db.scalar(text("SELECT meta_revision FROM projects WHERE id = :project_id"), {"project_id": project_id})
+            if current is None:
+                return None
+            raise PatchConflict(f"meta_revision is {current}, patch was based on {expected_revision}")
+        failed, revision = row
+        if failed is not None:
+            op = ops[failed]
+            raise PatchFailed(f"Operation {failed} ({op.get('op')} {op.get('path')}) could not be applied")
+        return revision
+
+meta_patch_service = MetaPatchService()
@@ -1,12 +1,38 @@
-import json
-from typing import Dict, Any, List, Optional, Tuple
-from app.services.llm_service import llm_service
+from typing import Dict, Any, List, Optional, Tuple, Literal
+from pydantic import BaseModel, Field
+from app.services.structured_output import generate_structured, StructuredOutputError
+from app.core.telemetry import traced
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db.models import Project
 import uuid
 
+class SuggestedOutline(BaseModel):
+    title: Optional[str] = None
+    summary: Optional[str] = None
+
+class OutlineComparison(BaseModel):
+    needs_update: bool
+    deviation_level: Literal["none", "minor", "major"]
+    suggested_outline: SuggestedOutline = Field(default_factory=SuggestedOutline)
+    analysis: str = ""
+
+class OutlineChapterChange(BaseModel):
+    chapter_num: int
+    vol_index: int
+    ch_index: int
+    title: str = ""
+    summary: str = ""
+    changed: bool = False
+    change_reason: Optional[str] = None
+
+class OutlineCascade(BaseModel):
+    modified_chapters: List[OutlineChapterChange]
+    total_changes: int = 0
+    high_impact_changes: List[str] = Field(default_factory=list)
+
 class OutlineService:
+    @traced("outline")
     async def compare_content_to_outline(
         self, 
         content: str, 
@@ -66,29 +92,19 @@ class OutlineService:
             {"role": "user", "content": user_prompt}
         ]
         
-        response_text = ""
         try:
-            async for chunk in llm_service.generate_text(messages, stream=False):
-                response_text += chunk
-            
-            # Clean JSON
-            response_text = response_text.strip()
-            if response_text.startswith("```"):
-                response_text = response_text.split("\n", 1)[1] if "\n" in response_text else response_text
-                if response_text.endswith("```"):
-                    response_text = response_text.rsplit("\n", 1)[0]
-            if response_text.startswith("json"):
-                response_text = response_text[4:].strip()
-            
-            result = json.loads(response_text)
+            comparison = await generate_structured(messages, OutlineComparison, "outline_comparison", kind="outline")
+            result = comparison.model_dump(exclude_none=True)
             result['chapter_num'] = chapter_num
             return result
             
         except Exception as e:
             print(f"Outline comparison failed: {e}")
-            print(f"Raw response: {response_text}")
+            if isinstance(e, StructuredOutputError):
+                print(f"Raw response: {e.raw}")
             return {"needs_update": False, "deviation_level": "none", "error": str(e)}
     
+    @traced("outline")
     async def batch_update_subsequent_outline(
         self,
         modified_chapter_num: int,
@@ -186,31 +202,20 @@ class OutlineService:
             {"role": "user", "content": user_prompt}
         ]
         
-        response_text = ""
         try:
-            async for chunk in llm_service.generate_text(messages, stream=False):
-                response_text += chunk
-            
-            # Clean JSON
-            response_text = response_text.strip()
-            if response_text.startswith("```"):
-                response_text = response_text.split("\n", 1)[1] if "\n" in response_text else response_text
-                if response_text.endswith("```"):
-                    response_text = response_text.rsplit("\n", 1)[0]
-            if response_text.startswith("json"):
-                response_text = response_text[4:].strip()
-            
-            result = json.loads(response_text)
+            cascade = await generate_structured(messages, OutlineCascade, "outline_cascade", kind="outline")
+            result = cascade.model_dump()
             
             # Validate completeness
-            if len(result.get('modified_chapters', [])) != len(subsequent_chapters):
-                print(f"Warning: LLM returned {len(result.get('modified_chapters', []))} chapters, expected {len(subsequent_chapters)}")
+            if len(result['modified_chapters']) != len(subsequent_chapters):
+                print(f"Warning: LLM returned {len(result['modified_chapters'])} chapters, expected {len(subsequent_chapters)}")
             
             return result
             
         except Exception as e:
             print(f"Batch outline update failed: {e}")
-            print(f"Raw response: {response_text}")
+            if isinstance(e, StructuredOutputError):
+                print(f"Raw response: {e.raw}")
             return {
                 "modified_chapters": [],
                 "total_changes": 0,
@@ -266,6 +271,7 @@ class OutlineService:
         
         return flat
     
+    @traced("outline")
     async def sync_outline_after_chapter_save(
         self,
         db: AsyncSession,
@@ -360,25 +366,35 @@ class OutlineService:
         new_outline_item: Dict,
         subsequent_changes: List[Dict]
     ):
-        """Apply outline changes to the project meta_info."""
+        """
+        Apply outline changes to the project meta_info.
+        Only the touched chapter titles and summaries are patched, so edits made to other
+        parts of meta_info while the LLM was comparing are kept.
+        """
+        from app.services.meta_patch_service import meta_patch_service
+
+        def chapter_ops(v_idx: int, c_idx: int, title: str, summary: str) -> List[Dict]:
+            base = f"/outline/{v_idx}/chapters/{c_idx}"
+            return [
+                {"op": "add", "path": f"{base}/title", "value": title},
+                {"op": "add", "path": f"{base}/summary", "value": summary}
+            ]
+
         # Update current chapter
-        vol_idx = current_outline_item['vol_index']
-        ch_idx = current_outline_item['ch_index']
-        
-        outline[vol_idx]['chapters'][ch_idx]['title'] = new_outline_item.get('title', current_outline_item['title'])
-        outline[vol_idx]['chapters'][ch_idx]['summary'] = new_outline_item.get('summary', '')
+        ops = chapter_ops(
+            current_outline_item['vol_index'],
+            current_outline_item['ch_index'],
+            new_outline_item.get('title', current_outline_item['title']),
+            new_outline_item.get('summary', '')
+        )
         
         # Update subsequent chapters
         for change in subsequent_changes:
             if change.get('changed'):
-                v_idx = change['vol_index']
-                c_idx = change['ch_index']
-                outline[v_idx]['chapters'][c_idx]['title'] = change.get('title', '')
-                outline[v_idx]['chapters'][c_idx]['summary'] = change.get('summary', '')
+                ops += chapter_ops(change['vol_index'], change['ch_index'], change.get('title', ''), change.get('summary', ''))
         
         # Save to database
-        project.meta_info['outline'] = outline
-        db.add(project)
+        await meta_patch_service.apply(db, project.id, ops)
         await db.commit()
 
 outline_service = OutlineService()
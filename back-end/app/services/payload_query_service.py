@@ -0,0 +1,388 @@
+import asyncio
+import hashlib
+import json
+import re
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import select, and_, or_, not_, exists, cast, literal, literal_column, func, text, tuple_, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert, JSONPATH
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from app.core.config import settings
+from app.core.telemetry import metrics, traced
+from app.db.database import AsyncSessionLocal, engine
+from app.db.models import EntityVersion, EntityVersionArchive, PayloadQueryStat
+from app.services.compaction_service import decompress_payload
+
+PAYLOAD_OPS = ("eq", "ne", "in", "contains", "exists", "lt", "lte", "gt", "gte")
+COMPARISONS = {"lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+# Path segments end up in index DDL and jsonpath literals, so only word characters are accepted
+PATH_SEGMENT = re.compile(r"^(?!\d+$)\w+$")
+MANAGED_INDEX_PREFIX = "ix_evp_"
+
+INDEX_CHANGES = metrics.counter(
+    "novel_payload_index_changes_total",
+    "Managed payload expression indexes created or dropped by tuning",
+    ["action"]
+)
+
+class InvalidPayloadQuery(ValueError):
+    """A filter with an unknown op, a malformed path or a value the op cannot use."""
+
+PayloadFilter = Tuple[List[str], str, Any] # (path, op, value)
+
+def parse_path(path: str) -> List[str]:
+    """"stats.realm" -> ["stats", "realm"]."""
+    segments = path.split(".") if isinstance(path, str) else []
+    if not segments or not all(PATH_SEGMENT.match(s) for s in segments):
+        raise InvalidPayloadQuery(f"Invalid payload path {path!r}")
+    return segments
+
+def parse_filter(item: Dict[str, Any]) -> PayloadFilter:
+    op = item.get("op", "eq")
+    if op not in PAYLOAD_OPS:
+        raise InvalidPayloadQuery(f"Unsupported op {op!r}")
+    path = parse_path(item.get("path"))
+    value = item.get("value")
+    if op == "in" and not isinstance(value, list):
+        raise InvalidPayloadQuery(f"'in' on {item.get('path')} needs a list value")
+    if op in COMPARISONS and (isinstance(value, bool) or not isinstance(value, (int, float, str))):
+        raise InvalidPayloadQuery(f"'{op}' on {item.get('path')} needs a number or string value")
+    return path, op, value
+
+def index_name(path: List[str]) -> str:
+    return MANAGED_INDEX_PREFIX + hashlib.md5(".".join(path).encode("utf-8")).hexdigest()[:16]
+
+def _text_path(path: List[str], column: str = "payload_json") -> str:
+    # Spelled as a constant (not a bind parameter) so the planner can match the managed expression index
+    return column + " #>> '{" + ",".join(path) + "}'"
+
+def _jsonpath(path: List[str]) -> str:
+    return "$" + "".join(f'."{segment}"' for segment in path)
+
+def _nest(path: List[str], value: Any) -> Dict[str, Any]:
+    for segment in reversed(path):
+        value = {segment: value}
+    return value
+
+def _is_scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+# --- Python evaluation, for cold-archived versions ---------------------------------
+
+def _lookup(payload: Any, path: List[str]) -> Tuple[bool, Any]:
+    for segment in path:
+        if not isinstance(payload, dict) or segment not in payload:
+            return False, None
+        payload = payload[segment]
+    return True, payload
+
+def _json_equal(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    return a == b
+
+def _contains(container: Any, item: Any) -> bool:
+    """jsonb @> semantics."""
+    if isinstance(container, dict):
+        return isinstance(item, dict) and all(k in container and _contains(container[k], v) for k, v in item.items())
+    if isinstance(container, list):
+        items = item if isinstance(item, list) else [item]
+        return all(any(_contains(c, i) for c in container) for i in items)
+    return _json_equal(container, item)
+
+def matches(payload: Dict[str, Any], filters: Sequence[PayloadFilter]) -> bool:
+    """Same semantics as the SQL predicates built by PayloadQueryService."""
+    for path, op, value in filters:
+        found, current = _lookup(payload, path)
+        if op == "eq":
+            ok = found and _json_equal(current, value)
+        elif op == "ne":
+            ok = not (found and _json_equal(current, value))
+        elif op == "in":
+            ok = found and any(_json_equal(current, v) for v in value)
+        elif op == "contains":
+            ok = found and isinstance(current, list) and _contains(current, value if isinstance(value, list) else [value])
+        elif op == "exists":
+            ok = found
+        else:
+            comparable = (
+                isinstance(current, str) and isinstance(value, str)
+                or isinstance(current, (int, float)) and not isinstance(current, bool) and isinstance(value, (int, float))
+            )
+            ok = found and comparable and {
+                "lt": current < value, "lte": current <= value, "gt": current > value, "gte": current >= value
+            }[op]
+        if not ok:
+            return False
+    return True
+
+class PayloadQueryService:
+    """
+    Structured filters over EntityVersion.payload_json, evaluated in SQL.
+
+    - Equality, `in` and `contains` become jsonb containment (@>) and `exists`/comparisons
+      JSON path predicates (@?, @@), all served by the jsonb_path_ops GIN index.
+    - String equality is also spelled as `payload_json #>> '{path}'`, which the planner can
+      answer from a managed expression index (project_id, entity_type, path) when one exists.
+      Which paths get one is decided from observed queries: every equality filter counts
+      towards its path, and tune_indexes() keeps the PAYLOAD_INDEX_MAX most used paths
+      indexed, building and dropping indexes CONCURRENTLY so writes are never blocked.
+    - Queries at a chapter follow time-travel rules (the version visible at N) and include
+      cold-archived versions, which are matched in Python with the same semantics.
+    """
+    def __init__(self):
+        self._observed: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def _predicate(self, path: List[str], op: str, value: Any):
+        payload = EntityVersion.payload_json
+        if op == "eq":
+            if not _is_scalar(value):
+                return payload[tuple(path)] == value
+            clause = payload.contains(_nest(path, value))
+            if isinstance(value, str):
+                # Redundant with @>, but lets a managed expression index be used instead of the GIN index
+                clause = and_(clause, literal_column(_text_path(path, "entity_versions.payload_json"), String) == literal(value, String))
+            return clause
+        if op == "ne":
+            return not_(func.coalesce(self._predicate(path, "eq", value), False))
+        if op == "in":
+            if not value:
+                return literal(False)
+            return or_(*[self._predicate(path, "eq", v) for v in value])
+        if op == "contains":
+            return payload.contains(_nest(path, value if isinstance(value, list) else [value]))
+        if op == "exists":
+            return payload.op("@?")(cast(literal(_jsonpath(path)), JSONPATH))
+        condition = f"{_jsonpath(path)} {COMPARISONS[op]} {json.dumps(value)}"
+        return payload.op("@@")(cast(literal(condition), JSONPATH))
+
+    def _observe(self, filters: Sequence[PayloadFilter]):
+        for path, op, value in filters:
+            if op == "eq" and isinstance(value, str) or op == "in" and all(isinstance(v, str) for v in value):
+                self._observed[".".join(path)] += 1
+
+    @traced("payload_query")
+    async def query(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        filters: List[Dict[str, Any]],
+        entity_type: Optional[str] = None,
+        chapter: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Entities whose payload satisfies every filter: current versions, or the versions
+        visible at `chapter`. Results have the shape of /context/retrieve results.
+        """
+        if len(filters) > settings.PAYLOAD_QUERY_MAX_FILTERS:
+            raise InvalidPayloadQuery(f"At most {settings.PAYLOAD_QUERY_MAX_FILTERS} filters per query")
+        parsed = [parse_filter(item) for item in filters]
+        self._observe(parsed)
+
+        stmt = select(
+            EntityVersion.entity_type,
+            EntityVersion.entity_id,
+            EntityVersion.version,
+            EntityVersion.valid_from_chapter,
+            EntityVersion.valid_to_chapter,
+            EntityVersion.payload_json
+        ).where(EntityVersion.project_id == project_id, *[self._predicate(*f) for f in parsed])
+        if entity_type:
+            stmt = stmt.where(EntityVersion.entity_type == entity_type)
+        if chapter is None:
+            stmt = stmt.where(EntityVersion.is_current == True)
+        else:
+            # The matching version must be the one visible at the chapter, not an older or newer one
+            newer = aliased(EntityVersion)
+            stmt = stmt.where(
+                EntityVersion.valid_from_chapter <= chapter,
+                or_(EntityVersion.valid_to_chapter == None, EntityVersion.valid_to_chapter >= chapter),
+                ~exists().where(
+                    newer.project_id == EntityVersion.project_id,
+                    newer.entity_type == EntityVersion.entity_type,
+                    newer.entity_id == EntityVersion.entity_id,
+                    newer.version > EntityVersion.version,
+                    newer.valid_from_chapter <= chapter,
+                    or_(newer.valid_to_chapter == None, newer.valid_to_chapter >= chapter)
+                )
+            )
+        stmt = stmt.order_by(EntityVersion.entity_type, EntityVersion.entity_id).limit(limit)
+        rows = list((await db.execute(stmt)).all())
+
+        if chapter is not None:
+            archived = select(
+                EntityVersionArchive.entity_type,
+                EntityVersionArchive.entity_id,
+                EntityVersionArchive.version,
+                EntityVersionArchive.valid_from_chapter,
+                EntityVersionArchive.valid_to_chapter,
+                EntityVersionArchive.payload_zlib
+            ).where(
+                EntityVersionArchive.project_id == project_id,
+                EntityVersionArchive.reason == "cold",
+                EntityVersionArchive.valid_from_chapter <= chapter,
+                EntityVersionArchive.valid_to_chapter >= chapter
+            )
+            if entity_type:
+                archived = archived.where(EntityVersionArchive.entity_type == entity_type)
+            if len(rows) >= limit:
+                # Only cold rows sorting before the last live match can still make the cut
+                last_type, last_id = rows[limit - 1][:2]
+                archived = archived.where(
+                    tuple_(EntityVersionArchive.entity_type, EntityVersionArchive.entity_id) <= tuple_(literal(last_type), literal(last_id))
+                )
+            # Cold payloads can only be filtered after decompression: stream them in result
+            # order and stop once `limit` match, rather than loading every cold row
+            archived = archived.order_by(EntityVersionArchive.entity_type, EntityVersionArchive.entity_id)
+            stream = await db.stream(archived.execution_options(yield_per=200))
+            found = 0
+            async for row in stream:
+                payload = decompress_payload(row.payload_zlib)
+                if matches(payload, parsed):
+                    rows.append((*row[:5], payload))
+                    found += 1
+                    if found >= limit:
+                        break
+            await stream.close()
+            rows.sort(key=lambda r: (r[0], r[1]))
+
+        return [
+            {
+                "entity_id": entity_id,
+                "entity_type": row_type,
+                "version": version,
+                "payload": payload,
+                "valid_from": valid_from,
+                "valid_to": valid_to
+            }
+            for row_type, entity_id, version, valid_from, valid_to, payload in rows[:limit]
+        ]
+
+    async def flush_stats(self):
+        """Add this worker's observed equality filters to payload_query_stats."""
+        if not self._observed:
+            return
+        observed, self._observed = self._observed, Counter()
+        stmt = pg_insert(PayloadQueryStat).values([
+            {"path": path, "query_count": count} for path, count in observed.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PayloadQueryStat.path],
+            set_={
+                "query_count": PayloadQueryStat.query_count + stmt.excluded.query_count,
+                "last_queried_at": func.now()
+            }
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def list_indexes(self, db: AsyncSession) -> Dict[str, Any]:
+        """Managed expression indexes and the most queried paths."""
+        indexes = await db.execute(text("""
+            SELECT c.relname AS name, obj_description(c.oid, 'pg_class') AS path,
+                   i.indisvalid AS valid, pg_relation_size(c.oid) AS size_bytes
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'entity_versions'::regclass AND c.relname LIKE :prefix
+            ORDER BY c.relname
+        """), {"prefix": MANAGED_INDEX_PREFIX + "%"})
+        stats = await db.execute(
+            select(PayloadQueryStat).order_by(PayloadQueryStat.query_count.desc()).limit(50)
+        )
+        return {
+            "indexes": [dict(row._mapping) for row in indexes.all()],
+            "paths": [
+                {"path": s.path, "query_count": round(s.query_count, 1), "last_queried_at": s.last_queried_at}
+                for s in stats.scalars().all()
+            ]
+        }
+
+    async def tune_indexes(self) -> Dict[str, Any]:
+        """
+        Converge the managed expression indexes on the most queried paths, then halve
+        every path's count so indexes follow changing query patterns. Runs on one worker
+        at a time (advisory lock); invalid leftovers of failed builds are rebuilt.
+        """
+        await self.flush_stats()
+        created: List[str] = []
+        dropped: List[str] = []
+        lock_key = func.hashtext("payload_index_tuning")
+        async with engine.connect() as conn:
+            # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await conn.scalar(select(func.pg_try_advisory_lock(lock_key))):
+                return {"skipped": True, "created": created, "dropped": dropped}
+            try:
+                popular = (await conn.execute(
+                    select(PayloadQueryStat.path)
+                    .where(PayloadQueryStat.query_count >= settings.PAYLOAD_INDEX_MIN_QUERIES)
+                    .order_by(PayloadQueryStat.query_count.desc())
+                    .limit(settings.PAYLOAD_INDEX_MAX)
+                )).scalars().all()
+                wanted: Dict[str, List[str]] = {}
+                for path in popular:
+                    try:
+                        segments = parse_path(path)
+                    except InvalidPayloadQuery:
+                        continue
+                    wanted[index_name(segments)] = segments
+                existing = {
+                    row.relname: row.indisvalid
+                    for row in (await conn.execute(text("""
+                        SELECT c.relname, i.indisvalid
+                        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                        WHERE i.indrelid = 'entity_versions'::regclass AND c.relname LIKE :prefix
+                    """), {"prefix": MANAGED_INDEX_PREFIX + "%"})).all()
+                }
+
+                for name, valid in existing.items():
+                    if name not in wanted or not valid:
+                        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                        if name not in wanted:
+                            dropped.append(name)
+                            INDEX_CHANGES.inc(action="dropped")
+                for name, segments in wanted.items():
+                    if existing.get(name):
+                        continue
+                    path = ".".join(segments)
+                    try:
+                        await conn.execute(text(
+                            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                            f"ON entity_versions (project_id, entity_type, ({_text_path(segments)}))"
+                        ))
+                        await conn.execute(text(f"COMMENT ON INDEX {name} IS '{path}'"))
+                        created.append(path)
+                        INDEX_CHANGES.inc(action="created")
+                    except Exception as e:
+                        print(f"⚠️  Failed to build payload index for {path}: {e}")
+                        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+                await conn.execute(
+                    PayloadQueryStat.__table__.update().values(query_count=PayloadQueryStat.query_count / 2)
+                )
+                await conn.execute(PayloadQueryStat.__table__.delete().where(PayloadQueryStat.query_count < 1))
+            finally:
+                await conn.execute(select(func.pg_advisory_unlock(lock_key)))
+        if created or dropped:
+            print(f"🗂️  Payload indexes: +{len(created)} -{len(dropped)}")
+        return {"skipped": False, "created": created, "dropped": dropped}
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.PAYLOAD_INDEX_TUNE_INTERVAL_SECONDS)
+            try:
+                await self.tune_indexes()
+            except Exception as e:
+                print(f"⚠️  Payload index tuning failed: {e}")
+
+    def start_background(self):
+        if settings.PAYLOAD_INDEX_TUNE_INTERVAL_SECONDS <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+payload_query_service = PayloadQueryService()
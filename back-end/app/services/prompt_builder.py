@@ -0,0 +1,158 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from app.core.telemetry import metrics
+
+PROMPT_PREFIX = metrics.counter(
+    "novel_prompt_prefix_total",
+    "Prompts whose stable prefix was already sent recently by this worker (repeat) or not (new)",
+    ["kind", "result"]
+)
+PREFIX_HISTORY_SIZE = 512
+
+def canonical_json(value: Any) -> str:
+    """Byte-stable JSON: the same data always renders to the same string."""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+def world_digest(meta: Dict[str, Any]) -> str:
+    """
+    The static part of a project bible: golden finger rules, world and main characters.
+    Built only from meta_info, in a fixed order, so it is identical across requests
+    until the project itself changes.
+    """
+    digest = ""
+    golden_finger_rules = meta.get('golden_finger_rules', [])
+    world = meta.get('world', {})
+
+    if golden_finger_rules:
+        digest += "【金手指规则】\n" + "\n".join([f"{i+1}. {r}" for i, r in enumerate(golden_finger_rules)]) + "\n\n"
+
+    if world:
+        digest += "【世界观】\n"
+        # Power System
+        power = world.get('power_system', {})
+        if power:
+            digest += f"力量体系: {power.get('source', '')}\n"
+            if power.get('levels'):
+                digest += "境界: " + " → ".join([lv.get('name', '') for lv in power.get('levels', [])[:5]]) + "...\n"
+        # Factions
+        factions = world.get('factions', [])
+        if factions:
+            digest += "主要势力: " + ", ".join([f.get('name', '') for f in factions]) + "\n"
+        # Rules
+        rules = world.get('rules', {})
+        if rules and rules.get('public_rules'):
+            digest += "核心规则:\n" + "\n".join([f"  {i+1}. {r}" for i, r in enumerate(rules['public_rules'][:3])]) + "\n"
+        digest += "\n"
+
+    characters = meta.get('characters', [])
+    if characters:
+        digest += "【主要角色】\n"
+        for char in characters[:5]: # Limit to top 5 to avoid overflow
+            digest += f"- {char.get('name')}: {char.get('role', '')}, {char.get('personality', '')}\n"
+        digest += "\n"
+    return digest
+
+class PromptLayout:
+    """
+    A prompt split into a stable prefix and volatile sections.
+
+    Providers with context caching (DeepSeek, OpenAI) bill and serve a repeated prefix
+    faster, but only up to the first differing byte. Stable sections (instructions,
+    project bible) therefore go first and must be rendered deterministically; anything
+    that changes per chapter, per query or per turn goes after them, least volatile first.
+    """
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.stable: List[str] = []
+        self.volatile: List[str] = []
+
+    def add_stable(self, text: Optional[str]):
+        if text and text.strip():
+            self.stable.append(text.strip("\n"))
+
+    def add_volatile(self, text: Optional[str]):
+        if text and text.strip():
+            self.volatile.append(text.strip("\n"))
+
+    def prefix(self) -> str:
+        return "\n\n".join(self.stable)
+
+    def tail(self) -> str:
+        return "\n\n".join(self.volatile)
+
+_recent_prefixes: Dict[str, "OrderedDict[str, None]"] = {}
+
+def record_prefix(kind: str, prefix: str) -> str:
+    """Count whether this worker sent the same prefix recently. Returns its fingerprint."""
+    fingerprint = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+    seen = _recent_prefixes.setdefault(kind, OrderedDict())
+    if fingerprint in seen:
+        seen.move_to_end(fingerprint)
+        PROMPT_PREFIX.inc(kind=kind, result="repeat")
+    else:
+        seen[fingerprint] = None
+        if len(seen) > PREFIX_HISTORY_SIZE:
+            seen.popitem(last=False)
+        PROMPT_PREFIX.inc(kind=kind, result="new")
+    return fingerprint
+
+CHAPTER_SYSTEM_PROMPT = """你是一位专业的小说创作者。请根据用户提供的项目背景、大纲脉络、相关设定以及上一章概要，创作下一章的内容。
+
+要求：
+1. **剧情承接**：紧密衔接上一章的结尾和概要。
+2. **设定一致**：严格遵守提供的角色和世界观设定。
+3. **指令遵循**：遵循创作指令和优先级规则（见下方）。
+4. **格式规范**：输出内容必须包含章节标题和正文。
+
+格式：
+# 章节标题
+正文内容..."""
+
+def chapter_instruction_block(instructions: Optional[str]) -> str:
+    """User instructions with their priority rules, or the outline-only mode when there are none."""
+    if instructions and instructions.strip():
+        # User provided specific instructions - prioritize them
+        return f"""【用户创作指令】
+{instructions}
+
+【优先级规则】
+- 用户创作指令 > 大纲建议
+- 如果用户指令与大纲有微小冲突（如改变场景细节、增加配角对话），请自然融合两者
+- 如果有重大冲突（如改变关键剧情走向），以用户指令为准，但请设法为后续章节留下回旋余地，保持故事整体连贯性"""
+    # No user instructions - follow outline strictly
+    return """【创作模式】
+严格按照大纲继续创作。无特殊指示，请根据大纲中本章的计划内容进行创作。"""
+
+def chapter_layout(
+    meta: Dict[str, Any],
+    outline_context: str,
+    prev_summary: str,
+    prev_content_tail: str,
+    rag_context: str,
+    instructions: Optional[str]
+) -> PromptLayout:
+    """
+    The prompt for drafting the next chapter. The stable prefix depends on meta_info only,
+    so it is identical for every chapter of the project; the rest goes from least to most
+    volatile: per chapter (outline window, previous chapter), per request (retrieval, instructions).
+    """
+    layout = PromptLayout("chapter")
+    layout.add_stable(CHAPTER_SYSTEM_PROMPT)
+    layout.add_stable(f"""【项目背景】
+类型: {meta.get('genre', '未定')}
+主题: {meta.get('theme', '')}""")
+    if meta.get('story_formula'):
+        layout.add_stable(f"【故事公式】\n{meta['story_formula']}")
+    layout.add_stable(world_digest(meta))
+
+    layout.add_volatile(outline_context)
+    layout.add_volatile(f"""【上一章概要】
+{prev_summary}
+
+【上一章结尾】
+{prev_content_tail}""")
+    layout.add_volatile(rag_context)
+    layout.add_volatile(chapter_instruction_block(instructions))
+    return layout
@@ -1,11 +1,24 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_, or_
-from app.db.models import EntityVersion
+from sqlalchemy import select, update, delete, and_, or_, values, column, cast, true, Integer, String
+from sqlalchemy.orm import aliased
+from pgvector.sqlalchemy import Vector, HALFVEC
+from app.db.models import EntityVersion, EntityVersionArchive
 from app.services.embedding_service import embedding_service
-from typing import List, Dict, Any, Optional
+from app.services.compaction_service import archived_to_version
+from app.services.snapshot_service import bump_entity_epoch
+from app.services.graph_service import graph_service
+from app.services.timeline_service import timeline_service
+from app.core.telemetry import traced
+from typing import List, Dict, Any, Optional, Tuple
+import math
 import uuid
 
+def entity_embedding_text(entity_type: str, entity_id: str, payload: Dict[str, Any]) -> str:
+    # Convert payload to string for embedding (simplified)
+    return f"{entity_type} {entity_id}: {str(payload)}"
+
 class RAGService:
+    @traced("rag")
     async def upsert_entity_version(
         self,
         db: AsyncSession,
@@ -13,15 +26,18 @@ class RAGService:
         entity_type: str,
         entity_id: str,
         payload: Dict[str, Any],
-        current_chapter: int
+        current_chapter: int,
+        embedding: Optional[List[float]] = None,
+        commit: bool = True
     ):
         """
         Insert a new version of an entity, handling time-travel logic.
+        Callers may pass an `embedding` of entity_embedding_text() computed ahead of time.
+        With commit=False the changes are only flushed and the caller commits.
         """
         # 1. Generate embedding for the payload
-        # Convert payload to string for embedding (simplified)
-        text_representation = f"{entity_type} {entity_id}: {str(payload)}"
-        embedding = await embedding_service.get_embedding(text_representation)
+        if embedding is None:
+            embedding = await embedding_service.get_embedding(entity_embedding_text(entity_type, entity_id, payload))
 
         # 2. Find current version
         stmt = select(EntityVersion).where(
@@ -50,6 +66,7 @@ class RAGService:
 
         # 4. Create new version
         new_entity = EntityVersion(
+            id=uuid.uuid4(),
             project_id=project_id,
             entity_type=entity_type,
             entity_id=entity_id,
@@ -61,42 +78,201 @@ class RAGService:
             embedding=embedding
         )
         db.add(new_entity)
-        await db.commit()
-        await db.refresh(new_entity)
+        await db.flush()
+        # Relationship edges belong to this version and share its validity range
+        await graph_service.index_version(db, new_entity)
+        if entity_type == "event":
+            await timeline_service.record(db, new_entity)
+        await bump_entity_epoch(db, project_id)
+        if commit:
+            await db.commit()
+            await db.refresh(new_entity)
         return new_entity
 
+    @traced("rag")
     async def retrieve_context(
         self,
         db: AsyncSession,
         project_id: uuid.UUID,
         query: str,
         current_chapter: int,
-        limit: int = 5
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None,
+        candidate_pool: Optional[int] = None
     ) -> List[EntityVersion]:
         """
         Retrieve relevant entity versions based on query and current chapter.
+        Callers may pass a precomputed `query_embedding` so the embedding request
+        does not run while the session holds a pooled connection.
+        With `candidate_pool`, the nearest N versions of the project are fetched first
+        (index-friendly) and the chapter filter is applied to that pool only; this trades
+        recall for latency on large projects with an ANN index.
         """
         # 1. Get query embedding
-        query_embedding = await embedding_service.get_embedding(query)
+        if query_embedding is None:
+            query_embedding = await embedding_service.get_embedding(query)
 
         # 2. SQL Query with pgvector distance and time filtering
         # We want entities that are valid for the current_chapter:
         # valid_from <= current_chapter AND (valid_to IS NULL OR valid_to >= current_chapter)
-        
-        stmt = select(EntityVersion).where(
-            EntityVersion.project_id == project_id,
+        distance = EntityVersion.embedding.l2_distance(query_embedding)
+        visible = and_(
             EntityVersion.valid_from_chapter <= current_chapter,
             or_(
                 EntityVersion.valid_to_chapter == None,
                 EntityVersion.valid_to_chapter >= current_chapter
             )
-        ).order_by(
-            EntityVersion.embedding.l2_distance(query_embedding)
-        ).limit(limit)
+        )
+
+        if candidate_pool:
+            candidates = select(EntityVersion.id).where(
+                EntityVersion.project_id == project_id
+            ).order_by(distance).limit(candidate_pool).scalar_subquery()
+            stmt = select(EntityVersion, distance).where(
+                EntityVersion.id.in_(candidates),
+                visible
+            ).order_by(distance).limit(limit)
+        else:
+            stmt = select(EntityVersion, distance).where(
+                EntityVersion.project_id == project_id,
+                visible
+            ).order_by(distance).limit(limit)
 
         result = await db.execute(stmt)
-        return result.scalars().all()
+        scored = [(math.inf if dist is None else dist, version) for version, dist in result.all()]
+
+        # Versions moved to cold storage by compaction are still valid for old chapters
+        archived = (await self._retrieve_archived(db, project_id, current_chapter, [query_embedding], limit=limit))[0]
+        if archived:
+            scored.extend(archived)
+            scored.sort(key=lambda item: item[0])
+        return [version for _, version in scored[:limit]]
+
+    @traced("rag")
+    async def retrieve_batch(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        queries: List[str],
+        current_chapter: int,
+        quotas: Dict[str, int],
+        query_embeddings: Optional[List[List[float]]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Retrieve for several queries at once, with a quota per entity type
+        (e.g. {"character": 5, "event": 3}) so no type crowds out the others.
+
+        All queries are embedded in one request, and every (query, type) pair is answered
+        by a LATERAL nearest-neighbour subquery in a single statement. Hits are deduplicated
+        across queries and each type is cut to its quota, best rank first, so every query
+        gets its top hits in before anyone's second-best.
+
+        Returns {entity_type: [{"version": EntityVersion, "distance": float, "queries": [idx, ...]}]}.
+        """
+        quotas = {entity_type: quota for entity_type, quota in quotas.items() if quota > 0}
+        if not queries or not quotas:
+            return {}
+        if query_embeddings is None:
+            query_embeddings = await embedding_service.get_embeddings(queries)
 
+        q = values(column("query_idx", Integer), column("query_embedding", Vector()), name="q").data(
+            list(enumerate(query_embeddings))
+        )
+        t = values(column("entity_type", String), column("quota", Integer), name="t").data(list(quotas.items()))
+        # VALUES parameters arrive untyped, so the vector is cast explicitly
+        distance = EntityVersion.embedding.l2_distance(cast(q.c.query_embedding, Vector()))
+        nearest = select(EntityVersion, distance.label("distance")).where(
+            EntityVersion.project_id == project_id,
+            EntityVersion.entity_type == t.c.entity_type,
+            EntityVersion.valid_from_chapter <= current_chapter,
+            or_(
+                EntityVersion.valid_to_chapter == None,
+                EntityVersion.valid_to_chapter >= current_chapter
+            )
+        ).order_by(distance).limit(t.c.quota).lateral("nearest")
+        hit = aliased(EntityVersion, nearest)
+        stmt = (
+            select(q.c.query_idx, hit, nearest.c.distance)
+            .select_from(q.join(t, true()).join(nearest, true()))
+        )
+        rows = (await db.execute(stmt)).all()
+
+        # (query, type) -> hits in distance order, hot and cold tier merged
+        ranked: Dict[Tuple[int, str], List[Tuple[float, EntityVersion]]] = {}
+        for query_idx, version, dist in rows:
+            ranked.setdefault((query_idx, version.entity_type), []).append((dist, version))
+        archived = await self._retrieve_archived(db, project_id, current_chapter, query_embeddings, quotas=quotas)
+        for query_idx, scored in enumerate(archived):
+            for dist, version in scored:
+                ranked.setdefault((query_idx, version.entity_type), []).append((dist, version))
+
+        best: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for (query_idx, entity_type), hits in ranked.items():
+            hits.sort(key=lambda item: item[0])
+            for rank, (dist, version) in enumerate(hits[:quotas[entity_type]]):
+                key = (version.entity_type, version.entity_id)
+                entry = best.get(key)
+                if entry is None:
+                    best[key] = {"version": version, "distance": dist, "rank": rank, "queries": [query_idx]}
+                    continue
+                if query_idx not in entry["queries"]:
+                    entry["queries"].append(query_idx)
+                if (rank, dist) < (entry["rank"], entry["distance"]):
+                    entry.update(version=version, distance=dist, rank=rank)
+
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in sorted(best.values(), key=lambda e: (e["rank"], e["distance"])):
+            group = grouped.setdefault(entry["version"].entity_type, [])
+            if len(group) < quotas[entry["version"].entity_type]:
+                entry["queries"].sort()
+                group.append({"version": entry["version"], "distance": entry["distance"], "queries": entry["queries"]})
+        return grouped
+
+    async def _retrieve_archived(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        current_chapter: int,
+        query_embeddings: List[List[float]],
+        limit: int = 0,
+        quotas: Optional[Dict[str, int]] = None
+    ) -> List[List[Tuple[float, EntityVersion]]]:
+        """
+        Cold versions valid at `current_chapter` nearest to each query: the `limit` nearest,
+        or with `quotas` the nearest of each entity type up to its quota. Ranked in SQL on the
+        halfvec embeddings like the live tier, so only the hits are loaded and decompressed.
+        Returns one list of (distance, version) per query, nearest first.
+        """
+        q = values(column("query_idx", Integer), column("query_embedding", HALFVEC()), name="cq").data(
+            list(enumerate(query_embeddings))
+        )
+        distance = EntityVersionArchive.embedding_half.l2_distance(cast(q.c.query_embedding, HALFVEC()))
+        nearest = select(EntityVersionArchive, distance.label("distance")).where(
+            EntityVersionArchive.project_id == project_id,
+            EntityVersionArchive.reason == "cold",
+            EntityVersionArchive.valid_from_chapter <= current_chapter,
+            EntityVersionArchive.valid_to_chapter >= current_chapter
+        ).order_by(distance)
+        if quotas:
+            t = values(column("entity_type", String), column("quota", Integer), name="ct").data(list(quotas.items()))
+            nearest = nearest.where(EntityVersionArchive.entity_type == t.c.entity_type).limit(t.c.quota).lateral("cold_nearest")
+            source = q.join(t, true()).join(nearest, true())
+        else:
+            nearest = nearest.limit(limit).lateral("cold_nearest")
+            source = q.join(nearest, true())
+        hit = aliased(EntityVersionArchive, nearest)
+        rows = (await db.execute(select(q.c.query_idx, hit, nearest.c.distance).select_from(source))).all()
+
+        scored: List[List[Tuple[float, EntityVersion]]] = [[] for _ in query_embeddings]
+        versions: Dict[uuid.UUID, EntityVersion] = {}
+        for query_idx, row, dist in rows:
+            if row.id not in versions:
+                versions[row.id] = archived_to_version(row)
+                db.expunge(row)
+            scored[query_idx].append((math.inf if dist is None else dist, versions[row.id]))
+        return scored
+
+    @traced("rag")
     async def delete_entity(
         self,
         db: AsyncSession,
@@ -105,52 +281,148 @@ class RAGService:
         entity_id: str
     ):
         """
-        Delete all versions of an entity.
+        Delete all versions of an entity, including those compaction moved to the archive
+        (cold rows are still served for old chapters; their edges go with them by cascade).
+        Runs as DELETE ... RETURNING so versions (and their vectors) are never loaded.
         """
-        stmt = select(EntityVersion).where(
+        stmt = delete(EntityVersion).where(
             EntityVersion.project_id == project_id,
             EntityVersion.entity_type == entity_type,
             EntityVersion.entity_id == entity_id
-        )
+        ).returning(EntityVersion.id)
         result = await db.execute(stmt)
-        versions = result.scalars().all()
-        
-        for version in versions:
-            await db.delete(version)
-            
+        deleted = len(result.all())
+        archived = await db.execute(
+            delete(EntityVersionArchive).where(
+                EntityVersionArchive.project_id == project_id,
+                EntityVersionArchive.entity_type == entity_type,
+                EntityVersionArchive.entity_id == entity_id
+            ).returning(EntityVersionArchive.id)
+        )
+        deleted += len(archived.all())
+        if deleted:
+            await bump_entity_epoch(db, project_id)
+        if entity_type == "event":
+            await timeline_service.delete_events(db, project_id, [entity_id])
+
         await db.commit()
-        return len(versions)
+        return deleted
 
+    @traced("rag")
     async def delete_events_for_chapter(
         self,
         db: AsyncSession,
         project_id: uuid.UUID,
-        chapter_num: int
+        chapter_num: int,
+        commit: bool = True
     ):
         """
         Delete all event entities that occurred in a specific chapter.
         This is used for hard reset when re-analyzing a chapter.
         """
-        # We need to find events where payload_json->>'occurred_at_chapter' == str(chapter_num)
-        # Or simpler: we can just filter by entity_type='event' and valid_from_chapter=chapter_num
-        # assuming events are created with valid_from_chapter = occurred_at_chapter
-        
-        stmt = select(EntityVersion).where(
+        # Events are created with valid_from_chapter = occurred_at_chapter,
+        # so filtering on entity_type='event' and valid_from_chapter is enough
+        stmt = delete(EntityVersion).where(
             EntityVersion.project_id == project_id,
             EntityVersion.entity_type == 'event',
             EntityVersion.valid_from_chapter == chapter_num
-        )
+        ).returning(EntityVersion.entity_id)
         result = await db.execute(stmt)
-        events = result.scalars().all()
-        
-        count = 0
-        for event in events:
-            await db.delete(event)
-            count += 1
-            
-        await db.commit()
+        event_ids = [row.entity_id for row in result.all()]
+        count = len(event_ids)
+        if count:
+            await bump_entity_epoch(db, project_id)
+            await timeline_service.delete_events(db, project_id, list(set(event_ids)))
+
+        if commit:
+            await db.commit()
         return count
 
+    async def apply_entity_updates(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        chapter_number: int,
+        entity_updates: List[Dict[str, Any]],
+        embeddings: Optional[List[Optional[List[float]]]] = None,
+        commit: bool = True
+    ) -> int:
+        """
+        Write the entity updates extracted from a chapter as new versions. Returns the count.
+        With commit=False nothing is committed, so the caller can apply them atomically.
+        """
+        for i, entity in enumerate(entity_updates):
+            await self.upsert_entity_version(
+                db,
+                project_id=project_id,
+                entity_type=entity.get('entity_type', 'unknown'),
+                entity_id=entity.get('entity_id', 'unknown'),
+                payload=entity.get('payload', {}),
+                current_chapter=chapter_number,
+                embedding=embeddings[i] if embeddings else None,
+                commit=commit
+            )
+        return len(entity_updates)
+
+    async def apply_chapter_events(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        chapter_number: int,
+        events: List[Dict[str, Any]],
+        event_ids: Optional[List[str]] = None,
+        embeddings: Optional[List[Optional[List[float]]]] = None,
+        commit: bool = True
+    ) -> Tuple[int, int]:
+        """
+        Replace the events of a chapter and propagate knowledge of each event to its witnesses.
+        Returns (events_created, characters_notified). With commit=False the caller commits.
+        """
+        if not events:
+            return 0, 0
+
+        # Hard Reset: Delete old events for this chapter to ensure consistency
+        await self.delete_events_for_chapter(db, project_id, chapter_number, commit=commit)
+
+        characters_notified = 0
+        for i, event_data in enumerate(events):
+            # Create Event Entity
+            event_id = event_ids[i] if event_ids else f"evt_{uuid.uuid4().hex[:8]}"
+            await self.upsert_entity_version(
+                db,
+                project_id=project_id,
+                entity_type="event",
+                entity_id=event_id,
+                payload=event_data,
+                current_chapter=chapter_number,
+                embedding=embeddings[i] if embeddings else None,
+                commit=commit
+            )
+
+            # Propagate Knowledge to Witnesses
+            for char_id in event_data.get('witnesses', []):
+                char_entity = await self.get_latest_entity_version(db, project_id, "character", char_id)
+                if not char_entity:
+                    continue
+                current_payload = char_entity.payload_json.copy()
+                known_events = current_payload.get('known_events', [])
+                if event_id not in known_events:
+                    known_events.append(event_id)
+                    current_payload['known_events'] = known_events
+                    await self.upsert_entity_version(
+                        db,
+                        project_id=project_id,
+                        entity_type="character",
+                        entity_id=char_id,
+                        payload=current_payload,
+                        current_chapter=chapter_number,
+                        commit=commit
+                    )
+                    characters_notified += 1
+                    print(f"  -> Updated knowledge for {char_id}")
+        return len(events), characters_notified
+
+    @traced("rag")
     async def get_latest_entity_version(
         self,
         db: AsyncSession,
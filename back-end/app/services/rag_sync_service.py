@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.rag_service import rag_service
+from app.core.telemetry import traced
 from app.db.models import Project
 from typing import Dict, Any, List
 import uuid
@@ -8,6 +9,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 class RAGSyncService:
+    @traced("rag")
     async def sync_project_to_rag(self, db: AsyncSession, project: Project):
         """
         Syncs all entities from Project.meta_info to the RAG system (EntityVersion).
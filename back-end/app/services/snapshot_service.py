@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from sqlalchemy import select, update, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.telemetry import traced, metrics
+from app.db.models import Project, EntityVersion, EntityVersionArchive
+from app.services.compaction_service import decompress_payload
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import uuid
+
+SNAPSHOT_CACHE = metrics.counter("novel_world_snapshot_cache_total", "World snapshot cache lookups", ["result"])
+
+async def bump_entity_epoch(db: AsyncSession, project_id: uuid.UUID):
+    """
+    Invalidate cached world snapshots of a project. Call in the same transaction as
+    any write to its entity versions. updated_at is left alone so entity churn does
+    not reorder the project list.
+    """
+    await db.execute(
+        update(Project)
+        .where(Project.id == project_id)
+        .values(entity_epoch=Project.entity_epoch + 1, updated_at=Project.updated_at)
+    )
+
+def _entity_dict(entity_type: str, entity_id: str, version: int, valid_from: int, valid_to: Optional[int], payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Same shape as /context/retrieve results
+    return {
+        "entity_id": entity_id,
+        "entity_type": entity_type,
+        "version": version,
+        "payload": payload,
+        "valid_from": valid_from,
+        "valid_to": valid_to
+    }
+
+class WorldSnapshotService:
+    """
+    State of every entity at chapter N: the versions valid at N, one per entity.
+    Results are cached per (project, chapter, types, entity epoch); the epoch is bumped
+    by every entity write, so a cached snapshot is never stale.
+    """
+    def __init__(self):
+        self._cache: "OrderedDict[Tuple, List[Dict[str, Any]]]" = OrderedDict()
+
+    async def get_epoch(self, db: AsyncSession, project_id: uuid.UUID) -> Optional[int]:
+        return await db.scalar(select(Project.entity_epoch).where(Project.id == project_id))
+
+    def _live_statement(self, project_id: uuid.UUID, chapter: int, types: Optional[Sequence[str]]):
+        # Embeddings are deliberately not selected; DISTINCT ON walks ix_entity_versions_temporal
+        stmt = select(
+            EntityVersion.entity_type,
+            EntityVersion.entity_id,
+            EntityVersion.version,
+            EntityVersion.valid_from_chapter,
+            EntityVersion.valid_to_chapter,
+            EntityVersion.payload_json
+        ).where(
+            EntityVersion.project_id == project_id,
+            EntityVersion.valid_from_chapter <= chapter,
+            or_(
+                EntityVersion.valid_to_chapter == None,
+                EntityVersion.valid_to_chapter >= chapter
+            )
+        )
+        if types:
+            stmt = stmt.where(EntityVersion.entity_type.in_(list(types)))
+        return stmt.distinct(
+            EntityVersion.entity_type, EntityVersion.entity_id
+        ).order_by(
+            EntityVersion.entity_type, EntityVersion.entity_id, EntityVersion.version.desc()
+        )
+
+    async def _archived(self, db: AsyncSession, project_id: uuid.UUID, chapter: int, types: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        """Versions moved to cold storage by compaction that are valid at `chapter`."""
+        stmt = select(
+            EntityVersionArchive.entity_type,
+            EntityVersionArchive.entity_id,
+            EntityVersionArchive.version,
+            EntityVersionArchive.valid_from_chapter,
+            EntityVersionArchive.valid_to_chapter,
+            EntityVersionArchive.payload_zlib
+        ).where(
+            EntityVersionArchive.project_id == project_id,
+            EntityVersionArchive.reason == "cold",
+            and_(
+                EntityVersionArchive.valid_from_chapter <= chapter,
+                EntityVersionArchive.valid_to_chapter >= chapter
+            )
+        )
+        if types:
+            stmt = stmt.where(EntityVersionArchive.entity_type.in_(list(types)))
+        rows = (await db.execute(stmt)).all()
+        archived = [_entity_dict(*row[:5], decompress_payload(row[5])) for row in rows]
+        archived.sort(key=lambda e: (e["entity_type"], e["entity_id"]))
+        return archived
+
+    async def iter_snapshot(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        chapter: int,
+        types: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the snapshot ordered by (entity_type, entity_id) using a server-side cursor,
+        so large worlds are never fully materialized.
+        """
+        archived = await self._archived(db, project_id, chapter, types)
+        position = 0
+        result = await db.stream(self._live_statement(project_id, chapter, types).execution_options(yield_per=500))
+        async for row in result:
+            key = (row[0], row[1])
+            while position < len(archived) and (archived[position]["entity_type"], archived[position]["entity_id"]) < key:
+                yield archived[position]
+                position += 1
+            yield _entity_dict(*row)
+        for entity in archived[position:]:
+            yield entity
+
+    @traced("snapshot")
+    async def get_snapshot(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        chapter: int,
+        types: Optional[Sequence[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Full snapshot as a dict, served from the cache when the project's epoch is unchanged."""
+        epoch = await self.get_epoch(db, project_id)
+        if epoch is None:
+            return None
+
+        types_key = tuple(sorted(set(types))) if types else ()
+        key = (project_id, chapter, types_key, epoch)
+        entities = self._cache.get(key)
+        if entities is not None:
+            self._cache.move_to_end(key)
+            SNAPSHOT_CACHE.inc(result="hit")
+        else:
+            SNAPSHOT_CACHE.inc(result="miss")
+            entities = [entity async for entity in self.iter_snapshot(db, project_id, chapter, types_key)]
+            if len(entities) <= settings.SNAPSHOT_CACHE_MAX_ENTITIES:
+                self._cache[key] = entities
+                while len(self._cache) > settings.SNAPSHOT_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+
+        return {
+            "project_id": str(project_id),
+            "chapter": chapter,
+            "epoch": epoch,
+            "count": len(entities),
+            "entities": entities
+        }
+
+    def cached(self, project_id: uuid.UUID, chapter: int, types: Optional[Sequence[str]], epoch: int) -> Optional[List[Dict[str, Any]]]:
+        types_key = tuple(sorted(set(types))) if types else ()
+        return self._cache.get((project_id, chapter, types_key, epoch))
+
+snapshot_service = WorldSnapshotService()
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, Any, TypeVar
+import anyio
+from fastapi import Request
+from app.core.telemetry import metrics
+
+T = TypeVar("T")
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+class StreamStats:
+    """
+    Counters for streamed work that finished or was cancelled early.
+    Savings are estimated against the running average of completed runs of the same kind.
+    """
+    def __init__(self):
+        self._kinds: Dict[str, Dict[str, float]] = {}
+
+    def _bucket(self, kind: str) -> Dict[str, float]:
+        return self._kinds.setdefault(kind, {
+            "completed": 0,
+            "cancelled": 0,
+            "disconnects": 0,
+            "completed_tokens": 0,
+            "completed_seconds": 0.0,
+            "tokens_before_cancel": 0,
+            "tokens_saved": 0,
+            "seconds_saved": 0.0,
+        })
+
+    def record_completed(self, kind: str, tokens: int, seconds: float):
+        bucket = self._bucket(kind)
+        bucket["completed"] += 1
+        bucket["completed_tokens"] += tokens
+        bucket["completed_seconds"] += seconds
+
+    def record_cancelled(self, kind: str, tokens: int, seconds: float):
+        bucket = self._bucket(kind)
+        bucket["cancelled"] += 1
+        bucket["tokens_before_cancel"] += tokens
+        if bucket["completed"]:
+            avg_tokens = bucket["completed_tokens"] / bucket["completed"]
+            avg_seconds = bucket["completed_seconds"] / bucket["completed"]
+            bucket["tokens_saved"] += max(0, int(avg_tokens - tokens))
+            bucket["seconds_saved"] += max(0.0, avg_seconds - seconds)
+
+    def record_disconnect(self, kind: str):
+        self._bucket(kind)["disconnects"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {kind: dict(bucket) for kind, bucket in self._kinds.items()}
+
+    def prometheus_lines(self):
+        lines = []
+        for field in ("completed", "cancelled", "disconnects", "tokens_saved", "seconds_saved"):
+            name = f"novel_stream_{field}_total"
+            lines.append(f"# HELP {name} Streamed work per kind: {field.replace('_', ' ')}")
+            lines.append(f"# TYPE {name} counter")
+            for kind, bucket in self._kinds.items():
+                lines.append(f'{name}{{kind="{kind}"}} {bucket[field]}')
+        return lines
+
+stream_stats = StreamStats()
+metrics.register_collector(stream_stats.prometheus_lines)
+
+async def _wait_for_disconnect(request: Request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+async def guard_stream(request: Request, source: AsyncIterator[T], kind: str) -> AsyncGenerator[T, None]:
+    """
+    Relay `source` to the client and close it as soon as the client disconnects.
+
+    Closing the source propagates GeneratorExit/CancelledError down the chain of
+    async generators, which closes the upstream OpenAI stream or cancels the graph run.
+    """
+    agen = source.__aiter__()
+    disconnect = asyncio.create_task(_wait_for_disconnect(request))
+    try:
+        while True:
+            next_item = asyncio.ensure_future(agen.__anext__())
+            done, _ = await asyncio.wait({next_item, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if next_item not in done:
+                stream_stats.record_disconnect(kind)
+                next_item.cancel()
+                with anyio.CancelScope(shield=True):
+                    await asyncio.gather(next_item, return_exceptions=True)
+                break
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                break
+            yield item
+    finally:
+        disconnect.cancel()
+        # The response task may itself be cancelled on disconnect; shield the cleanup
+        with anyio.CancelScope(shield=True):
+            await agen.aclose()
+
+async def run_cancellable(source: AsyncIterator[T], kind: str) -> AsyncGenerator[T, None]:
+    """
+    Consume `source` in its own task and relay its items.
+    When the consumer goes away the task is cancelled, which tears down
+    everything the source started (e.g. LangGraph node tasks and their LLM calls).
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    sentinel = object()
+    started = time.monotonic()
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put((item, None))
+            await queue.put((sentinel, None))
+        except Exception as e:
+            await queue.put((sentinel, e))
+
+    task = asyncio.create_task(pump())
+    finished = failed = False
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is sentinel:
+                if error:
+                    failed = True
+                    raise error
+                finished = True
+                break
+            yield item
+    finally:
+        elapsed = time.monotonic() - started
+        if finished:
+            stream_stats.record_completed(kind, 0, elapsed)
+        elif not failed:
+            task.cancel()
+            stream_stats.record_cancelled(kind, 0, elapsed)
+            with anyio.CancelScope(shield=True):
+                await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,296 @@
+"""
+JSON-producing LLM calls, validated against Pydantic schemas.
+
+Responses are requested in JSON mode, parsed strictly, and only if that fails run
+through a tolerant incremental parser (code fences, prose around the document, raw
+newlines in strings, trailing commas, truncated output). Fields that still fail
+validation are re-asked individually: the model sees its own answer and returns
+corrected values for just those fields, which are merged back. List items that stay
+invalid are dropped instead of discarding the whole answer.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel, ValidationError
+from app.core.config import settings
+from app.core.telemetry import metrics
+from app.services.llm_service import llm_service
+
+STRUCTURED_OUTPUT = metrics.counter(
+    "novel_llm_structured_output_total",
+    "Structured LLM calls by how a valid result was obtained (valid, repaired, reasked, partial, failed)",
+    ["schema", "outcome"]
+)
+STRUCTURED_PARSE_FAILURES = metrics.counter(
+    "novel_llm_structured_parse_failures_total",
+    "Responses that were not strict JSON (json) or did not match the schema (schema)",
+    ["schema", "stage"]
+)
+STRUCTURED_FIELD_REPAIRS = metrics.counter(
+    "novel_llm_structured_field_repairs_total",
+    "Fields re-asked after failing validation, by whether the re-ask fixed them",
+    ["schema", "result"]
+)
+
+T = TypeVar("T", bound=BaseModel)
+Path = Tuple[Any, ...]
+
+class StructuredOutputError(ValueError):
+    """No valid result could be obtained; `raw` is the last response text."""
+    def __init__(self, message: str, raw: str = ""):
+        super().__init__(message)
+        self.raw = raw
+
+class IncrementalJSONParser:
+    """
+    Tolerant JSON scanner that can be fed text as it arrives.
+
+    Skips everything before the first bracket and after the document closes, escapes
+    raw control characters inside strings, drops trailing commas, closes brackets the
+    model forgot and ignores stray ones. value() closes whatever is still open; if the
+    text was cut inside an incomplete member, it falls back to the last complete one.
+    """
+    def __init__(self):
+        self._out: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._pending_comma = False
+        self._done = False
+        self._safe: Optional[Tuple[int, List[str]]] = None # (output length, open brackets) after the last complete member
+
+    def feed(self, text: str) -> "IncrementalJSONParser":
+        for ch in text:
+            if self._done:
+                break
+            if not self._stack:
+                if ch in "{[":
+                    self._stack.append("}" if ch == "{" else "]")
+                    self._out.append(ch)
+                    self._safe = (1, list(self._stack))
+                continue
+            if self._in_string:
+                self._string_char(ch)
+                continue
+            if ch.isspace():
+                continue
+            if ch == ",":
+                if not self._pending_comma:
+                    self._safe = (len(self._out), list(self._stack))
+                self._pending_comma = True
+                continue
+            if ch in "}]":
+                if ch in self._stack:
+                    while self._stack[-1] != ch:
+                        self._out.append(self._stack.pop())
+                    self._out.append(self._stack.pop())
+                    self._pending_comma = False # Trailing comma before a closing bracket
+                    self._safe = (len(self._out), list(self._stack))
+                    self._done = not self._stack
+                continue
+            if self._pending_comma:
+                self._out.append(",")
+                self._pending_comma = False
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append("}" if ch == "{" else "]")
+            self._out.append(ch)
+        return self
+
+    def _string_char(self, ch: str):
+        if self._escape:
+            self._escape = False
+            self._out.append(ch)
+        elif ch == "\\":
+            self._escape = True
+            self._out.append(ch)
+        elif ch == '"':
+            self._in_string = False
+            self._out.append(ch)
+        elif ch in "\n\r\t":
+            self._out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}[ch])
+        elif ord(ch) >= 0x20:
+            self._out.append(ch)
+
+    def value(self) -> Any:
+        if not self._out:
+            raise ValueError("No JSON object or array found")
+        out = list(self._out)
+        if self._in_string:
+            if self._escape:
+                out.pop()
+            out.append('"')
+        try:
+            return json.loads("".join(out + list(reversed(self._stack))))
+        except json.JSONDecodeError:
+            if self._safe is None:
+                raise
+            length, stack = self._safe
+            return json.loads("".join(self._out[:length] + list(reversed(stack))))
+
+def parse_json(text: str) -> Tuple[Any, bool]:
+    """(document, repaired): strict parsing first, the tolerant parser only if that fails."""
+    try:
+        return json.loads(text.strip()), False
+    except json.JSONDecodeError:
+        return IncrementalJSONParser().feed(text).value(), True
+
+def _get(data: Any, path: Path) -> Any:
+    for part in path:
+        data = data[part]
+    return data
+
+def _set(data: Any, path: Path, value: Any):
+    _get(data, path[:-1])[path[-1]] = value
+
+def _pointer(path: Path) -> str:
+    return "/" + "/".join(str(part) for part in path)
+
+def _coerce_root(schema: Type[BaseModel], data: Any) -> Any:
+    """A bare list for a schema that wraps a single list field, e.g. [...] for {"events": [...]}."""
+    if isinstance(data, list):
+        required = [name for name, field in schema.model_fields.items() if field.is_required()]
+        if len(required) == 1:
+            return {required[0]: data}
+    return data
+
+def _error_targets(error: ValidationError, data: Any) -> Dict[Path, List[str]]:
+    """
+    Invalid locations grouped into re-askable units: a list item, or a top-level field.
+    Errors that cannot be located in the document are grouped under the root ().
+    """
+    targets: Dict[Path, List[str]] = {}
+    for err in error.errors():
+        loc = tuple(err["loc"])
+        cut = next((i + 1 for i, part in enumerate(loc) if isinstance(part, int)), 1)
+        target = loc[:cut]
+        try:
+            if len(target) > 1:
+                _get(data, target[:-1])
+        except (KeyError, IndexError, TypeError):
+            target = ()
+        detail = ".".join(str(part) for part in loc[len(target):]) or "(value)"
+        targets.setdefault(target, []).append(f"{detail}: {err['msg']}")
+    return targets
+
+class StructuredCall:
+    def __init__(self, messages: List[Dict[str, str]], schema: Type[BaseModel], name: str, kind: str, temperature: Optional[float]):
+        self.messages = messages
+        self.schema = schema
+        self.name = name
+        self.kind = kind
+        self.temperature = temperature
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        if settings.STRUCTURED_OUTPUT_JSON_MODE and not any("json" in m["content"].lower() for m in messages):
+            # JSON mode requires the word in the prompt
+            messages = messages + [{"role": "user", "content": "请只输出 JSON。"}]
+        text = ""
+        async for chunk in llm_service.generate_text(
+            messages,
+            stream=False,
+            kind=self.kind,
+            temperature=self.temperature,
+            response_format={"type": "json_object"} if settings.STRUCTURED_OUTPUT_JSON_MODE else None
+        ):
+            text += chunk
+        return text
+
+    async def reask_document(self, raw: str) -> str:
+        return await self.complete(self.messages + [
+            {"role": "assistant", "content": raw},
+            {"role": "user", "content": "上面的回答不是合法的 JSON。请按原要求重新输出完整的 JSON，不要包含任何其他文字。"}
+        ])
+
+    async def reask_fields(self, raw: str, data: Any, targets: Dict[Path, List[str]]) -> Dict[str, Any]:
+        """Corrected values for the invalid units only, keyed by JSON pointer."""
+        lines = []
+        for path, problems in targets.items():
+            try:
+                current = json.dumps(_get(data, path), ensure_ascii=False)[:2000]
+            except (KeyError, IndexError, TypeError):
+                current = "(缺失)"
+            lines.append(f"- {_pointer(path)}\n  当前值: {current}\n  问题: {'; '.join(problems)}")
+        schema = json.dumps(self.schema.model_json_schema(), ensure_ascii=False)
+        prompt = (
+            "你上面的 JSON 中以下字段不符合要求，请只修正这些字段，其余内容保持不变。\n"
+            + "\n".join(lines)
+            + f"\n\n完整的 JSON Schema：\n{schema}\n\n"
+            + '返回 JSON：{"fixes": {"<字段路径>": 修正后的完整值}}'
+        )
+        text = await self.complete(self.messages + [
+            {"role": "assistant", "content": raw},
+            {"role": "user", "content": prompt}
+        ])
+        fixes = parse_json(text)[0]
+        fixes = fixes.get("fixes", fixes) if isinstance(fixes, dict) else {}
+        return fixes if isinstance(fixes, dict) else {}
+
+    async def run(self) -> BaseModel:
+        outcome = "valid"
+        raw = await self.complete(self.messages)
+        try:
+            data, repaired = parse_json(raw)
+        except ValueError:
+            STRUCTURED_PARSE_FAILURES.inc(schema=self.name, stage="json")
+            raw = await self.reask_document(raw)
+            try:
+                data, repaired = parse_json(raw)
+            except ValueError:
+                STRUCTURED_OUTPUT.inc(schema=self.name, outcome="failed")
+                raise StructuredOutputError(f"{self.name}: response is not JSON", raw)
+            outcome = "reasked"
+        if repaired:
+            STRUCTURED_PARSE_FAILURES.inc(schema=self.name, stage="json")
+            if outcome == "valid":
+                outcome = "repaired"
+        data = _coerce_root(self.schema, data)
+
+        rounds = 0
+        while True:
+            try:
+                result = self.schema.model_validate(data)
+                STRUCTURED_OUTPUT.inc(schema=self.name, outcome=outcome)
+                return result
+            except ValidationError as e:
+                if rounds == 0:
+                    STRUCTURED_PARSE_FAILURES.inc(schema=self.name, stage="schema")
+                targets = _error_targets(e, data)
+                if () in targets or not isinstance(data, dict):
+                    STRUCTURED_OUTPUT.inc(schema=self.name, outcome="failed")
+                    raise StructuredOutputError(f"{self.name}: {e}", raw)
+
+            if rounds < settings.STRUCTURED_OUTPUT_REPAIR_ROUNDS:
+                rounds += 1
+                outcome = "reasked"
+                try:
+                    fixes = await self.reask_fields(raw, data, targets)
+                except ValueError:
+                    fixes = {}
+                for path in targets:
+                    fixed = _pointer(path) in fixes
+                    if fixed:
+                        _set(data, path, fixes[_pointer(path)])
+                    STRUCTURED_FIELD_REPAIRS.inc(schema=self.name, result="answered" if fixed else "unanswered")
+                continue
+
+            # Out of re-asks: keep the valid part if only list items are wrong
+            if not all(isinstance(path[-1], int) for path in targets):
+                STRUCTURED_OUTPUT.inc(schema=self.name, outcome="failed")
+                raise StructuredOutputError(f"{self.name}: fields still invalid after repair: {sorted(map(_pointer, targets))}", raw)
+            for path in sorted(targets, key=lambda p: p[-1], reverse=True):
+                del _get(data, path[:-1])[path[-1]]
+            outcome = "partial"
+
+async def generate_structured(
+    messages: List[Dict[str, str]],
+    schema: Type[T],
+    name: str,
+    kind: str = "structured",
+    temperature: Optional[float] = None
+) -> T:
+    """
+    Run a JSON-producing prompt and return the response validated as `schema`.
+    `name` labels the metrics. Raises StructuredOutputError if no valid result is obtained.
+    """
+    return await StructuredCall(messages, schema, name, kind, temperature).run()
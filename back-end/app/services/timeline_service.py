@@ -0,0 +1,157 @@
+import uuid
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select, delete, insert, or_, literal
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import StoryEvent, EntityVersion
+
+SIGNIFICANCE_LEVELS = {"low": 1, "medium": 2, "high": 3}
+SIGNIFICANCE_NAMES = {level: name for name, level in SIGNIFICANCE_LEVELS.items()}
+
+def _id_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value] if value else []
+    if isinstance(value, list):
+        return [str(v) for v in value if v]
+    return []
+
+def event_row(project_id: uuid.UUID, event_id: str, payload: Dict[str, Any], chapter: int, embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+    """Typed story_events row for an event payload as produced by AnalysisService.extract_events."""
+    significance = payload.get("significance")
+    location_id = payload.get("location_id")
+    return {
+        "id": uuid.uuid4(),
+        "project_id": project_id,
+        "event_id": event_id,
+        "chapter": payload.get("occurred_at_chapter") or chapter,
+        "title": payload.get("title"),
+        "description": payload.get("description"),
+        "participants": _id_list(payload.get("participants")),
+        "witnesses": _id_list(payload.get("witnesses")),
+        "location_id": location_id if isinstance(location_id, str) and location_id else None,
+        "significance": SIGNIFICANCE_LEVELS.get(str(significance).lower()) if significance else None,
+        "tags": _id_list(payload.get("tags")),
+        "payload_json": payload,
+        "embedding": embedding
+    }
+
+def event_to_dict(event: StoryEvent) -> Dict[str, Any]:
+    return {
+        "event_id": event.event_id,
+        "chapter": event.chapter,
+        "title": event.title,
+        "description": event.description,
+        "participants": event.participants,
+        "witnesses": event.witnesses,
+        "location_id": event.location_id,
+        "significance": SIGNIFICANCE_NAMES.get(event.significance),
+        "tags": event.tags
+    }
+
+class TimelineService:
+    """
+    Event timeline backed by story_events.
+
+    Events stay EntityVersions as well (retrieval, world snapshots, the relationship graph),
+    and every write of an event version is mirrored here in the same transaction. Typed
+    columns make the timeline queries index scans: GIN on participants/witnesses for
+    "involving X", the (project, chapter, significance) btree for ranges and "important
+    events before N".
+    """
+    async def record(self, db: AsyncSession, version: EntityVersion) -> None:
+        """Mirror a newly written event version (the caller commits)."""
+        row = event_row(version.project_id, version.entity_id, version.payload_json, version.valid_from_chapter, version.embedding)
+        await db.execute(delete(StoryEvent).where(StoryEvent.project_id == version.project_id, StoryEvent.event_id == version.entity_id))
+        await db.execute(insert(StoryEvent), [row])
+
+    async def delete_events(self, db: AsyncSession, project_id: uuid.UUID, event_ids: List[str]) -> int:
+        if not event_ids:
+            return 0
+        result = await db.execute(
+            delete(StoryEvent).where(StoryEvent.project_id == project_id, StoryEvent.event_id.in_(event_ids)).returning(StoryEvent.id)
+        )
+        return len(result.all())
+
+    async def rebuild(self, db: AsyncSession, project_id: uuid.UUID) -> int:
+        """Recreate a project's timeline from its event versions (backfill, after an import)."""
+        await db.execute(delete(StoryEvent).where(StoryEvent.project_id == project_id))
+        stream = await db.stream(
+            select(EntityVersion.entity_id, EntityVersion.payload_json, EntityVersion.valid_from_chapter, EntityVersion.embedding)
+            .where(
+                EntityVersion.project_id == project_id,
+                EntityVersion.entity_type == "event",
+                EntityVersion.is_current == True
+            )
+            .execution_options(yield_per=500)
+        )
+        total = 0
+        batch: List[Dict[str, Any]] = []
+        async for entity_id, payload, chapter, embedding in stream:
+            batch.append(event_row(project_id, entity_id, payload, chapter, embedding))
+            if len(batch) >= 500:
+                await db.execute(insert(StoryEvent), batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            await db.execute(insert(StoryEvent), batch)
+            total += len(batch)
+        return total
+
+    async def involving(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        entity_id: str,
+        from_chapter: Optional[int] = None,
+        to_chapter: Optional[int] = None,
+        role: str = "any",
+        limit: int = 100
+    ) -> List[StoryEvent]:
+        """Events in which `entity_id` took part, witnessed, or that happened at it, in chapter order."""
+        target = array([literal(entity_id)])
+        conditions = {
+            "participant": StoryEvent.participants.contains(target),
+            "witness": StoryEvent.witnesses.contains(target),
+            "location": StoryEvent.location_id == entity_id,
+        }
+        match = or_(*conditions.values()) if role == "any" else conditions[role]
+        stmt = select(StoryEvent).where(StoryEvent.project_id == project_id, match)
+        if from_chapter is not None:
+            stmt = stmt.where(StoryEvent.chapter >= from_chapter)
+        if to_chapter is not None:
+            stmt = stmt.where(StoryEvent.chapter <= to_chapter)
+        stmt = stmt.order_by(StoryEvent.chapter, StoryEvent.event_id).limit(limit)
+        return list((await db.execute(stmt)).scalars().all())
+
+    async def significant_before(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        chapter: int,
+        min_significance: str = "high",
+        limit: int = 20
+    ) -> List[StoryEvent]:
+        """The most recent events at or above `min_significance` that happened before `chapter`."""
+        stmt = select(StoryEvent).where(
+            StoryEvent.project_id == project_id,
+            StoryEvent.chapter < chapter,
+            StoryEvent.significance >= SIGNIFICANCE_LEVELS[min_significance]
+        ).order_by(StoryEvent.chapter.desc(), StoryEvent.event_id).limit(limit)
+        return list((await db.execute(stmt)).scalars().all())
+
+    async def similar(
+        self,
+        db: AsyncSession,
+        project_id: uuid.UUID,
+        query_embedding: List[float],
+        before_chapter: Optional[int] = None,
+        limit: int = 10
+    ) -> List[StoryEvent]:
+        """Events nearest to a query embedding, optionally only those before a chapter."""
+        stmt = select(StoryEvent).where(StoryEvent.project_id == project_id, StoryEvent.embedding != None)
+        if before_chapter is not None:
+            stmt = stmt.where(StoryEvent.chapter < before_chapter)
+        stmt = stmt.order_by(StoryEvent.embedding.l2_distance(query_embedding)).limit(limit)
+        return list((await db.execute(stmt)).scalars().all())
+
+timeline_service = TimelineService()
@@ -0,0 +1,397 @@
+import base64
+import json
+import struct
+import time
+import uuid
+from array import array
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncpg
+from app.core.config import settings
+from app.core.telemetry import metrics
+
+# --- Archive format ---------------------------------------------------------------
+#
+# MAGIC, then frames of <kind: 1 byte><length: uint32 big-endian><body>.
+#   J  NDJSON records of one table, each {"t": <record type>, ...}
+#   V  Embeddings of the entity_version records in the preceding J frame that have
+#      "e": 1, in order, as float32 big-endian (pgvector's own wire layout)
+# Record types appear in order: header, project, chapter*, entity_version*, archive*, end.
+# Archive records carry their halfvec embedding base64-encoded, as float16 big-endian.
+# Format 1 stored it as int8 bytes plus a scale; such archives are re-encoded on import.
+
+MAGIC = b"NOVELARC1\n"
+FRAME_HEADER = struct.Struct(">cI")
+VECTOR_HEADER = struct.Struct(">HH") # pgvector binary: dim, unused
+FORMAT_VERSION = 2
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+ARCHIVE_MEDIA_TYPE = "application/vnd.novel-archive"
+
+TRANSFER_ROWS = metrics.counter("novel_transfer_rows_total", "Rows exported or imported", ["direction", "table"])
+
+CHAPTER_COLUMNS = ["chapter_number", "title", "content", "summary", "detailed_outline", "created_at", "updated_at"]
+ENTITY_COLUMNS = ["entity_type", "entity_id", "version", "valid_from_chapter", "valid_to_chapter",
+                  "is_current", "payload_json", "created_at"]
+ARCHIVE_COLUMNS = ["entity_type", "entity_id", "version", "valid_from_chapter", "valid_to_chapter", "reason",
+                   "payload_zlib", "embedding_half", "created_at", "archived_at"]
+TIMESTAMP_COLUMNS = {"created_at", "updated_at", "archived_at"}
+JSON_COLUMNS = {"meta_info", "payload_json"}
+BINARY_COLUMNS = {"payload_zlib", "embedding_half"}
+SECTIONS = {"chapter": "chapters", "entity_version": "entity_versions", "archive": "entity_versions_archive"}
+
+def _asyncpg_dsn() -> str:
+    return settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+
+async def _connect() -> asyncpg.Connection:
+    """
+    Dedicated connection outside the SQLAlchemy pool. Vectors use a pass-through binary
+    codec, so embeddings move between the wire and the archive without being decoded.
+    """
+    conn = await asyncpg.connect(_asyncpg_dsn())
+    for type_name, width in (("vector", 4), ("halfvec", 2)):
+        await conn.set_type_codec(
+            type_name,
+            schema="public",
+            encoder=lambda data, width=width: VECTOR_HEADER.pack(len(data) // width, 0) + data,
+            decoder=lambda data: bytes(data[VECTOR_HEADER.size:]),
+            format="binary"
+        )
+    return conn
+
+def _encode_value(column: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if column in TIMESTAMP_COLUMNS:
+        return value.isoformat()
+    if column in JSON_COLUMNS:
+        return json.loads(value)
+    if column in BINARY_COLUMNS:
+        return base64.b64encode(value).decode("ascii")
+    return value
+
+def _decode_value(column: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if column in TIMESTAMP_COLUMNS:
+        return datetime.fromisoformat(value)
+    if column in JSON_COLUMNS:
+        return json.dumps(value, ensure_ascii=False)
+    if column in BINARY_COLUMNS:
+        return base64.b64decode(value)
+    return value
+
+def _upgrade_archive_record(record: Dict[str, Any]):
+    """Re-encode a format 1 int8 embedding (value = byte * scale) as halfvec."""
+    data = record.pop("embedding_int8", None)
+    scale = record.pop("embedding_scale", None)
+    if data is not None and scale is not None:
+        quantized = array("b", base64.b64decode(data))
+        half = struct.pack(f">{len(quantized)}e", *(v * scale for v in quantized))
+        record["embedding_half"] = base64.b64encode(half).decode("ascii")
+
+def _frame(kind: bytes, body: bytes) -> bytes:
+    return FRAME_HEADER.pack(kind, len(body)) + body
+
+# --- Progress -----------------------------------------------------------------------
+
+class TransferProgress:
+    def __init__(self, transfer_id: uuid.UUID, direction: str, project_id: Optional[uuid.UUID]):
+        self.id = transfer_id
+        self.direction = direction # export, import
+        self.project_id = project_id
+        self.status = "running" # running, completed, failed
+        self.error: Optional[str] = None
+        self.rows: Dict[str, int] = {}
+        self.expected: Dict[str, int] = {}
+        self.bytes = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def add_rows(self, table: str, count: int):
+        self.rows[table] = self.rows.get(table, 0) + count
+        TRANSFER_ROWS.inc(count, direction=self.direction, table=table)
+
+    def finish(self, error: Optional[str] = None):
+        self.status = "failed" if error else "completed"
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "transfer_id": str(self.id),
+            "direction": self.direction,
+            "project_id": str(self.project_id) if self.project_id else None,
+            "status": self.status,
+            "error": self.error,
+            "rows": dict(self.rows),
+            "expected_rows": dict(self.expected),
+            "bytes": self.bytes,
+            "elapsed_seconds": round(elapsed, 3),
+            "mb_per_second": round(self.bytes / 1e6 / elapsed, 3) if elapsed > 0 else None
+        }
+
+# --- Import reader ------------------------------------------------------------------
+
+class ArchiveReader:
+    """Parses frames from an async byte stream, holding at most one batch in memory."""
+    def __init__(self, chunks: AsyncIterator[bytes], progress: TransferProgress):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._progress = progress
+        self.records: List[Dict[str, Any]] = []
+        self.vectors: List[bytes] = []
+        self.kind: Optional[str] = None
+
+    async def _read_exact(self, size: int) -> Optional[bytes]:
+        while len(self._buffer) < size:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                if self._buffer:
+                    raise ValueError("Archive is truncated")
+                return None
+            self._buffer.extend(chunk)
+            self._progress.bytes += len(chunk)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def _read_frame(self) -> Tuple[Optional[bytes], bytes]:
+        header = await self._read_exact(FRAME_HEADER.size)
+        if header is None:
+            return None, b""
+        kind, length = FRAME_HEADER.unpack(header)
+        body = await self._read_exact(length) if length else b""
+        if body is None:
+            raise ValueError("Archive is truncated")
+        return kind, body
+
+    async def start(self):
+        if await self._read_exact(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a project archive")
+        await self.advance()
+
+    async def advance(self):
+        """Load the next batch: a J frame and, for entity versions, its V frame."""
+        kind, body = await self._read_frame()
+        if kind is None:
+            raise ValueError("Archive ended without an end record")
+        if kind != b"J":
+            raise ValueError(f"Unexpected frame {kind!r}")
+        # Not splitlines(): it also breaks on U+2028 and friends, which json.dumps leaves unescaped
+        self.records = [json.loads(line) for line in body.decode("utf-8").split("\n") if line]
+        kinds = {record.get("t") for record in self.records}
+        if len(kinds) != 1:
+            raise ValueError("A frame must hold records of a single type")
+        self.kind = kinds.pop()
+        self.vectors = []
+        with_vectors = sum(1 for record in self.records if record.get("e"))
+        if with_vectors:
+            kind, body = await self._read_frame()
+            if kind != b"V" or len(body) % with_vectors:
+                raise ValueError("Missing or malformed vector block")
+            size = len(body) // with_vectors
+            self.vectors = [body[i:i + size] for i in range(0, len(body), size)]
+
+    def take_one(self, kind: str) -> Dict[str, Any]:
+        if self.kind != kind or len(self.records) != 1:
+            raise ValueError(f"Expected a single {kind} record, got {self.kind}")
+        return self.records[0]
+
+# --- Service ------------------------------------------------------------------------
+
+class TransferService:
+    """
+    Streaming project export/import that keeps embeddings and version history, so a moved
+    project needs neither re-embedding nor re-analysis. Both directions hold one batch
+    of rows in memory at a time, whatever the project size.
+    """
+    def __init__(self):
+        self._transfers: Dict[uuid.UUID, TransferProgress] = {}
+
+    def _register(self, direction: str, project_id: Optional[uuid.UUID], transfer_id: Optional[uuid.UUID] = None) -> TransferProgress:
+        cutoff = time.time() - settings.TRANSFER_RETENTION_SECONDS
+        for key, progress in list(self._transfers.items()):
+            if progress.finished_at and progress.finished_at < cutoff:
+                self._transfers.pop(key, None)
+        progress = TransferProgress(transfer_id or uuid.uuid4(), direction, project_id)
+        self._transfers[progress.id] = progress
+        return progress
+
+    def get_progress(self, transfer_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        progress = self._transfers.get(transfer_id)
+        return progress.to_dict() if progress else None
+
+    def list_progress(self) -> List[Dict[str, Any]]:
+        return [progress.to_dict() for progress in self._transfers.values()]
+
+    def start_export(self, project_id: uuid.UUID) -> TransferProgress:
+        return self._register("export", project_id)
+
+    async def export_project(self, progress: TransferProgress) -> AsyncIterator[bytes]:
+        """
+        Yield the archive of a project. Everything is read in one REPEATABLE READ
+        transaction, so the archive is a consistent snapshot even while the project is edited.
+        """
+        project_id = progress.project_id
+        conn = await _connect()
+        try:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                project = await conn.fetchrow(
+                    "SELECT name, description, meta_info, created_at, updated_at FROM projects WHERE id = $1",
+                    project_id
+                )
+                if project is None:
+                    raise ValueError("Project not found")
+                for table in ("chapters", "entity_versions", "entity_versions_archive"):
+                    progress.expected[table] = await conn.fetchval(f"SELECT count(*) FROM {table} WHERE project_id = $1", project_id)
+
+                header = {"t": "header", "format_version": FORMAT_VERSION, "exported_at": datetime.now(timezone.utc).isoformat(),
+                          "source_project_id": str(project_id), "counts": progress.expected}
+                chunk = MAGIC + _frame(b"J", self._ndjson([header]))
+                chunk += _frame(b"J", self._ndjson([{"t": "project", **{k: _encode_value(k, project[k]) for k in project.keys()}}]))
+                progress.bytes += len(chunk)
+                yield chunk
+
+                sections = [
+                    ("chapter", CHAPTER_COLUMNS, "chapter_number"),
+                    ("entity_version", ENTITY_COLUMNS + ["embedding"], "entity_type, entity_id, version"),
+                    ("archive", ARCHIVE_COLUMNS, "entity_type, entity_id, version"),
+                ]
+                for kind, columns, order in sections:
+                    query = f"SELECT {', '.join(columns)} FROM {SECTIONS[kind]} WHERE project_id = $1 ORDER BY {order}"
+                    async for chunk in self._export_section(conn, progress, kind, query):
+                        yield chunk
+
+                chunk = _frame(b"J", self._ndjson([{"t": "end", "counts": progress.rows}]))
+                progress.bytes += len(chunk)
+                yield chunk
+            progress.finish()
+        except BaseException as e:
+            progress.finish(str(e) or type(e).__name__)
+            raise
+        finally:
+            await conn.close()
+
+    async def _export_section(self, conn: asyncpg.Connection, progress: TransferProgress, kind: str, query: str) -> AsyncIterator[bytes]:
+        table = SECTIONS[kind]
+        lines: List[bytes] = []
+        vectors: List[bytes] = []
+        size = 0
+
+        def flush() -> bytes:
+            chunk = _frame(b"J", b"".join(lines))
+            if vectors:
+                chunk += _frame(b"V", b"".join(vectors))
+            progress.add_rows(table, len(lines))
+            progress.bytes += len(chunk)
+            lines.clear()
+            vectors.clear()
+            return chunk
+
+        # jsonb comes back from asyncpg as text, vectors as raw float32 bytes
+        async for row in conn.cursor(query, progress.project_id, prefetch=settings.TRANSFER_BATCH_ROWS):
+            record = {"t": kind}
+            for column, value in row.items():
+                if column == "embedding":
+                    record["e"] = 1 if value is not None else 0
+                    if value is not None:
+                        vectors.append(value)
+                        size += len(value)
+                else:
+                    record[column] = _encode_value(column, value)
+            line = self._ndjson([record])
+            lines.append(line)
+            size += len(line)
+            if len(lines) >= settings.TRANSFER_BATCH_ROWS or size >= settings.TRANSFER_FRAME_BYTES:
+                yield flush()
+                size = 0
+        if lines:
+            yield flush()
+
+    def _ndjson(self, records: List[Dict[str, Any]]) -> bytes:
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+    def start_import(self, transfer_id: Optional[uuid.UUID] = None) -> TransferProgress:
+        return self._register("import", None, transfer_id)
+
+    async def import_project(self, progress: TransferProgress, chunks: AsyncIterator[bytes], name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Create a new project from an archive stream. Rows are bulk-loaded with COPY inside
+        a single transaction: a truncated or invalid archive leaves nothing behind.
+        All ids are regenerated, so the same archive can be imported any number of times.
+        """
+        reader = ArchiveReader(chunks, progress)
+        conn = await _connect()
+        try:
+            await reader.start()
+            header = reader.take_one("header")
+            if header.get("format_version") not in SUPPORTED_FORMAT_VERSIONS:
+                raise ValueError(f"Unsupported archive version {header.get('format_version')}")
+            progress.expected = dict(header.get("counts") or {})
+            await reader.advance()
+            project = reader.take_one("project")
+
+            project_id = uuid.uuid4()
+            progress.project_id = project_id
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO projects (id, name, description, meta_info, created_at, updated_at) "
+                    "VALUES ($1, $2, $3, $4::jsonb, $5, now())",
+                    project_id, name or project["name"], project.get("description"),
+                    _decode_value("meta_info", project.get("meta_info") or {}),
+                    _decode_value("created_at", project.get("created_at")) or datetime.now(timezone.utc)
+                )
+                await reader.advance()
+                for kind, table in SECTIONS.items():
+                    if reader.kind != kind:
+                        continue
+                    columns = {"chapter": CHAPTER_COLUMNS, "entity_version": ENTITY_COLUMNS, "archive": ARCHIVE_COLUMNS}[kind]
+                    copy_columns = ["id", "project_id"] + columns + (["embedding"] if kind == "entity_version" else [])
+                    await conn.copy_records_to_table(
+                        table,
+                        records=self._section_records(reader, progress, kind, table, project_id, columns),
+                        columns=copy_columns
+                    )
+                reader.take_one("end")
+            await conn.execute("ANALYZE chapters; ANALYZE entity_versions;")
+            # Edges and the event timeline are derived data and not part of the archive
+            from app.db.database import AsyncSessionLocal
+            from app.services.graph_service import graph_service
+            from app.services.timeline_service import timeline_service
+            async with AsyncSessionLocal() as db:
+                await graph_service.rebuild(db, project_id)
+                await timeline_service.rebuild(db, project_id)
+                await db.commit()
+            progress.finish()
+            return progress.to_dict()
+        except BaseException as e:
+            progress.finish(str(e) or type(e).__name__)
+            raise
+        finally:
+            await conn.close()
+
+    async def _section_records(
+        self,
+        reader: ArchiveReader,
+        progress: TransferProgress,
+        kind: str,
+        table: str,
+        project_id: uuid.UUID,
+        columns: List[str]
+    ) -> AsyncIterator[Tuple]:
+        """Rows for one COPY, pulled batch by batch until the section ends."""
+        while reader.kind == kind:
+            vectors = iter(reader.vectors)
+            for record in reader.records:
+                if kind == "archive" and "embedding_int8" in record:
+                    _upgrade_archive_record(record)
+                row = (uuid.uuid4(), project_id) + tuple(_decode_value(column, record.get(column)) for column in columns)
+                if kind == "entity_version":
+                    row += (next(vectors) if record.get("e") else None,)
+                yield row
+            progress.add_rows(table, len(reader.records))
+            await reader.advance()
+
+transfer_service = TransferService()
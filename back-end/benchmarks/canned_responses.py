@@ -0,0 +1,141 @@
+"""
+Canned completions for the stub LLM server.
+
+Responses are chosen by matching the prompts the app actually sends
+(analysis, outline sync, Genesis agents, title pipeline). Anything else gets
+prose filler, which is what chapter generation and chat stream back.
+"""
+import hashlib
+import json
+import re
+from typing import Dict, List
+
+FILLER = "夜色如墨，风从山谷里卷上来，吹得檐角铜铃叮当作响。少年握紧了手中的剑，抬头望向远处翻涌的云海。"
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:4], "little")
+
+def _entities(content: str) -> List[Dict]:
+    seed = _seed(content)
+    return [
+        {
+            "entity_type": "character",
+            "entity_id": f"char_{seed % 40}",
+            "payload": {"status": "受伤" if seed % 2 else "安好", "location": f"loc_{seed % 12}"}
+        },
+        {
+            "entity_type": "location",
+            "entity_id": f"loc_{seed % 12}",
+            "payload": {"description": "古老的遗迹，石壁上刻满符文", "status": "已开启"}
+        }
+    ]
+
+def _events(content: str) -> List[Dict]:
+    seed = _seed(content)
+    return [
+        {
+            "title": f"遗迹探索{seed % 100}",
+            "description": "主角在遗迹深处发现了一枚残缺的玉简。",
+            "participants": [f"char_{seed % 40}"],
+            "witnesses": [f"char_{seed % 40}", f"char_{(seed // 7) % 40}"],
+            "location_id": f"loc_{seed % 12}",
+            "significance": ["high", "medium", "low"][seed % 3],
+            "tags": ["发现"]
+        }
+    ]
+
+def _outline_update(prompt: str) -> Dict:
+    chapters = [int(n) for n in re.findall(r"第(\d+)章 - ", prompt)]
+    return {
+        "modified_chapters": [
+            {"chapter_num": n, "title": f"第{n}章", "summary": "保持原计划", "changed": False}
+            for n in chapters
+        ],
+        "total_changes": 0,
+        "high_impact_changes": []
+    }
+
+def _genesis_outline() -> Dict:
+    return {
+        "outline": [
+            {
+                "id": f"volume_{v}",
+                "title": f"第{v}卷",
+                "summary": "阶段目标与主要冲突",
+                "world_unlock": "新的势力登场",
+                "chapters": [
+                    {"id": f"chapter_{v}_{c}", "title": f"第{c}章", "summary": "章节概要", "plot_hook": "悬念"}
+                    for c in range(1, 6)
+                ]
+            }
+            for v in range(1, 4)
+        ],
+        "foreshadowing": ["玉简的来历"],
+        "hidden_plot": {"line": "宗门内奸"},
+        "response": "大纲已生成。"
+    }
+
+def canned_response(messages: List[Dict[str, str]], filler_chars: int = 3000, outline_deviation: bool = False) -> str:
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = messages[-1]["content"] if messages else ""
+    prompt = system + "\n" + user
+
+    if "小说设定分析助手" in prompt:
+        return json.dumps(_entities(user), ensure_ascii=False)
+    if "小说剧情分析专家" in prompt:
+        return json.dumps(_events(user), ensure_ascii=False)
+    if "精炼概要" in prompt:
+        return "本章主角深入遗迹，发现玉简，并与神秘人短暂交手。"
+    if "小说大纲分析专家" in prompt:
+        return json.dumps({
+            "needs_update": outline_deviation,
+            "deviation_level": "major" if outline_deviation else "none",
+            "suggested_outline": {"title": "新的章节标题", "summary": "修改后的概要"},
+            "analysis": "正文与大纲基本一致"
+        }, ensure_ascii=False)
+    if "小说大纲维护专家" in prompt:
+        return json.dumps(_outline_update(user), ensure_ascii=False)
+    if "网文策划助手" in prompt:
+        return json.dumps({"target_tabs": ["skeleton", "characters", "world", "outline"], "response": "好的，我来完善。"}, ensure_ascii=False)
+    if "网文骨架设计师" in prompt:
+        return json.dumps({
+            "title": "玉简问道",
+            "story_formula": "废柴少年 + 上古玉简 = 逆天改命",
+            "volume1_goal": "进入内门",
+            "golden_finger_rules": ["玉简每日只能使用一次"],
+            "core_hook": "玉简里封着一个人",
+            "emotional_tone": "热血"
+        }, ensure_ascii=False)
+    if "网文角色设计师" in prompt:
+        return json.dumps({
+            "characters": [
+                {"id": f"char_{i}", "name": f"角色{i}", "role": "protagonist" if i == 0 else "supporting",
+                 "personality": "坚韧", "relationships": [{"target": f"char_{(i + 1) % 5}", "type": "朋友"}]}
+                for i in range(5)
+            ],
+            "response": "角色已设定。"
+        }, ensure_ascii=False)
+    if "网文世界观架构师" in prompt:
+        return json.dumps({
+            "power_system": {"source": "灵气", "levels": [{"name": n} for n in ["炼气", "筑基", "金丹"]]},
+            "factions": [{"name": "青云宗"}, {"name": "魔渊"}],
+            "rules": {"public_rules": ["宗门之间不得私斗"]}
+        }, ensure_ascii=False)
+    if "网文大纲架构师" in prompt:
+        return json.dumps(_genesis_outline(), ensure_ascii=False)
+    if "开篇撰写专家" in prompt:
+        return json.dumps({"title": "第一章 玉简", "content": FILLER * 20, "response": "开篇即冲突。"}, ensure_ascii=False)
+    if "网文创作顾问" in prompt:
+        return json.dumps({"title": "玉简问道", "genre": "东方玄幻", "theme": "逆天改命", "response": "概念有辨识度。"}, ensure_ascii=False)
+    if "网文主编" in prompt or "网文市场的分析师" in prompt or "金牌网文编辑" in prompt:
+        return json.dumps({
+            "core_elements": ["玉简", "逆袭"],
+            "selling_point_summary": "废柴逆袭",
+            "naming_direction": "直白爽文",
+            "queries": ["玉简 逆袭 小说"],
+            "reasoning": "针对核心道具与爽点搜索",
+            "suggestions": ["玉简问道", "开局一枚玉简", "问道长生", "玉简通神", "逆命"]
+        }, ensure_ascii=False)
+
+    repeats = max(1, filler_chars // len(FILLER))
+    return "# 第N章 风起\n\n" + FILLER * repeats
@@ -0,0 +1,399 @@
+"""
+Deterministic synthetic long-novel corpus for RAG and scaling tests.
+
+Generates a project with thousands of chapters, entity versions with realistic
+churn (skewed towards a few main characters), events with witness lists and a
+deep volume/chapter outline, and loads it straight into Postgres with COPY.
+
+    python -m benchmarks.corpus --preset 10x
+    python -m benchmarks.corpus --chapters 3000 --characters 400 --skew 1.2 --seed 7
+    python -m benchmarks.corpus --drop <project_id>
+
+The same (spec, seed) always produces the same rows, ids included, so retrieval
+experiments can derive labeled queries from the spec instead of the database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, asdict, field, replace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import asyncpg
+from benchmarks.hashing import hashed_embedding
+
+# Pool of characters used to build names and prose; kept small so bigram features overlap
+NAME_CHARS = "云风林叶白青玄墨苏楚萧秦沈陆顾韩谢江柳洛凌霜夜星辰月寒山海天羽灵尘"
+PLACE_SUFFIXES = ["城", "山", "谷", "宗", "殿", "海", "林", "渊", "阁", "镇"]
+ITEM_SUFFIXES = ["剑", "玉简", "丹", "鼎", "印", "符", "珠", "镜"]
+FACTION_SUFFIXES = ["宗", "门", "阁", "盟", "府", "教"]
+STATUSES = ["安好", "受伤", "闭关", "失踪", "突破", "中毒", "昏迷", "游历"]
+REALMS = ["炼气", "筑基", "金丹", "元婴", "化神", "炼虚", "合体", "大乘"]
+MOODS = ["愤怒", "平静", "犹豫", "坚定", "悲伤", "警惕", "喜悦"]
+SIGNIFICANCE = ["low", "medium", "high"]
+PROSE = [
+    "夜色如墨，风从山谷里卷上来，吹得檐角铜铃叮当作响。",
+    "他握紧了手中的剑，抬头望向远处翻涌的云海。",
+    "石壁上的符文忽明忽暗，仿佛在回应某种古老的召唤。",
+    "人群中传来低低的议论声，却没有人敢上前一步。",
+    "她垂下眼帘，指尖的灵力缓缓收拢，像一朵合拢的莲。",
+    "远处的钟声响了三下，宗门的大阵随之亮起。",
+]
+
+@dataclass
+class CorpusSpec:
+    chapters: int = 1000
+    characters: int = 200
+    locations: int = 80
+    items: int = 60
+    factions: int = 20
+    entity_updates_per_chapter: float = 4.0 # Mean non-event versions created per chapter
+    skew: float = 1.1 # Zipf exponent; higher means updates concentrate on a few main entities
+    rewrite_rate: float = 0.1 # Share of updates re-saved within the same chapter (invisible versions)
+    events_per_chapter: float = 2.0
+    witnesses_per_event: int = 4
+    chapters_per_volume: int = 50
+    chapter_chars: int = 2000
+    embeddings: bool = True
+    seed: int = 42
+
+# "1x" approximates a large real project today; the others scale every dimension
+PRESETS: Dict[str, CorpusSpec] = {
+    "1x": CorpusSpec(chapters=100, characters=40, locations=15, items=10, factions=5, chapters_per_volume=25),
+    "10x": CorpusSpec(chapters=1000, characters=200, locations=80, items=60, factions=20),
+    "100x": CorpusSpec(chapters=5000, characters=1000, locations=300, items=300, factions=60, entity_updates_per_chapter=8.0, chapters_per_volume=100),
+}
+
+@dataclass
+class EntityDef:
+    entity_type: str
+    entity_id: str
+    name: str
+    intro_chapter: int
+    base: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class CorpusRows:
+    project: Tuple
+    chapters: List[Tuple] = field(default_factory=list)
+    entity_versions: List[Tuple] = field(default_factory=list)
+    entities: List[EntityDef] = field(default_factory=list)
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+def _name(rng: random.Random, length: int = 2) -> str:
+    return "".join(rng.choice(NAME_CHARS) for _ in range(length))
+
+def _zipf_weights(n: int, skew: float) -> List[float]:
+    return [1.0 / (rank + 1) ** skew for rank in range(n)]
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Knuth; means here are small
+    limit, k, p = pow(2.718281828459045, -mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+def build_entities(spec: CorpusSpec, rng: random.Random) -> List[EntityDef]:
+    """Entity definitions in rank order (rank 0 is the most frequently updated)."""
+    entities = []
+
+    def intro(rank: int, total: int) -> int:
+        # Main cast appears early; the long tail is introduced throughout the book
+        if rank < max(3, total // 20):
+            return 1
+        return rng.randint(1, spec.chapters)
+
+    for i in range(spec.characters):
+        name = _name(rng, 3 if rng.random() < 0.6 else 2)
+        entities.append(EntityDef("character", f"char_{i}", name, intro(i, spec.characters), {
+            "name": name,
+            "role": "protagonist" if i == 0 else ("supporting" if i < spec.characters // 10 else "minor"),
+            "personality": rng.choice(MOODS),
+            "realm": REALMS[0],
+        }))
+    for i in range(spec.locations):
+        name = _name(rng) + rng.choice(PLACE_SUFFIXES)
+        entities.append(EntityDef("location", f"loc_{i}", name, intro(i, spec.locations), {
+            "name": name, "description": rng.choice(PROSE), "status": "平静"
+        }))
+    for i in range(spec.items):
+        name = _name(rng) + rng.choice(ITEM_SUFFIXES)
+        entities.append(EntityDef("item", f"item_{i}", name, intro(i, spec.items), {
+            "name": name, "grade": rng.choice(REALMS), "owner": None
+        }))
+    for i in range(spec.factions):
+        name = _name(rng) + rng.choice(FACTION_SUFFIXES)
+        entities.append(EntityDef("faction", f"faction_{i}", name, intro(i, spec.factions), {
+            "name": name, "description": rng.choice(PROSE), "strength": rng.randint(1, 10)
+        }))
+    return entities
+
+def build_outline(spec: CorpusSpec, rng: random.Random) -> List[Dict[str, Any]]:
+    volumes = []
+    for v, start in enumerate(range(1, spec.chapters + 1, spec.chapters_per_volume), start=1):
+        end = min(start + spec.chapters_per_volume - 1, spec.chapters)
+        volumes.append({
+            "id": f"volume_{v}",
+            "title": f"第{v}卷 {_name(rng)}{rng.choice(PLACE_SUFFIXES)}风云",
+            "summary": rng.choice(PROSE),
+            "world_unlock": f"{_name(rng)}{rng.choice(FACTION_SUFFIXES)}登场",
+            "chapters": [
+                {
+                    "id": f"chapter_{v}_{n - start + 1}",
+                    "title": f"第{n}章",
+                    "summary": rng.choice(PROSE) + rng.choice(PROSE),
+                    "plot_hook": rng.choice(PROSE)
+                }
+                for n in range(start, end + 1)
+            ]
+        })
+    return volumes
+
+def _evolve(entity: EntityDef, payload: Dict[str, Any], chapter: int, rng: random.Random) -> Dict[str, Any]:
+    payload = dict(payload)
+    if entity.entity_type == "character":
+        payload["status"] = rng.choice(STATUSES)
+        payload["mood"] = rng.choice(MOODS)
+        if rng.random() < 0.2:
+            payload["realm"] = REALMS[min(REALMS.index(payload.get("realm", REALMS[0])) + 1, len(REALMS) - 1)]
+        payload["last_seen_chapter"] = chapter
+    elif entity.entity_type == "item":
+        payload["owner"] = f"char_{int(rng.paretovariate(1.2)) % 50}"
+    else:
+        payload["status"] = rng.choice(["平静", "动荡", "被封锁", "繁荣", "衰落"])
+        payload["note"] = rng.choice(PROSE)
+    return payload
+
+def generate_rows(spec: CorpusSpec, name: Optional[str] = None) -> CorpusRows:
+    """Build every row in memory. Deterministic for a given spec."""
+    rng = random.Random(spec.seed)
+    project_id = _uuid(rng)
+    entities = build_entities(spec, rng)
+    outline = build_outline(spec, rng)
+    characters = [e for e in entities if e.entity_type == "character"]
+
+    meta_info = {
+        "title": name or f"synthetic-s{spec.seed}",
+        "synthetic_spec": asdict(spec),
+        "characters": [{"id": e.entity_id, **e.base} for e in characters[:200]],
+        "world": {
+            "factions": [e.base for e in entities if e.entity_type == "faction"],
+            "locations": [{"id": e.entity_id, **e.base} for e in entities if e.entity_type == "location"][:100]
+        },
+        "outline": outline
+    }
+    rows = CorpusRows(project=(
+        project_id, name or f"synthetic-s{spec.seed}", "Synthetic corpus for scaling tests", json.dumps(meta_info, ensure_ascii=False)
+    ), entities=entities)
+
+    weights = _zipf_weights(len(entities), spec.skew)
+    # Interleave types by rank so the head of the distribution mixes characters and places
+    order = sorted(range(len(entities)), key=lambda i: (int(entities[i].entity_id.rsplit("_", 1)[1]), i))
+    ranked = [entities[i] for i in order]
+    state: Dict[str, Dict[str, Any]] = {} # entity_id -> {"version", "payload", "index"} for the open version
+
+    def add_version(entity: EntityDef, chapter: int, payload: Dict[str, Any]):
+        current = state.get(entity.entity_id)
+        version = 1
+        if current:
+            version = current["version"] + 1
+            old = rows.entity_versions[current["index"]]
+            # Close the previous version: same rule as upsert_entity_version
+            rows.entity_versions[current["index"]] = old[:6] + (max(0, chapter - 1), False) + old[8:]
+        rows.entity_versions.append((
+            _uuid(rng), project_id, entity.entity_type, entity.entity_id, version,
+            chapter, None, True, payload
+        ))
+        state[entity.entity_id] = {"version": version, "payload": payload, "index": len(rows.entity_versions) - 1}
+
+    introduced: List[EntityDef] = []
+    introduced_weights: List[float] = []
+    by_intro: Dict[int, List[Tuple[EntityDef, float]]] = {}
+    for entity, weight in zip(ranked, weights):
+        by_intro.setdefault(entity.intro_chapter, []).append((entity, weight))
+
+    for chapter in range(1, spec.chapters + 1):
+        for entity, weight in by_intro.get(chapter, []):
+            introduced.append(entity)
+            introduced_weights.append(weight)
+            add_version(entity, chapter, dict(entity.base))
+
+        mentioned = set()
+        for entity in rng.choices(introduced, introduced_weights, k=_poisson(rng, spec.entity_updates_per_chapter)) if introduced else []:
+            if entity.intro_chapter == chapter:
+                continue
+            add_version(entity, chapter, _evolve(entity, state[entity.entity_id]["payload"], chapter, rng))
+            if rng.random() < spec.rewrite_rate:
+                # A re-save of the same chapter leaves an invisible version (valid_to < valid_from)
+                add_version(entity, chapter, _evolve(entity, state[entity.entity_id]["payload"], chapter, rng))
+            mentioned.add(entity.name)
+
+        present = [e for e in introduced if e.entity_type == "character"]
+        present_weights = [w for e, w in zip(introduced, introduced_weights) if e.entity_type == "character"]
+        locations = [e for e in introduced if e.entity_type == "location"]
+        for _ in range(_poisson(rng, spec.events_per_chapter) if present else 0):
+            participants = {e.entity_id: e for e in rng.choices(present, present_weights, k=min(2, len(present)))}
+            witnesses = dict(participants)
+            for e in rng.choices(present, present_weights, k=spec.witnesses_per_event):
+                witnesses.setdefault(e.entity_id, e)
+            location = rng.choice(locations) if locations else None
+            names = "、".join(e.name for e in participants.values())
+            event_id = f"evt_{rng.getrandbits(32):08x}"
+            event_payload = {
+                "title": f"{names}{rng.choice(['交手', '结盟', '相遇', '争夺宝物', '密谈', '决裂'])}",
+                "description": f"{names}在{location.name if location else '荒野'}。{rng.choice(PROSE)}",
+                "participants": list(participants),
+                "witnesses": list(witnesses),
+                "location_id": location.entity_id if location else None,
+                "significance": rng.choices(SIGNIFICANCE, [6, 3, 1])[0],
+                "occurred_at_chapter": chapter
+            }
+            rows.entity_versions.append((_uuid(rng), project_id, "event", event_id, 1, chapter, None, True, event_payload))
+            mentioned.update(e.name for e in participants.values())
+            # Knowledge propagation: each witness gets a new version listing the event
+            for witness in witnesses.values():
+                payload = dict(state[witness.entity_id]["payload"])
+                payload["known_events"] = (payload.get("known_events") or [])[-19:] + [event_id]
+                add_version(witness, chapter, payload)
+
+        names = "，".join(sorted(mentioned)) or _name(rng)
+        body = []
+        while sum(len(p) for p in body) < spec.chapter_chars:
+            body.append(rng.choice(PROSE))
+            if rng.random() < 0.3:
+                body.append(f"{names}。")
+        rows.chapters.append((
+            _uuid(rng), project_id, chapter, f"第{chapter}章", "".join(body)[:spec.chapter_chars],
+            f"本章涉及{names}。{rng.choice(PROSE)}", rng.choice(PROSE)
+        ))
+    return rows
+
+CHAPTER_COLUMNS = ["id", "project_id", "chapter_number", "title", "content", "summary", "detailed_outline"]
+ENTITY_COLUMNS = ["id", "project_id", "entity_type", "entity_id", "version", "valid_from_chapter",
+                  "valid_to_chapter", "is_current", "payload_json", "embedding"]
+
+def to_asyncpg_dsn(database_url: str) -> str:
+    return database_url.replace("postgresql+asyncpg://", "postgresql://")
+
+def entity_records(rows: CorpusRows, embeddings: bool = True) -> Iterator[Tuple]:
+    """
+    Entity version rows ready for COPY. Embeddings are computed on the fly so the
+    100x preset does not hold hundreds of thousands of 1536-float vectors in memory.
+    """
+    for row in rows.entity_versions:
+        payload = row[8]
+        # Same text the app embeds in RAGService.upsert_entity_version
+        embedding = hashed_embedding(f"{row[2]} {row[3]}: {str(payload)}") if embeddings else None
+        yield row[:8] + (json.dumps(payload, ensure_ascii=False), embedding)
+
+async def load_rows(conn: asyncpg.Connection, rows: CorpusRows, embeddings: bool = True) -> Dict[str, float]:
+    """COPY all rows in one transaction. Returns per-table load timings."""
+    from pgvector.asyncpg import register_vector
+
+    await register_vector(conn)
+    timings = {}
+    async with conn.transaction():
+        await conn.execute(
+            "INSERT INTO projects (id, name, description, meta_info, updated_at) VALUES ($1, $2, $3, $4::jsonb, now())",
+            *rows.project
+        )
+        started = time.perf_counter()
+        await conn.copy_records_to_table("chapters", records=rows.chapters, columns=CHAPTER_COLUMNS)
+        timings["chapters_seconds"] = time.perf_counter() - started
+        started = time.perf_counter()
+        await conn.copy_records_to_table("entity_versions", records=entity_records(rows, embeddings), columns=ENTITY_COLUMNS)
+        timings["entity_versions_seconds"] = time.perf_counter() - started
+    await conn.execute("ANALYZE chapters; ANALYZE entity_versions;")
+    return timings
+
+def corpus_name(preset: str, spec: CorpusSpec) -> str:
+    return f"synthetic-{preset}-s{spec.seed}"
+
+async def generate_corpus(database_url: str, spec: CorpusSpec, name: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    rows = generate_rows(spec, name)
+    build_seconds = time.perf_counter() - started
+    conn = await asyncpg.connect(to_asyncpg_dsn(database_url))
+    try:
+        timings = await load_rows(conn, rows, spec.embeddings)
+    finally:
+        await conn.close()
+    return {
+        "project_id": str(rows.project[0]),
+        "name": name,
+        "spec": asdict(spec),
+        "chapters": len(rows.chapters),
+        "entity_versions": len(rows.entity_versions),
+        "events": sum(1 for r in rows.entity_versions if r[2] == "event"),
+        "invisible_versions": sum(1 for r in rows.entity_versions if r[6] is not None and r[6] < r[5]),
+        "build_seconds": round(build_seconds, 2),
+        **{k: round(v, 2) for k, v in timings.items()}
+    }
+
+async def ensure_corpus(database_url: str, preset: str, seed: Optional[int] = None) -> str:
+    """Fixture helper: return the project id for a preset corpus, generating it on first use."""
+    spec = PRESETS[preset] if seed is None else replace(PRESETS[preset], seed=seed)
+    name = corpus_name(preset, spec)
+    conn = await asyncpg.connect(to_asyncpg_dsn(database_url))
+    try:
+        existing = await conn.fetchval("SELECT id FROM projects WHERE name = $1", name)
+    finally:
+        await conn.close()
+    if existing:
+        return str(existing)
+    manifest = await generate_corpus(database_url, spec, name)
+    return manifest["project_id"]
+
+async def drop_corpus(database_url: str, project_id: str) -> Dict[str, int]:
+    conn = await asyncpg.connect(to_asyncpg_dsn(database_url))
+    try:
+        async with conn.transaction():
+            pid = uuid.UUID(project_id)
+            versions = await conn.execute("DELETE FROM entity_versions WHERE project_id = $1", pid)
+            chapters = await conn.execute("DELETE FROM chapters WHERE project_id = $1", pid)
+            await conn.execute("DELETE FROM projects WHERE id = $1", pid)
+    finally:
+        await conn.close()
+    return {"entity_versions": int(versions.split()[-1]), "chapters": int(chapters.split()[-1])}
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Generate a synthetic long-novel corpus in Postgres")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="10x")
+    parser.add_argument("--name", help="Project name (default: synthetic-<preset>-s<seed>)")
+    parser.add_argument("--drop", metavar="PROJECT_ID", help="Delete a generated project and exit")
+    parser.add_argument("--dry-run", action="store_true", help="Build rows and print counts without loading")
+    for field_name, default in asdict(CorpusSpec()).items():
+        flag = "--" + field_name.replace("_", "-")
+        if isinstance(default, bool):
+            parser.add_argument(flag, type=lambda v: v.lower() in ("1", "true", "yes"), default=None)
+        else:
+            parser.add_argument(flag, type=type(default), default=None)
+    args = parser.parse_args()
+
+    if not args.database_url and not args.dry_run:
+        parser.error("DATABASE_URL is not set")
+    if args.drop:
+        print(json.dumps(asyncio.run(drop_corpus(args.database_url, args.drop))))
+        return
+
+    overrides = {k: v for k, v in vars(args).items() if k in CorpusSpec.__dataclass_fields__ and v is not None}
+    spec = replace(PRESETS[args.preset], **overrides)
+    name = args.name or corpus_name(args.preset, spec)
+    if args.dry_run:
+        rows = generate_rows(spec, name)
+        print(json.dumps({"chapters": len(rows.chapters), "entity_versions": len(rows.entity_versions)}))
+        return
+    print(json.dumps(asyncio.run(generate_corpus(args.database_url, spec, name)), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import hashlib
+import math
+import re
+from typing import List
+
+EMBEDDING_DIM = 1536
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|[一-鿿]")
+
+def _tokens(text: str) -> List[str]:
+    """ASCII words plus CJK unigrams and bigrams, so related texts share features."""
+    raw = _TOKEN_RE.findall(text.lower())
+    cjk = [t for t in raw if len(t) == 1 and "一" <= t <= "鿿"]
+    return raw + [a + b for a, b in zip(cjk, cjk[1:])]
+
+def hashed_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """
+    Deterministic feature-hashing embedding.
+    Texts that share words get nearby vectors, which is enough for benchmarking and
+    retrieval-quality experiments without paying for a real embedding model.
+    """
+    vec = [0.0] * dim
+    for token in _tokens(text):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        idx = int.from_bytes(digest[:4], "little") % dim
+        vec[idx] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec))
+    if norm == 0:
+        vec[0] = 1.0
+        return vec
+    return [v / norm for v in vec]
@@ -0,0 +1,317 @@
+"""
+Retrieval quality vs. latency evaluation for RAGService.retrieve_context.
+
+Labeled queries are derived from a synthetic corpus (benchmarks.corpus): each
+query names an entity or event as it stands at a given chapter, and the expected
+answer is that entity id. For every configuration in the sweep (vector index
+type, hnsw.ef_search, ivfflat.probes, candidate pool size) the harness reports
+recall@k, MRR, temporal-validity violations and latency percentiles, then marks
+the Pareto-optimal configurations (best recall for their p95 latency).
+
+A temporal violation is a result whose content is not the entity's state at the
+query chapter according to the corpus itself (a superseded version, or an entity
+not introduced yet), so it catches wrong validity ranges in the database, e.g.
+after compaction, and not just a missing chapter filter.
+
+    python -m benchmarks.retrieval_eval --corpus 10x
+    python -m benchmarks.retrieval_eval --project-id <id> --indexes none hnsw --ef-search 20 40 100 --candidate-pool 0 200 1000
+
+Runs in-process against DATABASE_URL; query embeddings use the same feature
+hashing as the corpus, so no embedding provider is needed.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+from benchmarks.corpus import CorpusSpec, CorpusRows, generate_rows, ensure_corpus, PRESETS as CORPUS_PRESETS
+from benchmarks.hashing import hashed_embedding
+from benchmarks.scenarios import percentile
+
+INDEX_NAME = "ix_eval_entity_versions_embedding"
+
+@dataclass
+class LabeledQuery:
+    query: str
+    chapter: int
+    expected: List[str] # entity ids
+    kind: str # entity, event
+
+@dataclass
+class EvalConfig:
+    index: str = "none" # none, hnsw, ivfflat
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    candidate_pool: Optional[int] = None
+
+    @property
+    def label(self) -> str:
+        parts = [self.index]
+        if self.ef_search:
+            parts.append(f"ef={self.ef_search}")
+        if self.probes:
+            parts.append(f"probes={self.probes}")
+        parts.append(f"pool={self.candidate_pool or 'off'}")
+        return " ".join(parts)
+
+def _visible(row: Tuple, chapter: int) -> bool:
+    valid_from, valid_to = row[5], row[6]
+    return valid_from <= chapter and (valid_to is None or valid_to >= chapter)
+
+def version_index(rows: CorpusRows) -> Dict[Tuple[str, str], List[Tuple]]:
+    """Corpus versions by (entity_type, entity_id): the ground truth for temporal checks."""
+    index: Dict[Tuple[str, str], List[Tuple]] = {}
+    for row in rows.entity_versions:
+        index.setdefault((row[2], row[3]), []).append(row)
+    return index
+
+def is_temporal_violation(result: Any, chapter: int, truth: Dict[Tuple[str, str], List[Tuple]]) -> bool:
+    """
+    True unless the corpus has a version of the result's entity visible at `chapter` with
+    the same payload. Payloads are compared rather than version numbers, so versions merged
+    by compaction (same payload, wider range) still count as valid.
+    """
+    return not any(
+        _visible(row, chapter) and row[8] == result.payload_json
+        for row in truth.get((result.entity_type, result.entity_id), [])
+    )
+
+def build_queries(rows: CorpusRows, spec: CorpusSpec, count: int, seed: int = 0) -> List[LabeledQuery]:
+    """Sample (chapter, entity) pairs and phrase a query from the version visible at that chapter."""
+    rng = random.Random(seed)
+    versions: Dict[str, List[Tuple]] = {}
+    events: List[Tuple] = []
+    for row in rows.entity_versions:
+        if row[2] == "event":
+            events.append(row)
+        else:
+            versions.setdefault(row[3], []).append(row)
+
+    queries: List[LabeledQuery] = []
+    attempts = 0
+    while len(queries) < count and attempts < count * 20:
+        attempts += 1
+        chapter = rng.randint(1, spec.chapters)
+        if rng.random() < 0.2 and events:
+            row = rng.choice(events)
+            if row[5] > chapter:
+                continue
+            payload = row[8]
+            queries.append(LabeledQuery(f"{payload['title']} {payload['description'][:20]}", chapter, [row[3]], "event"))
+            continue
+        entity_id = rng.choice(list(versions))
+        current = next((r for r in versions[entity_id] if _visible(r, chapter)), None)
+        if current is None:
+            continue
+        payload = current[8]
+        details = " ".join(str(payload[k]) for k in ("status", "realm", "owner") if payload.get(k))
+        queries.append(LabeledQuery(f"{payload['name']} {details}".strip(), chapter, [entity_id], "entity"))
+    return queries
+
+async def _load_corpus(db, project_id: uuid.UUID) -> Tuple[CorpusSpec, CorpusRows]:
+    from sqlalchemy import select
+    from app.db.models import Project
+
+    project = (await db.execute(select(Project).where(Project.id == project_id))).scalars().first()
+    if not project or "synthetic_spec" not in (project.meta_info or {}):
+        raise SystemExit(f"Project {project_id} is not a synthetic corpus (missing meta_info.synthetic_spec)")
+    spec = CorpusSpec(**project.meta_info["synthetic_spec"])
+    rows = generate_rows(spec, project.name)
+    if rows.project[0] != project_id:
+        raise SystemExit("Regenerated corpus does not match the project id; was it generated with a different version?")
+    return spec, rows
+
+async def prepare_index(index: str, lists: int):
+    """Make `index` the only evaluation index on entity_versions.embedding."""
+    from sqlalchemy import text
+    from app.db.database import engine
+
+    async with engine.begin() as conn:
+        for kind in ("hnsw", "ivfflat"):
+            if kind != index:
+                await conn.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}_{kind}"))
+        if index == "hnsw":
+            await conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {INDEX_NAME}_hnsw ON entity_versions USING hnsw (embedding vector_l2_ops)"
+            ))
+        elif index == "ivfflat":
+            await conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {INDEX_NAME}_ivfflat ON entity_versions "
+                f"USING ivfflat (embedding vector_l2_ops) WITH (lists = {int(lists)})"
+            ))
+        await conn.execute(text("ANALYZE entity_versions"))
+
+async def run_config(
+    project_id: uuid.UUID,
+    config: EvalConfig,
+    queries: List[LabeledQuery],
+    k: int,
+    truth: Dict[Tuple[str, str], List[Tuple]]
+) -> Dict[str, Any]:
+    from sqlalchemy import text
+    from app.db.database import AsyncSessionLocal
+    from app.services.rag_service import rag_service
+
+    latencies: List[float] = []
+    hits = 0
+    reciprocal_ranks = 0.0
+    violations = 0
+    embeddings = [hashed_embedding(q.query) for q in queries]
+
+    async with AsyncSessionLocal() as db:
+        for query, embedding in zip(queries, embeddings):
+            # Settings are transaction-scoped so every configuration starts clean
+            if config.ef_search:
+                await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(config.ef_search)}"))
+            if config.probes:
+                await db.execute(text(f"SET LOCAL ivfflat.probes = {int(config.probes)}"))
+            started = time.perf_counter()
+            results = await rag_service.retrieve_context(
+                db, project_id, query.query, query.chapter,
+                limit=k, query_embedding=embedding, candidate_pool=config.candidate_pool
+            )
+            latencies.append(time.perf_counter() - started)
+
+            ids = [r.entity_id for r in results]
+            violations += sum(1 for r in results if is_temporal_violation(r, query.chapter, truth))
+            await db.rollback()
+            rank = next((pos for pos, entity_id in enumerate(ids, start=1) if entity_id in query.expected), None)
+            if rank:
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+
+    n = max(len(queries), 1)
+    return {
+        **asdict(config),
+        "label": config.label,
+        "queries": len(queries),
+        f"recall@{k}": round(hits / n, 4),
+        "mrr": round(reciprocal_ranks / n, 4),
+        "temporal_violations": violations,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+def mark_pareto(results: List[Dict[str, Any]], recall_key: str) -> List[Dict[str, Any]]:
+    """A configuration is Pareto-optimal if no other one has higher-or-equal recall and lower-or-equal p95, strictly better in one."""
+    for result in results:
+        result["pareto"] = not any(
+            other is not result
+            and other[recall_key] >= result[recall_key]
+            and other["p95_ms"] <= result["p95_ms"]
+            and (other[recall_key] > result[recall_key] or other["p95_ms"] < result["p95_ms"])
+            for other in results
+        )
+    return results
+
+def format_table(results: List[Dict[str, Any]], recall_key: str) -> str:
+    header = f"{'configuration':<36} {recall_key:>10} {'mrr':>7} {'viol':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  pareto"
+    lines = [header, "-" * len(header)]
+    for r in sorted(results, key=lambda r: (r["p95_ms"], -r[recall_key])):
+        lines.append(
+            f"{r['label']:<36} {r[recall_key]:>10.3f} {r['mrr']:>7.3f} {r['temporal_violations']:>5} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}  {'*' if r['pareto'] else ''}"
+        )
+    return "\n".join(lines)
+
+def build_configs(args) -> List[EvalConfig]:
+    pools = [p or None for p in args.candidate_pool]
+    configs = []
+    for index in args.indexes:
+        if index == "hnsw":
+            configs += [EvalConfig(index, ef_search=ef, candidate_pool=pool) for ef, pool in itertools.product(args.ef_search, pools)]
+        elif index == "ivfflat":
+            configs += [EvalConfig(index, probes=probes, candidate_pool=pool) for probes, pool in itertools.product(args.probes, pools)]
+        else:
+            configs += [EvalConfig(index, candidate_pool=pool) for pool in pools]
+    return configs
+
+async def evaluate(args) -> Dict[str, Any]:
+    from app.db.database import AsyncSessionLocal
+
+    project_id = uuid.UUID(args.project_id) if args.project_id else uuid.UUID(
+        await ensure_corpus(args.database_url, args.corpus, args.corpus_seed)
+    )
+    async with AsyncSessionLocal() as db:
+        spec, rows = await _load_corpus(db, project_id)
+
+    if args.queries and os.path.exists(args.queries):
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [LabeledQuery(**q) for q in json.load(f)["queries"]]
+    else:
+        queries = build_queries(rows, spec, args.num_queries, args.query_seed)
+        if args.queries:
+            os.makedirs(os.path.dirname(os.path.abspath(args.queries)), exist_ok=True)
+            with open(args.queries, "w", encoding="utf-8") as f:
+                json.dump({"project_id": str(project_id), "spec": asdict(spec), "queries": [asdict(q) for q in queries]}, f, ensure_ascii=False, indent=2)
+
+    truth = version_index(rows)
+    recall_key = f"recall@{args.k}"
+    results: List[Dict[str, Any]] = []
+    lists = args.ivfflat_lists or max(10, len(rows.entity_versions) // 1000)
+    try:
+        for index in args.indexes:
+            print(f"Preparing index: {index}")
+            started = time.perf_counter()
+            await prepare_index(index, lists)
+            build_seconds = round(time.perf_counter() - started, 2)
+            for config in [c for c in build_configs(args) if c.index == index]:
+                # Warm caches so the first configuration is not penalized
+                await run_config(project_id, config, queries[:10], args.k, truth)
+                result = await run_config(project_id, config, queries, args.k, truth)
+                result["index_build_seconds"] = build_seconds
+                results.append(result)
+                print(f"  {config.label:<36} {recall_key}={result[recall_key]:.3f} p95={result['p95_ms']}ms")
+    finally:
+        if not args.keep_index:
+            await prepare_index("none", lists)
+
+    mark_pareto(results, recall_key)
+    print()
+    print(format_table(results, recall_key))
+    return {
+        "project_id": str(project_id),
+        "spec": asdict(spec),
+        "entity_versions": len(rows.entity_versions),
+        "k": args.k,
+        "queries": len(queries),
+        "results": results
+    }
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Retrieval quality vs latency sweep for retrieve_context")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--project-id", help="Synthetic corpus project to evaluate")
+    parser.add_argument("--corpus", choices=sorted(CORPUS_PRESETS), default="10x", help="Preset to use (generated on first use) when --project-id is not given")
+    parser.add_argument("--corpus-seed", type=int, default=None)
+    parser.add_argument("--queries", help="Labeled query set JSON; created from the corpus if missing")
+    parser.add_argument("--num-queries", type=int, default=300)
+    parser.add_argument("--query-seed", type=int, default=0)
+    parser.add_argument("--k", type=int, default=5, help="Result limit, as passed to retrieve_context")
+    parser.add_argument("--indexes", nargs="+", choices=["none", "hnsw", "ivfflat"], default=["none", "hnsw", "ivfflat"])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[20, 40, 100, 200])
+    parser.add_argument("--probes", nargs="+", type=int, default=[1, 5, 10, 20])
+    parser.add_argument("--ivfflat-lists", type=int, default=None)
+    parser.add_argument("--candidate-pool", nargs="+", type=int, default=[0, 100, 400, 1000], help="0 disables the candidate pool")
+    parser.add_argument("--keep-index", action="store_true", help="Leave the last evaluated index in place")
+    parser.add_argument("--out", help="Write results JSON here")
+    args = parser.parse_args()
+
+    report = asyncio.run(evaluate(args))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Run the load-test scenarios and compare against a saved baseline.
+
+Typical offline run (spawns the stub LLM server and the app against local Postgres):
+
+    python -m benchmarks.run_benchmarks --spawn --save-baseline benchmarks/results/baseline.json
+    python -m benchmarks.run_benchmarks --spawn --baseline benchmarks/results/baseline.json
+
+Exit code is 1 when any tracked metric regresses beyond --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import httpx
+from benchmarks.corpus import PRESETS as CORPUS_PRESETS
+from benchmarks.scenarios import SCENARIOS, ScenarioContext, ScenarioResult, percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metrics compared against the baseline; all of them are "lower is better"
+TRACKED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "ttfb_p95_ms", "db_statements_per_request", "llm_calls_per_request")
+
+def parse_prometheus(text: str) -> Dict[str, float]:
+    """Sum samples by metric name (labels dropped); enough for counters and simple gauges."""
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_part, _, value = line.rpartition(" ")
+        name = name_part.split("{", 1)[0]
+        try:
+            values[name] = values.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return values
+
+async def _scrape(client: httpx.AsyncClient) -> Dict[str, float]:
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+        return parse_prometheus(response.text)
+    except httpx.HTTPError:
+        return {}
+
+async def _stub_stats(stub: Optional[httpx.AsyncClient]) -> Dict[str, float]:
+    if stub is None:
+        return {}
+    try:
+        response = await stub.get("/stats")
+        response.raise_for_status()
+        return response.json()["stats"]
+    except httpx.HTTPError:
+        return {}
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 1) if value is not None else None
+
+def summarize(result: ScenarioResult, metrics_before: Dict[str, float], metrics_after: Dict[str, float], stub_stats: Dict[str, float]) -> Dict[str, Any]:
+    requests = max(result.requests, 1)
+    db_statements = metrics_after.get("novel_db_statements_total", 0.0) - metrics_before.get("novel_db_statements_total", 0.0)
+    llm_calls = stub_stats.get("chat_completions", 0)
+    cache_hits = stub_stats.get("prompt_cache_hit_tokens", 0)
+    cache_misses = stub_stats.get("prompt_cache_miss_tokens", 0)
+    return {
+        "requests": result.requests,
+        "errors": result.errors,
+        "error_samples": result.error_samples,
+        "wall_seconds": round(result.wall_seconds, 3),
+        "throughput_rps": round(result.requests / result.wall_seconds, 3) if result.wall_seconds else None,
+        "p50_ms": _ms(percentile(result.latencies, 50)),
+        "p95_ms": _ms(percentile(result.latencies, 95)),
+        "p99_ms": _ms(percentile(result.latencies, 99)),
+        "ttfb_p50_ms": _ms(percentile(result.ttfb, 50)),
+        "ttfb_p95_ms": _ms(percentile(result.ttfb, 95)),
+        "db_statements": int(db_statements),
+        "db_statements_per_request": round(db_statements / requests, 2),
+        "db_pool_peak": metrics_after.get("novel_db_pool_checked_out_peak"),
+        "llm_calls": int(llm_calls),
+        "llm_calls_per_request": round(llm_calls / requests, 2),
+        "embedding_inputs": int(stub_stats.get("embedding_inputs", 0)),
+        "completion_tokens": int(stub_stats.get("completion_tokens", 0)),
+        "prompt_cache_hit_ratio": round(cache_hits / (cache_hits + cache_misses), 3) if cache_hits + cache_misses else None
+    }
+
+async def run_scenarios(args) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    corpus_project_id = args.corpus_project_id
+    if args.corpus and not corpus_project_id:
+        from benchmarks.corpus import ensure_corpus
+        print(f"Preparing synthetic corpus '{args.corpus}'...")
+        corpus_project_id = await ensure_corpus(args.database_url, args.corpus, args.corpus_seed)
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+    async with httpx.AsyncClient(base_url=args.app_url, timeout=timeout) as client:
+        stub = httpx.AsyncClient(base_url=args.stub_url, timeout=10.0) if args.stub_url else None
+        try:
+            for name in args.scenarios:
+                print(f"▶ {name} (concurrency={args.concurrency}, requests={args.requests})")
+                if stub is not None:
+                    await stub.post("/stats/reset")
+                try:
+                    await client.post("/api/system/pool/reset-peak")
+                except httpx.HTTPError:
+                    pass
+                before = await _scrape(client)
+                result = await SCENARIOS[name](ScenarioContext(client, args.concurrency, args.requests, corpus_project_id))
+                after = await _scrape(client)
+                summary = summarize(result, before, after, await _stub_stats(stub))
+                results[name] = summary
+                print(
+                    f"  p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms "
+                    f"rps={summary['throughput_rps']} errors={summary['errors']} "
+                    f"db/req={summary['db_statements_per_request']} llm/req={summary['llm_calls_per_request']}"
+                )
+        finally:
+            if stub is not None:
+                await stub.aclose()
+    return results
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return human-readable regressions of tracked metrics beyond `tolerance` (a ratio)."""
+    regressions = []
+    for name, summary in current.items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if not reference:
+            continue
+        if summary["errors"] > reference.get("errors", 0):
+            regressions.append(f"{name}: errors {reference.get('errors', 0)} -> {summary['errors']}")
+        for metric in TRACKED_METRICS:
+            old, new = reference.get(metric), summary.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > 1e-6:
+                regressions.append(f"{name}: {metric} {old} -> {new} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+def _wait_for(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+def spawn_processes(args) -> List[subprocess.Popen]:
+    """Start the stub server and the app, wiring the app's LLM/embedding clients to the stub."""
+    stub_port = httpx.URL(args.stub_url).port
+    app_port = httpx.URL(args.app_url).port
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_llm_server", "--port", str(stub_port),
+         "--latency", args.stub_latency, "--tokens-per-second", str(args.stub_tokens_per_second)],
+        cwd=BACKEND_DIR
+    )
+    env = {
+        **os.environ,
+        "LLM_BASE_URL": f"{args.stub_url}/v1",
+        "EMBEDDING_BASE_URL": f"{args.stub_url}/v1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "stub"),
+        "EMBEDDING_API_KEY": os.environ.get("EMBEDDING_API_KEY", "stub")
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+    processes = [stub, app]
+    try:
+        _wait_for(f"{args.stub_url}/stats")
+        _wait_for(f"{args.app_url}/")
+    except Exception:
+        for process in processes:
+            process.terminate()
+        raise
+    return processes
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Offline load tests against the stub LLM server")
+    parser.add_argument("--app-url", default="http://127.0.0.1:8100")
+    parser.add_argument("--stub-url", default="http://127.0.0.1:9100")
+    parser.add_argument("--spawn", action="store_true", help="Start the stub server and the app as subprocesses")
+    parser.add_argument("--stub-latency", default="lognormal:400,0.5")
+    parser.add_argument("--stub-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--corpus", choices=sorted(CORPUS_PRESETS), help="Run against a synthetic corpus preset (generated on first use)")
+    parser.add_argument("--corpus-seed", type=int, default=None)
+    parser.add_argument("--corpus-project-id", help="Run against an existing project instead of per-scenario fixtures")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"), help="Used to generate the corpus")
+    parser.add_argument("--out", help="Write this run's results to a JSON file")
+    parser.add_argument("--save-baseline", help="Write this run's results as the new baseline")
+    parser.add_argument("--baseline", help="Compare against a baseline JSON and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    processes = spawn_processes(args) if args.spawn else []
+    try:
+        scenarios = asyncio.run(run_scenarios(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "settings": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "stub_latency": args.stub_latency,
+            "stub_tokens_per_second": args.stub_tokens_per_second,
+            "corpus": args.corpus,
+            "corpus_seed": args.corpus_seed,
+            "corpus_project_id": args.corpus_project_id
+        },
+        "scenarios": scenarios
+    }
+    for path in filter(None, (args.out, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(scenarios, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Load-test scenarios driven over HTTP against a running app.
+
+Each scenario sets up its own project(s), fires requests at a fixed concurrency
+and records per-request latency. Streaming scenarios also record time to first
+byte. Nothing here imports the app, so the same scenarios can be pointed at any
+deployment.
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import httpx
+
+API = "/api"
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int = 0
+    errors: int = 0
+    wall_seconds: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    ttfb: List[float] = field(default_factory=list)
+    error_samples: List[str] = field(default_factory=list)
+
+    def record_error(self, message: str):
+        self.errors += 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(message[:300])
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def sample_meta_info(characters: int = 12, volumes: int = 3, chapters_per_volume: int = 10) -> Dict[str, Any]:
+    """A Genesis-shaped meta_info large enough to make RAG sync and prompts realistic."""
+    return {
+        "title": "玉简问道",
+        "characters": [
+            {
+                "id": f"char_{i}",
+                "name": f"角色{i}",
+                "role": "protagonist" if i == 0 else "supporting",
+                "personality": "坚韧隐忍，外冷内热",
+                "background": "出身没落世家，少年时遭逢大变。" * 3,
+                "relationships": [{"target": f"char_{(i + 1) % characters}", "type": "同门"}]
+            }
+            for i in range(characters)
+        ],
+        "world": {
+            "power_system": {"source": "灵气", "levels": [{"name": n} for n in ["炼气", "筑基", "金丹", "元婴"]]},
+            "factions": [{"name": f"势力{i}", "description": "盘踞一方的宗门"} for i in range(6)],
+            "locations": [{"id": f"loc_{i}", "name": f"地点{i}", "description": "群山环抱的古城"} for i in range(10)]
+        },
+        "outline": [
+            {
+                "id": f"volume_{v}",
+                "title": f"第{v}卷",
+                "summary": "阶段目标与主要冲突",
+                "chapters": [
+                    {"id": f"chapter_{v}_{c}", "title": f"第{(v - 1) * chapters_per_volume + c}章", "summary": "章节概要，主角遭遇新的挑战。"}
+                    for c in range(1, chapters_per_volume + 1)
+                ]
+            }
+            for v in range(1, volumes + 1)
+        ]
+    }
+
+def chapter_text(chapter_number: int, chars: int = 3000) -> str:
+    base = f"第{chapter_number}章。夜色如墨，少年握紧了手中的剑，与同门在遗迹深处发现了一枚残缺的玉简。"
+    return (base * (chars // len(base) + 1))[:chars]
+
+class ScenarioContext:
+    def __init__(self, client: httpx.AsyncClient, concurrency: int, requests: int, corpus_project_id: Optional[str] = None):
+        self.client = client
+        self.concurrency = concurrency
+        self.requests = requests
+        self.corpus_project_id = corpus_project_id # Synthetic corpus (benchmarks.corpus) to run against
+        self._corpus_project: Optional[Dict[str, Any]] = None
+
+    async def fixture_project(self, name: str, chapters: int = 1) -> Tuple[Dict[str, Any], bool]:
+        """The synthetic corpus project when configured, else a fresh project. Returns (project, owned)."""
+        if self.corpus_project_id:
+            if self._corpus_project is None:
+                response = await self.client.get(f"{API}/projects/{self.corpus_project_id}")
+                response.raise_for_status()
+                self._corpus_project = response.json()
+            return self._corpus_project, False
+        return await self.create_project(name, chapters), True
+
+    async def create_project(self, name: str, chapters: int = 1) -> Dict[str, Any]:
+        response = await self.client.post(f"{API}/projects", json={
+            "name": name,
+            "description": "benchmark fixture",
+            "meta_info": sample_meta_info()
+        })
+        response.raise_for_status()
+        project = response.json()
+        for number in range(2, chapters + 1):
+            created = await self.client.post(f"{API}/projects/{project['id']}/chapters", json={
+                "title": f"第{number}章",
+                "chapter_number": number,
+                "content": chapter_text(number, 500)
+            })
+            created.raise_for_status()
+        detail = await self.client.get(f"{API}/projects/{project['id']}")
+        detail.raise_for_status()
+        return detail.json()
+
+    async def delete_project(self, project_id: str):
+        try:
+            await self.client.delete(f"{API}/projects/{project_id}")
+        except httpx.HTTPError:
+            pass
+
+    async def run(self, name: str, make_request: Callable[[int, ScenarioResult], Awaitable[None]]) -> ScenarioResult:
+        """Run `make_request(i)` for i in range(requests), at most `concurrency` at a time."""
+        result = ScenarioResult(name)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await make_request(i, result)
+                    result.latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    result.record_error(f"{type(e).__name__}: {e}")
+                finally:
+                    result.requests += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(self.requests)))
+        result.wall_seconds = time.perf_counter() - started
+        return result
+
+async def _consume_stream(client: httpx.AsyncClient, method: str, url: str, payload: Dict[str, Any], result: ScenarioResult) -> str:
+    started = time.perf_counter()
+    first = True
+    body = []
+    async with client.stream(method, url, json=payload) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        async for chunk in response.aiter_text():
+            if first and chunk:
+                result.ttfb.append(time.perf_counter() - started)
+                first = False
+            body.append(chunk)
+    return "".join(body)
+
+async def chapter_save_storm(ctx: ScenarioContext) -> ScenarioResult:
+    """Many writers saving chapters at once: analysis, event extraction and outline sync per save."""
+    project, owned = await ctx.fixture_project("bench-save-storm", chapters=min(ctx.requests, 30))
+    chapters = sorted(project["chapters"], key=lambda c: c["chapter_number"])
+    if not owned:
+        # Spread saves over the whole book so outline sync sees early and late chapters
+        chapters = chapters[::max(1, len(chapters) // max(ctx.requests, 1))]
+
+    async def save(i: int, result: ScenarioResult):
+        chapter = chapters[i % len(chapters)]
+        response = await ctx.client.put(f"{API}/chapters/{chapter['id']}", json={
+            "content": chapter_text(chapter["chapter_number"]) + f"（第{i}次修改）"
+        })
+        response.raise_for_status()
+
+    try:
+        return await ctx.run("chapter_save_storm", save)
+    finally:
+        if owned:
+            await ctx.delete_project(project["id"])
+
+async def concurrent_generate(ctx: ScenarioContext) -> ScenarioResult:
+    """Concurrent /chapters/generate streams, read to completion."""
+    project, owned = await ctx.fixture_project("bench-generate", chapters=5)
+    chapters = sorted(project["chapters"], key=lambda c: c["chapter_number"])
+
+    async def generate(i: int, result: ScenarioResult):
+        text = await _consume_stream(ctx.client, "POST", f"{API}/chapters/generate", {
+            "project_id": project["id"],
+            "instructions": "主角进入遗迹深处，与神秘人交手。",
+            "previous_chapter_id": chapters[-1]["id"]
+        }, result)
+        if not text:
+            raise RuntimeError("empty stream")
+
+    try:
+        return await ctx.run("concurrent_generate", generate)
+    finally:
+        if owned:
+            await ctx.delete_project(project["id"])
+
+async def genesis_unified(ctx: ScenarioContext) -> ScenarioResult:
+    """Full multi-agent Genesis runs streamed as NDJSON."""
+    async def unified(i: int, result: ScenarioResult):
+        text = await _consume_stream(ctx.client, "POST", f"{API}/genesis/unified", {
+            "user_input": "帮我完善大纲和第一章",
+            "current_data": {"concept": {"core_idea": "废柴少年得到上古玉简"}, "skeleton": {}, "characters": [], "world": {}}
+        }, result)
+        events = [json.loads(line) for line in text.splitlines() if line.strip()]
+        failures = [e["message"] for e in events if e.get("type") == "status" and "message" in e]
+        if failures:
+            raise RuntimeError(failures[0])
+
+    return await ctx.run("genesis_unified", unified)
+
+async def bulk_sync_rag(ctx: ScenarioContext) -> ScenarioResult:
+    """Re-sync meta_info into the RAG tables for several projects in parallel."""
+    projects = [await ctx.create_project(f"bench-sync-{i}") for i in range(min(ctx.concurrency, 8))]
+
+    async def sync(i: int, result: ScenarioResult):
+        response = await ctx.client.post(f"{API}/projects/{projects[i % len(projects)]['id']}/sync-rag")
+        response.raise_for_status()
+
+    try:
+        return await ctx.run("bulk_sync_rag", sync)
+    finally:
+        for project in projects:
+            await ctx.delete_project(project["id"])
+
+async def get_project(ctx: ScenarioContext) -> ScenarioResult:
+    """Load the full project detail (chapters + entity versions), as the editor does on open."""
+    project, owned = await ctx.fixture_project("bench-get-project", chapters=20)
+
+    async def load(i: int, result: ScenarioResult):
+        response = await ctx.client.get(f"{API}/projects/{project['id']}")
+        response.raise_for_status()
+
+    try:
+        return await ctx.run("get_project", load)
+    finally:
+        if owned:
+            await ctx.delete_project(project["id"])
+
+async def context_retrieve(ctx: ScenarioContext) -> ScenarioResult:
+    """Temporal vector retrieval at chapters spread across the book."""
+    project, owned = await ctx.fixture_project("bench-retrieve", chapters=20)
+    last_chapter = max(c["chapter_number"] for c in project["chapters"])
+    names = [c.get("name") or c.get("id") for c in project["meta_info"].get("characters", [])] or ["主角"]
+
+    async def retrieve(i: int, result: ScenarioResult):
+        response = await ctx.client.post(f"{API}/context/retrieve", json={
+            "project_id": project["id"],
+            "query": f"{names[i % len(names)]}现在的状态和位置",
+            "current_chapter": 1 + (i * 7919) % last_chapter,
+            "limit": 10
+        })
+        response.raise_for_status()
+
+    try:
+        return await ctx.run("context_retrieve", retrieve)
+    finally:
+        if owned:
+            await ctx.delete_project(project["id"])
+
+SCENARIOS: Dict[str, Callable[[ScenarioContext], Awaitable[ScenarioResult]]] = {
+    "chapter_save_storm": chapter_save_storm,
+    "concurrent_generate": concurrent_generate,
+    "genesis_unified": genesis_unified,
+    "bulk_sync_rag": bulk_sync_rag,
+    "get_project": get_project,
+    "context_retrieve": context_retrieve,
+}
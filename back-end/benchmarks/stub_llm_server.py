@@ -0,0 +1,269 @@
+"""
+OpenAI-compatible stub server for offline benchmarks.
+
+Serves /v1/chat/completions (streaming and non-streaming) and /v1/embeddings
+with configurable latency and streaming rates, so load tests exercise the real
+app code paths without paying for (or being rate limited by) a provider.
+
+Usage:
+    python -m benchmarks.stub_llm_server --port 9100 --latency lognormal:400,0.5 --tokens-per-second 60
+
+Then start the app with LLM_BASE_URL and EMBEDDING_BASE_URL set to http://localhost:9100/v1.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from benchmarks.canned_responses import canned_response
+from benchmarks.hashing import hashed_embedding
+
+@dataclass
+class LatencyDistribution:
+    """
+    Latency spec in milliseconds:
+        fixed:200
+        uniform:100,400
+        normal:300,50          (mean, stddev)
+        lognormal:400,0.5      (median, sigma)
+    """
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, params = spec.partition(":")
+        values = [float(v) for v in params.split(",") if v] or [0.0]
+        return cls(kind, values[0], values[1] if len(values) > 1 else 0.0)
+
+    def sample_seconds(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            ms = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            ms = rng.gauss(self.a, self.b)
+        elif self.kind == "lognormal":
+            ms = rng.lognormvariate(math.log(max(self.a, 1e-3)), self.b)
+        else:
+            ms = self.a
+        return max(0.0, ms) / 1000
+
+@dataclass
+class StubConfig:
+    chat_latency: str = "lognormal:400,0.5" # Time to first token
+    embedding_latency: str = "lognormal:60,0.3"
+    tokens_per_second: float = 60.0
+    chars_per_token: int = 2
+    filler_chars: int = 3000 # Length of free-form completions (chapters, chat)
+    outline_deviation_ratio: float = 0.0 # Share of outline comparisons reporting a major deviation
+    cache_block_tokens: int = 64 # Prefix cache granularity, as on DeepSeek; 0 disables cache emulation
+    seed: int = 42
+
+class StubState:
+    def __init__(self, config: StubConfig):
+        self.configure(config)
+
+    def configure(self, config: StubConfig):
+        self.config = config
+        self.chat_latency = LatencyDistribution.parse(config.chat_latency)
+        self.embedding_latency = LatencyDistribution.parse(config.embedding_latency)
+        self.rng = random.Random(config.seed)
+        self.reset()
+
+    def reset(self):
+        self.stats: Dict[str, float] = {
+            "chat_completions": 0,
+            "chat_completions_streamed": 0,
+            "embedding_requests": 0,
+            "embedding_inputs": 0,
+            "completion_tokens": 0,
+            "streams_aborted": 0,
+            "prompt_cache_hit_tokens": 0,
+            "prompt_cache_miss_tokens": 0,
+        }
+        self.prefix_cache: "OrderedDict[str, None]" = OrderedDict()
+
+    def prompt_cache_hit_chars(self, prompt: str) -> int:
+        """
+        Emulate provider context caching: the longest block-aligned prefix seen before
+        is a hit. Every block-aligned prefix of this prompt is cached afterwards.
+        """
+        block = self.config.cache_block_tokens * self.config.chars_per_token
+        if block <= 0:
+            return 0
+        hit = 0
+        digest = hashlib.sha256()
+        for end in range(block, len(prompt) + 1, block):
+            digest.update(prompt[end - block:end].encode("utf-8"))
+            key = digest.copy().hexdigest()
+            if key in self.prefix_cache:
+                self.prefix_cache.move_to_end(key)
+                if hit == end - block:
+                    hit = end
+            else:
+                self.prefix_cache[key] = None
+        while len(self.prefix_cache) > 200_000:
+            self.prefix_cache.popitem(last=False)
+        return hit
+
+state = StubState(StubConfig())
+app = FastAPI(title="Stub LLM Server")
+
+def _usage(prompt: str, completion_tokens: int, cache_hit_chars: int = 0) -> Dict[str, int]:
+    prompt_tokens = max(1, len(prompt) // 2)
+    hit_tokens = min(prompt_tokens, cache_hit_chars // 2)
+    state.stats["prompt_cache_hit_tokens"] += hit_tokens
+    state.stats["prompt_cache_miss_tokens"] += prompt_tokens - hit_tokens
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        # DeepSeek's field names
+        "prompt_cache_hit_tokens": hit_tokens,
+        "prompt_cache_miss_tokens": prompt_tokens - hit_tokens
+    }
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages: List[Dict[str, str]] = body.get("messages", [])
+    model = body.get("model", "stub")
+    config = state.config
+    state.stats["chat_completions"] += 1
+
+    text = canned_response(
+        messages,
+        filler_chars=config.filler_chars,
+        outline_deviation=state.rng.random() < config.outline_deviation_ratio
+    )
+    # Role markers keep message boundaries part of the cached prefix, as on the real API
+    prompt = "".join(f"<{m.get('role', '')}>{m.get('content', '')}" for m in messages)
+    cache_hit_chars = state.prompt_cache_hit_chars(prompt)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    await asyncio.sleep(state.chat_latency.sample_seconds(state.rng))
+
+    if not body.get("stream"):
+        tokens = max(1, len(text) // config.chars_per_token)
+        state.stats["completion_tokens"] += tokens
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(prompt, tokens, cache_hit_chars)
+        })
+
+    state.stats["chat_completions_streamed"] += 1
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def event_stream():
+        def chunk(delta: Dict[str, Any], finish_reason=None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }, ensure_ascii=False) + "\n\n"
+
+        step = config.chars_per_token
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+        tokens = 0
+        try:
+            yield chunk({"role": "assistant", "content": ""})
+            for i in range(0, len(text), step):
+                yield chunk({"content": text[i:i + step]})
+                tokens += 1
+                state.stats["completion_tokens"] += 1
+                if delay:
+                    await asyncio.sleep(delay)
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": _usage(prompt, tokens, cache_hit_chars)
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+        except asyncio.CancelledError:
+            state.stats["streams_aborted"] += 1
+            raise
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    state.stats["embedding_requests"] += 1
+    state.stats["embedding_inputs"] += len(inputs)
+    await asyncio.sleep(state.embedding_latency.sample_seconds(state.rng))
+    return JSONResponse({
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": hashed_embedding(text)}
+            for i, text in enumerate(inputs)
+        ],
+        "model": body.get("model", "stub-embedding"),
+        "usage": {"prompt_tokens": sum(len(t) for t in inputs), "total_tokens": sum(len(t) for t in inputs)}
+    })
+
+@app.get("/stats")
+async def get_stats():
+    return {"config": asdict(state.config), "stats": state.stats}
+
+@app.post("/stats/reset")
+async def reset_stats():
+    state.reset()
+    return {"status": "reset"}
+
+@app.post("/config")
+async def update_config(overrides: Dict[str, Any]):
+    """Change latency/streaming settings between scenarios without restarting."""
+    state.configure(StubConfig(**{**asdict(state.config), **overrides}))
+    return asdict(state.config)
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", default=StubConfig.chat_latency, help="Time-to-first-token distribution (ms)")
+    parser.add_argument("--embedding-latency", default=StubConfig.embedding_latency)
+    parser.add_argument("--tokens-per-second", type=float, default=StubConfig.tokens_per_second)
+    parser.add_argument("--filler-chars", type=int, default=StubConfig.filler_chars)
+    parser.add_argument("--outline-deviation-ratio", type=float, default=StubConfig.outline_deviation_ratio)
+    parser.add_argument("--cache-block-tokens", type=int, default=StubConfig.cache_block_tokens,
+                        help="Prefix cache granularity reported in usage; 0 disables")
+    parser.add_argument("--seed", type=int, default=StubConfig.seed)
+    args = parser.parse_args()
+
+    state.configure(StubConfig(
+        chat_latency=args.latency,
+        embedding_latency=args.embedding_latency,
+        tokens_per_second=args.tokens_per_second,
+        filler_chars=args.filler_chars,
+        outline_deviation_ratio=args.outline_deviation_ratio,
+        cache_block_tokens=args.cache_block_tokens,
+        seed=args.seed
+    ))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
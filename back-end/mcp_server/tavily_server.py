@@ -1,6 +1,9 @@
 from mcp.server.fastmcp import FastMCP
 from tavily import TavilyClient
 import os
+import sys
+import time
+from contextlib import contextmanager
 from typing import Dict, Any
 
 # Initialize FastMCP server
@@ -11,6 +14,41 @@ mcp = FastMCP("Tavily Search")
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 tavily_client = TavilyClient(api_key=tavily_api_key) if tavily_api_key else None
 
+# The backend passes its trace context via TRACEPARENT (W3C format) when it spawns this server.
+# Timings go to stderr because stdout carries the MCP protocol.
+TRACEPARENT = os.getenv("TRACEPARENT")
+
+def _init_tracer():
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": "novel-assist-mcp-tavily"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"])))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("mcp-tavily")
+
+tracer = _init_tracer()
+
+@contextmanager
+def traced_tool(name: str):
+    started = time.perf_counter()
+    if tracer is not None:
+        from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+        parent = TraceContextTextMapPropagator().extract({"traceparent": TRACEPARENT}) if TRACEPARENT else None
+        with tracer.start_as_current_span(f"mcp.{name}", context=parent):
+            yield
+    else:
+        yield
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"[trace {TRACEPARENT or '-'}] mcp.{name} took {elapsed_ms:.1f}ms", file=sys.stderr)
+
 @mcp.tool()
 async def search_inspiration(query: str) -> Dict[str, Any]:
     """
@@ -27,7 +65,8 @@ async def search_inspiration(query: str) -> Dict[str, Any]:
     
     try:
         # We use advanced search depth for better results
-        response = tavily_client.search(query=query, search_depth="advanced")
+        with traced_tool("search_inspiration"):
+            response = tavily_client.search(query=query, search_depth="advanced")
         return response
     except Exception as e:
         return {"error": str(e)}
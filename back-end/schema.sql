@@ -3,6 +3,8 @@ CREATE TABLE projects (
         id UUID NOT NULL, 
         name VARCHAR NOT NULL, 
         description TEXT, 
+        entity_epoch INTEGER DEFAULT 0 NOT NULL, 
+        meta_revision INTEGER DEFAULT 0 NOT NULL, 
         created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
         updated_at TIMESTAMP WITH TIME ZONE, 
         PRIMARY KEY (id)
@@ -15,10 +17,13 @@ CREATE TABLE chapters (
         title VARCHAR NOT NULL, 
         content TEXT, 
         summary TEXT, 
+        content_revision INTEGER DEFAULT 0 NOT NULL, 
+        analyzed_revision INTEGER, 
+        analysis_report JSONB, 
         created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
         updated_at TIMESTAMP WITH TIME ZONE, 
         PRIMARY KEY (id), 
-        FOREIGN KEY(project_id) REFERENCES projects (id)
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE
 );
 
 CREATE TABLE entity_versions (
@@ -34,5 +39,191 @@ CREATE TABLE entity_versions (
         embedding VECTOR(1536), 
         created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
         PRIMARY KEY (id), 
-        FOREIGN KEY(project_id) REFERENCES projects (id)
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE
 );
+
+CREATE INDEX ix_chapters_project_id ON chapters (project_id);
+
+CREATE INDEX ix_entity_versions_project_id ON entity_versions (project_id);
+
+CREATE INDEX ix_entity_versions_temporal ON entity_versions (project_id, entity_type, entity_id, version DESC) INCLUDE (valid_from_chapter, valid_to_chapter);
+CREATE INDEX ix_entity_versions_payload ON entity_versions USING gin (payload_json jsonb_path_ops);
+
+CREATE TABLE entity_versions_archive (
+        id UUID NOT NULL, 
+        project_id UUID NOT NULL, 
+        entity_type VARCHAR NOT NULL, 
+        entity_id VARCHAR NOT NULL, 
+        version INTEGER NOT NULL, 
+        valid_from_chapter INTEGER NOT NULL, 
+        valid_to_chapter INTEGER, 
+        reason VARCHAR NOT NULL, 
+        payload_zlib BYTEA NOT NULL, 
+        embedding_half HALFVEC(1536), 
+        created_at TIMESTAMP WITH TIME ZONE, 
+        archived_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_entity_versions_archive_temporal ON entity_versions_archive (project_id, reason, valid_from_chapter, valid_to_chapter);
+
+CREATE TABLE entity_edges (
+        id UUID NOT NULL, 
+        project_id UUID NOT NULL, 
+        source_version_id UUID NOT NULL, 
+        src_type VARCHAR NOT NULL, 
+        src_id VARCHAR NOT NULL, 
+        dst_type VARCHAR NOT NULL, 
+        dst_id VARCHAR NOT NULL, 
+        relation VARCHAR NOT NULL, 
+        label TEXT, 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE, 
+        FOREIGN KEY(source_version_id) REFERENCES entity_versions (id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_entity_edges_source_version_id ON entity_edges (source_version_id);
+CREATE INDEX ix_entity_edges_src ON entity_edges (project_id, src_type, src_id);
+CREATE INDEX ix_entity_edges_dst ON entity_edges (project_id, dst_type, dst_id);
+
+CREATE TABLE entity_edges_archive (
+        id UUID NOT NULL, 
+        project_id UUID NOT NULL, 
+        source_version_id UUID NOT NULL, 
+        src_type VARCHAR NOT NULL, 
+        src_id VARCHAR NOT NULL, 
+        dst_type VARCHAR NOT NULL, 
+        dst_id VARCHAR NOT NULL, 
+        relation VARCHAR NOT NULL, 
+        label TEXT, 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE, 
+        FOREIGN KEY(source_version_id) REFERENCES entity_versions_archive (id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_entity_edges_archive_source_version_id ON entity_edges_archive (source_version_id);
+CREATE INDEX ix_entity_edges_archive_src ON entity_edges_archive (project_id, src_type, src_id);
+CREATE INDEX ix_entity_edges_archive_dst ON entity_edges_archive (project_id, dst_type, dst_id);
+
+CREATE TABLE story_events (
+        id UUID NOT NULL, 
+        project_id UUID NOT NULL, 
+        event_id VARCHAR NOT NULL, 
+        chapter INTEGER NOT NULL, 
+        title VARCHAR, 
+        description TEXT, 
+        participants VARCHAR[] NOT NULL, 
+        witnesses VARCHAR[] NOT NULL, 
+        location_id VARCHAR, 
+        significance SMALLINT, 
+        tags VARCHAR[] NOT NULL, 
+        payload_json JSONB NOT NULL, 
+        embedding VECTOR(1536), 
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE
+);
+
+CREATE UNIQUE INDEX ix_story_events_project_event ON story_events (project_id, event_id);
+CREATE INDEX ix_story_events_chapter_significance ON story_events (project_id, chapter, significance);
+CREATE INDEX ix_story_events_location ON story_events (project_id, location_id);
+CREATE INDEX ix_story_events_participants ON story_events USING gin (participants);
+CREATE INDEX ix_story_events_witnesses ON story_events USING gin (witnesses);
+
+CREATE TABLE payload_query_stats (
+        path VARCHAR NOT NULL, 
+        query_count FLOAT NOT NULL, 
+        last_queried_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (path)
+);
+
+CREATE TABLE genesis_node_cache (
+        draft_id VARCHAR NOT NULL, 
+        node VARCHAR NOT NULL, 
+        fingerprint VARCHAR NOT NULL, 
+        intent VARCHAR NOT NULL, 
+        outputs_json JSONB NOT NULL, 
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (draft_id, node)
+);
+
+CREATE INDEX ix_genesis_node_cache_updated_at ON genesis_node_cache (updated_at);
+
+CREATE TABLE genesis_runs (
+        id UUID NOT NULL, 
+        draft_id VARCHAR, 
+        status VARCHAR NOT NULL, 
+        error TEXT, 
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (id)
+);
+
+CREATE INDEX ix_genesis_runs_updated_at ON genesis_runs (updated_at);
+
+CREATE TABLE generations (
+        id UUID NOT NULL, 
+        project_id UUID, 
+        kind VARCHAR NOT NULL, 
+        status VARCHAR NOT NULL, 
+        content TEXT NOT NULL, 
+        context_json JSONB, 
+        error TEXT, 
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_generations_project_id ON generations (project_id);
+
+CREATE TABLE ingestion_jobs (
+        id UUID NOT NULL, 
+        project_id UUID NOT NULL, 
+        status VARCHAR NOT NULL, 
+        source_name VARCHAR, 
+        run_analysis BOOLEAN NOT NULL, 
+        first_chapter INTEGER NOT NULL, 
+        last_chapter INTEGER NOT NULL, 
+        applied_through INTEGER NOT NULL, 
+        stats JSONB NOT NULL, 
+        error TEXT, 
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_ingestion_jobs_project_id ON ingestion_jobs (project_id);
+
+CREATE TABLE chat_sessions (
+        id UUID NOT NULL, 
+        project_id UUID, 
+        title VARCHAR, 
+        current_chapter INTEGER NOT NULL, 
+        message_count INTEGER NOT NULL, 
+        summary TEXT, 
+        summarized_through INTEGER NOT NULL, 
+        context_cache TEXT, 
+        context_key VARCHAR, 
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(project_id) REFERENCES projects (id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_chat_sessions_project_id ON chat_sessions (project_id);
+
+CREATE TABLE chat_messages (
+        id UUID NOT NULL, 
+        session_id UUID NOT NULL, 
+        seq INTEGER NOT NULL, 
+        role VARCHAR NOT NULL, 
+        content TEXT NOT NULL, 
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(), 
+        PRIMARY KEY (id), 
+        FOREIGN KEY(session_id) REFERENCES chat_sessions (id) ON DELETE CASCADE
+);
+
+CREATE UNIQUE INDEX ix_chat_messages_session_seq ON chat_messages (session_id, seq);
@@ -0,0 +1,27 @@
+import asyncio
+from typing import Awaitable, Callable
+import pytest
+
+@pytest.fixture
+def run_db() -> Callable[[Callable[[], Awaitable[None]]], None]:
+    """
+    Run an async test body against DATABASE_URL, with the tables created as init_db does.
+    Skips when no database is reachable (or it lacks the pgvector version the schema needs). Bodies create their own project and delete it.
+    """
+    def run(body: Callable[[], Awaitable[None]]):
+        async def main():
+            from sqlalchemy.exc import DBAPIError
+            from app.db.database import engine
+            from app.db.init_db import init_models
+
+            try:
+                try:
+                    await asyncio.wait_for(init_models(), timeout=10)
+                except (OSError, asyncio.TimeoutError, DBAPIError) as e:
+                    pytest.skip(f"No database reachable: {e}")
+                await body()
+            finally:
+                await engine.dispose()
+
+        asyncio.run(main())
+    return run
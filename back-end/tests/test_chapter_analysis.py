@@ -0,0 +1,53 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+import pytest
+from app.core.config import settings
+from app.services import chapter_analysis_service as analysis_module
+from app.services import ingestion_service
+from app.services.chapter_analysis_service import ChapterAnalysisService, Superseded
+
+class _FakeSession:
+    """Stands in for AsyncSessionLocal: every read returns the chapter at `row`."""
+    row = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        return SimpleNamespace(first=lambda: self.row)
+
+def test_save_on_another_worker_supersedes_running_extraction(monkeypatch):
+    chapter_id = uuid.uuid4()
+    _FakeSession.row = SimpleNamespace(project_id=uuid.uuid4(), chapter_number=3, content="正文", content_revision=1)
+    monkeypatch.setattr(analysis_module, "AsyncSessionLocal", _FakeSession)
+    monkeypatch.setattr(settings, "ANALYSIS_SUPERSEDE_POLL_SECONDS", 0.01)
+
+    started = asyncio.Event()
+    extraction = {"cancelled": False}
+
+    async def slow_extract(content, number):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            extraction["cancelled"] = True
+            raise
+    monkeypatch.setattr(ingestion_service, "extract_chapter", slow_extract)
+
+    service = ChapterAnalysisService()
+
+    async def current_revision(cid):
+        # Another worker saves the chapter once the extraction is under way
+        return 2 if started.is_set() else 1
+    monkeypatch.setattr(service, "_current_revision", current_revision)
+
+    async def main():
+        with pytest.raises(Superseded):
+            await asyncio.wait_for(service._analyze_locked(chapter_id, 1), timeout=5)
+
+    asyncio.run(main())
+    assert extraction["cancelled"]
@@ -0,0 +1,94 @@
+import uuid
+from app.db.models import Project, Chapter
+from app.services.chat_service import build_outline_block, build_recent_outlines_block, attach_context, session_prompt
+from app.services.prompt_builder import canonical_json, chapter_layout, record_prefix
+
+META = {
+    "genre": "玄幻",
+    "theme": "逆天改命",
+    "story_formula": "废柴逆袭 + 签到系统",
+    "outline": [{"title": "第一卷", "chapters": [{"title": "第1章", "summary": "入门"}]}],
+    "golden_finger_rules": ["每日签到获得一次抽奖", "抽奖结果不可交易"],
+    "world": {
+        "power_system": {"source": "灵气", "levels": [{"name": "炼气"}, {"name": "筑基"}, {"name": "金丹"}]},
+        "factions": [{"name": "青云宗"}, {"name": "魔教"}],
+        "rules": {"public_rules": ["宗门弟子不得私斗"]},
+    },
+    "characters": [{"name": "林凡", "role": "主角", "personality": "隐忍"}],
+}
+
+def _reordered(value):
+    """The same data with every dict's keys inserted in reverse order, as a JSONB round trip may return it."""
+    if isinstance(value, dict):
+        return {key: _reordered(value[key]) for key in reversed(list(value))}
+    if isinstance(value, list):
+        return [_reordered(item) for item in value]
+    return value
+
+def _chapter_layout(meta, chapter: int, rag_context: str):
+    """The prompt generate_chapter builds for `chapter`, with that chapter's outline window and previous chapter."""
+    return chapter_layout(
+        meta,
+        outline_context=f"【大纲上下文】\n- 第{chapter}章: 计划内容 (当前)",
+        prev_summary=f"第{chapter - 1}章概要",
+        prev_content_tail=f"第{chapter - 1}章结尾",
+        rag_context=rag_context,
+        instructions=f"第{chapter}章让林凡突破"
+    )
+
+def _chat_turn(meta, history, rag_block: str, context_data: str, summary=None):
+    """The prompt prepare_turn builds for a session turn in chapter 3 of a project with `meta`."""
+    project = Project(id=uuid.uuid4(), name="测试", meta_info=meta)
+    chapters = [Chapter(chapter_number=n, detailed_outline=f"第{n}章细纲") for n in (1, 2, 3)]
+    project_context = build_outline_block(project, 3) + build_recent_outlines_block(chapters)
+    return session_prompt(project_context, summary, history, rag_block, context_data)
+
+def test_canonical_json_ignores_key_order():
+    assert canonical_json(META) == canonical_json(_reordered(META))
+
+def test_prefix_identical_across_chapters():
+    first = _chapter_layout(META, 3, canonical_json({"林凡": {"realm": "炼气"}}))
+    second = _chapter_layout(_reordered(META), 4, canonical_json({"林凡": {"realm": "筑基"}}))
+    assert first.prefix() == second.prefix()
+    assert first.tail() != second.tail()
+
+def test_empty_sections_do_not_shift_prefix():
+    layout = _chapter_layout(META, 3, "")
+    layout.add_stable("")
+    layout.add_stable(None)
+    assert layout.prefix() == _chapter_layout(META, 5, "检索结果").prefix()
+
+def test_record_prefix_fingerprint_is_stable():
+    prefix = _chapter_layout(META, 3, "").prefix()
+    assert record_prefix("test", prefix) == record_prefix("test", _chapter_layout(_reordered(META), 9, "").prefix())
+
+def test_chapter_instructions_stay_out_of_prefix():
+    layout = _chapter_layout(META, 3, "")
+    assert "林凡突破" not in layout.prefix()
+    assert "第2章结尾" in layout.tail()
+
+def test_chat_prefix_identical_across_turns():
+    first_turn = [{"role": "user", "content": "林凡现在是什么境界？"}]
+    second_turn = first_turn + [
+        {"role": "assistant", "content": "炼气期。"},
+        {"role": "user", "content": "下一章让他突破吧"}
+    ]
+    first = _chat_turn(META, first_turn, "【相关资料】\n- 林凡: 炼气\n\n", "编辑器选中文本A", summary="讨论了境界设定")
+    second = _chat_turn(_reordered(META), second_turn, "【相关资料】\n- 青云宗\n\n", "编辑器选中文本B", summary="讨论了境界设定")
+    assert first[0]["role"] == second[0]["role"] == "system"
+    assert first[0]["content"] == second[0]["content"]
+    assert "讨论了境界设定" in first[0]["content"]
+    assert "编辑器选中文本B" in second[-1]["content"]
+    assert "编辑器选中文本B" not in second[0]["content"]
+
+def test_chat_client_system_message_keeps_prefix_stable():
+    # Stateless /chat/generate: the client's own system message comes first, project context after it
+    system = {"role": "system", "content": "你是写作助手。"}
+    first = attach_context(
+        [system, {"role": "user", "content": "问题一"}], build_outline_block(Project(meta_info=META), 1), "", "上下文一"
+    )
+    second = attach_context(
+        [system, {"role": "user", "content": "问题二"}], build_outline_block(Project(meta_info=_reordered(META)), 1), "", "上下文二"
+    )
+    assert first[0]["content"] == second[0]["content"]
+    assert first[0]["content"].startswith("你是写作助手。")
@@ -0,0 +1,49 @@
+import uuid
+from sqlalchemy import delete
+from app.db.database import AsyncSessionLocal
+from app.db.models import Project, Chapter
+from app.services.compaction_service import compaction_service
+from app.services.rag_service import rag_service
+from app.services.snapshot_service import snapshot_service
+
+EMBEDDING = [0.01] * 1536
+
+async def _snapshot_ids(project_id: uuid.UUID, chapter: int):
+    async with AsyncSessionLocal() as db:
+        return [(e["entity_type"], e["entity_id"]) async for e in snapshot_service.iter_snapshot(db, project_id, chapter)]
+
+async def _retrieved_ids(project_id: uuid.UUID, chapter: int):
+    async with AsyncSessionLocal() as db:
+        results = await rag_service.retrieve_context(db, project_id, "林凡", chapter, limit=5, query_embedding=EMBEDDING)
+        batch = await rag_service.retrieve_batch(db, project_id, ["林凡"], chapter, {"character": 5}, query_embeddings=[EMBEDDING])
+    return [r.entity_id for r in results] + [hit["version"].entity_id for hit in batch.get("character", [])]
+
+def test_delete_entity_removes_compacted_versions(run_db):
+    async def body():
+        project_id = uuid.uuid4()
+        async with AsyncSessionLocal() as db:
+            db.add(Project(id=project_id, name="delete-after-compaction"))
+            db.add(Chapter(project_id=project_id, chapter_number=10, title="第10章"))
+            await db.commit()
+        try:
+            async with AsyncSessionLocal() as db:
+                await rag_service.upsert_entity_version(db, project_id, "character", "char_lin", {"name": "林凡", "realm": "炼气"}, 1, embedding=EMBEDDING)
+                await rag_service.upsert_entity_version(db, project_id, "character", "char_lin", {"name": "林凡", "realm": "筑基"}, 5, embedding=EMBEDDING)
+            # Version 1 (chapters 1-4) moves to the cold archive
+            report = await compaction_service.compact_project(project_id, horizon=0)
+            assert report["cold_archived"] == 1
+            assert ("character", "char_lin") in await _snapshot_ids(project_id, 2)
+            assert "char_lin" in await _retrieved_ids(project_id, 2)
+
+            async with AsyncSessionLocal() as db:
+                assert await rag_service.delete_entity(db, project_id, "character", "char_lin") == 2
+
+            for chapter in (2, 7):
+                assert await _snapshot_ids(project_id, chapter) == []
+                assert await _retrieved_ids(project_id, chapter) == []
+        finally:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(Project).where(Project.id == project_id))
+                await db.commit()
+
+    run_db(body)
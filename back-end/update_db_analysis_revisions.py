@@ -0,0 +1,13 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE chapters ADD COLUMN IF NOT EXISTS content_revision INTEGER NOT NULL DEFAULT 0;"))
+        await conn.execute(text("ALTER TABLE chapters ADD COLUMN IF NOT EXISTS analyzed_revision INTEGER;"))
+        await conn.execute(text("ALTER TABLE chapters ADD COLUMN IF NOT EXISTS analysis_report JSONB;"))
+    print("Schema updated successfully: Added content_revision, analyzed_revision and analysis_report to chapters.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
@@ -0,0 +1,31 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS entity_versions_archive (
+                id UUID PRIMARY KEY,
+                project_id UUID NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+                entity_type VARCHAR NOT NULL,
+                entity_id VARCHAR NOT NULL,
+                version INTEGER NOT NULL,
+                valid_from_chapter INTEGER NOT NULL,
+                valid_to_chapter INTEGER,
+                reason VARCHAR NOT NULL,
+                payload_zlib BYTEA NOT NULL,
+                embedding_int8 BYTEA,
+                embedding_scale FLOAT,
+                created_at TIMESTAMP WITH TIME ZONE,
+                archived_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_entity_versions_archive_temporal
+            ON entity_versions_archive (project_id, reason, valid_from_chapter, valid_to_chapter);
+        """))
+    print("Schema updated successfully: Added entity_versions_archive table.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
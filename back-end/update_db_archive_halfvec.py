@@ -0,0 +1,29 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        # halfvec needs pgvector 0.7 or newer
+        await conn.execute(text("ALTER EXTENSION vector UPDATE"))
+        await conn.execute(text("ALTER TABLE entity_versions_archive ADD COLUMN IF NOT EXISTS embedding_half halfvec(1536)"))
+        legacy = await conn.scalar(text("""
+            SELECT count(*) FROM information_schema.columns
+            WHERE table_name = 'entity_versions_archive' AND column_name = 'embedding_int8'
+        """))
+        if legacy:
+            # int8 bytes are unsigned in get_byte(); value = signed byte * scale
+            await conn.execute(text("""
+                UPDATE entity_versions_archive a
+                SET embedding_half = (
+                    SELECT array_agg((CASE WHEN b > 127 THEN b - 256 ELSE b END) * a.embedding_scale ORDER BY i)::real[]::halfvec
+                    FROM generate_series(0, length(a.embedding_int8) - 1) AS i,
+                         LATERAL get_byte(a.embedding_int8, i) AS b
+                )
+                WHERE a.embedding_int8 IS NOT NULL AND a.embedding_scale IS NOT NULL
+            """))
+            await conn.execute(text("ALTER TABLE entity_versions_archive DROP COLUMN embedding_int8, DROP COLUMN embedding_scale"))
+    print("Schema updated successfully: Archived embeddings stored as halfvec.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
@@ -0,0 +1,21 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        # Recreate the project foreign keys with ON DELETE CASCADE so projects
+        # (and entities) can be deleted with set-based statements
+        for table in ("chapters", "entity_versions"):
+            await conn.execute(text(f"""
+                ALTER TABLE {table}
+                    DROP CONSTRAINT IF EXISTS {table}_project_id_fkey,
+                    ADD CONSTRAINT {table}_project_id_fkey
+                        FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE;
+            """))
+            # The cascade looks child rows up by project_id
+            await conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_project_id ON {table} (project_id);"))
+    print("Schema updated successfully: Added ON DELETE CASCADE to chapters and entity_versions.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
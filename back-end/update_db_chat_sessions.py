@@ -0,0 +1,37 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                id UUID PRIMARY KEY,
+                project_id UUID REFERENCES projects (id) ON DELETE CASCADE,
+                title VARCHAR,
+                current_chapter INTEGER NOT NULL DEFAULT 1,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                summary TEXT,
+                summarized_through INTEGER NOT NULL DEFAULT 0,
+                context_cache TEXT,
+                context_key VARCHAR,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_sessions_project_id ON chat_sessions (project_id);"))
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id UUID PRIMARY KEY,
+                session_id UUID NOT NULL REFERENCES chat_sessions (id) ON DELETE CASCADE,
+                seq INTEGER NOT NULL,
+                role VARCHAR NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+        await conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_chat_messages_session_seq ON chat_messages (session_id, seq);"))
+    print("Schema updated successfully: Added chat_sessions and chat_messages tables.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
@@ -0,0 +1,44 @@
+import asyncio
+from sqlalchemy import text, select
+from app.db.database import engine, AsyncSessionLocal
+from app.db.models import Project
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS entity_edges_archive (
+                id UUID PRIMARY KEY,
+                project_id UUID NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+                source_version_id UUID NOT NULL REFERENCES entity_versions_archive (id) ON DELETE CASCADE,
+                src_type VARCHAR NOT NULL,
+                src_id VARCHAR NOT NULL,
+                dst_type VARCHAR NOT NULL,
+                dst_id VARCHAR NOT NULL,
+                relation VARCHAR NOT NULL,
+                label TEXT
+            );
+        """))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_entity_edges_archive_source_version_id ON entity_edges_archive (source_version_id);"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_entity_edges_archive_src ON entity_edges_archive (project_id, src_type, src_id);"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_entity_edges_archive_dst ON entity_edges_archive (project_id, dst_type, dst_id);"))
+    print("Schema updated successfully: Added entity_edges_archive table.")
+
+async def backfill():
+    """Versions compacted before this table existed lost their edges; rebuild them from the archived payloads."""
+    from app.services.graph_service import graph_service
+
+    async with AsyncSessionLocal() as db:
+        project_ids = (await db.execute(select(Project.id))).scalars().all()
+    for project_id in project_ids:
+        async with AsyncSessionLocal() as db:
+            count = await graph_service.rebuild(db, project_id)
+            await db.commit()
+        print(f"  {project_id}: {count} edges")
+    print(f"Backfilled entity_edges and entity_edges_archive for {len(project_ids)} projects.")
+
+async def main():
+    await update_schema()
+    await backfill()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS generations (
+                id UUID PRIMARY KEY,
+                project_id UUID REFERENCES projects (id) ON DELETE CASCADE,
+                kind VARCHAR NOT NULL,
+                status VARCHAR NOT NULL DEFAULT 'running',
+                content TEXT NOT NULL DEFAULT '',
+                context_json JSONB,
+                error TEXT,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+        # Tables created before the foreign key existed: drop generations of deleted projects, then add it
+        await conn.execute(text("""
+            DELETE FROM generations
+            WHERE project_id IS NOT NULL AND project_id NOT IN (SELECT id FROM projects);
+        """))
+        await conn.execute(text("""
+            ALTER TABLE generations
+                DROP CONSTRAINT IF EXISTS generations_project_id_fkey,
+                ADD CONSTRAINT generations_project_id_fkey
+                    FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE;
+        """))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_generations_project_id ON generations (project_id);"))
+    print("Schema updated successfully: Added generations table with ON DELETE CASCADE to projects.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
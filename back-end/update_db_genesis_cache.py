@@ -0,0 +1,22 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS genesis_node_cache (
+                draft_id VARCHAR NOT NULL,
+                node VARCHAR NOT NULL,
+                fingerprint VARCHAR NOT NULL,
+                intent VARCHAR NOT NULL,
+                outputs_json JSONB NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                PRIMARY KEY (draft_id, node)
+            );
+        """))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_genesis_node_cache_updated_at ON genesis_node_cache (updated_at);"))
+    print("Schema updated successfully: Added genesis_node_cache table.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
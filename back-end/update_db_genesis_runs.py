@@ -0,0 +1,21 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS genesis_runs (
+                id UUID PRIMARY KEY,
+                draft_id VARCHAR,
+                status VARCHAR NOT NULL,
+                error TEXT,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_genesis_runs_updated_at ON genesis_runs (updated_at);"))
+    print("Schema updated successfully: Added genesis_runs table (LangGraph creates its checkpoint tables on first use).")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
@@ -0,0 +1,27 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                id UUID PRIMARY KEY,
+                project_id UUID NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+                status VARCHAR NOT NULL DEFAULT 'running',
+                source_name VARCHAR,
+                run_analysis BOOLEAN NOT NULL DEFAULT true,
+                first_chapter INTEGER NOT NULL,
+                last_chapter INTEGER NOT NULL,
+                applied_through INTEGER NOT NULL,
+                stats JSONB NOT NULL DEFAULT '{}',
+                error TEXT,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_project_id ON ingestion_jobs (project_id);"))
+    print("Schema updated successfully: Added ingestion_jobs table.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
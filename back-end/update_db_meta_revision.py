@@ -0,0 +1,11 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE projects ADD COLUMN IF NOT EXISTS meta_revision INTEGER NOT NULL DEFAULT 0;"))
+    print("Schema updated successfully: Added meta_revision to projects.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
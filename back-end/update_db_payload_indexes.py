@@ -0,0 +1,24 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS payload_query_stats (
+                path VARCHAR PRIMARY KEY,
+                query_count FLOAT NOT NULL,
+                last_queried_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+    # Built without blocking writes to entity_versions; CONCURRENTLY needs autocommit
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_entity_versions_payload "
+            "ON entity_versions USING gin (payload_json jsonb_path_ops);"
+        ))
+    print("Schema updated successfully: Added payload GIN index and payload_query_stats table.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
@@ -0,0 +1,18 @@
+import asyncio
+from sqlalchemy import text
+from app.db.database import engine
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            ALTER TABLE projects ADD COLUMN IF NOT EXISTS entity_epoch INTEGER NOT NULL DEFAULT 0;
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_entity_versions_temporal
+            ON entity_versions (project_id, entity_type, entity_id, version DESC)
+            INCLUDE (valid_from_chapter, valid_to_chapter);
+        """))
+    print("Schema updated successfully: Added projects.entity_epoch and ix_entity_versions_temporal.")
+
+if __name__ == "__main__":
+    asyncio.run(update_schema())
@@ -0,0 +1,50 @@
+import asyncio
+from sqlalchemy import text, select
+from app.db.database import engine, AsyncSessionLocal
+from app.db.models import Project
+
+async def update_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS story_events (
+                id UUID PRIMARY KEY,
+                project_id UUID NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+                event_id VARCHAR NOT NULL,
+                chapter INTEGER NOT NULL,
+                title VARCHAR,
+                description TEXT,
+                participants VARCHAR[] NOT NULL,
+                witnesses VARCHAR[] NOT NULL,
+                location_id VARCHAR,
+                significance SMALLINT,
+                tags VARCHAR[] NOT NULL,
+                payload_json JSONB NOT NULL,
+                embedding VECTOR(1536),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """))
+        await conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_story_events_project_event ON story_events (project_id, event_id);"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_story_events_chapter_significance ON story_events (project_id, chapter, significance);"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_story_events_location ON story_events (project_id, location_id);"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_story_events_participants ON story_events USING gin (participants);"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_story_events_witnesses ON story_events USING gin (witnesses);"))
+    print("Schema updated successfully: Added story_events table.")
+
+async def backfill():
+    from app.services.timeline_service import timeline_service
+
+    async with AsyncSessionLocal() as db:
+        project_ids = (await db.execute(select(Project.id))).scalars().all()
+    for project_id in project_ids:
+        async with AsyncSessionLocal() as db:
+            count = await timeline_service.rebuild(db, project_id)
+            await db.commit()
+        print(f"  {project_id}: {count} events")
+    print(f"Backfilled story_events for {len(project_ids)} projects.")
+
+async def main():
+    await update_schema()
+    await backfill()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -307,7 +307,8 @@ export const api = {
         userInput: string,
         currentData: any,
         inspirationContext: string = '',
-        onUpdate: (data: any) => void
+        onUpdate: (data: any) => void,
+        draftId?: string
     ): Promise<void> => {
         const response = await fetch(`${BASE_URL}/genesis/unified`, {
             method: 'POST',
@@ -315,7 +316,9 @@ export const api = {
             body: JSON.stringify({
                 user_input: userInput,
                 current_data: currentData,
-                inspiration_context: inspirationContext
+                inspiration_context: inspirationContext,
+                // Lets the server reuse agent outputs whose inputs did not change
+                draft_id: draftId
             }),
         });
 
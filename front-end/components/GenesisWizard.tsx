@@ -61,6 +61,7 @@ const GenesisWizard: React.FC<{ onComplete: (projectId: string) => void }> = ({
     const [chatHistory, setChatHistory] = useState<{ role: 'user' | 'assistant' | 'system', content: string }[]>([]);
     const [agentStatus, setAgentStatus] = useState<string>('');
     const [abortController, setAbortController] = useState<AbortController | null>(null);
+    const [draftId, setDraftId] = useState<string | undefined>(undefined);
 
     const normalizeCharacters = (incoming: any[], existing: Character[]) => {
         const existingNames = new Set(existing.map((c: any) => c.name));
@@ -215,7 +216,9 @@ const GenesisWizard: React.FC<{ onComplete: (projectId: string) => void }> = ({
                 }
 
                 await api.generateUnified(currentInput, previewData, inspirationContext, (update) => {
-                    if (update.type === 'status') {
+                    if (update.type === 'draft') {
+                        setDraftId(update.draft_id);
+                    } else if (update.type === 'status') {
                         setAgentStatus(update.message);
                     } else if (update.type === 'result') {
                         const data = update.data;
@@ -276,7 +279,7 @@ const GenesisWizard: React.FC<{ onComplete: (projectId: string) => void }> = ({
                             return newData;
                         });
                     }
-                });
+                }, draftId);
             } else {
                 // ... (existing logic for other tabs) ...
                 // Note: I need to preserve the existing logic for other tabs which I'm not showing here to save space in the tool call, 